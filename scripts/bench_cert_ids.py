@@ -0,0 +1,74 @@
+"""
+Compara el esquema antiguo de certificado_id (CERT-<10 hex> aleatorio) con el
+ordenable por tiempo (CERT-<ULID>): throughput de inserción y tamaño del índice.
+
+    DATABASE_URL=... python -m scripts.bench_cert_ids --rows 200000 --batch 1000
+
+Cada esquema inserta en su propia tabla temporal con la misma definición de
+columna y restricción UNIQUE que `certificates`. Se reporta filas/s, tamaño
+final del índice y densidad de hojas (pgstattuple, si la extensión existe).
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+import asyncpg
+
+from src.utils.ids import new_certificado_id
+
+SCHEMES = {
+    "uuid4_hex10": lambda: f"CERT-{uuid.uuid4().hex[:10]}",
+    "ulid": new_certificado_id,
+}
+
+
+async def bench(conn, name: str, generate, rows: int, batch: int):
+    table = f"bench_cert_{name}"
+    await conn.execute(f"""
+        CREATE TEMP TABLE {table} (
+            id SERIAL PRIMARY KEY,
+            certificado_id VARCHAR(50) UNIQUE NOT NULL,
+            issued_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+    insert = f"INSERT INTO {table} (certificado_id) SELECT unnest($1::varchar[])"
+
+    start = time.perf_counter()
+    for offset in range(0, rows, batch):
+        ids = [generate() for _ in range(min(batch, rows - offset))]
+        await conn.execute(insert, ids)
+    elapsed = time.perf_counter() - start
+
+    index = await conn.fetchval(
+        "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = $1::regclass AND NOT indisprimary",
+        table
+    )
+    size = await conn.fetchval("SELECT pg_relation_size($1::regclass)", index)
+    density = None
+    try:
+        density = await conn.fetchval("SELECT avg_leaf_density FROM pgstatindex($1)", index)
+    except asyncpg.PostgresError:
+        pass
+    await conn.execute(f"DROP TABLE {table}")
+    return rows / elapsed, size, density
+
+
+async def main(args):
+    conn = await asyncpg.connect(os.getenv("DATABASE_URL"))
+    try:
+        print(f"{'esquema':<14}{'filas/s':>12}{'índice MB':>12}{'densidad hojas %':>18}")
+        for name, generate in SCHEMES.items():
+            rate, size, density = await bench(conn, name, generate, args.rows, args.batch)
+            density_text = f"{density:.1f}" if density is not None else "n/d"
+            print(f"{name:<14}{rate:>12.0f}{size / 1024 / 1024:>12.2f}{density_text:>18}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de esquemas de certificado_id")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,241 @@
+"""
+Benchmark del índice MinHash/LSH de contratos similares sobre datos sintéticos.
+
+    DATABASE_URL=... python -m scripts.bench_contract_similarity --contracts 1000000
+
+Genera contratos con proveedores de tamaño desigual (unos pocos RUT concentran
+miles de contratos) y grupos sembrados de compras fraccionadas, y los carga en
+un esquema aparte (bench_similarity) con las mismas tablas e índices que
+producción. Reporta:
+
+- firmas/s (MinHash + bandas LSH) y filas/s del COPY,
+- latencia de find_near_duplicates (lookup por bandas) frente a comparar de a
+  pares con todos los contratos del mismo RUT en la ventana (Jaccard exacto),
+- recall y precisión del LSH respecto de ese Jaccard exacto.
+
+El esquema se elimina al terminar salvo --keep.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import asyncpg
+from databases import Database
+
+from src.services import contract_similarity as cs
+
+SCHEMA = "bench_similarity"
+
+ITEMS = [
+    "computadores portátiles", "licencias de software", "mobiliario de oficina", "insumos médicos",
+    "alimentación escolar", "mantención de áreas verdes", "reparación de caminos vecinales",
+    "servicio de aseo", "arriendo de vehículos", "combustible", "uniformes", "material de ferretería",
+    "servicio de vigilancia", "impresoras multifuncionales", "equipamiento deportivo",
+]
+TARGETS = [
+    "Dirección de Obras Municipales", "Departamento de Salud", "Liceo Municipal", "CESFAM",
+    "Departamento de Educación", "Oficina de Partes", "Delegación Rural", "Biblioteca Pública",
+]
+TEMPLATES = [
+    "Adquisición de {n} {item} para {target}",
+    "Contratación de {item} para {target}, período {y}",
+    "Suministro de {item} destinado a {target} ({n} unidades)",
+    "Servicio de {item} en dependencias de {target}",
+]
+
+
+def random_text(rng: random.Random) -> str:
+    return rng.choice(TEMPLATES).format(
+        n=rng.randint(1, 500), item=rng.choice(ITEMS), target=rng.choice(TARGETS), y=rng.randint(2018, 2025)
+    )
+
+
+def split_variant(rng: random.Random, text: str, part: int) -> str:
+    """Mismo objeto con pequeñas variaciones, como una compra dividida en partes"""
+    return f"{text} - parte {part}" if rng.random() < 0.5 else f"{text}, lote {part}"
+
+
+def generate(args):
+    """Entrega (request_id, rut_num, contract_at, objeto, sembrado) sin materializar la lista"""
+    rng = random.Random(args.seed)
+    base = datetime(2024, 1, 1)
+    planted = 0
+    i = 0
+    while i < args.contracts:
+        # Sesgado: pocos proveedores concentran miles de contratos
+        rut_num = 1000000 + int(args.ruts * rng.random() ** 3)
+        at = base + timedelta(seconds=rng.randint(0, 365 * 86400))
+        text = random_text(rng)
+        if planted < args.clusters and rng.random() < args.clusters / args.contracts:
+            planted += 1
+            for part in range(1, rng.randint(3, 5) + 1):
+                yield f"BENCH-{i}", rut_num, at + timedelta(days=rng.randint(0, 20)), split_variant(rng, text, part), True
+                i += 1
+            continue
+        yield f"BENCH-{i}", rut_num, at, text, False
+        i += 1
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+async def setup(conn):
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    for table in ("contract_signatures", "contract_lsh_buckets"):
+        await conn.execute(f"CREATE TABLE {SCHEMA}.{table} (LIKE public.{table} INCLUDING ALL)")
+    await conn.execute(f"""
+        CREATE TABLE {SCHEMA}.contracts (
+            request_id VARCHAR(100) PRIMARY KEY,
+            proveedor_rut_num INTEGER NOT NULL,
+            contract_at TIMESTAMP NOT NULL,
+            objeto_contrato TEXT NOT NULL
+        )
+    """)
+
+
+async def load(conn, args):
+    sign_seconds = copy_seconds = 0.0
+    total = 0
+    # Mitad de las consultas sobre grupos sembrados, mitad sobre el resto
+    samples = {True: [], False: []}
+    seen = {True: 0, False: 0}
+    per_kind = max(args.queries // 2, 1)
+    contracts, signatures, buckets = [], [], []
+
+    async def flush():
+        nonlocal copy_seconds
+        start = time.perf_counter()
+        await conn.copy_records_to_table("contracts", schema_name=SCHEMA, records=contracts)
+        await conn.copy_records_to_table(
+            "contract_signatures", schema_name=SCHEMA, records=signatures,
+            columns=["request_id", "proveedor_rut_num", "contract_at", "version", "signature"]
+        )
+        await conn.copy_records_to_table(
+            "contract_lsh_buckets", schema_name=SCHEMA, records=buckets,
+            columns=["proveedor_rut_num", "band", "bucket", "contract_at", "request_id"]
+        )
+        copy_seconds += time.perf_counter() - start
+        contracts.clear()
+        signatures.clear()
+        buckets.clear()
+
+    rng = random.Random(args.seed + 1)
+    for request_id, rut_num, at, text, planted in generate(args):
+        start = time.perf_counter()
+        signature = cs.minhash(text)
+        bands = cs.lsh_buckets(signature)
+        sign_seconds += time.perf_counter() - start
+
+        contracts.append((request_id, rut_num, at, text))
+        signatures.append((request_id, rut_num, at, cs.SIGNATURE_VERSION, cs.pack_signature(signature)))
+        buckets.extend((rut_num, band, bucket, at, request_id) for band, bucket in bands)
+        total += 1
+        # Muestreo de reservorio para las consultas
+        seen[planted] += 1
+        sample = samples[planted]
+        if len(sample) < per_kind:
+            sample.append((request_id, rut_num, at, text))
+        elif rng.random() < per_kind / seen[planted]:
+            sample[rng.randrange(per_kind)] = (request_id, rut_num, at, text)
+        if len(contracts) >= args.batch_size:
+            await flush()
+            print(f"  ... {total} contratos", end="\r")
+    await flush()
+
+    start = time.perf_counter()
+    await conn.execute(f"ANALYZE {SCHEMA}.contract_lsh_buckets")
+    await conn.execute(f"ANALYZE {SCHEMA}.contract_signatures")
+    await conn.execute(f"CREATE INDEX ON {SCHEMA}.contracts (proveedor_rut_num, contract_at)")
+    await conn.execute(f"ANALYZE {SCHEMA}.contracts")
+    print(f"Contratos: {total}")
+    print(f"  🧬 Firmas: {total / sign_seconds:,.0f}/s ({sign_seconds:.1f}s)")
+    print(f"  📥 COPY: {total * (2 + cs.LSH_BANDS) / copy_seconds:,.0f} filas/s ({copy_seconds:.1f}s)")
+    print(f"  🗂️  Índices y ANALYZE: {time.perf_counter() - start:.1f}s")
+    return samples[True] + samples[False]
+
+
+async def pairwise(conn, request_id, rut_num, at, text, window):
+    """Línea base: Jaccard exacto contra todo el historial del RUT en la ventana"""
+    rows = await conn.fetch(
+        f"""
+        SELECT request_id, objeto_contrato FROM {SCHEMA}.contracts
+        WHERE proveedor_rut_num = $1 AND contract_at BETWEEN $2 AND $3 AND request_id <> $4
+        """,
+        rut_num, at - window, at + window, request_id
+    )
+    mine = cs.shingles(text)
+    return len(rows), {
+        row["request_id"] for row in rows
+        if jaccard(mine, cs.shingles(row["objeto_contrato"])) >= cs.SIMILARITY_THRESHOLD
+    }
+
+
+def percentile(values, p):
+    return sorted(values)[min(int(len(values) * p), len(values) - 1)] * 1000
+
+
+async def main(args):
+    url = args.database_url
+    conn = await asyncpg.connect(url)
+    db = Database(url, server_settings={"search_path": f"{SCHEMA}, public"})
+    try:
+        await setup(conn)
+        sample = await load(conn, args)
+        await db.connect()
+
+        window = timedelta(days=args.window_days)
+        lsh_ms, base_ms, scanned = [], [], []
+        true_positives = found = expected = 0
+        for request_id, rut_num, at, text in sample:
+            start = time.perf_counter()
+            matches = await cs.find_near_duplicates(
+                request_id, rut_num, text, at=at, window_days=args.window_days, db=db
+            )
+            lsh_ms.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            n, exact = await pairwise(conn, request_id, rut_num, at, text, window)
+            base_ms.append(time.perf_counter() - start)
+            scanned.append(n)
+
+            approx = {m["request_id"] for m in matches}
+            true_positives += len(approx & exact)
+            found += len(approx)
+            expected += len(exact)
+
+        print(f"Consultas: {len(sample)} (contratos del mismo RUT en ventana: "
+              f"mediana {statistics.median(scanned):.0f}, máx {max(scanned)})")
+        print(f"{'estrategia':<12}{'p50 ms':>10}{'p95 ms':>10}{'máx ms':>10}")
+        for label, values in (("lsh", lsh_ms), ("pares", base_ms)):
+            print(f"{label:<12}{percentile(values, 0.5):>10.2f}{percentile(values, 0.95):>10.2f}"
+                  f"{max(values) * 1000:>10.2f}")
+        recall = true_positives / expected if expected else 1.0
+        precision = true_positives / found if found else 1.0
+        print(f"  🎯 Recall {recall:.3f}, precisión {precision:.3f} "
+              f"(umbral {cs.SIMILARITY_THRESHOLD}, {expected} pares similares esperados)")
+    finally:
+        if db.is_connected:
+            await db.disconnect()
+        if not args.keep:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del índice de contratos similares")
+    parser.add_argument("--contracts", type=int, default=1000000)
+    parser.add_argument("--ruts", type=int, default=50000)
+    parser.add_argument("--clusters", type=int, default=5000, help="Grupos de compras fraccionadas sembrados")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--window-days", type=int, default=cs.WINDOW_DAYS)
+    parser.add_argument("--batch-size", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=21595)
+    parser.add_argument("--keep", action="store_true", help="No eliminar el esquema bench_similarity")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,90 @@
+"""
+Compara la ruta `databases` con el fast path asyncpg en las consultas calientes.
+
+    DATABASE_URL=... DB_FASTPATH=true python -m scripts.bench_fastpath \
+        --request-id REQ-1 --certificado-id CERT-... --iterations 2000 --concurrency 20
+
+Reporta llamadas/segundo por repositorio y bloques/bytes asignados por llamada
+(tracemalloc, en una pasada secuencial aparte para no mezclar con la latencia).
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from src.db.database import connect_db, disconnect_db
+from src.db.fastpath import fastpath
+from src.db.repositories.art17_repository import Art17Repository
+from src.db.repositories.hitl_repository import HITLRepository
+
+
+def build_calls(args):
+    art17 = Art17Repository()
+    hitl = HITLRepository()
+    calls = {
+        "workflow_by_request_id": lambda: art17.get_workflow_by_request_id(args.request_id),
+        "pending_hitl": lambda: hitl.get_pending_hitl_cases(limit=50),
+        "search": lambda: art17.search_workflows(riesgo="BAJO", limit=50),
+    }
+    if args.certificado_id:
+        calls["certificate_by_id"] = lambda: art17.get_certificate_by_id(args.certificado_id)
+    return calls
+
+
+async def throughput(call, iterations: int, concurrency: int) -> float:
+    queue = asyncio.Queue()
+    for _ in range(iterations):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            await call()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return iterations / (time.perf_counter() - start)
+
+
+async def allocations(call, iterations: int):
+    await call()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    for _ in range(iterations):
+        await call()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(max(s.count_diff, 0) for s in stats)
+    size = sum(max(s.size_diff, 0) for s in stats)
+    return blocks / iterations, size / iterations
+
+
+async def main(args):
+    await connect_db()
+    pool = fastpath.pool
+    if pool is None:
+        print("⚠️  Fast path inactivo: ejecute con DB_FASTPATH=true para comparar")
+    try:
+        print(f"{'consulta':<26}{'ruta':<11}{'llamadas/s':>12}{'bloques/llamada':>18}{'bytes/llamada':>16}")
+        for name, call in build_calls(args).items():
+            for label, active in (("databases", None), ("fastpath", pool)):
+                if label == "fastpath" and pool is None:
+                    continue
+                fastpath.pool = active
+                rps = await throughput(call, args.iterations, args.concurrency)
+                blocks, size = await allocations(call, min(args.iterations, 200))
+                print(f"{name:<26}{label:<11}{rps:>12.1f}{blocks:>18.1f}{size:>16.0f}")
+    finally:
+        fastpath.pool = pool
+        await disconnect_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark databases vs fast path asyncpg")
+    parser.add_argument("--request-id", required=True)
+    parser.add_argument("--certificado-id", default=None)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
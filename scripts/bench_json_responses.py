@@ -0,0 +1,78 @@
+"""
+Compara el tamaño y el costo de serialización de las respuestas grandes.
+
+    DATABASE_URL=... python -m scripts.bench_json_responses \
+        --request-id REQ-1 --hitl-request-id REQ-2 --limit 100 --iterations 200
+
+Para cada endpoint mide la ruta genérica (jsonable_encoder + json.dumps, como
+FastAPI por defecto) frente a la ruta rápida (JSON de Postgres o FastJSONResponse):
+bytes sin comprimir, bytes con gzip y milisegundos de serialización por respuesta.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from src.api.responses import GZIP_COMPRESS_LEVEL, dumps
+from src.db.database import connect_db, disconnect_db
+from src.db.repositories.art17_repository import Art17Repository
+from src.db.repositories.hitl_repository import HITLRepository
+
+
+def generic_encode(content) -> bytes:
+    return json.dumps(jsonable_encoder(content)).encode("utf-8")
+
+
+def timed(encode, content, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body = encode(content)
+    return body, (time.perf_counter() - start) * 1000 / iterations
+
+
+def report(name: str, label: str, body: bytes, ms: float):
+    compressed = len(gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL))
+    print(f"{name:<14}{label:<10}{len(body):>12}{compressed:>12}{ms:>12.3f}")
+
+
+async def main(args):
+    await connect_db()
+    art17 = Art17Repository()
+    hitl = HITLRepository()
+    try:
+        print(f"{'endpoint':<14}{'ruta':<10}{'bytes':>12}{'gzip':>12}{'ms/resp':>12}")
+
+        search = await art17.search_workflows(limit=args.limit)
+        body, ms = timed(generic_encode, search, args.iterations)
+        report("search", "generica", body, ms)
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            raw = await art17.search_workflows_json(limit=args.limit)
+        db_ms = (time.perf_counter() - start) * 1000 / args.iterations
+        # Incluye el viaje a Postgres: la serialización ocurre allá
+        report("search", "postgres", raw["body"].encode("utf-8"), db_ms)
+
+        pages = {"audit_trail": await art17.get_audit_trail(args.request_id)}
+        if args.hitl_request_id:
+            pages["hitl_case"] = await hitl.get_hitl_case_detail(args.hitl_request_id)
+        for name, content in pages.items():
+            if not content:
+                print(f"{name:<14}sin datos")
+                continue
+            for label, encode in (("generica", generic_encode), ("rapida", dumps)):
+                body, ms = timed(encode, content, args.iterations)
+                report(name, label, body, ms)
+    finally:
+        await disconnect_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de serialización de respuestas JSON")
+    parser.add_argument("--request-id", required=True)
+    parser.add_argument("--hitl-request-id", default=None)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,116 @@
+"""
+Compara las facetas de búsqueda en una sola consulta frente a N búsquedas filtradas.
+
+    DATABASE_URL=... python -m scripts.bench_search_facets --iterations 20
+    DATABASE_URL=... python -m scripts.bench_search_facets --query "servicios" --riesgo MEDIO
+
+- n_consultas: lo que hace hoy la UI, una búsqueda por valor de faceta (cada una
+  repite el COUNT(*) completo) más la búsqueda de la página.
+- una_pasada: search_workflows_json(facets=True), GROUPING SETS junto a la página.
+- contadores: sin filtros, página + search_facet_counts (solo si no hay filtros).
+
+Verifica además que los conteos de una_pasada coincidan con los de n_consultas.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from src.db.database import connect_db, disconnect_db
+from src.db.repositories.art17_repository import Art17Repository
+
+# Mismos cortes que monto_banda() en la migración 009 (monto_max es inclusivo)
+MONTO_BANDS = {
+    "hasta_1M": (None, 999999.99),
+    "1M_10M": (1000000, 9999999.99),
+    "10M_100M": (10000000, 99999999.99),
+    "sobre_100M": (100000000, None),
+}
+
+
+async def n_queries(repo: Art17Repository, filters: dict, statuses, riesgos) -> dict:
+    """Una búsqueda por valor de faceta, como las llamadas extra de la UI"""
+    page = json.loads((await repo.search_workflows_json(limit=50, **filters))["body"])
+    facets = {"status": {}, "nivel_riesgo": {}, "monto": {}}
+    for status in statuses:
+        result = await repo.search_workflows_json(limit=1, **{**filters, "status": status})
+        facets["status"][status] = result["total"]
+    for riesgo in riesgos:
+        result = await repo.search_workflows_json(limit=1, **{**filters, "riesgo": riesgo})
+        facets["nivel_riesgo"][riesgo] = result["total"]
+    for band, (monto_min, monto_max) in MONTO_BANDS.items():
+        result = await repo.search_workflows_json(
+            limit=1, **{**filters, "monto_min": monto_min, "monto_max": monto_max}
+        )
+        facets["monto"][band] = result["total"]
+    return {"total": page["total"], "facets": facets}
+
+
+async def one_pass(repo: Art17Repository, filters: dict, use_counters: bool = False) -> dict:
+    body = json.loads((await repo.search_workflows_json(
+        limit=50, facets=True, use_counters=use_counters, **filters
+    ))["body"])
+    return {"total": body["total"], "facets": body["facets"]}
+
+
+async def timed(label: str, fn, iterations: int, queries: int):
+    await fn()  # calentamiento
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = await fn()
+    ms = (time.perf_counter() - start) * 1000 / iterations
+    print(f"{label:<14}{queries:>10}{ms:>14.2f}")
+    return result, ms
+
+
+async def main(args):
+    await connect_db()
+    repo = Art17Repository()
+    filters = {
+        k: v for k, v in {"query": args.query, "riesgo": args.riesgo, "status": args.status}.items() if v
+    }
+    try:
+        reference = await one_pass(repo, filters)
+        statuses = [s for s in reference["facets"]["status"] if s != "sin_dato"]
+        riesgos = [r for r in reference["facets"]["nivel_riesgo"] if r != "sin_dato"]
+        n = 1 + len(statuses) + len(riesgos) + len(MONTO_BANDS)
+
+        print(f"Filtros: {filters or 'ninguno'}")
+        print(f"{'estrategia':<14}{'consultas':>10}{'ms/búsqueda':>14}")
+        baseline, base_ms = await timed(
+            "n_consultas", lambda: n_queries(repo, filters, statuses, riesgos), args.iterations, n
+        )
+        single, single_ms = await timed("una_pasada", lambda: one_pass(repo, filters), args.iterations, 1)
+        print(f"  ⚡ {base_ms / single_ms:.1f}x más rápido en una pasada")
+
+        # Los conteos por valor filtrado deben coincidir con los de GROUPING SETS
+        # Una faceta cuyo propio filtro está activo no es comparable (la UI lo reemplaza)
+        skipped = {"status": "status", "nivel_riesgo": "riesgo"}
+        mismatches = [
+            (facet, value, count, single["facets"][facet].get(value, 0))
+            for facet, values in baseline["facets"].items()
+            if skipped.get(facet) not in filters
+            for value, count in values.items()
+            if single["facets"][facet].get(value, 0) != count
+        ]
+        if baseline["total"] != single["total"]:
+            mismatches.append(("total", "", baseline["total"], single["total"]))
+        print("  ✅ Conteos coinciden" if not mismatches else f"  ❌ Diferencias: {mismatches}")
+
+        if not filters:
+            counters, _ = await timed(
+                "contadores", lambda: one_pass(repo, filters, use_counters=True), args.iterations, 2
+            )
+            facets = counters["facets"]
+            print(f"  ℹ️  Fuente: {facets.get('fuente')} (actualizado {facets.get('actualizado_at')})")
+    finally:
+        await disconnect_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de facetas de búsqueda")
+    parser.add_argument("--query")
+    parser.add_argument("--riesgo")
+    parser.add_argument("--status")
+    parser.add_argument("--iterations", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
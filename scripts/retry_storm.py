@@ -0,0 +1,90 @@
+"""
+Tormenta de reintentos contra POST /art17/run para validar la idempotencia.
+
+    python -m scripts.retry_storm --url http://localhost:8080 \
+        --url http://localhost:8081 --requests 20 --retries 25
+
+Envía `--retries` copias concurrentes de cada request_id, repartidas entre las
+instancias dadas, y verifica que todas las respuestas 200 de un mismo request_id
+traigan el mismo certificado_id. Reporta latencias y códigos de estado.
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+
+
+def payload(request_id: str) -> dict:
+    return {
+        "request_id": request_id,
+        "proveedor_rut": "76.086.428-5",
+        "proveedor_nombre": "Proveedor Tormenta SpA",
+        "monto_contrato": 15000000,
+        "objeto_contrato": "Prueba de reintentos idempotentes"
+    }
+
+
+async def main(args) -> bool:
+    prefix = f"STORM-{uuid.uuid4().hex[:8]}"
+    request_ids = [f"{prefix}-{i}" for i in range(args.requests)]
+    clients = [httpx.AsyncClient(base_url=url, timeout=args.timeout) for url in args.url]
+    targets = itertools.cycle(clients)
+
+    certificates = defaultdict(set)
+    statuses = Counter()
+    latencies = []
+
+    async def submit(client, request_id):
+        start = time.perf_counter()
+        try:
+            response = await client.post("/art17/run", json=payload(request_id))
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+            return
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses[response.status_code] += 1
+        if response.status_code == 200:
+            certificates[request_id].add(response.json()["result"].get("certificado_id"))
+
+    try:
+        calls = [
+            submit(next(targets), request_id)
+            for request_id in request_ids
+            for _ in range(args.retries)
+        ]
+        start = time.perf_counter()
+        await asyncio.gather(*calls)
+        elapsed = time.perf_counter() - start
+    finally:
+        for client in clients:
+            await client.aclose()
+
+    duplicated = {rid: certs for rid, certs in certificates.items() if len(certs) > 1}
+    print(f"envíos={len(calls)} en {elapsed:.2f}s  estados={dict(statuses)}")
+    if latencies:
+        ordered = sorted(latencies)
+        print(
+            f"latencia ms: p50={statistics.median(ordered):.1f} "
+            f"p95={ordered[int(len(ordered) * 0.95) - 1]:.1f} max={ordered[-1]:.1f}"
+        )
+    print(f"request_id con respuesta={len(certificates)}/{len(request_ids)} con certificados distintos={len(duplicated)}")
+    for request_id, certs in list(duplicated.items())[:10]:
+        print(f"  ❌ {request_id}: {sorted(c or '-' for c in certs)}")
+    return not duplicated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tormenta de reintentos sobre /art17/run")
+    parser.add_argument("--url", action="append", required=True, help="Instancia de la API (repetible)")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--retries", type=int, default=25)
+    parser.add_argument("--timeout", type=float, default=60)
+    ok = asyncio.run(main(parser.parse_args()))
+    print("✅ Un solo certificado por request_id" if ok else "❌ Se emitieron certificados duplicados")
+    sys.exit(0 if ok else 1)
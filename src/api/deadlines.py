@@ -0,0 +1,124 @@
+import asyncio
+import functools
+import inspect
+import logging
+import os
+from typing import Awaitable, Callable, Dict
+
+from fastapi import HTTPException, Request
+
+from src.db.deadlines import DeadlineExceeded, deadline_scope
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se revisa si el cliente cerró la conexión
+DISCONNECT_POLL_SECONDS = float(os.getenv("DEADLINE_DISCONNECT_POLL_SECONDS", "0.1"))
+# Código de nginx para "el cliente cerró la request": nadie lo recibe, queda en logs
+CLIENT_CLOSED_REQUEST = 499
+
+_budgets: Dict[str, float] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _route_stats(name: str) -> Dict[str, int]:
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = {"calls": 0, "completed": 0, "timeouts": 0, "disconnects": 0}
+    return stats
+
+
+async def _wait_disconnect(request: Request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def _cancel(task: asyncio.Task):
+    """Cancela y espera: asyncpg envía el CancelRequest y la conexión vuelve al pool"""
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+
+
+async def run_with_deadline(
+    name: str, budget: float, request: Request, call: Callable[[], Awaitable]
+):
+    """
+    Ejecuta el handler con un plazo de `budget` segundos. Si vence, o el cliente
+    se desconecta antes, la tarea se cancela (con ella la consulta en curso) y
+    se responde 504 / 499.
+    """
+    stats = _route_stats(name)
+    stats["calls"] += 1
+    with deadline_scope(budget) as deadline:
+        # La tarea copia el contexto: las consultas del handler ven el plazo
+        handler = asyncio.ensure_future(call())
+    watcher = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        done, _ = await asyncio.wait(
+            {handler, watcher}, timeout=budget, return_when=asyncio.FIRST_COMPLETED
+        )
+    except asyncio.CancelledError:
+        await _cancel(handler)
+        await _cancel(watcher)
+        raise
+
+    if handler in done:
+        await _cancel(watcher)
+        try:
+            result = handler.result()
+        except (HTTPException, DeadlineExceeded) as e:
+            # Las rutas convierten cualquier error en 500: si el plazo se agotó es un 504
+            if isinstance(e, HTTPException) and not deadline.exceeded:
+                raise
+            stats["timeouts"] += 1
+            logger.warning(f"⏱️ {name}: consulta cancelada por plazo de {budget:.2f}s")
+            raise HTTPException(status_code=504, detail=f"Plazo de {budget:.2f}s agotado")
+        stats["completed"] += 1
+        return result
+
+    await _cancel(handler)
+    if watcher in done:
+        stats["disconnects"] += 1
+        logger.info(f"🔌 {name}: cliente desconectado, consulta cancelada")
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Cliente desconectado")
+
+    await _cancel(watcher)
+    stats["timeouts"] += 1
+    logger.warning(f"⏱️ {name}: plazo de {budget:.2f}s agotado, request cancelada")
+    raise HTTPException(status_code=504, detail=f"Plazo de {budget:.2f}s agotado")
+
+
+def with_deadline(name: str, default_seconds: float):
+    """
+    Declara el presupuesto de latencia de una ruta (configurable con
+    DEADLINE_<NOMBRE>_SECONDS). Va debajo de @router.get; agrega a la firma el
+    Request que necesita para detectar desconexiones.
+    """
+    budget = float(os.getenv(f"DEADLINE_{name.upper()}_SECONDS", str(default_seconds)))
+    _budgets[name] = budget
+
+    def decorator(endpoint):
+        signature = inspect.signature(endpoint)
+        parameters = list(signature.parameters.values()) + [
+            inspect.Parameter("_deadline_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+        ]
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, _deadline_request: Request, **kwargs):
+            return await run_with_deadline(
+                name, budget, _deadline_request, lambda: endpoint(*args, **kwargs)
+            )
+
+        wrapper.__signature__ = signature.replace(parameters=parameters)
+        return wrapper
+
+    return decorator
+
+
+def get_route_deadline_stats() -> Dict[str, Dict]:
+    return {
+        name: {"budget_seconds": budget, **_route_stats(name)}
+        for name, budget in _budgets.items()
+    }
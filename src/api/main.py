@@ -1,19 +1,32 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from src.db.database import db, connect_db, disconnect_db
+from fastapi.middleware.gzip import GZipMiddleware
+from src.api.responses import GZIP_MIN_SIZE, GZIP_COMPRESS_LEVEL
+from src.db.database import db, read_database, connect_db, disconnect_db, replica_status, shard_status
+from src.db.sharding import SHARD_URLS
+from src.db.routing import consistency_middleware
+from src.db.run_migrations import run_migrations
+from src.db.instrumentation import start_query_reporter, stop_query_reporter
+from src.db.partitions import start_partition_maintenance, stop_partition_maintenance
+from src.services.stats_rollup import start_rollup_refresher, stop_rollup_refresher
+from src.services.audit import start_audit_writer, stop_audit_writer
+from src.services.audit_chain import start_audit_checkpointer, stop_audit_checkpointer
+from src.services.change_feed import change_feed, start_change_feed, stop_change_feed
+from src.services.tracing import tracing_middleware
+from src.services.profiler import start_loop_lag_monitor, stop_loop_lag_monitor
+from src.workflows.art17.queue import start_art17_queue_worker, stop_art17_queue_worker
+from src.utils.logging_pipeline import configure_logging, stop_logging
+from src.services.verification_snapshot import (
+    verification_snapshot, start_verification_snapshot, stop_verification_snapshot
+)
 import logging
-import sys
 import os
 
 # Importar routers
-from src.api.routes import workflows, hitl, signing, query_routes, search_stats_routes
+from src.api.routes import workflows, hitl, signing, query_routes, search_stats_routes, debug, verification, imports
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler(sys.stdout)]
-)
+# Configurar logging: cola + hilo escritor, JSON por defecto (ver src/utils/logging_pipeline.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -31,12 +44,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Gzip negociado por Accept-Encoding, solo para respuestas grandes
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_COMPRESS_LEVEL)
+
+# Read-your-writes con réplicas: token de consistencia (LSN) por header
+if read_database:
+    app.middleware("http")(consistency_middleware(read_database))
+
+# Trazas de requests lentas; el último en registrarse envuelve a los demás
+app.middleware("http")(tracing_middleware)
+
 # Registrar routers
 app.include_router(workflows.router)
 app.include_router(hitl.router)
 app.include_router(signing.router)
 app.include_router(search_stats_routes.router)
 app.include_router(query_routes.router)
+app.include_router(debug.router)
+app.include_router(verification.router)
+app.include_router(imports.router)
 @app.on_event("startup")
 async def startup():
     """Inicializar conexiones al arranque"""
@@ -45,13 +71,36 @@ async def startup():
     logger.info("Docs disponibles en: /docs")
     logger.info("🆕 FASE 2A: Búsquedas y Estadísticas activos")
     
+    # Snapshot local de verificación: se carga del disco aunque la BD no esté disponible
+    start_verification_snapshot()
+    start_loop_lag_monitor()
+    
+    database_url = os.getenv("DATABASE_URL")
+    if database_url and os.getenv("MIGRATE_ON_STARTUP", "false").lower() == "true":
+        # Protegido por advisory lock: solo una instancia aplica a la vez.
+        # Una migración fallida aborta el arranque: no se sirve con un esquema a medias
+        try:
+            logger.info("Aplicando migraciones pendientes...")
+            await run_migrations(database_url)
+            for shard_url in SHARD_URLS:
+                await run_migrations(shard_url)
+        except Exception as e:
+            logger.error(f"❌ Migraciones fallidas, se aborta el arranque: {e}")
+            raise
+    
     # Intentar conectar a la base de datos
     try:
-        database_url = os.getenv("DATABASE_URL")
         if database_url:
             logger.info("Conectando a PostgreSQL (Neon)...")
             await connect_db()
             logger.info("✅ Base de datos conectada")
+            start_partition_maintenance()
+            start_query_reporter()
+            start_rollup_refresher()
+            start_audit_writer()
+            start_audit_checkpointer()
+            start_art17_queue_worker()
+            start_change_feed()
         else:
             logger.warning("⚠️ DATABASE_URL no configurada, continuando sin BD")
     except Exception as e:
@@ -62,10 +111,22 @@ async def startup():
 async def shutdown():
     """Cerrar conexiones al apagar"""
     logger.info("Cerrando conexión a base de datos")
+    await stop_art17_queue_worker()
+    await stop_change_feed()
+    await stop_rollup_refresher()
+    await stop_audit_checkpointer()
+    await stop_verification_snapshot()
+    await stop_partition_maintenance()
+    await stop_query_reporter()
+    await stop_loop_lag_monitor()
+    # Los eventos de auditoría en buffer se escriben antes de cerrar la BD
+    await stop_audit_writer()
     try:
         await disconnect_db()
     except Exception as e:
         logger.error(f"Error cerrando BD: {e}")
+    # Último: escribe lo que quede en la cola de logs
+    stop_logging()
 
 # Health check endpoint (CRITICO para Cloud Run)
 @app.get("/health")
@@ -75,7 +136,11 @@ async def health_check():
         "status": "healthy",
         "service": "cleantransparency-v2",
         "version": "2.0-fase2a",
-        "database_connected": db.is_connected if db else False
+        "database_connected": db.is_connected if db else False,
+        "replicas": replica_status(),
+        "shards": shard_status(),
+        "change_feed_healthy": change_feed.healthy,
+        "verification_snapshot": verification_snapshot.status()
     }
 
 @app.get("/")
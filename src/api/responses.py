@@ -0,0 +1,71 @@
+import json
+import logging
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - se usa el encoder estándar como respaldo
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Respuestas menores a este tamaño no se comprimen (el costo supera la ganancia)
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+GZIP_COMPRESS_LEVEL = int(os.getenv("GZIP_COMPRESS_LEVEL", "5"))
+
+
+def _default(obj: Any) -> Any:
+    """Tipos que devuelven los drivers y que json/orjson no serializan solos"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "_mapping"):
+        # Record de databases
+        return dict(obj._mapping)
+    if hasattr(obj, "keys"):
+        # Record de asyncpg
+        return dict(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serializa a bytes JSON compactos, sin pasar por jsonable_encoder"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """
+    Respuesta JSON para páginas grandes armadas en Python: Decimal, datetime y
+    Records se codifican directamente, sin jsonable_encoder ni validación.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RawJSONResponse(Response):
+    """Respuesta con JSON ya generado (p. ej. por Postgres con json_agg): se envía tal cual"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return content.encode("utf-8")
@@ -0,0 +1,247 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from typing import Dict, Optional
+import logging
+import os
+
+from src.api.deadlines import get_route_deadline_stats
+from src.db import deadlines, instrumentation
+from src.services.single_flight import single_flight
+from src.services.audit import audit_writer
+from src.services import audit_chain, profiler, tracing
+from src.services.change_feed import change_feed
+from src.utils import logging_pipeline
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v2/debug", tags=["debug"])
+
+# ==================== AUTENTICACIÓN ====================
+
+def require_debug_token(x_debug_token: Optional[str] = Header(None)):
+    """Los endpoints de diagnóstico solo existen si DEBUG_TOKEN está configurado"""
+    expected = os.getenv("DEBUG_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_debug_token != expected:
+        raise HTTPException(status_code=401, detail="Token de diagnóstico inválido")
+
+# ==================== CONSULTAS LENTAS ====================
+
+@router.get("/slow-queries", dependencies=[Depends(require_debug_token)])
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=500),
+    top: int = Query(10, ge=1, le=100)
+) -> Dict:
+    """
+    Consultas que superaron el umbral (más recientes primero), con plan EXPLAIN
+    muestreado, y agregados por huella de SQL del intervalo de reporte actual.
+    """
+    return {
+        "threshold_ms": instrumentation.SLOW_QUERY_THRESHOLD_MS,
+        "explain_sample_rate": instrumentation.EXPLAIN_SAMPLE_RATE,
+        "slow_queries": instrumentation.get_slow_queries(limit),
+        "aggregates": instrumentation.get_query_aggregates(top)
+    }
+
+
+@router.delete("/slow-queries", dependencies=[Depends(require_debug_token)])
+async def reset_slow_queries() -> Dict:
+    """Vacía el buffer de consultas lentas y los agregados"""
+    instrumentation.reset_query_stats()
+    logger.info("Registro de consultas lentas reiniciado")
+    return {"status": "ok"}
+
+
+# ==================== COALESCENCIA DE LECTURAS ====================
+
+@router.get("/coalescing", dependencies=[Depends(require_debug_token)])
+async def get_coalescing_stats() -> Dict:
+    """
+    Contadores de single-flight por ruta: llamadas recibidas, consultas ejecutadas,
+    llamadas unidas a una en curso, aciertos stale y consultas a BD evitadas.
+    """
+    return single_flight.stats()
+
+
+@router.delete("/coalescing", dependencies=[Depends(require_debug_token)])
+async def reset_coalescing_stats() -> Dict:
+    """Reinicia los contadores y descarta los resultados stale retenidos"""
+    single_flight.reset()
+    logger.info("Contadores de coalescencia reiniciados")
+    return {"status": "ok"}
+
+
+# ==================== AUDITORÍA ====================
+
+@router.get("/audit-writer", dependencies=[Depends(require_debug_token)])
+async def get_audit_writer_stats() -> Dict:
+    """Buffer de auditoría: eventos pendientes, escritos, descartados y esperas por backpressure"""
+    return audit_writer.stats()
+
+
+@router.get("/audit-chain", dependencies=[Depends(require_debug_token)])
+async def verify_audit_chain(from_checkpoint: Optional[int] = Query(None, ge=0)) -> Dict:
+    """
+    Verificación incremental de la cadena de auditoría: checkpoints posteriores a
+    `from_checkpoint` (por defecto el último) y eventos aún sin checkpoint.
+    """
+    try:
+        return await audit_chain.verify_audit_chain(from_checkpoint)
+    except Exception as e:
+        logger.error(f"❌ Error verificando cadena de auditoría: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/audit-chain/checkpoint", dependencies=[Depends(require_debug_token)])
+async def create_audit_checkpoint() -> Dict:
+    """Fuerza un checkpoint firmado de las cabezas con eventos nuevos"""
+    try:
+        result = await audit_chain.create_checkpoint()
+        return result or {"checkpoint_id": None, "failures": []}
+    except Exception as e:
+        logger.error(f"❌ Error creando checkpoint de auditoría: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ==================== CHANGE FEED ====================
+
+@router.get("/change-feed", dependencies=[Depends(require_debug_token)])
+async def get_change_feed_stats() -> Dict:
+    """
+    Listener LISTEN/NOTIFY por base: conexión, último evento visto, eventos
+    recibidos y releídos tras reconectar, retraso de invalidación (p50/p95/p99)
+    y aciertos de la caché local.
+    """
+    return change_feed.stats()
+
+
+# ==================== PLAZOS POR RUTA ====================
+
+@router.get("/deadlines", dependencies=[Depends(require_debug_token)])
+async def get_deadline_stats() -> Dict:
+    """
+    Presupuesto de cada ruta con plazo y cuántas requests terminaron, vencieron
+    o se cancelaron por desconexión; contadores de consultas acotadas y de
+    cancelaciones por statement_timeout o espera local.
+    """
+    return {
+        "routes": get_route_deadline_stats(),
+        "queries": deadlines.get_deadline_stats()
+    }
+
+
+# ==================== LOGGING ====================
+
+@router.get("/logging", dependencies=[Depends(require_debug_token)])
+async def get_logging_stats() -> Dict:
+    """
+    Cola de logs: registros encolados, pendientes de escribir y descartados por
+    muestreo, límite por logger o cola llena (solo INFO/DEBUG).
+    """
+    return logging_pipeline.get_logging_stats()
+
+
+# ==================== TRAZAS ====================
+
+@router.get("/traces", dependencies=[Depends(require_debug_token)])
+async def get_traces(
+    limit: int = Query(50, ge=1, le=500),
+    min_ms: float = Query(0, ge=0, description="Solo trazas de al menos esta duración")
+) -> Dict:
+    """
+    Trazas retenidas (lentas o muestreadas), más recientes primero: duración
+    total, status HTTP y cantidad de spans. El árbol está en /traces/{trace_id}.
+    """
+    return {
+        **tracing.get_tracing_stats(),
+        "traces": tracing.get_traces(limit, min_ms)
+    }
+
+
+@router.get("/traces/{trace_id}", dependencies=[Depends(require_debug_token)])
+async def get_trace(
+    trace_id: str,
+    format: str = Query("tree", description="tree u otlp")
+) -> Dict:
+    """
+    Árbol de spans de una traza: handler, métodos de repositorio, espera por
+    conexión, sentencias SQL, nodos del grafo y firma. Con format=otlp se
+    devuelve como ExportTraceServiceRequest JSON.
+    """
+    if format not in ("tree", "otlp"):
+        raise HTTPException(status_code=400, detail="Formato inválido. Debe ser: ['tree', 'otlp']")
+    if format == "otlp":
+        trace = tracing.find_trace(trace_id)
+        if trace is None:
+            raise HTTPException(status_code=404, detail=f"Traza '{trace_id}' no encontrada")
+        return tracing.to_otlp([trace])
+    tree = tracing.get_trace(trace_id)
+    if tree is None:
+        raise HTTPException(status_code=404, detail=f"Traza '{trace_id}' no encontrada")
+    return tree
+
+
+@router.post("/traces/export", dependencies=[Depends(require_debug_token)])
+async def export_traces() -> Dict:
+    """Agrega el buffer completo como una línea OTLP/JSON al archivo de exportación"""
+    path = tracing.TRACE_EXPORT_FILE or tracing.DEFAULT_EXPORT_FILE
+    exported = tracing.export_traces(path)
+    logger.info(f"{exported} trazas exportadas a {path}")
+    return {"status": "ok", "path": path, "exported": exported}
+
+
+@router.delete("/traces", dependencies=[Depends(require_debug_token)])
+async def reset_traces() -> Dict:
+    """Descarta las trazas retenidas"""
+    tracing.reset_traces()
+    return {"status": "ok"}
+
+
+# ==================== PERFILADO ====================
+
+@router.get("/profile", dependencies=[Depends(require_debug_token)])
+async def get_profile(
+    seconds: float = Query(30, gt=0, le=profiler.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(profiler.PROFILE_INTERVAL_MS, ge=1, le=1000),
+    top: int = Query(30, ge=1, le=200),
+    include_idle: bool = Query(False, description="Incluir hilos esperando IO, locks o colas"),
+    format: str = Query("json", description="json o collapsed (texto para flamegraph.pl / speedscope)")
+):
+    """
+    Muestrea las pilas de todos los hilos (event loop incluido) durante la
+    ventana pedida y responde pilas colapsadas y las funciones con más muestras.
+    Uno a la vez por instancia; sin perfilado en curso no hay costo.
+    """
+    if format not in ("json", "collapsed"):
+        raise HTTPException(status_code=400, detail="Formato inválido. Debe ser: ['json', 'collapsed']")
+    try:
+        result = await profiler.sample_profile(seconds, interval_ms, top, include_idle)
+    except profiler.ProfileInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Perfilado terminado: {result['samples']} muestras en {result['seconds']}s")
+    if format == "collapsed":
+        return PlainTextResponse("\n".join(result["collapsed"]) + "\n")
+    return result
+
+
+@router.get("/loop-lag", dependencies=[Depends(require_debug_token)])
+async def get_loop_lag() -> Dict:
+    """Lag del event loop (p50/p99/máx) y bloqueos sobre el umbral con la pila capturada"""
+    return profiler.loop_lag_monitor.stats()
+
+
+@router.post("/loop-lag", dependencies=[Depends(require_debug_token)])
+async def start_loop_lag(
+    seconds: float = Query(300, ge=0, description="Duración; 0 = hasta detenerlo")
+) -> Dict:
+    """Activa el monitor de lag del event loop por una ventana"""
+    profiler.loop_lag_monitor.start(seconds or None)
+    return {"status": "ok", "running": profiler.loop_lag_monitor.running, "seconds": seconds or None}
+
+
+@router.delete("/loop-lag", dependencies=[Depends(require_debug_token)])
+async def stop_loop_lag() -> Dict:
+    """Detiene el monitor de lag del event loop"""
+    await profiler.loop_lag_monitor.stop()
+    return {"status": "ok"}
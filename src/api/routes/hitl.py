@@ -3,8 +3,12 @@ from pydantic import BaseModel
 from typing import Dict, Optional
 import logging
 
+from src.api.deadlines import with_deadline
+from src.api.responses import FastJSONResponse
 from src.db.database import is_connected
 from src.db.repositories.hitl_repository import HITLRepository
+from src.db.sharding import ShardSlotMovingError
+from src.services.single_flight import single_flight, flight_key
 
 logger = logging.getLogger(__name__)
 
@@ -20,9 +24,11 @@ class HITLDecisionRequest(BaseModel):
 # ==================== ENDPOINTS ====================
 
 @router.get("/cases/pending")
+@with_deadline("hitl_pending", 3)
 async def get_pending_cases(
     limit: int = Query(50, ge=1, le=100),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    proveedor_rut: Optional[str] = Query(None, description="Filtrar por RUT del proveedor")
 ) -> Dict:
     """
     Obtiene casos que requieren revisión humana.
@@ -33,31 +39,40 @@ async def get_pending_cases(
             raise HTTPException(status_code=503, detail="Base de datos no disponible")
         
         repo = HITLRepository()
-        result = await repo.get_pending_hitl_cases(limit=limit, offset=offset)
+        result = await repo.get_pending_hitl_cases(
+            limit=limit, offset=offset, proveedor_rut=proveedor_rut
+        )
         
-        logger.info(f"Casos HITL pendientes consultados: {result['count']} de {result['total']}")
+        logger.info("Casos HITL pendientes consultados: %s de %s", result['count'], result['total'])
         return result
         
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Error obteniendo casos HITL: {e}")
+        logger.error("Error obteniendo casos HITL: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/cases/{request_id}")
-async def get_case_detail(request_id: str) -> Dict:
+async def get_case_detail(
+    request_id: str,
+    proof: bool = Query(False, description="Incluir prueba de integridad de la cadena de auditoría")
+) -> Dict:
     """
     Obtiene detalle completo de un caso HITL incluyendo:
     - Información del proveedor
     - Razón de escalamiento
     - Nivel de riesgo
-    - Audit trail
+    - Audit trail (y, con ?proof=true, su prueba contra el último checkpoint firmado)
     """
     try:
         if not is_connected():
             raise HTTPException(status_code=503, detail="Base de datos no disponible")
         
         repo = HITLRepository()
-        case = await repo.get_hitl_case_detail(request_id)
+        case = await repo.get_hitl_case_detail(request_id, include_proof=proof)
         
         if not case:
             raise HTTPException(
@@ -65,12 +80,12 @@ async def get_case_detail(request_id: str) -> Dict:
                 detail=f"Caso HITL {request_id} no encontrado"
             )
         
-        return case
+        return FastJSONResponse(case)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error obteniendo detalle de caso {request_id}: {e}")
+        logger.error("Error obteniendo detalle de caso %s: %s", request_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -96,13 +111,15 @@ async def submit_decision(request_id: str, decision_data: HITLDecisionRequest) -
             notes=decision_data.notes
         )
         
-        logger.info(f"Decisión HITL registrada: {request_id} - {decision_data.decision}")
+        logger.info("Decisión HITL registrada: %s - %s", request_id, decision_data.decision)
         return result
         
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except ShardSlotMovingError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
-        logger.error(f"Error registrando decisión HITL: {e}")
+        logger.error("Error registrando decisión HITL: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -120,12 +137,12 @@ async def get_statistics() -> Dict:
             raise HTTPException(status_code=503, detail="Base de datos no disponible")
         
         repo = HITLRepository()
-        stats = await repo.get_hitl_statistics()
+        stats = await single_flight.do(flight_key("hitl_statistics"), repo.get_hitl_statistics)
         
         return stats
         
     except Exception as e:
-        logger.error(f"Error obteniendo estadísticas HITL: {e}")
+        logger.error("Error obteniendo estadísticas HITL: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -0,0 +1,190 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import Dict
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime
+
+from src.api.routes.debug import require_debug_token
+from src.db.database import is_connected, shards
+from src.db.bulk_import import BulkImporter, FORMATS, IMPORTS_DIR, rows_per_second
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v2/imports", tags=["imports"])
+
+# Tope del cuerpo de POST /api/v2/imports; los dumps más grandes se cargan con la CLI
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(2 * 1024 ** 3)))
+# Los chunks del cuerpo se agrupan hasta este tamaño antes de cada escritura
+UPLOAD_WRITE_BYTES = 1024 * 1024
+
+_tasks: Dict[str, asyncio.Task] = {}
+
+
+def _require_single_shard():
+    """
+    La importación fusiona cada lote en una sola base, en la misma transacción
+    que avanza byte_offset; con shards las filas deben ir al shard de su RUT.
+    """
+    if shards.enabled:
+        raise HTTPException(
+            status_code=409,
+            detail="Importación masiva no disponible con DATABASE_SHARD_URLS: las filas deben ir al shard de su RUT"
+        )
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"El cuerpo excede {IMPORT_MAX_BYTES} bytes")
+
+
+async def _receive_upload(request: Request, path) -> int:
+    """Escribe el cuerpo en `path` sin bloquear el event loop; borra el archivo si falla"""
+    if int(request.headers.get("content-length") or 0) > IMPORT_MAX_BYTES:
+        raise _too_large()
+
+    size = 0
+    pending = bytearray()
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > IMPORT_MAX_BYTES:
+                raise _too_large()
+            pending += chunk
+            if len(pending) >= UPLOAD_WRITE_BYTES:
+                await asyncio.to_thread(f.write, bytes(pending))
+                pending.clear()
+        if pending:
+            await asyncio.to_thread(f.write, bytes(pending))
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        os.remove(path)
+        raise
+    await asyncio.to_thread(f.close)
+    return size
+
+
+async def _run_import(job_id: str, create: Dict = None):
+    from src.db.database import database
+
+    try:
+        async with database.connection() as connection:
+            conn = connection.raw_connection
+            if create:
+                importer = await BulkImporter.create(conn, job_id=job_id, **create)
+            else:
+                importer = await BulkImporter.resume(conn, job_id)
+            await importer.run()
+    except Exception as e:
+        # El error y el último byte_offset confirmado quedan en import_jobs
+        logger.error(f"❌ Importación {job_id} falló: {e}")
+    finally:
+        _tasks.pop(job_id, None)
+
+
+@router.post("", status_code=202, dependencies=[Depends(require_debug_token)])
+async def start_import(
+    request: Request,
+    format: str = Query("csv", description="csv o ndjson"),
+    enqueue: bool = Query(False, description="Encolar las filas nuevas para el workflow Art. 17")
+):
+    """Recibe el dump en el cuerpo (stream a disco, hasta IMPORT_MAX_BYTES) e inicia la importación en segundo plano"""
+    if not is_connected():
+        raise HTTPException(status_code=503, detail="Database not connected")
+    _require_single_shard()
+
+    try:
+        if format not in FORMATS:
+            raise ValueError(f"Formato inválido. Debe ser: {list(FORMATS)}")
+
+        job_id = f"import-{datetime.utcnow():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+        IMPORTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = IMPORTS_DIR / f"{job_id}.{format}"
+        size = await _receive_upload(request, path)
+        if size == 0:
+            os.remove(path)
+            raise ValueError("Cuerpo vacío")
+
+        _tasks[job_id] = asyncio.create_task(_run_import(job_id, {
+            "source": str(path), "fmt": format, "enqueue": enqueue
+        }))
+        logger.info(f"📥 Importación {job_id} recibida ({size} bytes)")
+        return {"job_id": job_id, "status": "running", "file_size": size}
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ Error starting import: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{job_id}", dependencies=[Depends(require_debug_token)])
+async def get_import(job_id: str, rejects: int = Query(50, ge=0, le=1000)):
+    """Progreso de la importación, filas/segundo y las primeras filas rechazadas"""
+    from src.db.database import database
+
+    if not is_connected():
+        raise HTTPException(status_code=503, detail="Database not connected")
+
+    try:
+        row = await database.fetch_one(
+            "SELECT * FROM import_jobs WHERE job_id = :job_id", values={"job_id": job_id}
+        )
+        if row is None:
+            raise HTTPException(status_code=404, detail=f"Import {job_id} not found")
+
+        job = dict(row)
+        if job["status"] == "running" and job_id not in _tasks:
+            job["status"] = "interrupted"
+        job["rows_per_second"] = round(rows_per_second(job), 1)
+        job["progress"] = round(job["byte_offset"] / job["file_size"], 4) if job["file_size"] else None
+        job["rejects"] = [dict(r) for r in await database.fetch_all(
+            """
+            SELECT byte_offset, error, raw FROM import_rejects
+            WHERE job_id = :job_id ORDER BY byte_offset LIMIT :limit
+            """,
+            values={"job_id": job_id, "limit": rejects}
+        )]
+        return job
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error getting import {job_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/{job_id}/resume", status_code=202, dependencies=[Depends(require_debug_token)])
+async def resume_import(job_id: str):
+    """Continúa una importación interrumpida desde su último lote confirmado"""
+    from src.db.database import database
+
+    if not is_connected():
+        raise HTTPException(status_code=503, detail="Database not connected")
+
+    _require_single_shard()
+
+    try:
+        if job_id in _tasks:
+            raise HTTPException(status_code=409, detail="La importación ya está en ejecución")
+        row = await database.fetch_one(
+            "SELECT status, byte_offset FROM import_jobs WHERE job_id = :job_id", values={"job_id": job_id}
+        )
+        if row is None:
+            raise HTTPException(status_code=404, detail=f"Import {job_id} not found")
+        if row["status"] == "completed":
+            raise ValueError(f"Importación {job_id} ya completada")
+
+        _tasks[job_id] = asyncio.create_task(_run_import(job_id))
+        return {"job_id": job_id, "status": "running", "byte_offset": row["byte_offset"]}
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ Error resuming import {job_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
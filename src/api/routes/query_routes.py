@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from typing import Dict
 import logging
 
+from src.api.deadlines import with_deadline
+from src.api.responses import FastJSONResponse, RawJSONResponse
 from src.db.database import db, is_connected
 from src.db.repositories.art17_repository import Art17Repository
+from src.db.repositories.certificate_read_model_repository import CertificateReadModelRepository
+from src.services.verification_snapshot import verification_snapshot, FOUND as SNAPSHOT_FOUND, ABSENT as SNAPSHOT_ABSENT
 
 logger = logging.getLogger(__name__)
 
@@ -74,13 +78,13 @@ async def get_workflow(request_id: str) -> Dict:
                 "hash_final": workflow['hash_final']
             }
         
-        logger.info(f"Workflow {request_id} consultado exitosamente")
+        logger.info("Workflow %s consultado exitosamente", request_id)
         return response
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error al consultar workflow {request_id}: {e}")
+        logger.error("Error al consultar workflow %s: %s", request_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -90,6 +94,7 @@ async def get_workflow(request_id: str) -> Dict:
 async def get_certificate(certificado_id: str) -> Dict:
     """
     Obtiene información completa de un certificado por su ID
+    (lectura por clave primaria del modelo de lectura)
     """
     try:
         if not is_connected():
@@ -98,46 +103,22 @@ async def get_certificate(certificado_id: str) -> Dict:
                 detail="Base de datos no disponible"
             )
         
-        repo = Art17Repository()
-        cert = await repo.get_certificate_by_id(certificado_id)
+        repo = CertificateReadModelRepository()
+        body = await repo.get_document(certificado_id, "certificado")
         
-        if not cert:
+        if body is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"Certificado '{certificado_id}' no encontrado"
             )
         
-        response = {
-            "certificado_id": cert['certificado_id'],
-            "request_id": cert['request_id'],
-            "issued_at": str(cert['issued_at']),
-            "hash_final": cert['hash_final'],
-            "proveedor": {
-                "rut": cert['proveedor_rut'],
-                "nombre": cert['proveedor_nombre']
-            },
-            "contrato": {
-                "monto": float(cert['monto_contrato']) if cert['monto_contrato'] else None,
-                "objeto": cert['objeto_contrato']
-            },
-            "evaluacion": {
-                "nivel_riesgo": cert['riesgo'],
-                "cumplimiento": bool(cert['cumplimiento']),
-                "workflow_type": cert['workflow_type']
-            },
-            "verificacion": {
-                "url": f"/api/v2/certificates/{certificado_id}/verify",
-                "metodo": "GET"
-            }
-        }
-        
-        logger.info(f"Certificado {certificado_id} consultado exitosamente")
-        return response
+        logger.info("Certificado %s consultado exitosamente", certificado_id)
+        return RawJSONResponse(body)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error al consultar certificado {certificado_id}: {e}")
+        logger.error("Error al consultar certificado %s: %s", certificado_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -146,53 +127,59 @@ async def get_certificate(certificado_id: str) -> Dict:
 @router.get("/certificates/{certificado_id}/verify")
 async def verify_certificate(certificado_id: str) -> Dict:
     """
-    Verifica la integridad y validez de un certificado
+    Verifica la integridad y validez de un certificado: coincidencia del hash
+    final, cadena de hashes completa y decisión HITL.
+    
+    Responde primero desde el snapshot local (Bloom + mmap), sin tocar
+    Postgres; solo los IDs más recientes que el snapshot consultan la BD.
     """
     try:
+        status, body = verification_snapshot.lookup(certificado_id)
+        if status == SNAPSHOT_FOUND:
+            return RawJSONResponse(body)
+        if status == SNAPSHOT_ABSENT:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Certificado '{certificado_id}' no encontrado"
+            )
+        
         if not is_connected():
             raise HTTPException(
                 status_code=503,
                 detail="Base de datos no disponible"
             )
         
-        repo = Art17Repository()
-        verification = await repo.verify_certificate_integrity(certificado_id)
+        repo = CertificateReadModelRepository()
+        body = await repo.get_document(certificado_id, "verificacion")
         
-        if not verification['exists']:
+        if body is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"Certificado '{certificado_id}' no encontrado"
             )
         
-        if verification['valid']:
-            verification['confianza'] = "ALTA"
-            verification['mensaje'] = "✅ Certificado válido e íntegro"
-        else:
-            verification['confianza'] = "BAJA"
-            verification['mensaje'] = "⚠️ Certificado con problemas de integridad"
-        
-        if not verification.get('hash_match', False):
-            verification['advertencia'] = "El hash del certificado no coincide con el hash final del workflow"
-        
-        if not verification.get('chain_complete', False):
-            verification['advertencia'] = "La cadena de hashes está incompleta"
-        
-        logger.info(f"Verificación de certificado {certificado_id}: {'VÁLIDO' if verification['valid'] else 'INVÁLIDO'}")
-        return verification
+        logger.info("Verificación de certificado %s consultada", certificado_id)
+        return RawJSONResponse(body)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error al verificar certificado {certificado_id}: {e}")
+        logger.error("Error al verificar certificado %s: %s", certificado_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ==================== ENDPOINT 4: TRAIL DE AUDITORÍA ====================
 
 @router.get("/audit/trail/{request_id}")
-async def get_audit_trail(request_id: str) -> Dict:
+@with_deadline("audit_trail", 5)
+async def get_audit_trail(
+    request_id: str,
+    proof: bool = Query(False, description="Incluir prueba de integridad de la cadena de auditoría")
+) -> Dict:
     """
-    Obtiene el trail completo de auditoría para una solicitud
+    Obtiene el trail completo de auditoría para una solicitud. Con ?proof=true
+    incluye la cadena de eventos recalculada y el camino Merkle al último
+    checkpoint firmado que la cubre.
     """
     try:
         if not is_connected():
@@ -202,7 +189,7 @@ async def get_audit_trail(request_id: str) -> Dict:
             )
         
         repo = Art17Repository()
-        trail = await repo.get_audit_trail(request_id)
+        trail = await repo.get_audit_trail(request_id, include_proof=proof)
         
         if not trail['exists']:
             raise HTTPException(
@@ -224,13 +211,13 @@ async def get_audit_trail(request_id: str) -> Dict:
             "cadena_intacta": len(all_hashes) > 0
         }
         
-        logger.info(f"Audit trail de {request_id} generado exitosamente")
-        return trail
+        logger.info("Audit trail de %s generado exitosamente", request_id)
+        return FastJSONResponse(trail)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error al generar audit trail de {request_id}: {e}")
+        logger.error("Error al generar audit trail de %s: %s", request_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
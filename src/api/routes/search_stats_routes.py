@@ -1,9 +1,26 @@
 from fastapi import APIRouter, HTTPException, Query
 from typing import Dict, Optional
+from datetime import datetime, timedelta, timezone
 import logging
 
+from src.api.deadlines import with_deadline
+from src.api.responses import RawJSONResponse
 from src.db.database import db, is_connected
 from src.db.repositories.art17_repository import Art17Repository
+from src.db.repositories.stats_repository import StatsRepository, TIMESERIES_BUCKETS
+from src.services.single_flight import single_flight, flight_key
+from src.utils.rut import try_normalize_rut
+
+# Máximo de puntos por serie, para acotar la respuesta con bucket=hour
+MAX_TIMESERIES_POINTS = 2000
+BUCKET_SECONDS = {"hour": 3600, "day": 86400, "week": 7 * 86400, "month": 28 * 86400}
+
+
+def _as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Las columnas son TIMESTAMP sin zona (UTC): descarta la zona tras convertir"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +29,7 @@ router = APIRouter(prefix="/api/v2", tags=["search-stats"])
 # ==================== ENDPOINT 1: PERFIL DE PROVEEDOR ====================
 
 @router.get("/proveedores/{rut}/profile")
+@with_deadline("profile", 3)
 async def get_proveedor_profile(rut: str) -> Dict:
     """
     Obtiene perfil completo de un proveedor incluyendo:
@@ -29,7 +47,9 @@ async def get_proveedor_profile(rut: str) -> Dict:
             )
         
         repo = Art17Repository()
-        profile = await repo.get_proveedor_profile(rut)
+        # Clave por RUT normalizado: '12.345.678-5' y '12345678-5' comparten la consulta
+        key = flight_key("proveedor_profile", rut=try_normalize_rut(rut) or rut)
+        profile = await single_flight.do(key, lambda: repo.get_proveedor_profile(rut))
         
         if not profile['exists']:
             raise HTTPException(
@@ -37,19 +57,22 @@ async def get_proveedor_profile(rut: str) -> Dict:
                 detail=f"Proveedor con RUT '{rut}' no encontrado"
             )
         
-        logger.info(f"Perfil de proveedor {rut} consultado exitosamente")
+        logger.info("Perfil de proveedor %s consultado exitosamente", rut)
         return profile
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Error al consultar perfil de proveedor {rut}: {e}")
+        logger.error("Error al consultar perfil de proveedor %s: %s", rut, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ==================== ENDPOINT 2: BÚSQUEDA AVANZADA ====================
 
 @router.get("/workflows/art17/search")
+@with_deadline("search", 5)
 async def search_workflows(
     query: Optional[str] = Query(None, description="Texto a buscar en RUT, nombre, objeto"),
     status: Optional[str] = Query(None, description="Estado: completed, processing, failed"),
@@ -59,7 +82,8 @@ async def search_workflows(
     fecha_desde: Optional[str] = Query(None, description="Fecha desde (YYYY-MM-DD)"),
     fecha_hasta: Optional[str] = Query(None, description="Fecha hasta (YYYY-MM-DD)"),
     limit: int = Query(50, ge=1, le=100, description="Límite de resultados"),
-    offset: int = Query(0, ge=0, description="Offset para paginación")
+    offset: int = Query(0, ge=0, description="Offset para paginación"),
+    facets: bool = Query(False, description="Incluir conteos por estado, riesgo y banda de monto")
 ) -> Dict:
     """
     Búsqueda avanzada de workflows con múltiples filtros:
@@ -70,6 +94,7 @@ async def search_workflows(
     - **monto_min/monto_max**: Rango de montos
     - **fecha_desde/fecha_hasta**: Rango de fechas
     - **limit/offset**: Paginación
+    - **facets**: Conteos del conjunto filtrado por estado, nivel de riesgo y banda de monto
     
     Ejemplo:
     `/api/v2/workflows/art17/search?riesgo=BAJO&monto_min=10000000&limit=20`
@@ -82,7 +107,8 @@ async def search_workflows(
             )
         
         repo = Art17Repository()
-        results = await repo.search_workflows(
+        # Postgres arma el JSON de la página: los bytes pasan sin re-serializar
+        results = await repo.search_workflows_json(
             query=query,
             status=status,
             riesgo=riesgo,
@@ -91,22 +117,26 @@ async def search_workflows(
             fecha_desde=fecha_desde,
             fecha_hasta=fecha_hasta,
             limit=limit,
-            offset=offset
+            offset=offset,
+            facets=facets
         )
         
-        logger.info(f"Búsqueda ejecutada: {results['count']} resultados de {results['total']} totales")
-        return results
+        logger.info("Búsqueda ejecutada: %s resultados de %s totales", results['count'], results['total'])
+        return RawJSONResponse(results["body"])
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Error en búsqueda de workflows: {e}")
+        logger.error("Error en búsqueda de workflows: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ==================== ENDPOINT 3: ESTADÍSTICAS GENERALES ====================
 
 @router.get("/workflows/art17/stats/summary")
+@with_deadline("stats_summary", 5)
 async def get_statistics_summary() -> Dict:
     """
     Obtiene estadísticas generales del sistema:
@@ -129,7 +159,9 @@ async def get_statistics_summary() -> Dict:
             )
         
         repo = Art17Repository()
-        summary = await repo.get_statistics_summary()
+        summary = await single_flight.do(
+            flight_key("stats_summary"), repo.get_statistics_summary
+        )
         
         logger.info("Estadísticas generales consultadas exitosamente")
         return summary
@@ -137,7 +169,63 @@ async def get_statistics_summary() -> Dict:
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error al obtener estadísticas: {e}")
+        logger.error("Error al obtener estadísticas: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ==================== ENDPOINT 4: SERIES DE TIEMPO ====================
+
+@router.get("/workflows/art17/stats/timeseries")
+@with_deadline("timeseries", 5)
+async def get_statistics_timeseries(
+    bucket: str = Query("day", description="Granularidad: hour, day, week, month"),
+    desde: Optional[datetime] = Query(None, alias="from", description="Inicio (ISO 8601), por defecto hace 30 días"),
+    hasta: Optional[datetime] = Query(None, alias="to", description="Fin exclusivo (ISO 8601), por defecto ahora")
+) -> Dict:
+    """
+    Series de tiempo para dashboards, leídas desde los rollups por hora/día:
+    
+    - Solicitudes y certificados emitidos por bucket
+    - Mezcla de riesgo (bajo/medio/alto)
+    - Casos HITL abiertos, resueltos y backlog acumulado
+    
+    Ejemplo:
+    `/api/v2/workflows/art17/stats/timeseries?bucket=week&from=2024-01-01`
+    """
+    try:
+        if not is_connected():
+            raise HTTPException(
+                status_code=503,
+                detail="Base de datos no disponible"
+            )
+        
+        if bucket not in TIMESERIES_BUCKETS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Bucket inválido. Debe ser: {list(TIMESERIES_BUCKETS)}"
+            )
+        
+        hasta = _as_naive_utc(hasta) or datetime.utcnow()
+        desde = _as_naive_utc(desde) or hasta - timedelta(days=30)
+        if desde >= hasta:
+            raise HTTPException(status_code=400, detail="'from' debe ser anterior a 'to'")
+        
+        if (hasta - desde).total_seconds() / BUCKET_SECONDS[bucket] > MAX_TIMESERIES_POINTS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Rango demasiado amplio para bucket={bucket} (máx. {MAX_TIMESERIES_POINTS} puntos)"
+            )
+        
+        repo = StatsRepository()
+        series = await repo.get_timeseries(bucket, desde, hasta)
+        
+        logger.info("Serie de tiempo consultada: bucket=%s, %s puntos", bucket, series['count'])
+        return series
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error al obtener serie de tiempo: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -153,7 +241,8 @@ async def health_check() -> Dict:
         "endpoints": {
             "proveedor_profile": "/api/v2/proveedores/{rut}/profile",
             "search": "/api/v2/workflows/art17/search",
-            "statistics": "/api/v2/workflows/art17/stats/summary"
+            "statistics": "/api/v2/workflows/art17/stats/summary",
+            "timeseries": "/api/v2/workflows/art17/stats/timeseries"
         },
         "version": "2.0-fase2a"
     }
@@ -0,0 +1,118 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Dict, Optional
+import asyncio
+import json
+import logging
+
+from src.api.routes.debug import require_debug_token
+from src.db.database import is_connected
+from src.services.bulk_verification import BulkVerificationJob, JOB_ID_RE, database_page_reader
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v2/verification", tags=["verification"])
+
+_jobs: Dict[str, BulkVerificationJob] = {}
+_tasks: Dict[str, asyncio.Task] = {}
+
+
+class BulkVerificationRequest(BaseModel):
+    desde: Optional[datetime] = None
+    hasta: Optional[datetime] = None
+    resume_job_id: Optional[str] = None
+    workers: Optional[int] = None
+
+
+async def _run_job(job: BulkVerificationJob):
+    from src.db.database import read_database
+
+    try:
+        # Tramos paginados por id desde réplicas: sin conexión ni transacción tomadas del primario
+        await job.run(database_page_reader(read_database))
+    except Exception as e:
+        # run() ya marca el job; esto cubre fallas previas. El checkpoint permite continuar
+        if job.error is None:
+            job.status = "failed"
+            job.error = str(e)
+        logger.error(f"❌ Re-verificación {job.job_id} terminó con error: {e}", exc_info=True)
+    finally:
+        _tasks.pop(job.job_id, None)
+
+
+def _read_failures(job: BulkVerificationJob, limit: int):
+    path = job.failures_path
+    if not path.exists():
+        return []
+    failures = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if len(failures) >= limit:
+                break
+            failures.append(json.loads(line))
+    return failures
+
+
+@router.post("/bulk", status_code=202, dependencies=[Depends(require_debug_token)])
+async def start_bulk_verification(payload: BulkVerificationRequest):
+    """Inicia (o continúa desde su checkpoint) una re-verificación masiva en segundo plano"""
+    if not is_connected():
+        raise HTTPException(status_code=503, detail="Database not connected")
+
+    try:
+        options = {"workers": payload.workers} if payload.workers else {}
+        if payload.resume_job_id:
+            if not JOB_ID_RE.match(payload.resume_job_id):
+                raise ValueError("job_id inválido")
+            if payload.resume_job_id in _tasks:
+                raise HTTPException(status_code=409, detail="El job ya está en ejecución")
+            job = BulkVerificationJob.resume(payload.resume_job_id, **options)
+        else:
+            if not payload.desde or not payload.hasta:
+                raise ValueError("desde y hasta son obligatorios")
+            if payload.desde >= payload.hasta:
+                raise ValueError("desde debe ser anterior a hasta")
+            job = BulkVerificationJob(payload.desde, payload.hasta, **options)
+
+        _jobs[job.job_id] = job
+        _tasks[job.job_id] = asyncio.create_task(_run_job(job))
+        logger.info(f"🔎 Re-verificación masiva iniciada: {job.job_id}")
+        return job.progress()
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ Error starting bulk verification: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/bulk/{job_id}", dependencies=[Depends(require_debug_token)])
+async def get_bulk_verification(job_id: str, failures: int = Query(50, ge=0, le=1000)):
+    """Progreso del job; al terminar incluye el reporte firmado y las primeras fallas"""
+    try:
+        if not JOB_ID_RE.match(job_id):
+            raise HTTPException(status_code=400, detail="job_id inválido")
+        job = _jobs.get(job_id)
+        if job is None:
+            # Jobs de ejecuciones anteriores del proceso: solo lo persistido en disco
+            try:
+                job = BulkVerificationJob.resume(job_id)
+            except ValueError:
+                raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+            job.status = "completed" if job.report_path.exists() else "interrupted"
+
+        result = job.progress()
+        if job.report_path.exists():
+            with open(job.report_path, encoding="utf-8") as f:
+                result["report"] = json.load(f)
+        result["failures"] = _read_failures(job, failures)
+        return result
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error getting bulk verification {job_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
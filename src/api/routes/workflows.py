@@ -1,12 +1,14 @@
-from fastapi import APIRouter
-from src.workflows.art17.flow import run_art17_workflow
+from fastapi import APIRouter, HTTPException
+from src.workflows.art17.flow import run_art17_workflow, WorkflowInProgressError
+from src.db.sharding import ShardSlotMovingError
 from pydantic import BaseModel
 from typing import Optional
 
 router = APIRouter()
 
 class Art17Input(BaseModel):
-    request_id: str
+    # Opcional: si falta se genera uno que lleva el shard del proveedor
+    request_id: Optional[str] = None
     proveedor_rut: str
     proveedor_nombre: Optional[str] = None
     monto_contrato: Optional[float] = None
@@ -24,7 +26,14 @@ async def workflows_root():
 
 @router.post("/art17/run")
 async def run_art17(payload: Art17Input):
-    result = await run_art17_workflow(payload.dict())
+    try:
+        result = await run_art17_workflow(payload.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except WorkflowInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+    except ShardSlotMovingError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
     return {
         "status": "ok",
         "workflow": "art17",
@@ -0,0 +1,86 @@
+import asyncio
+import os
+from databases import Database
+
+from src.utils.rut import try_normalize_rut, format_rut
+
+BATCH_SIZE = int(os.getenv("RUT_BACKFILL_BATCH_SIZE", "1000"))
+
+TABLES = ["requests", "workflow_executions"]
+
+
+async def backfill_table(db: Database, table: str, batch_size: int = BATCH_SIZE):
+    """Rellena proveedor_rut_num/dv por lotes de ids, sin bloquear la tabla completa"""
+    last_id = 0
+    updated = 0
+    invalid = 0
+
+    while True:
+        rows = await db.fetch_all(
+            query=f"""
+                SELECT id, proveedor_rut
+                FROM {table}
+                WHERE id > :last_id AND proveedor_rut_num IS NULL
+                ORDER BY id
+                LIMIT :batch_size
+            """,
+            values={"last_id": last_id, "batch_size": batch_size}
+        )
+        if not rows:
+            break
+
+        last_id = rows[-1]["id"]
+        batch = []
+        for row in rows:
+            normalized = try_normalize_rut(row["proveedor_rut"])
+            if normalized is None:
+                invalid += 1
+                print(f"  ⚠️  {table}.id={row['id']}: RUT inválido '{row['proveedor_rut']}'")
+                continue
+            body, dv = normalized
+            batch.append({
+                "id": row["id"],
+                "rut": format_rut(body, dv),
+                "rut_num": body,
+                "rut_dv": dv
+            })
+
+        if batch:
+            async with db.transaction():
+                await db.execute_many(
+                    query=f"""
+                        UPDATE {table}
+                        SET proveedor_rut = :rut,
+                            proveedor_rut_num = :rut_num,
+                            proveedor_rut_dv = :rut_dv
+                        WHERE id = :id
+                    """,
+                    values=batch
+                )
+            updated += len(batch)
+
+        print(f"  ✅ {table}: {updated} filas normalizadas (último id {last_id})")
+
+    return updated, invalid
+
+
+async def backfill_rut():
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL not set")
+        return
+
+    db = Database(database_url)
+    await db.connect()
+    print("✅ Connected to database")
+
+    for table in TABLES:
+        print(f"📋 Backfill RUT normalizado: {table}")
+        updated, invalid = await backfill_table(db, table)
+        print(f"  📊 {table}: {updated} actualizadas, {invalid} inválidas")
+
+    await db.disconnect()
+    print("✅ Backfill completed")
+
+if __name__ == "__main__":
+    asyncio.run(backfill_rut())
@@ -0,0 +1,399 @@
+"""
+Importación masiva de contratos desde dumps de compras públicas (CSV o NDJSON).
+
+    python -m src.db.bulk_import contratos.csv [--format csv|ndjson] [--enqueue]
+    python -m src.db.bulk_import --resume <job_id>
+
+El archivo se recorre como stream (memoria constante). Cada lote se valida y
+normaliza en Python, se carga con COPY a una tabla temporal y se fusiona en
+requests con un único INSERT ... ON CONFLICT; en la misma transacción se
+registran los rechazos y se avanza byte_offset en import_jobs, así que tras una
+caída la importación continúa desde el último lote confirmado.
+
+Con DATABASE_SHARD_URLS no está disponible (la API responde 409): cada fila
+debería fusionarse en el shard de su RUT y el avance vive en una sola base.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.utils.rut import normalize_rut, format_rut
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "5000"))
+IMPORTS_DIR = Path(os.getenv("IMPORTS_DIR", "imports"))
+FORMATS = ("csv", "ndjson")
+
+# Nombres de columna habituales en los dumps -> campo de requests
+FIELD_ALIASES = {
+    "request_id": ["request_id", "codigo", "codigo_contrato", "id_contrato", "id"],
+    "proveedor_rut": ["proveedor_rut", "rut_proveedor", "rut"],
+    "proveedor_nombre": ["proveedor_nombre", "nombre_proveedor", "proveedor", "razon_social"],
+    "monto_contrato": ["monto_contrato", "monto", "monto_total"],
+    "objeto_contrato": ["objeto_contrato", "objeto", "descripcion", "nombre_contrato"],
+}
+
+MAX_MONTO = Decimal("9999999999999.99")  # DECIMAL(15, 2)
+
+STAGING_COLUMNS = [
+    "byte_offset", "request_id", "proveedor_rut", "proveedor_rut_num", "proveedor_rut_dv",
+    "proveedor_nombre", "monto_contrato", "objeto_contrato",
+]
+
+STAGING_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS requests_import_staging (
+        byte_offset BIGINT NOT NULL,
+        request_id VARCHAR(100) NOT NULL,
+        proveedor_rut VARCHAR(20) NOT NULL,
+        proveedor_rut_num INTEGER NOT NULL,
+        proveedor_rut_dv CHAR(1) NOT NULL,
+        proveedor_nombre VARCHAR(255),
+        monto_contrato DECIMAL(15, 2),
+        objeto_contrato TEXT
+    ) ON COMMIT DELETE ROWS
+"""
+
+# Fusión por conjuntos: la última aparición de cada request_id en el lote gana;
+# las solicitudes ya procesadas no se tocan (su cadena de hashes depende de estos datos)
+MERGE_SQL = """
+    WITH lote AS (
+        SELECT DISTINCT ON (request_id) *
+        FROM requests_import_staging
+        ORDER BY request_id, byte_offset DESC
+    ),
+    fusion AS (
+        INSERT INTO requests AS r (
+            request_id, proveedor_rut, proveedor_rut_num, proveedor_rut_dv,
+            proveedor_nombre, monto_contrato, objeto_contrato, status
+        )
+        SELECT
+            request_id, proveedor_rut, proveedor_rut_num, proveedor_rut_dv,
+            proveedor_nombre, monto_contrato, objeto_contrato, $1
+        FROM lote
+        ON CONFLICT (request_id) DO UPDATE SET
+            proveedor_rut = EXCLUDED.proveedor_rut,
+            proveedor_rut_num = EXCLUDED.proveedor_rut_num,
+            proveedor_rut_dv = EXCLUDED.proveedor_rut_dv,
+            proveedor_nombre = EXCLUDED.proveedor_nombre,
+            monto_contrato = EXCLUDED.monto_contrato,
+            objeto_contrato = EXCLUDED.objeto_contrato,
+            status = CASE WHEN r.status = 'queued' THEN r.status ELSE EXCLUDED.status END
+        WHERE r.status IN ('imported', 'queued')
+          AND (r.proveedor_rut, r.proveedor_nombre, r.monto_contrato, r.objeto_contrato, r.status)
+              IS DISTINCT FROM
+              (EXCLUDED.proveedor_rut, EXCLUDED.proveedor_nombre, EXCLUDED.monto_contrato,
+               EXCLUDED.objeto_contrato, CASE WHEN r.status = 'queued' THEN r.status ELSE EXCLUDED.status END)
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT
+        COUNT(*) FILTER (WHERE inserted) AS inserted,
+        COUNT(*) FILTER (WHERE NOT inserted) AS updated
+    FROM fusion
+"""
+
+PROGRESS_SQL = """
+    UPDATE import_jobs SET
+        byte_offset = $2,
+        rows_read = rows_read + $3,
+        rows_inserted = rows_inserted + $4,
+        rows_updated = rows_updated + $5,
+        rows_skipped = rows_skipped + $6,
+        rows_invalid = rows_invalid + $7,
+        elapsed_seconds = $8,
+        updated_at = NOW()
+    WHERE job_id = $1
+"""
+
+
+# ==================== LECTURA EN STREAM ====================
+
+class _OffsetLines:
+    """Líneas decodificadas de un archivo binario, con el offset en bytes tras cada una"""
+
+    def __init__(self, f):
+        self.f = f
+        self.offset = f.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode("utf-8", errors="replace")
+
+
+def _normalize_keys(record: Dict) -> Dict:
+    return {str(k).strip().lower(): v for k, v in record.items()}
+
+
+def iter_records(f, fmt: str, start_offset: int = 0) -> Iterator[Tuple[int, Optional[Dict], str]]:
+    """
+    Recorre el archivo desde start_offset. Entrega (offset tras el registro,
+    registro o None si no se pudo parsear, texto crudo).
+    """
+    if fmt == "csv":
+        header_line = f.readline().decode("utf-8-sig", errors="replace")
+        delimiter = ";" if header_line.count(";") > header_line.count(",") else ","
+        header = [h.strip().lower() for h in next(csv.reader([header_line], delimiter=delimiter))]
+        f.seek(max(start_offset, f.tell()))
+        lines = _OffsetLines(f)
+        # csv.reader consume exactamente las líneas de cada registro (incluidas las
+        # multilínea entre comillas), así que lines.offset queda en su borde
+        for row in csv.reader(lines, delimiter=delimiter):
+            if not row:
+                continue
+            yield lines.offset, dict(zip(header, row)), delimiter.join(row)
+    else:
+        f.seek(start_offset)
+        lines = _OffsetLines(f)
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield lines.offset, None, line
+                continue
+            yield lines.offset, _normalize_keys(record) if isinstance(record, dict) else None, line
+
+
+# ==================== VALIDACIÓN ====================
+
+def _field(record: Dict, name: str):
+    for alias in FIELD_ALIASES[name]:
+        value = record.get(alias)
+        if value is not None and str(value).strip() != "":
+            return value
+    return None
+
+
+def parse_monto(value) -> Optional[Decimal]:
+    """Acepta números y montos con formato chileno ('$ 1.234.567,89')"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        text = str(value)
+    else:
+        text = str(value).replace("$", "").replace(" ", "").strip()
+        if "," in text:
+            text = text.replace(".", "").replace(",", ".")
+        elif text.count(".") > 1:
+            text = text.replace(".", "")
+    try:
+        monto = Decimal(text).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f"Monto inválido: {value!r}")
+    if monto < 0 or monto > MAX_MONTO:
+        raise ValueError(f"Monto fuera de rango: {value!r}")
+    return monto
+
+
+def normalize_record(record: Optional[Dict], offset: int) -> Tuple:
+    """Fila lista para COPY (orden de STAGING_COLUMNS); ValueError si no es válida"""
+    if record is None:
+        raise ValueError("Registro ilegible")
+    request_id = _field(record, "request_id")
+    if request_id is None:
+        raise ValueError("Falta request_id")
+    request_id = str(request_id).strip()
+    if len(request_id) > 100:
+        raise ValueError("request_id excede 100 caracteres")
+
+    rut_num, rut_dv = normalize_rut(_field(record, "proveedor_rut"))
+    nombre = _field(record, "proveedor_nombre")
+    objeto = _field(record, "objeto_contrato")
+    return (
+        offset,
+        request_id,
+        format_rut(rut_num, rut_dv),
+        rut_num,
+        rut_dv,
+        str(nombre).strip()[:255] if nombre is not None else None,
+        parse_monto(_field(record, "monto_contrato")),
+        str(objeto).strip() if objeto is not None else None,
+    )
+
+
+# ==================== IMPORTACIÓN ====================
+
+class BulkImporter:
+    def __init__(self, conn, job: Dict, batch_size: int = BATCH_SIZE):
+        self.conn = conn
+        self.job = job
+        self.batch_size = batch_size
+
+    @classmethod
+    async def create(cls, conn, source: str, fmt: str, enqueue: bool = False,
+                     job_id: Optional[str] = None, **kwargs) -> "BulkImporter":
+        if fmt not in FORMATS:
+            raise ValueError(f"Formato inválido. Debe ser: {list(FORMATS)}")
+        if not os.path.exists(source):
+            raise ValueError(f"No existe el archivo {source}")
+        job_id = job_id or f"import-{datetime.utcnow():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+        row = await conn.fetchrow(
+            """
+            INSERT INTO import_jobs (job_id, source, format, enqueue, file_size)
+            VALUES ($1, $2, $3, $4, $5)
+            RETURNING *
+            """,
+            job_id, str(source), fmt, enqueue, os.path.getsize(source)
+        )
+        return cls(conn, dict(row), **kwargs)
+
+    @classmethod
+    async def resume(cls, conn, job_id: str, **kwargs) -> "BulkImporter":
+        row = await conn.fetchrow("SELECT * FROM import_jobs WHERE job_id = $1", job_id)
+        if row is None:
+            raise ValueError(f"Importación {job_id} no encontrada")
+        if row["status"] == "completed":
+            raise ValueError(f"Importación {job_id} ya completada")
+        await conn.execute(
+            "UPDATE import_jobs SET status = 'running', error = NULL, updated_at = NOW() WHERE job_id = $1",
+            job_id
+        )
+        return cls(conn, dict(row), **kwargs)
+
+    async def _flush(self, batch: List[Tuple], rejects: List[Tuple], offset: int, read: int, elapsed: float):
+        status = "queued" if self.job["enqueue"] else "imported"
+        inserted = updated = 0
+        async with self.conn.transaction():
+            if batch:
+                await self.conn.copy_records_to_table(
+                    "requests_import_staging", records=batch, columns=STAGING_COLUMNS
+                )
+                merged = await self.conn.fetchrow(MERGE_SQL, status)
+                inserted, updated = merged["inserted"], merged["updated"]
+            if rejects:
+                await self.conn.executemany(
+                    "INSERT INTO import_rejects (job_id, byte_offset, error, raw) VALUES ($1, $2, $3, $4)",
+                    [(self.job["job_id"], *reject) for reject in rejects]
+                )
+            # Duplicados dentro del lote y filas sin cambios o ya procesadas
+            skipped = len(batch) - inserted - updated
+            await self.conn.execute(
+                PROGRESS_SQL, self.job["job_id"], offset, read,
+                inserted, updated, skipped, len(rejects), elapsed
+            )
+        for key, value in (("rows_read", read), ("rows_inserted", inserted), ("rows_updated", updated),
+                           ("rows_skipped", skipped), ("rows_invalid", len(rejects))):
+            self.job[key] += value
+        self.job["byte_offset"] = offset
+        self.job["elapsed_seconds"] = elapsed
+
+    async def run(self) -> Dict:
+        job_id = self.job["job_id"]
+        started = time.perf_counter()
+        elapsed_before = self.job["elapsed_seconds"]
+        await self.conn.execute(STAGING_DDL)
+
+        try:
+            batch, rejects, read = [], [], 0
+            offset = self.job["byte_offset"]
+            with open(self.job["source"], "rb") as f:
+                for offset, record, raw in iter_records(f, self.job["format"], self.job["byte_offset"]):
+                    read += 1
+                    try:
+                        batch.append(normalize_record(record, offset))
+                    except ValueError as e:
+                        rejects.append((offset, str(e), raw[:1000]))
+                    if len(batch) + len(rejects) >= self.batch_size:
+                        elapsed = elapsed_before + time.perf_counter() - started
+                        await self._flush(batch, rejects, offset, read, elapsed)
+                        batch, rejects, read = [], [], 0
+                        logger.info(
+                            f"📥 {job_id}: {self.job['rows_read']} filas "
+                            f"({rows_per_second(self.job):.0f} filas/s), offset {offset}"
+                        )
+                elapsed = elapsed_before + time.perf_counter() - started
+                await self._flush(batch, rejects, offset, read, elapsed)
+
+            await self.conn.execute(
+                "UPDATE import_jobs SET status = 'completed', completed_at = NOW(), updated_at = NOW() WHERE job_id = $1",
+                job_id
+            )
+            self.job["status"] = "completed"
+            logger.info(
+                f"✅ Importación {job_id}: {self.job['rows_inserted']} nuevas, {self.job['rows_updated']} actualizadas, "
+                f"{self.job['rows_invalid']} inválidas ({rows_per_second(self.job, elapsed):.0f} filas/s)"
+            )
+            return self.job
+        except Exception as e:
+            logger.error(f"❌ Importación {job_id} interrumpida en offset {self.job['byte_offset']}: {e}")
+            await self.conn.execute(
+                "UPDATE import_jobs SET status = 'failed', error = $2, updated_at = NOW() WHERE job_id = $1",
+                job_id, str(e)
+            )
+            raise
+
+
+def rows_per_second(job: Dict, elapsed: Optional[float] = None) -> float:
+    elapsed = job["elapsed_seconds"] if elapsed is None else elapsed
+    return job["rows_read"] / elapsed if elapsed else 0.0
+
+
+# ==================== CLI ====================
+
+async def main(args):
+    import asyncpg
+
+    from src.db.sharding import SHARD_URLS
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL not set")
+        return
+    if SHARD_URLS:
+        # Las filas de otros slots quedarían en una base que la cola no procesa
+        print("❌ Con DATABASE_SHARD_URLS la importación masiva no está soportada: "
+              "las filas deben ir al shard de su RUT")
+        return
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        if args.resume:
+            importer = await BulkImporter.resume(conn, args.resume, batch_size=args.batch_size)
+            print(f"↩️  Continuando {args.resume} desde el byte {importer.job['byte_offset']}")
+        else:
+            if not args.source:
+                print("❌ Indica el archivo a importar (o --resume)")
+                return
+            fmt = args.format or ("ndjson" if args.source.endswith((".ndjson", ".jsonl")) else "csv")
+            importer = await BulkImporter.create(
+                conn, args.source, fmt, enqueue=args.enqueue, batch_size=args.batch_size
+            )
+            print(f"📥 Importación {importer.job['job_id']} ({fmt})")
+
+        job = await importer.run()
+        print(
+            f"  ✅ {job['rows_read']} filas: {job['rows_inserted']} nuevas, {job['rows_updated']} actualizadas, "
+            f"{job['rows_skipped']} sin cambios, {job['rows_invalid']} inválidas"
+        )
+        print(f"  ⚡ {rows_per_second(job):.0f} filas/s")
+        if job["enqueue"]:
+            print("  📬 Filas nuevas en cola para Art. 17 (status 'queued')")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importación masiva de contratos vía COPY")
+    parser.add_argument("source", nargs="?", help="Archivo CSV o NDJSON")
+    parser.add_argument("--format", choices=FORMATS, help="Por defecto según la extensión")
+    parser.add_argument("--enqueue", action="store_true", help="Encolar las filas para el workflow Art. 17")
+    parser.add_argument("--resume", help="job_id a continuar desde su último byte_offset")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    asyncio.run(main(parser.parse_args()))
@@ -2,8 +2,15 @@ import os
 import logging
 import databases
 
+from src.db.instrumentation import instrument
+from src.db.routing import ReplicaRouter
+from src.db.sharding import ShardRouter, SHARD_URLS
+from src.db.fastpath import fastpath
+
 logger = logging.getLogger(__name__)
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Réplicas de lectura opcionales, separadas por coma
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
 
 class Database:
     def __init__(self, url: str):
@@ -28,14 +35,33 @@ class Database:
 
 # Instancia global que usa todo el proyecto
 db = Database(DATABASE_URL)
-database = db.db  # Alias for repositories that import 'database'
+database = instrument(db.db)  # Alias for repositories that import 'database' (con registro de consultas lentas)
+# Lecturas de repositorios: réplicas sanas o primario (read-your-writes vía LSN)
+read_database = ReplicaRouter(database, DATABASE_REPLICA_URLS) if database else None
+# Datos de workflow repartidos por RUT; el shard 0 es este mismo primario (catálogo)
+shards = ShardRouter(database, read_database, SHARD_URLS)
 
 # Helper functions for main.py
 async def connect_db():
     await db.connect()
+    if read_database:
+        await read_database.connect()
+    await shards.connect()
+    # Las lecturas del fast path siguen el mismo ruteo a réplicas que read_database
+    await fastpath.connect(read_database)
 
 async def disconnect_db():
+    await fastpath.disconnect()
+    await shards.disconnect()
+    if read_database:
+        await read_database.disconnect()
     await db.disconnect()
 
+def replica_status():
+    return read_database.status() if read_database else []
+
+def shard_status():
+    return shards.status()
+
 def is_connected():
     return db.is_connected()
@@ -0,0 +1,115 @@
+"""
+Plazos por request propagados hasta las consultas.
+
+La ruta declara su presupuesto con with_deadline (src/api/deadlines.py); el
+plazo viaja en un contextvar y cada consulta lo aplica de dos formas:
+
+- statement_timeout = presupuesto restante en la conexión usada, para que
+  Postgres aborte la sentencia aunque el cliente ya no esté;
+- espera acotada del lado del cliente (incluida la espera por una conexión del
+  pool): al vencer se cancela la tarea y asyncpg envía el CancelRequest.
+
+El SET se hace sobre la conexión sin RESET explícito: el pool de asyncpg ejecuta
+RESET ALL al recibirla de vuelta. Sin plazo activo las consultas no cambian.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Optional
+
+# Margen para que el statement_timeout del servidor dispare antes que la espera local
+CLIENT_GRACE_SECONDS = float(os.getenv("DEADLINE_CLIENT_GRACE_SECONDS", "0.05"))
+MIN_STATEMENT_TIMEOUT_MS = 1
+
+# SQLSTATE query_canceled: statement_timeout o CancelRequest
+QUERY_CANCELED = "57014"
+
+
+class DeadlineExceeded(Exception):
+    """El presupuesto de latencia de la request se agotó"""
+
+
+class Deadline:
+    def __init__(self, budget_seconds: float):
+        self.budget = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+        self.exceeded = False
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def statement_timeout_ms(self) -> int:
+        """Presupuesto restante en ms; se llama ya con la conexión adquirida"""
+        left = self.remaining()
+        if left <= 0:
+            raise _exceeded(self, "exhausted_before_query")
+        return max(int(left * 1000), MIN_STATEMENT_TIMEOUT_MS)
+
+
+def statement_timeout_sql(timeout_ms: int) -> str:
+    return f"SET statement_timeout = {int(timeout_ms)}"
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+_counters: Dict[str, int] = {
+    "bounded_queries": 0,
+    "statement_timeouts": 0,
+    "client_timeouts": 0,
+    "exhausted_before_query": 0,
+}
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(budget_seconds: float):
+    """Activa un plazo para el código del bloque (y las tareas que cree)"""
+    deadline = Deadline(budget_seconds)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def _exceeded(deadline: Deadline, counter: str) -> DeadlineExceeded:
+    deadline.exceeded = True
+    _counters[counter] += 1
+    return DeadlineExceeded(f"Presupuesto de {deadline.budget:.2f}s agotado")
+
+
+async def run_bounded(call: Callable[[Optional[Deadline]], Awaitable]):
+    """
+    Ejecuta call(deadline) dentro del plazo actual. Con plazo, call debe
+    adquirir la conexión y fijar en ella statement_timeout_sql(
+    deadline.statement_timeout_ms()) antes de la consulta; sin plazo recibe None.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return await call(None)
+
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise _exceeded(deadline, "exhausted_before_query")
+    _counters["bounded_queries"] += 1
+
+    try:
+        # La espera por una conexión del pool también consume el presupuesto
+        return await asyncio.wait_for(call(deadline), remaining + CLIENT_GRACE_SECONDS)
+    except asyncio.TimeoutError:
+        raise _exceeded(deadline, "client_timeouts")
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        if getattr(e, "sqlstate", None) == QUERY_CANCELED:
+            raise _exceeded(deadline, "statement_timeouts") from e
+        raise
+
+
+def get_deadline_stats() -> Dict[str, int]:
+    return dict(_counters)
@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import re
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from src.db.deadlines import Deadline, run_bounded, statement_timeout_sql
+from src.db.instrumentation import normalize_sql, observe_query
+from src.services.tracing import CLIENT, span
+
+logger = logging.getLogger(__name__)
+
+# Ruta de acceso opcional sobre un pool asyncpg nativo para las consultas más
+# calientes de los repositorios. Se activa con DB_FASTPATH=true.
+FASTPATH_ENABLED = os.getenv("DB_FASTPATH", "false").lower() == "true"
+FASTPATH_URL = os.getenv("DB_FASTPATH_URL") or os.getenv("DATABASE_URL")
+FASTPATH_MIN_SIZE = int(os.getenv("DB_FASTPATH_MIN_SIZE", "2"))
+FASTPATH_MAX_SIZE = int(os.getenv("DB_FASTPATH_MAX_SIZE", "10"))
+# Sentencias preparadas retenidas por conexión (variantes de búsqueda incluidas)
+PREPARED_PER_CONNECTION = int(os.getenv("DB_FASTPATH_PREPARED_PER_CONNECTION", "128"))
+
+_NAMED_PARAM_RE = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")
+
+
+@lru_cache(maxsize=256)
+def to_positional(query: str) -> Tuple[str, Tuple[str, ...]]:
+    """Convierte ':nombre' (estilo databases) a '$n' de asyncpg; respeta los casts '::tipo'"""
+    order: List[str] = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in order:
+            order.append(name)
+        return f"${order.index(name) + 1}"
+
+    return _NAMED_PARAM_RE.sub(replace, query), tuple(order)
+
+
+class HotConnection(asyncpg.Connection):
+    """Conexión que prepara cada SQL caliente una sola vez y reutiliza la sentencia"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hot_statements: Dict[str, Any] = {}
+
+    async def hot_statement(self, query: str):
+        statement = self.hot_statements.get(query)
+        if statement is None:
+            if len(self.hot_statements) >= PREPARED_PER_CONNECTION:
+                self.hot_statements.pop(next(iter(self.hot_statements)))
+            statement = self.hot_statements[query] = await self.prepare(query)
+        return statement
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    # Decodificación directa al tipo de la respuesta: sin Decimal ni JSON en texto
+    await conn.set_type_codec(
+        "numeric", encoder=str, decoder=float, schema="pg_catalog", format="text"
+    )
+    for json_type in ("json", "jsonb"):
+        await conn.set_type_codec(
+            json_type, encoder=json.dumps, decoder=json.loads, schema="pg_catalog"
+        )
+
+
+async def _create_pool(url: str) -> asyncpg.Pool:
+    return await asyncpg.create_pool(
+        url,
+        min_size=FASTPATH_MIN_SIZE,
+        max_size=FASTPATH_MAX_SIZE,
+        connection_class=HotConnection,
+        init=_init_connection,
+    )
+
+
+class FastPath:
+    """
+    Pool asyncpg del primario más uno por réplica. Cada lectura pasa por el
+    ReplicaRouter: va a la réplica que este elegiría (sana y al día con el
+    token de consistencia) y al primario si el request ya escribió.
+    """
+
+    def __init__(self, url: Optional[str]):
+        self.url = url
+        self.pool: Optional[asyncpg.Pool] = None
+        self.router = None
+        self.replica_pools: Dict[str, asyncpg.Pool] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.pool is not None
+
+    async def connect(self, router=None):
+        if not FASTPATH_ENABLED or not self.url:
+            return
+        self.pool = await _create_pool(self.url)
+        self.router = router
+        for replica in getattr(router, "replicas", []):
+            try:
+                self.replica_pools[replica.url] = await _create_pool(replica.url)
+            except Exception as e:
+                # Sin pool propio, las lecturas que le tocarían van al primario
+                logger.error(f"❌ Fast path sin réplica {replica.host}: {e}")
+        logger.info(f"⚡ Fast path asyncpg activo ({len(self.replica_pools)} réplicas)")
+
+    async def disconnect(self):
+        for pool in self.replica_pools.values():
+            await pool.close()
+        self.replica_pools = {}
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    def _choose_pool(self) -> asyncpg.Pool:
+        replica = self.router.choose_replica() if self.router is not None else None
+        if replica is not None:
+            return self.replica_pools.get(replica.url, self.pool)
+        return self.pool
+
+    async def _execute(self, method: str, positional: str, args: List, deadline: Optional[Deadline]):
+        pool = self._choose_pool()
+        with span("db.acquire", CLIENT):
+            conn = await pool.acquire()
+        try:
+            if deadline is not None:
+                # El pool ejecuta RESET ALL al devolver la conexión
+                await conn.execute(statement_timeout_sql(deadline.statement_timeout_ms()))
+            try:
+                statement = await conn.hot_statement(positional)
+                return await getattr(statement, method)(*args)
+            except asyncpg.exceptions.InvalidCachedStatementError:
+                # Cambió el esquema: se vuelve a preparar una vez
+                conn.hot_statements.pop(positional, None)
+                statement = await conn.hot_statement(positional)
+                return await getattr(statement, method)(*args)
+        finally:
+            await pool.release(conn)
+
+    async def _run(self, method: str, query: str, values: Optional[Dict]):
+        positional, names = to_positional(query)
+        args = [(values or {})[name] for name in names]
+        start = time.perf_counter()
+        with span(f"db.fastpath.{method}", CLIENT, **{"db.statement": normalize_sql(query)[:500]}):
+            result = await run_bounded(lambda deadline: self._execute(method, positional, args, deadline))
+        observe_query(f"fastpath.{method}", query, (time.perf_counter() - start) * 1000, values)
+        return result
+
+    async def fetch_all(self, query: str, values: Optional[Dict] = None) -> List[Dict]:
+        return [dict(row) for row in await self._run("fetch", query, values)]
+
+    async def fetch_one(self, query: str, values: Optional[Dict] = None) -> Optional[Dict]:
+        row = await self._run("fetchrow", query, values)
+        return dict(row) if row is not None else None
+
+    async def fetch_val(self, query: str, values: Optional[Dict] = None) -> Any:
+        return await self._run("fetchval", query, values)
+
+
+fastpath = FastPath(FASTPATH_URL)
@@ -0,0 +1,284 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from src.db.deadlines import Deadline, run_bounded, statement_timeout_sql
+from src.services.tracing import CLIENT, span, tracing_active
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "200"))
+# Fracción de consultas lentas para las que se captura EXPLAIN (FORMAT JSON)
+EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0.2"))
+# Como máximo un EXPLAIN por huella en este intervalo
+EXPLAIN_COOLDOWN_SECONDS = float(os.getenv("SLOW_QUERY_EXPLAIN_COOLDOWN_SECONDS", "60"))
+REPORT_INTERVAL_SECONDS = int(os.getenv("SLOW_QUERY_REPORT_INTERVAL_SECONDS", "300"))
+REPORT_TOP_N = int(os.getenv("SLOW_QUERY_REPORT_TOP_N", "10"))
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_slow_queries: Deque[Dict] = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+_aggregates: Dict[str, Dict] = {}
+_last_explain: Dict[str, float] = {}
+_reporter_task: Optional[asyncio.Task] = None
+# EXPLAIN en curso: corren fuera de la request que fue lenta
+_explain_tasks: Set[asyncio.Task] = set()
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(query: str) -> str:
+    """SQL sin literales ni espacios redundantes (los parámetros :nombre se conservan)"""
+    query = _STRING_RE.sub("?", query)
+    query = _NUMBER_RE.sub("?", query)
+    return _WHITESPACE_RE.sub(" ", query).strip()
+
+
+@lru_cache(maxsize=1024)
+def sql_fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def params_fingerprint(values: Optional[Dict]) -> Optional[str]:
+    """Huella de nombres y tipos de parámetros; nunca incluye los valores"""
+    if not values:
+        return None
+    shape = ",".join(f"{k}:{type(v).__name__}" for k, v in sorted(values.items()))
+    return hashlib.sha1(shape.encode()).hexdigest()[:12]
+
+
+def _repository_caller() -> Optional[str]:
+    """Primer marco de pila dentro de src/db/repositories (solo para consultas lentas)"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if "repositories" in filename:
+            return f"{os.path.basename(filename)}:{frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def _record(normalized: str, fingerprint: str, duration_ms: float):
+    stats = _aggregates.get(fingerprint)
+    if stats is None:
+        stats = _aggregates[fingerprint] = {
+            "sql": normalized, "calls": 0, "slow_calls": 0, "total_ms": 0.0, "max_ms": 0.0
+        }
+    stats["calls"] += 1
+    stats["total_ms"] += duration_ms
+    if duration_ms > stats["max_ms"]:
+        stats["max_ms"] = duration_ms
+    if duration_ms >= SLOW_QUERY_THRESHOLD_MS:
+        stats["slow_calls"] += 1
+
+
+def observe_query(method: str, query: str, duration_ms: float, values: Optional[Dict] = None):
+    """Registro para rutas de acceso que no pasan por InstrumentedDatabase (sin EXPLAIN)"""
+    normalized = normalize_sql(query)
+    fingerprint = sql_fingerprint(normalized)
+    _record(normalized, fingerprint, duration_ms)
+    if duration_ms >= SLOW_QUERY_THRESHOLD_MS:
+        _slow_queries.append({
+            "timestamp": datetime.utcnow().isoformat(),
+            "method": method,
+            "caller": _repository_caller(),
+            "duration_ms": round(duration_ms, 2),
+            "fingerprint": fingerprint,
+            "params_fingerprint": params_fingerprint(values),
+            "sql": normalized,
+            "plan": None,
+        })
+
+
+class InstrumentedDatabase:
+    """
+    Envoltura de databases.Database que mide cada sentencia y registra las que
+    superan SLOW_QUERY_THRESHOLD_MS, con su plan EXPLAIN muestreado. Dentro de
+    un plazo de request (src/db/deadlines.py) cada sentencia lleva su
+    statement_timeout.
+    El resto de atributos (transaction, connection, is_connected...) se delega.
+    """
+
+    def __init__(self, database):
+        self._database = database
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._database, name)
+
+    async def _bounded(self, call, deadline: Optional[Deadline]):
+        if deadline is None and not tracing_active():
+            return await call()
+        # Conexión explícita: la espera en el pool queda como span propio y el
+        # statement_timeout se fija en la misma conexión que ejecuta la sentencia
+        connection = self._database.connection()
+        with span("db.acquire", CLIENT):
+            await connection.__aenter__()
+        try:
+            if deadline is not None:
+                await connection.raw_connection.execute(statement_timeout_sql(deadline.statement_timeout_ms()))
+            return await call()
+        finally:
+            await connection.__aexit__(None, None, None)
+
+    async def _timed(self, method: str, query, values: Optional[Dict], call):
+        raw = query if isinstance(query, str) else str(query)
+        normalized = normalize_sql(raw)
+        fingerprint = sql_fingerprint(normalized)
+
+        start = time.perf_counter()
+        with span(f"db.{method}", CLIENT, **{"db.statement": normalized[:500], "db.fingerprint": fingerprint}):
+            result = await run_bounded(lambda deadline: self._bounded(call, deadline))
+        duration_ms = (time.perf_counter() - start) * 1000
+        _record(normalized, fingerprint, duration_ms)
+
+        if duration_ms >= SLOW_QUERY_THRESHOLD_MS:
+            await self._capture_slow(method, raw, values, normalized, fingerprint, duration_ms)
+        return result
+
+    async def _capture_slow(
+        self, method: str, raw: str, values: Optional[Dict],
+        normalized: str, fingerprint: str, duration_ms: float
+    ):
+        entry = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "method": method,
+            "caller": _repository_caller(),
+            "duration_ms": round(duration_ms, 2),
+            "fingerprint": fingerprint,
+            "params_fingerprint": params_fingerprint(values),
+            "sql": normalized,
+            "plan": None,
+        }
+
+        now = time.monotonic()
+        explain_due = now - _last_explain.get(fingerprint, 0.0) >= EXPLAIN_COOLDOWN_SECONDS
+        if method != "execute_many" and explain_due and random.random() < EXPLAIN_SAMPLE_RATE:
+            _last_explain[fingerprint] = now
+            # El plan se completa en la entrada del buffer cuando termina; la
+            # request que ya fue lenta no espera otro viaje a la BD
+            entry["plan_pending"] = True
+            task = asyncio.create_task(self._explain(entry, raw, values))
+            _explain_tasks.add(task)
+            task.add_done_callback(_explain_tasks.discard)
+
+        _slow_queries.append(entry)
+        logger.warning(f"🐢 Consulta lenta ({entry['duration_ms']} ms) {entry['caller']}: {normalized[:200]}")
+
+    async def _explain(self, entry: Dict, raw: str, values: Optional[Dict]):
+        try:
+            # Tarea propia: conexión propia del pool, fuera de la transacción del llamador.
+            # Sin ANALYZE: el plan se obtiene sin volver a ejecutar la sentencia
+            async with self._database.connection() as connection:
+                plan = await connection.fetch_val(query=f"EXPLAIN (FORMAT JSON) {raw}", values=values)
+            entry["plan"] = json.loads(plan) if isinstance(plan, str) else plan
+        except Exception as e:
+            entry["plan_error"] = str(e)
+        finally:
+            entry.pop("plan_pending", None)
+
+    async def fetch_all(self, query, values: Optional[Dict] = None):
+        return await self._timed(
+            "fetch_all", query, values, lambda: self._database.fetch_all(query=query, values=values)
+        )
+
+    async def fetch_one(self, query, values: Optional[Dict] = None):
+        return await self._timed(
+            "fetch_one", query, values, lambda: self._database.fetch_one(query=query, values=values)
+        )
+
+    async def fetch_val(self, query, values: Optional[Dict] = None, column: Any = 0):
+        return await self._timed(
+            "fetch_val", query, values, lambda: self._database.fetch_val(query=query, values=values, column=column)
+        )
+
+    async def execute(self, query, values: Optional[Dict] = None):
+        return await self._timed(
+            "execute", query, values, lambda: self._database.execute(query=query, values=values)
+        )
+
+    async def execute_many(self, query, values: List[Dict]):
+        return await self._timed(
+            "execute_many", query, None, lambda: self._database.execute_many(query=query, values=values)
+        )
+
+
+def instrument(database):
+    return InstrumentedDatabase(database) if database is not None else None
+
+
+# ==================== CONSULTA Y REPORTE ====================
+
+def get_slow_queries(limit: int = 50) -> List[Dict]:
+    return list(_slow_queries)[-limit:][::-1]
+
+
+def get_query_aggregates(top_n: int = REPORT_TOP_N) -> List[Dict]:
+    ranked = sorted(_aggregates.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+    return [
+        {
+            "fingerprint": fingerprint,
+            "sql": stats["sql"][:500],
+            "calls": stats["calls"],
+            "slow_calls": stats["slow_calls"],
+            "total_ms": round(stats["total_ms"], 2),
+            "avg_ms": round(stats["total_ms"] / stats["calls"], 2) if stats["calls"] else 0,
+            "max_ms": round(stats["max_ms"], 2),
+        }
+        for fingerprint, stats in ranked[:top_n]
+    ]
+
+
+def reset_query_stats():
+    _slow_queries.clear()
+    _aggregates.clear()
+    _last_explain.clear()
+
+
+async def _reporter_loop():
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL_SECONDS)
+        top = get_query_aggregates()
+        if not top:
+            continue
+        lines = [
+            f"  {q['fingerprint']} calls={q['calls']} slow={q['slow_calls']} "
+            f"avg={q['avg_ms']}ms max={q['max_ms']}ms total={q['total_ms']}ms :: {q['sql'][:120]}"
+            for q in top
+        ]
+        logger.info(f"📊 Reporte de consultas (últimos {REPORT_INTERVAL_SECONDS}s):\n" + "\n".join(lines))
+        # Cada reporte cubre solo su intervalo; el buffer de lentas se conserva
+        _aggregates.clear()
+
+
+def start_query_reporter():
+    global _reporter_task
+    if _reporter_task is None or _reporter_task.done():
+        _reporter_task = asyncio.create_task(_reporter_loop())
+
+
+async def stop_query_reporter():
+    global _reporter_task
+    if _reporter_task is not None:
+        _reporter_task.cancel()
+        try:
+            await _reporter_task
+        except asyncio.CancelledError:
+            pass
+        _reporter_task = None
+    # Los EXPLAIN pendientes no deben sobrevivir al cierre de la BD
+    for task in list(_explain_tasks):
+        task.cancel()
+    if _explain_tasks:
+        await asyncio.gather(*_explain_tasks, return_exceptions=True)
@@ -0,0 +1,14 @@
+-- RUT normalizado (cuerpo entero + DV) para búsquedas exactas indexadas.
+-- El backfill de filas existentes se ejecuta por lotes con:
+--   python -m src.db.backfill_rut
+-- migrate:no-transaction
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS proveedor_rut_num INTEGER;
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS proveedor_rut_dv CHAR(1);
+
+ALTER TABLE workflow_executions ADD COLUMN IF NOT EXISTS proveedor_rut_num INTEGER;
+ALTER TABLE workflow_executions ADD COLUMN IF NOT EXISTS proveedor_rut_dv CHAR(1);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_requests_proveedor_rut_num
+    ON requests(proveedor_rut_num);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_workflow_executions_proveedor_rut_num
+    ON workflow_executions(proveedor_rut_num, created_at DESC);
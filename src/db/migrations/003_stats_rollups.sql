@@ -0,0 +1,25 @@
+-- Rollups por hora/día para series de tiempo de dashboards.
+-- Se alimentan incrementalmente desde flow.py y las decisiones HITL, y se
+-- recalculan periódicamente para la ventana reciente (corrección de datos tardíos).
+-- migrate:no-transaction
+CREATE TABLE IF NOT EXISTS workflow_stats_rollup (
+    bucket_size VARCHAR(10) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    solicitudes INTEGER NOT NULL DEFAULT 0,
+    certificados_emitidos INTEGER NOT NULL DEFAULT 0,
+    riesgo_bajo INTEGER NOT NULL DEFAULT 0,
+    riesgo_medio INTEGER NOT NULL DEFAULT 0,
+    riesgo_alto INTEGER NOT NULL DEFAULT 0,
+    hitl_abiertos INTEGER NOT NULL DEFAULT 0,
+    hitl_resueltos INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (bucket_size, bucket_start)
+);
+
+-- BRIN: índice mínimo para recorrer rangos de created_at en backfills
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_workflow_executions_created_at_brin
+    ON workflow_executions USING BRIN (created_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_workflow_executions_hitl_reviewed_at
+    ON workflow_executions(hitl_reviewed_at)
+    WHERE hitl_reviewed_at IS NOT NULL;
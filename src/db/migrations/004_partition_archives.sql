@@ -0,0 +1,15 @@
+-- Registro de particiones mensuales archivadas (audit_log, workflow_executions).
+-- La conversión a tablas particionadas se ejecuta en línea con:
+--   python -m src.db.partitions migrate
+CREATE TABLE IF NOT EXISTS partition_archives (
+    id SERIAL PRIMARY KEY,
+    parent_table VARCHAR(100) NOT NULL,
+    partition_name VARCHAR(100) UNIQUE NOT NULL,
+    range_start TIMESTAMP,
+    range_end TIMESTAMP NOT NULL,
+    file_path TEXT NOT NULL,
+    row_count BIGINT NOT NULL,
+    sha256 VARCHAR(64) NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    reattached_at TIMESTAMP
+);
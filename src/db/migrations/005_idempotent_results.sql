@@ -0,0 +1,4 @@
+-- Resultado almacenado de cada workflow completado: los reintentos con el mismo
+-- request_id lo reciben sin volver a ejecutar el grafo ni emitir otro certificado.
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS result JSONB;
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP;
@@ -0,0 +1,16 @@
+-- Modelo de lectura de certificados (CQRS): una fila por certificado con las
+-- respuestas públicas ya armadas de GET /certificates/{id} y /verify.
+-- Se escribe en la misma transacción que el workflow y las decisiones HITL;
+-- para poblarlo o regenerarlo desde las tablas fuente:
+--   python -m src.db.rebuild_read_model
+CREATE TABLE IF NOT EXISTS certificate_read_model (
+    certificado_id VARCHAR(50) PRIMARY KEY,
+    request_id VARCHAR(100) NOT NULL,
+    issued_at TIMESTAMP NOT NULL,
+    certificado JSONB NOT NULL,
+    verificacion JSONB NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_certificate_read_model_request_id
+    ON certificate_read_model (request_id);
@@ -0,0 +1,5 @@
+-- Sondeo incremental del snapshot local de verificación por
+-- (updated_at, certificado_id) sobre el modelo de lectura.
+-- migrate:no-transaction
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_certificate_read_model_updated_at
+    ON certificate_read_model (updated_at, certificado_id);
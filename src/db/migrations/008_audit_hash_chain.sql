@@ -0,0 +1,95 @@
+-- Cadena de hashes del audit_log: cada evento enlaza con el anterior de su stream
+-- (request_id, o '_global' para eventos sin solicitud). El trigger asigna seq,
+-- prev_hash y entry_hash en el INSERT (también bajo COPY); la fila del stream en
+-- audit_chain_heads queda bloqueada hasta el commit, así que seq sigue el orden
+-- de confirmación. Los eventos anteriores a esta migración quedan sin encadenar.
+--
+-- Checkpoints firmados: raíz Merkle de las cabezas de los streams con eventos
+-- nuevos, encadenada al checkpoint anterior y firmada con el P12. La verificación
+-- parte del último checkpoint y solo recorre los eventos posteriores.
+ALTER TABLE audit_log
+    ADD COLUMN IF NOT EXISTS stream VARCHAR(100),
+    ADD COLUMN IF NOT EXISTS seq BIGINT,
+    ADD COLUMN IF NOT EXISTS prev_hash VARCHAR(64),
+    ADD COLUMN IF NOT EXISTS entry_hash VARCHAR(64);
+
+-- Parcial: las filas previas (stream NULL) no entran al índice
+CREATE INDEX IF NOT EXISTS idx_audit_log_stream_seq
+    ON audit_log (stream, seq) WHERE stream IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS audit_chain_heads (
+    stream VARCHAR(100) PRIMARY KEY,
+    seq BIGINT NOT NULL,
+    entry_hash VARCHAR(64) NOT NULL,
+    checkpointed_seq BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Streams con eventos aún no cubiertos por un checkpoint
+CREATE INDEX IF NOT EXISTS idx_audit_chain_heads_pending
+    ON audit_chain_heads (stream) WHERE seq > checkpointed_seq;
+
+CREATE TABLE IF NOT EXISTS audit_checkpoints (
+    id SERIAL PRIMARY KEY,
+    prev_hash VARCHAR(64) NOT NULL,
+    merkle_root VARCHAR(64) NOT NULL,
+    checkpoint_hash VARCHAR(64) UNIQUE NOT NULL,
+    streams INTEGER NOT NULL,
+    entries INTEGER NOT NULL,
+    firma_digital TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS audit_checkpoint_heads (
+    checkpoint_id INTEGER NOT NULL REFERENCES audit_checkpoints(id),
+    stream VARCHAR(100) NOT NULL,
+    seq BIGINT NOT NULL,
+    entry_hash VARCHAR(64) NOT NULL,
+    PRIMARY KEY (checkpoint_id, stream)
+);
+
+CREATE INDEX IF NOT EXISTS idx_audit_checkpoint_heads_stream
+    ON audit_checkpoint_heads (stream, checkpoint_id DESC);
+
+-- Misma serialización que src/services/audit_chain.entry_hash
+CREATE OR REPLACE FUNCTION audit_entry_hash(
+    prev_hash TEXT, stream TEXT, seq BIGINT, action TEXT, user_id TEXT, details JSONB, ts TIMESTAMP
+) RETURNS VARCHAR(64) LANGUAGE sql STABLE AS $$
+    SELECT encode(sha256(convert_to(
+        COALESCE(prev_hash, '') || '|' || stream || '|' || seq::text || '|' ||
+        COALESCE(action, '') || '|' || COALESCE(user_id, '') || '|' ||
+        COALESCE(details::text, '') || '|' ||
+        to_char(ts, 'YYYY-MM-DD"T"HH24:MI:SS.US'),
+        'UTF8'
+    )), 'hex')
+$$;
+
+CREATE OR REPLACE FUNCTION audit_log_chain() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    head RECORD;
+BEGIN
+    NEW.stream := COALESCE(NEW.request_id, '_global');
+
+    -- Reserva el siguiente seq y bloquea la cabeza del stream hasta el commit
+    INSERT INTO audit_chain_heads AS h (stream, seq, entry_hash)
+    VALUES (NEW.stream, 1, '')
+    ON CONFLICT (stream) DO UPDATE SET seq = h.seq + 1
+    RETURNING h.seq, h.entry_hash INTO head;
+
+    NEW.seq := head.seq;
+    NEW.prev_hash := head.entry_hash;
+    NEW.entry_hash := audit_entry_hash(
+        NEW.prev_hash, NEW.stream, NEW.seq, NEW.action, NEW.user_id, NEW.details, NEW.timestamp
+    );
+
+    UPDATE audit_chain_heads
+    SET entry_hash = NEW.entry_hash, updated_at = NOW()
+    WHERE stream = NEW.stream;
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS audit_log_chain ON audit_log;
+CREATE TRIGGER audit_log_chain
+    BEFORE INSERT ON audit_log
+    FOR EACH ROW EXECUTE FUNCTION audit_log_chain();
@@ -0,0 +1,47 @@
+-- Facetas de la búsqueda de workflows (estado, nivel de riesgo, banda de monto).
+-- Con filtros se calculan junto a la página en una sola consulta (GROUPING SETS);
+-- sin filtros se leen de esta vista materializada, que refresca la tarea
+-- periódica de rollups (REFRESH CONCURRENTLY, sin bloquear lecturas).
+CREATE OR REPLACE FUNCTION monto_banda(monto NUMERIC) RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE
+        WHEN monto IS NULL THEN 'sin_dato'
+        WHEN monto < 1000000 THEN 'hasta_1M'
+        WHEN monto < 10000000 THEN '1M_10M'
+        WHEN monto < 100000000 THEN '10M_100M'
+        ELSE 'sobre_100M'
+    END
+$$;
+
+-- Se crea vacía: el primer refresh la puebla fuera de la migración
+CREATE MATERIALIZED VIEW IF NOT EXISTS search_facet_counts AS
+    SELECT
+        CASE
+            WHEN GROUPING(status) = 0 THEN 'status'
+            WHEN GROUPING(nivel_riesgo) = 0 THEN 'nivel_riesgo'
+            WHEN GROUPING(monto_banda) = 0 THEN 'monto'
+            ELSE 'total'
+        END AS facet,
+        COALESCE(
+            CASE
+                WHEN GROUPING(status) = 0 THEN status
+                WHEN GROUPING(nivel_riesgo) = 0 THEN nivel_riesgo
+                WHEN GROUPING(monto_banda) = 0 THEN monto_banda
+                ELSE ''
+            END,
+            'sin_dato'
+        ) AS valor,
+        COUNT(*) AS total,
+        NOW() AS refreshed_at
+    FROM (
+        SELECT w.status, LOWER(w.nivel_riesgo) AS nivel_riesgo, monto_banda(r.monto_contrato) AS monto_banda
+        FROM workflow_executions w
+        LEFT JOIN requests r ON w.request_id = r.request_id
+        WHERE w.proveedor_rut IS NOT NULL
+    ) filtrados
+    GROUP BY GROUPING SETS ((status), (nivel_riesgo), (monto_banda), ())
+WITH NO DATA;
+
+-- Requerido por REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_search_facet_counts_facet_valor
+    ON search_facet_counts (facet, valor);
@@ -0,0 +1,40 @@
+-- Importación masiva de contratos (python -m src.db.bulk_import / POST /api/v2/imports).
+-- Cada lote se carga con COPY a una tabla temporal y se fusiona en requests en la
+-- misma transacción que avanza byte_offset: tras una caída se retoma desde ahí.
+-- Las filas importadas con --enqueue quedan en status 'queued' para el worker Art. 17.
+-- migrate:no-transaction
+CREATE TABLE IF NOT EXISTS import_jobs (
+    job_id VARCHAR(64) PRIMARY KEY,
+    source TEXT NOT NULL,
+    format VARCHAR(10) NOT NULL,
+    enqueue BOOLEAN NOT NULL DEFAULT false,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    byte_offset BIGINT NOT NULL DEFAULT 0,
+    file_size BIGINT,
+    rows_read BIGINT NOT NULL DEFAULT 0,
+    rows_inserted BIGINT NOT NULL DEFAULT 0,
+    rows_updated BIGINT NOT NULL DEFAULT 0,
+    rows_skipped BIGINT NOT NULL DEFAULT 0,
+    rows_invalid BIGINT NOT NULL DEFAULT 0,
+    elapsed_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    error TEXT,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
+-- Cola Art. 17: el worker reclama filas 'queued' con FOR UPDATE SKIP LOCKED
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_requests_queued
+    ON requests (id) WHERE status = 'queued';
+
+-- Filas rechazadas por validación, registradas en la transacción de su lote
+CREATE TABLE IF NOT EXISTS import_rejects (
+    id BIGSERIAL PRIMARY KEY,
+    job_id VARCHAR(64) NOT NULL REFERENCES import_jobs(job_id),
+    byte_offset BIGINT NOT NULL,
+    error TEXT NOT NULL,
+    raw TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_import_rejects_job
+    ON import_rejects (job_id, byte_offset);
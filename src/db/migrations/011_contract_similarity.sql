@@ -0,0 +1,25 @@
+-- Índice de similitud de objeto_contrato (MinHash + LSH) para detectar
+-- contratos casi idénticos del mismo proveedor (posible fraccionamiento).
+-- ingest indexa cada solicitud; para las filas existentes o importadas:
+--   python -m src.services.contract_similarity build
+CREATE TABLE IF NOT EXISTS contract_signatures (
+    request_id VARCHAR(100) PRIMARY KEY REFERENCES requests(request_id),
+    proveedor_rut_num INTEGER NOT NULL,
+    contract_at TIMESTAMP NOT NULL,
+    version SMALLINT NOT NULL,
+    signature BYTEA NOT NULL
+);
+
+-- Una fila por banda LSH: la consulta de candidatos es un lookup por
+-- (RUT, banda, bucket) acotado a la ventana de tiempo, sin recorrer el historial
+CREATE TABLE IF NOT EXISTS contract_lsh_buckets (
+    proveedor_rut_num INTEGER NOT NULL,
+    band SMALLINT NOT NULL,
+    bucket BIGINT NOT NULL,
+    contract_at TIMESTAMP NOT NULL,
+    request_id VARCHAR(100) NOT NULL,
+    PRIMARY KEY (proveedor_rut_num, band, bucket, contract_at, request_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_contract_lsh_buckets_request_id
+    ON contract_lsh_buckets (request_id);
@@ -0,0 +1,21 @@
+-- Sharding por RUT de proveedor (src/db/sharding.py). Se aplica en todos los
+-- shards; shard_slots solo se lee en el catálogo (shard 0, DATABASE_URL).
+-- Los slots sin fila usan el shard por defecto (slot % número de shards).
+-- Para mover slots entre shards:
+--   python -m src.db.rebalance_shards plan
+--   python -m src.db.rebalance_shards move --slots 0-63 --to 2
+
+-- Mismo hash que sharding.slot_for_rut (primeros 4 bytes de sha256, mod 1024)
+CREATE OR REPLACE FUNCTION shard_slot(rut_num INTEGER) RETURNS INTEGER
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT (('x' || substr(encode(sha256(rut_num::text::bytea), 'hex'), 1, 8))::bit(32)::bigint % 1024)::integer
+$$;
+
+CREATE TABLE IF NOT EXISTS shard_slots (
+    slot SMALLINT PRIMARY KEY,
+    shard SMALLINT NOT NULL,
+    -- 'moving': escrituras del slot en pausa mientras se copia a target_shard
+    state VARCHAR(10) NOT NULL DEFAULT 'active',
+    target_shard SMALLINT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
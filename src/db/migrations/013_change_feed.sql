@@ -0,0 +1,32 @@
+-- Change feed para invalidar cachés locales entre instancias
+-- (src/services/change_feed.py). Las rutas de escritura insertan en
+-- change_outbox dentro de su transacción; el trigger emite NOTIFY, que Postgres
+-- entrega solo al confirmar. El id es la versión del evento: tras reconectar,
+-- cada instancia relee los eventos posteriores al último que vio. Se aplica en
+-- todos los shards (cada shard notifica lo que se escribe en él).
+CREATE TABLE IF NOT EXISTS change_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    entity VARCHAR(50) NOT NULL,
+    key VARCHAR(150) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+
+-- Limpieza por antigüedad y relectura por ventana de tiempo
+CREATE INDEX IF NOT EXISTS idx_change_outbox_created_at ON change_outbox (created_at);
+
+-- Payload compacto: id|entity|key|epoch del INSERT (para medir el retraso)
+CREATE OR REPLACE FUNCTION change_outbox_notify() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify(
+        'change_feed',
+        NEW.id::text || '|' || NEW.entity || '|' || NEW.key || '|' ||
+        extract(epoch FROM clock_timestamp())::text
+    );
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS change_outbox_notify ON change_outbox;
+CREATE TRIGGER change_outbox_notify
+    AFTER INSERT ON change_outbox
+    FOR EACH ROW EXECUTE FUNCTION change_outbox_notify();
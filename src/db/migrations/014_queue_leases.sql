@@ -0,0 +1,10 @@
+-- Lease de la cola Art. 17 (src/workflows/art17/queue.py). El worker sella
+-- claimed_at al reclamar; una fila 'processing' cuyo lease venció (la instancia
+-- murió a mitad del workflow) vuelve a reclamarse en el mismo SKIP LOCKED.
+-- Las filas que el workflow marca 'processing' por la API no tienen claimed_at
+-- y nunca se reclaman.
+-- migrate:no-transaction
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_requests_claimed
+    ON requests (claimed_at) WHERE status = 'processing' AND claimed_at IS NOT NULL;
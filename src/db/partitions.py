@@ -0,0 +1,396 @@
+# Particionamiento mensual por rango de audit_log y workflow_executions.
+#   migrate: convierte la tabla existente sin bloqueos largos; la tabla actual queda
+#            como partición <tabla>_legacy (MINVALUE → corte)
+#   ensure:  crea las particiones de los próximos meses (también al arranque de la API)
+#   archive: separa particiones antiguas y las exporta a CSV comprimido
+#   restore: vuelve a adjuntar una partición archivada para auditorías
+import argparse
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Tabla -> columna de partición
+PARTITIONED_TABLES = {
+    "audit_log": "timestamp",
+    "workflow_executions": "created_at",
+}
+
+# Índices locales creados en cada partición nueva (vacía, sin costo de bloqueo)
+PARTITION_INDEXES = {
+    "audit_log": ["(request_id, timestamp)", "(stream, seq) WHERE stream IS NOT NULL"],
+    "workflow_executions": ["(request_id)", "(proveedor_rut_num, created_at DESC)"],
+}
+
+# Claves foráneas de la tabla original, replicadas en cada partición nueva
+PARTITION_FOREIGN_KEYS = {
+    "workflow_executions": ["FOREIGN KEY (request_id) REFERENCES requests(request_id)"],
+}
+
+# Triggers de fila (nombre = función) que pasan de la tabla original a la padre;
+# la padre los propaga a todas sus particiones
+PARTITION_TRIGGERS = {
+    "audit_log": ["audit_log_chain"],
+}
+
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", "86400"))
+ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "./archives")
+
+_BOUND_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+_maintenance_task: Optional[asyncio.Task] = None
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + (value.month - 1) + months
+    return value.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_y{start.year:04d}m{start.month:02d}"
+
+
+def _parse_bound(value: str) -> Optional[datetime]:
+    value = value.strip().strip("'")
+    if value.upper() == "MINVALUE":
+        return None
+    return datetime.fromisoformat(value)
+
+
+async def is_partitioned(conn: asyncpg.Connection, table: str) -> bool:
+    relkind = await conn.fetchval(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass($1)", table
+    )
+    return relkind == "p"
+
+
+async def list_partitions(conn: asyncpg.Connection, table: str) -> List[Tuple[str, Optional[datetime], datetime]]:
+    """Particiones adjuntas como (nombre, inicio | None para MINVALUE, fin)"""
+    rows = await conn.fetch(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass($1)
+        """,
+        table,
+    )
+    partitions = []
+    for row in rows:
+        match = _BOUND_RE.search(row["bound"] or "")
+        if not match:
+            continue
+        partitions.append((row["relname"], _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return sorted(partitions, key=lambda p: p[2])
+
+
+async def create_partition(conn: asyncpg.Connection, table: str, start: datetime) -> str:
+    """Crea (si no existe) la partición mensual que comienza en `start`"""
+    name = partition_name(table, start)
+    end = add_months(start, 1)
+    async with conn.transaction():
+        await conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        for i, columns in enumerate(PARTITION_INDEXES.get(table, [])):
+            await conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_idx{i} ON {name} {columns}")
+        for i, fk in enumerate(PARTITION_FOREIGN_KEYS.get(table, [])):
+            exists = await conn.fetchval(
+                "SELECT 1 FROM pg_constraint WHERE conname = $1", f"{name}_fk{i}"
+            )
+            if not exists:
+                await conn.execute(f"ALTER TABLE {name} ADD CONSTRAINT {name}_fk{i} {fk}")
+    return name
+
+
+async def ensure_future_partitions(conn: asyncpg.Connection, months_ahead: int = MONTHS_AHEAD) -> List[str]:
+    """Garantiza particiones desde el último límite existente hasta `months_ahead` meses adelante"""
+    created = []
+    horizon = add_months(month_start(datetime.utcnow()), months_ahead + 1)
+    for table in PARTITIONED_TABLES:
+        if not await is_partitioned(conn, table):
+            continue
+        partitions = await list_partitions(conn, table)
+        cursor = partitions[-1][2] if partitions else month_start(datetime.utcnow())
+        while cursor < horizon:
+            created.append(await create_partition(conn, table, cursor))
+            cursor = add_months(cursor, 1)
+    if created:
+        logger.info(f"Particiones creadas: {', '.join(created)}")
+    return created
+
+
+async def migrate_table(conn: asyncpg.Connection, table: str) -> datetime:
+    """
+    Convierte `table` en particionada por mes. Cada paso toma a lo sumo un bloqueo
+    breve (lock_timeout), las validaciones corren con SHARE UPDATE EXCLUSIVE y el
+    índice único se construye CONCURRENTLY, sin bloquear escrituras.
+    """
+    column = PARTITIONED_TABLES[table]
+    legacy = f"{table}_legacy"
+
+    if await is_partitioned(conn, table):
+        logger.info(f"{table} ya está particionada")
+        return month_start(datetime.utcnow())
+
+    # Corte: inicio del próximo mes; la tabla actual queda como partición (MINVALUE, corte)
+    now = datetime.utcnow()
+    cutoff = add_months(month_start(now), 1)
+    if (cutoff - now).total_seconds() < 86400:
+        cutoff = add_months(cutoff, 1)
+
+    await conn.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+
+    # 1. NOT NULL en la columna de partición sin recorrer la tabla bajo bloqueo exclusivo
+    not_null = await conn.fetchval(
+        "SELECT attnotnull FROM pg_attribute WHERE attrelid = to_regclass($1) AND attname = $2",
+        table, column,
+    )
+    if not not_null:
+        await conn.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_{column}_nn")
+        await conn.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_nn "
+            f"CHECK ({column} IS NOT NULL) NOT VALID"
+        )
+        await conn.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_{column}_nn")
+        await conn.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+        await conn.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_{column}_nn")
+
+    # 2. CHECK con el límite de la partición: permite ATTACH sin escaneo
+    await conn.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {legacy}_bound")
+    await conn.execute(
+        f"ALTER TABLE {table} ADD CONSTRAINT {legacy}_bound "
+        f"CHECK ({column} < '{cutoff.isoformat()}') NOT VALID"
+    )
+    await conn.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {legacy}_bound")
+
+    # 3. Unicidad (id, columna) exigida por la tabla particionada, construida en línea
+    await conn.execute(
+        f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {table}_id_{column}_key "
+        f"ON {table} (id, {column})"
+    )
+
+    # 4. Intercambio: renombrar, crear la tabla padre y adjuntar la original
+    async with conn.transaction():
+        await conn.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_id_{column}_key "
+            f"UNIQUE USING INDEX {table}_id_{column}_key"
+        )
+        await conn.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        await conn.execute(
+            f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE ({column})"
+        )
+        await conn.execute(f"ALTER TABLE {table} ADD UNIQUE (id, {column})")
+        for trigger in PARTITION_TRIGGERS.get(table, []):
+            exists = await conn.fetchval(
+                "SELECT 1 FROM pg_trigger WHERE tgrelid = to_regclass($1) AND tgname = $2",
+                legacy, trigger,
+            )
+            if exists:
+                await conn.execute(f"DROP TRIGGER {trigger} ON {legacy}")
+                await conn.execute(
+                    f"CREATE TRIGGER {trigger} BEFORE INSERT ON {table} "
+                    f"FOR EACH ROW EXECUTE FUNCTION {trigger}()"
+                )
+        await conn.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{cutoff.isoformat()}')"
+        )
+
+    await conn.execute("RESET lock_timeout")
+    logger.info(f"✅ {table} particionada; histórico en {legacy} hasta {cutoff.date()}")
+    return cutoff
+
+
+async def archive_partitions(
+    conn: asyncpg.Connection, table: str, keep_months: int, dest_dir: str = ARCHIVE_DIR
+) -> List[Dict]:
+    """Separa y exporta a CSV.gz las particiones que terminan antes de `keep_months` meses atrás"""
+    limit = add_months(month_start(datetime.utcnow()), -keep_months)
+    dest = Path(dest_dir)
+    dest.mkdir(parents=True, exist_ok=True)
+    archived = []
+
+    for name, start, end in await list_partitions(conn, table):
+        if end > limit:
+            continue
+
+        await conn.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+        await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {name} CONCURRENTLY")
+        await conn.execute("RESET lock_timeout")
+
+        path = dest / f"{name}.csv.gz"
+        with gzip.open(path, "wb") as f:
+            await conn.copy_from_table(name, output=f, format="csv", header=True)
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+
+        row_count = await conn.fetchval(f"SELECT COUNT(*) FROM {name}")
+        async with conn.transaction():
+            await conn.execute(
+                """
+                INSERT INTO partition_archives
+                    (parent_table, partition_name, range_start, range_end, file_path, row_count, sha256)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+                ON CONFLICT (partition_name) DO UPDATE
+                SET file_path = EXCLUDED.file_path, row_count = EXCLUDED.row_count,
+                    sha256 = EXCLUDED.sha256, archived_at = NOW(), reattached_at = NULL
+                """,
+                table, name, start, end, str(path), row_count, digest.hexdigest(),
+            )
+            await conn.execute(f"DROP TABLE {name}")
+
+        logger.info(f"📦 {name} archivada en {path} ({row_count} filas)")
+        archived.append({"partition": name, "file": str(path), "rows": row_count})
+
+    return archived
+
+
+async def restore_partition(conn: asyncpg.Connection, name: str) -> Dict:
+    """Recrea una partición archivada desde su CSV.gz y la vuelve a adjuntar"""
+    entry = await conn.fetchrow("SELECT * FROM partition_archives WHERE partition_name = $1", name)
+    if not entry:
+        raise ValueError(f"Partición archivada '{name}' no encontrada")
+
+    table = entry["parent_table"]
+    column = PARTITIONED_TABLES[table]
+    start = f"'{entry['range_start'].isoformat()}'" if entry["range_start"] else "MINVALUE"
+    end = f"'{entry['range_end'].isoformat()}'"
+
+    digest = hashlib.sha256()
+    with open(entry["file_path"], "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    if digest.hexdigest() != entry["sha256"]:
+        raise ValueError(f"El archivo de {name} no coincide con el hash registrado")
+
+    async with conn.transaction():
+        await conn.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+        with gzip.open(entry["file_path"], "rb") as f:
+            await conn.copy_to_table(name, source=f, format="csv", header=True)
+        # CHECK previo para que el ATTACH no vuelva a recorrer las filas
+        await conn.execute(
+            f"ALTER TABLE {name} ADD CONSTRAINT {name}_bound CHECK ("
+            + (f"{column} >= {start} AND " if entry["range_start"] else "")
+            + f"{column} < {end})"
+        )
+        for i, columns in enumerate(PARTITION_INDEXES.get(table, [])):
+            await conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_idx{i} ON {name} {columns}")
+        await conn.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ({start}) TO ({end})")
+        await conn.execute(
+            "UPDATE partition_archives SET reattached_at = NOW() WHERE partition_name = $1", name
+        )
+
+    logger.info(f"♻️ {name} re-adjuntada a {table}")
+    return {"partition": name, "table": table, "rows": entry["row_count"]}
+
+
+# ==================== MANTENCIÓN EN LA API ====================
+
+async def _run_maintenance():
+    from src.db.database import database
+
+    async with database.connection() as connection:
+        await ensure_future_partitions(connection.raw_connection)
+
+
+async def _maintenance_loop():
+    while True:
+        try:
+            await _run_maintenance()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error creando particiones futuras: {e}")
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
+
+def start_partition_maintenance():
+    """Crea particiones futuras al arranque y luego una vez al día (idempotente)"""
+    global _maintenance_task
+    if _maintenance_task is None or _maintenance_task.done():
+        _maintenance_task = asyncio.create_task(_maintenance_loop())
+
+
+async def stop_partition_maintenance():
+    global _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        try:
+            await _maintenance_task
+        except asyncio.CancelledError:
+            pass
+        _maintenance_task = None
+
+
+# ==================== CLI ====================
+
+async def main(args):
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL not set")
+        return
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        tables = [args.table] if args.table else list(PARTITIONED_TABLES)
+        if args.command == "migrate":
+            for table in tables:
+                cutoff = await migrate_table(conn, table)
+                print(f"  ✅ {table}: particionada (corte {cutoff.date()})")
+            await ensure_future_partitions(conn)
+        elif args.command == "ensure":
+            created = await ensure_future_partitions(conn, args.months_ahead)
+            print(f"  ✅ {len(created)} particiones creadas")
+        elif args.command == "archive":
+            for table in tables:
+                for item in await archive_partitions(conn, table, args.keep_months, args.dest):
+                    print(f"  📦 {item['partition']}: {item['rows']} filas → {item['file']}")
+        elif args.command == "restore":
+            item = await restore_partition(conn, args.partition)
+            print(f"  ♻️ {item['partition']} re-adjuntada a {item['table']}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Particionamiento mensual y archivado")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    migrate = sub.add_parser("migrate", help="Convierte las tablas a particionadas en línea")
+    migrate.add_argument("--table", choices=list(PARTITIONED_TABLES))
+
+    ensure = sub.add_parser("ensure", help="Crea particiones futuras")
+    ensure.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    ensure.set_defaults(table=None)
+
+    archive = sub.add_parser("archive", help="Separa y exporta particiones antiguas")
+    archive.add_argument("--table", choices=list(PARTITIONED_TABLES))
+    archive.add_argument("--keep-months", type=int, default=12)
+    archive.add_argument("--dest", default=ARCHIVE_DIR)
+
+    restore = sub.add_parser("restore", help="Re-adjunta una partición archivada")
+    restore.add_argument("partition")
+    restore.set_defaults(table=None)
+
+    asyncio.run(main(parser.parse_args()))
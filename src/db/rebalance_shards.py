@@ -0,0 +1,384 @@
+"""
+Rebalanceo de slots entre shards (ver src/db/sharding.py).
+
+    python -m src.db.rebalance_shards plan
+    python -m src.db.rebalance_shards move --slots 0-63 --to 2 [--batch-size 500] [--dry-run]
+
+move hace, por cada shard de origen:
+  1. marca los slots 'moving' en shard_slots: la API y la cola dejan de escribir
+     en ellos (503 / reencolado) cuando releen el mapa, por eso se espera
+     --settle-seconds (por defecto dos intervalos de refresco);
+  2. toma en el origen el advisory lock exclusivo de cada slot (espera a las
+     escrituras en curso, que lo toman compartido y revisan shard_slots) y lo
+     retiene hasta terminar la limpieza: ninguna escritura se cuela en el origen
+     después de copiarlo;
+  3. copia por lotes de requests.id (keyset) las solicitudes del slot con sus
+     ejecuciones, certificados, modelo de lectura y firmas de similitud; cada
+     lote es una transacción en el destino y las solicitudes que ya están allí
+     se omiten, así que un move interrumpido se puede repetir;
+  4. apunta los slots al destino y los deja 'active', espera otra vez para que
+     ninguna instancia siga leyendo del origen, y
+  5. borra del origen lo copiado.
+
+Las solicitudes sin RUT normalizado viven siempre en el catálogo y no se mueven.
+audit_log no se toca: sigue en el catálogo.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List
+
+import asyncpg
+
+from src.db.sharding import SHARD_MAP_REFRESH_SECONDS, SHARD_SLOTS, SHARD_URLS, SLOT_LOCK_NAMESPACE
+
+logger = logging.getLogger(__name__)
+
+MOVE_BATCH_SIZE = int(os.getenv("SHARD_MOVE_BATCH_SIZE", "500"))
+
+# Tablas hijas de requests que viajan con cada solicitud, en orden de copia
+# (el borrado va en orden inverso). workflow_executions se trata aparte porque
+# sus ids cambian en el destino.
+CHILD_TABLES = ["certificates", "certificate_read_model", "contract_signatures", "contract_lsh_buckets"]
+
+BATCH_QUERY = """
+    SELECT * FROM requests
+    WHERE id > $1 AND proveedor_rut_num IS NOT NULL
+      AND shard_slot(proveedor_rut_num) = ANY($2::integer[])
+    ORDER BY id
+    LIMIT $3
+"""
+
+
+def parse_slots(value: str) -> List[int]:
+    """'0-63,100,200-201' -> lista de slots"""
+    slots = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+            slots.update(range(start, end + 1))
+        else:
+            slots.add(int(part))
+    invalid = [s for s in slots if not 0 <= s < SHARD_SLOTS]
+    if invalid:
+        raise ValueError(f"Slots fuera de rango (0-{SHARD_SLOTS - 1}): {sorted(invalid)[:10]}")
+    return sorted(slots)
+
+
+def format_slots(slots: List[int]) -> str:
+    """Inversa compacta de parse_slots"""
+    ranges, start = [], None
+    for i, slot in enumerate(slots):
+        if start is None:
+            start = slot
+        if i + 1 == len(slots) or slots[i + 1] != slot + 1:
+            ranges.append(str(start) if start == slot else f"{start}-{slot}")
+            start = None
+    return ",".join(ranges)
+
+
+async def connect_all(database_url: str) -> List[asyncpg.Connection]:
+    return [await asyncpg.connect(url) for url in [database_url] + SHARD_URLS]
+
+
+async def load_slot_map(catalog: asyncpg.Connection, shard_count: int) -> Dict[int, int]:
+    slot_map = {slot: slot % shard_count for slot in range(SHARD_SLOTS)}
+    for row in await catalog.fetch("SELECT slot, shard FROM shard_slots"):
+        slot_map[row["slot"]] = row["shard"]
+    return slot_map
+
+
+async def slot_sizes(conn: asyncpg.Connection) -> Dict[int, int]:
+    rows = await conn.fetch("""
+        SELECT shard_slot(proveedor_rut_num) AS slot, COUNT(*) AS total
+        FROM requests WHERE proveedor_rut_num IS NOT NULL
+        GROUP BY 1
+    """)
+    return {row["slot"]: row["total"] for row in rows}
+
+
+async def table_columns(conn: asyncpg.Connection, table: str) -> List[str]:
+    rows = await conn.fetch(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = $1
+        ORDER BY ordinal_position
+        """,
+        table
+    )
+    return [row["column_name"] for row in rows]
+
+
+# ==================== PLAN ====================
+
+def suggest_moves(sizes: Dict[int, int], slot_map: Dict[int, int], shard_count: int, tolerance: float = 0.1):
+    """Mueve greedy los slots más grandes del shard más cargado al más liviano"""
+    load = [0] * shard_count
+    for slot, shard in slot_map.items():
+        load[shard] += sizes.get(slot, 0)
+    target = sum(load) / shard_count
+    assignment = dict(slot_map)
+    moves: Dict[tuple, List[int]] = {}
+    while True:
+        heaviest = max(range(shard_count), key=lambda s: load[s])
+        lightest = min(range(shard_count), key=lambda s: load[s])
+        if load[heaviest] <= target * (1 + tolerance) or heaviest == lightest:
+            break
+        gap = (load[heaviest] - load[lightest]) / 2
+        candidates = [
+            slot for slot, shard in assignment.items()
+            if shard == heaviest and 0 < sizes.get(slot, 0) <= gap
+        ]
+        if not candidates:
+            break
+        slot = max(candidates, key=lambda s: sizes[s])
+        assignment[slot] = lightest
+        load[heaviest] -= sizes[slot]
+        load[lightest] += sizes[slot]
+        moves.setdefault((heaviest, lightest), []).append(slot)
+    return moves, load
+
+
+async def plan(conns: List[asyncpg.Connection]):
+    slot_map = await load_slot_map(conns[0], len(conns))
+    sizes: Dict[int, int] = {}
+    for conn in conns:
+        for slot, total in (await slot_sizes(conn)).items():
+            sizes[slot] = sizes.get(slot, 0) + total
+
+    print(f"{'shard':<7}{'slots':>7}{'solicitudes':>14}")
+    for shard in range(len(conns)):
+        slots = [slot for slot, s in slot_map.items() if s == shard]
+        print(f"{shard:<7}{len(slots):>7}{sum(sizes.get(slot, 0) for slot in slots):>14}")
+
+    moves, load = suggest_moves(sizes, slot_map, len(conns))
+    if not moves:
+        print("✅ Shards balanceados")
+        return
+    print("Movimientos sugeridos:")
+    for (source, target), slots in moves.items():
+        print(f"  python -m src.db.rebalance_shards move --slots {format_slots(sorted(slots))} --to {target}"
+              f"   # desde shard {source}")
+    print(f"Carga resultante: {load}")
+
+
+# ==================== MOVE ====================
+
+def _remap_result(value, remap: Dict[int, int]):
+    """El resultado almacenado guarda el id de la ejecución, que cambia en el destino"""
+    if value is None:
+        return None
+    result = json.loads(value) if isinstance(value, str) else dict(value)
+    old = result.get("workflow_id")
+    if old is not None and str(old).isdigit() and int(old) in remap:
+        result["workflow_id"] = str(remap[int(old)])
+    return json.dumps(result)
+
+
+async def copy_batch(source: asyncpg.Connection, target: asyncpg.Connection, requests, columns: Dict) -> int:
+    request_ids = [row["request_id"] for row in requests]
+    existing = {
+        row["request_id"] for row in await target.fetch(
+            "SELECT request_id FROM requests WHERE request_id = ANY($1)", request_ids
+        )
+    }
+    requests = [row for row in requests if row["request_id"] not in existing]
+    if not requests:
+        return 0
+    request_ids = [row["request_id"] for row in requests]
+
+    executions = await source.fetch(
+        "SELECT * FROM workflow_executions WHERE request_id = ANY($1) ORDER BY id", request_ids
+    )
+    children = {
+        table: await source.fetch(f"SELECT * FROM {table} WHERE request_id = ANY($1)", request_ids)
+        for table in CHILD_TABLES
+    }
+
+    async with target.transaction():
+        request_columns = [c for c in columns["requests"] if c != "id"]
+        # El resultado se reescribe después, cuando se conocen los ids nuevos
+        await target.copy_records_to_table(
+            "requests", columns=request_columns,
+            records=[tuple(row[c] for c in request_columns) for row in requests]
+        )
+
+        execution_columns = [c for c in columns["workflow_executions"] if c != "id"]
+        insert_execution = (
+            f"INSERT INTO workflow_executions ({', '.join(execution_columns)}) "
+            f"VALUES ({', '.join(f'${i}' for i in range(1, len(execution_columns) + 1))}) RETURNING id"
+        )
+        remap = {}
+        for row in executions:
+            remap[row["id"]] = await target.fetchval(insert_execution, *(row[c] for c in execution_columns))
+
+        if "result" in request_columns and remap:
+            await target.executemany(
+                "UPDATE requests SET result = $2::jsonb WHERE request_id = $1",
+                [
+                    (row["request_id"], _remap_result(row["result"], remap))
+                    for row in requests if row["result"] is not None
+                ]
+            )
+
+        for table in CHILD_TABLES:
+            table_cols = [c for c in columns[table] if c != "id"]
+            records = []
+            for row in children[table]:
+                values = dict(row)
+                if table == "certificates" and values.get("workflow_execution_id") is not None:
+                    values["workflow_execution_id"] = remap.get(values["workflow_execution_id"])
+                records.append(tuple(values[c] for c in table_cols))
+            if records:
+                await target.copy_records_to_table(table, columns=table_cols, records=records)
+    return len(requests)
+
+
+async def delete_batch(source: asyncpg.Connection, request_ids: List[str]):
+    async with source.transaction():
+        for table in reversed(CHILD_TABLES):
+            await source.execute(f"DELETE FROM {table} WHERE request_id = ANY($1)", request_ids)
+        await source.execute("DELETE FROM workflow_executions WHERE request_id = ANY($1)", request_ids)
+        await source.execute("DELETE FROM requests WHERE request_id = ANY($1)", request_ids)
+
+
+async def lock_slots(conn: asyncpg.Connection, slots: List[int]):
+    """Locks exclusivos de sesión: espera a que terminen las escrituras que ya validaron el slot"""
+    await conn.execute(
+        "SELECT pg_advisory_lock($1, slot) FROM unnest($2::integer[]) AS slot", SLOT_LOCK_NAMESPACE, slots
+    )
+
+
+async def unlock_slots(conn: asyncpg.Connection, slots: List[int]):
+    await conn.execute(
+        "SELECT pg_advisory_unlock($1, slot) FROM unnest($2::integer[]) AS slot", SLOT_LOCK_NAMESPACE, slots
+    )
+
+
+async def move(conns: List[asyncpg.Connection], slots: List[int], target_index: int, batch_size: int,
+               settle_seconds: float, dry_run: bool = False):
+    if not 0 <= target_index < len(conns):
+        raise ValueError(f"Shard destino {target_index} no configurado (hay {len(conns)})")
+    catalog, target = conns[0], conns[target_index]
+    slot_map = await load_slot_map(catalog, len(conns))
+
+    by_source: Dict[int, List[int]] = {}
+    for slot in slots:
+        if slot_map[slot] != target_index:
+            by_source.setdefault(slot_map[slot], []).append(slot)
+    if not by_source:
+        print(f"✅ Los slots ya están en el shard {target_index}")
+        return
+
+    for source_index, source_slots in by_source.items():
+        sizes = await slot_sizes(conns[source_index])
+        total = sum(sizes.get(slot, 0) for slot in source_slots)
+        print(f"🚚 Shard {source_index} -> {target_index}: {len(source_slots)} slots, {total} solicitudes")
+    if dry_run:
+        return
+
+    # Columnas presentes en el destino (todos los shards corren las mismas migraciones)
+    columns = {
+        table: await table_columns(target, table)
+        for table in ["requests", "workflow_executions"] + CHILD_TABLES
+    }
+    moving = [slot for source_slots in by_source.values() for slot in source_slots]
+
+    await catalog.executemany(
+        """
+        INSERT INTO shard_slots (slot, shard, state, target_shard, updated_at)
+        VALUES ($1, $2, 'moving', $3, NOW())
+        ON CONFLICT (slot) DO UPDATE
+        SET state = 'moving', target_shard = EXCLUDED.target_shard, updated_at = NOW()
+        """,
+        [(slot, slot_map[slot], target_index) for slot in moving]
+    )
+    print(f"⏳ Slots en 'moving'; esperando {settle_seconds:.0f}s a que las instancias relean el mapa")
+    await asyncio.sleep(settle_seconds)
+
+    started = time.perf_counter()
+    locked = []
+    try:
+        for source_index, source_slots in by_source.items():
+            await lock_slots(conns[source_index], source_slots)
+            locked.append(source_index)
+        print("🔒 Slots bloqueados en el origen: sin escrituras en curso")
+
+        for source_index, source_slots in by_source.items():
+            source = conns[source_index]
+            last_id, copied = 0, 0
+            while True:
+                rows = await source.fetch(BATCH_QUERY, last_id, source_slots, batch_size)
+                if not rows:
+                    break
+                last_id = rows[-1]["id"]
+                copied += await copy_batch(source, target, rows, columns)
+                logger.info(f"🚚 Shard {source_index}: {copied} solicitudes copiadas (último id {last_id})")
+            print(f"  ✅ {copied} solicitudes copiadas desde el shard {source_index}")
+
+        await catalog.execute(
+            """
+            UPDATE shard_slots SET shard = $2, state = 'active', target_shard = NULL, updated_at = NOW()
+            WHERE slot = ANY($1::smallint[])
+            """,
+            moving, target_index
+        )
+        print(f"🔀 Slots apuntados al shard {target_index}; esperando {settle_seconds:.0f}s antes de limpiar el origen")
+        await asyncio.sleep(settle_seconds)
+
+        for source_index, source_slots in by_source.items():
+            source = conns[source_index]
+            deleted = 0
+            while True:
+                rows = await source.fetch(BATCH_QUERY, 0, source_slots, batch_size)
+                if not rows:
+                    break
+                await delete_batch(source, [row["request_id"] for row in rows])
+                deleted += len(rows)
+            print(f"  🧹 {deleted} solicitudes eliminadas del shard {source_index}")
+    finally:
+        for source_index in locked:
+            await unlock_slots(conns[source_index], by_source[source_index])
+    print(f"✅ Rebalanceo terminado en {time.perf_counter() - started:.1f}s")
+
+
+async def main(args):
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL not set")
+        return
+    if not SHARD_URLS:
+        print("❌ DATABASE_SHARD_URLS no configurado: hay un solo shard")
+        return
+
+    conns = await connect_all(database_url)
+    try:
+        if args.command == "plan":
+            await plan(conns)
+        else:
+            await move(conns, parse_slots(args.slots), args.to, args.batch_size, args.settle_seconds, args.dry_run)
+    finally:
+        for conn in conns:
+            await conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebalanceo de slots entre shards")
+    parser.add_argument("command", choices=["plan", "move"])
+    parser.add_argument("--slots", help="Slots a mover, p. ej. 0-63,128")
+    parser.add_argument("--to", type=int, help="Shard destino")
+    parser.add_argument("--batch-size", type=int, default=MOVE_BATCH_SIZE)
+    parser.add_argument("--settle-seconds", type=float, default=2 * SHARD_MAP_REFRESH_SECONDS,
+                        help="Espera para que las instancias relean el mapa de slots")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    if args.command == "move" and (args.slots is None or args.to is None):
+        parser.error("move requiere --slots y --to")
+    asyncio.run(main(args))
@@ -0,0 +1,51 @@
+import argparse
+import asyncio
+import os
+from databases import Database
+
+from src.db.repositories.certificate_read_model_repository import CertificateReadModelRepository
+
+BATCH_SIZE = int(os.getenv("READ_MODEL_REBUILD_BATCH_SIZE", "1000"))
+
+
+async def rebuild_read_model(batch_size: int = BATCH_SIZE, truncate: bool = False):
+    """Regenera certificate_read_model desde certificates/requests/workflow_executions"""
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL not set")
+        return
+
+    db = Database(database_url)
+    await db.connect()
+    print("✅ Connected to database")
+
+    try:
+        repo = CertificateReadModelRepository(db)
+        if truncate:
+            # Elimina también proyecciones huérfanas (certificados borrados)
+            await db.execute(query="TRUNCATE certificate_read_model")
+            print("🧹 Modelo de lectura vaciado")
+
+        last_id = 0
+        batches = 0
+        while True:
+            # Un lote por transacción; las filas aún no proyectadas se leen desde las tablas fuente
+            async with db.transaction():
+                last = await repo.project_batch(last_id, batch_size)
+            if last is None:
+                break
+            last_id = last
+            batches += 1
+            print(f"  ✅ Lote {batches}: certificados proyectados hasta id {last_id}")
+    finally:
+        await db.disconnect()
+
+    print(f"✅ Rebuild completed ({batches} lotes)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenera el modelo de lectura de certificados")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--truncate", action="store_true", help="Vaciar antes de regenerar")
+    args = parser.parse_args()
+    asyncio.run(rebuild_read_model(args.batch_size, args.truncate))
@@ -1,25 +1,56 @@
+import json
 import logging
-from typing import Dict, List, Optional
-from src.db.database import database
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from src.db.database import database, read_database, shards
+from src.db.fastpath import fastpath
+from src.db.repositories.stats_repository import StatsRepository
+from src.services.audit_chain import request_proof
+from src.services.change_feed import ALL, PROVEEDOR, STATS, change_cache
+from src.services.tracing import traced_methods
+from src.utils.ids import certificado_id_bounds, CERT_ID_SQL_PATTERN
+from src.utils.rut import normalize_rut, try_normalize_rut, format_rut
 
 logger = logging.getLogger(__name__)
 
+def _parse_fecha(value: str, name: str) -> datetime:
+    """'YYYY-MM-DD' o ISO 8601 -> datetime (ValueError si no es una fecha)"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} inválida: {value} (formato YYYY-MM-DD)")
+
+@traced_methods
 class Art17Repository:
     def __init__(self):
         self.db = database
+        self.reader = read_database
+    
+    @property
+    def hot_reader(self):
+        """Consultas calientes: fast path asyncpg con sentencias preparadas si está activo"""
+        return fastpath if fastpath.enabled else self.reader
     
     async def get_proveedor_profile(self, rut: str) -> Dict:
-        """Obtiene perfil completo de un proveedor"""
+        """Obtiene perfil completo de un proveedor (ValueError si el RUT es inválido)"""
         try:
+            rut_num, rut_dv = normalize_rut(rut)
+            rut = format_rut(rut_num, rut_dv)
             query = """
                 SELECT 
                     request_id, proveedor_nombre, proveedor_rut,
                     status, nivel_riesgo, certificado_emitido, created_at
                 FROM workflow_executions
-                WHERE proveedor_rut = :rut
+                WHERE proveedor_rut_num = :rut_num
                 ORDER BY created_at DESC
             """
-            results = await self.db.fetch_all(query=query, values={"rut": rut})
+            # Todas las solicitudes del proveedor están en su shard; la caché
+            # local se invalida cuando otra instancia le emite un certificado
+            reader = shards.for_rut(rut_num).reader
+            results = await change_cache.get_or_load(
+                PROVEEDOR, rut_num, "profile",
+                lambda: reader.fetch_all(query=query, values={"rut_num": rut_num})
+            )
             
             if not results:
                 return {"exists": False, "rut": rut, "message": "Proveedor no encontrado"}
@@ -37,7 +68,7 @@ class Art17Repository:
             logger.error(f"Error al obtener perfil de proveedor {rut}: {e}")
             raise
 
-    async def search_workflows(
+    def _search_filters(
         self,
         query: Optional[str] = None,
         status: Optional[str] = None,
@@ -45,48 +76,66 @@ class Art17Repository:
         monto_min: Optional[float] = None,
         monto_max: Optional[float] = None,
         fecha_desde: Optional[str] = None,
-        fecha_hasta: Optional[str] = None,
+        fecha_hasta: Optional[str] = None
+    ) -> Tuple[str, Dict]:
+        """Cláusula WHERE y valores comunes a las variantes de búsqueda"""
+        conditions = ["w.proveedor_rut IS NOT NULL"]
+        values = {}
+        
+        # Un RUT escrito como tal (con guion o puntos) se busca por la clave
+        # normalizada (índice exacto). Solo dígitos es texto libre: uno de cada
+        # once números pasa el módulo 11 y perdería sus coincidencias de texto
+        rut_key = try_normalize_rut(query) if query and ("-" in query or "." in query) else None
+        if rut_key:
+            conditions.append("w.proveedor_rut_num = :rut_num")
+            values["rut_num"] = rut_key[0]
+        
+        # Búsqueda de texto libre
+        elif query:
+            conditions.append("""(
+                w.proveedor_rut ILIKE :query OR 
+                w.proveedor_nombre ILIKE :query OR
+                r.objeto_contrato ILIKE :query
+            )""")
+            values["query"] = f"%{query}%"
+        
+        # Filtros específicos
+        if status:
+            conditions.append("w.status = :status")
+            values["status"] = status
+        
+        if riesgo:
+            conditions.append("LOWER(w.nivel_riesgo) = LOWER(:riesgo)")
+            values["riesgo"] = riesgo
+        
+        if monto_min is not None:
+            conditions.append("r.monto_contrato >= :monto_min")
+            values["monto_min"] = monto_min
+        
+        if monto_max is not None:
+            conditions.append("r.monto_contrato <= :monto_max")
+            values["monto_max"] = monto_max
+        
+        # Se enlazan como datetime: asyncpg (fast path) rechaza texto en un parámetro timestamp
+        if fecha_desde:
+            conditions.append("w.created_at >= :fecha_desde")
+            values["fecha_desde"] = _parse_fecha(fecha_desde, "fecha_desde")
+        
+        if fecha_hasta:
+            conditions.append("w.created_at <= :fecha_hasta")
+            values["fecha_hasta"] = _parse_fecha(fecha_hasta, "fecha_hasta")
+        
+        return " AND ".join(conditions), values
+
+    async def search_workflows(
+        self,
         limit: int = 50,
-        offset: int = 0
+        offset: int = 0,
+        **filters
     ) -> Dict:
         """Busca workflows con múltiples filtros"""
         try:
-            conditions = ["w.proveedor_rut IS NOT NULL"]
-            values = {}
-            
-            # Búsqueda de texto libre
-            if query:
-                conditions.append("""(
-                    w.proveedor_rut ILIKE :query OR 
-                    w.proveedor_nombre ILIKE :query OR
-                    r.objeto_contrato ILIKE :query
-                )""")
-                values["query"] = f"%{query}%"
-            
-            # Filtros específicos
-            if status:
-                conditions.append("w.status = :status")
-                values["status"] = status
-            
-            if riesgo:
-                conditions.append("LOWER(w.nivel_riesgo) = LOWER(:riesgo)")
-                values["riesgo"] = riesgo
-            
-            if monto_min is not None:
-                conditions.append("r.monto_contrato >= :monto_min")
-                values["monto_min"] = monto_min
-            
-            if monto_max is not None:
-                conditions.append("r.monto_contrato <= :monto_max")
-                values["monto_max"] = monto_max
-            
-            if fecha_desde:
-                conditions.append("w.created_at >= :fecha_desde::timestamp")
-                values["fecha_desde"] = fecha_desde
-            
-            if fecha_hasta:
-                conditions.append("w.created_at <= :fecha_hasta::timestamp")
-                values["fecha_hasta"] = fecha_hasta
+            where, values = self._search_filters(**filters)
             
             # Query principal
             query_sql = f"""
@@ -96,38 +145,205 @@ class Art17Repository:
                     w.created_at, r.monto_contrato, r.objeto_contrato
                 FROM workflow_executions w
                 LEFT JOIN requests r ON w.request_id = r.request_id
-                WHERE {" AND ".join(conditions)}
+                WHERE {where}
                 ORDER BY w.created_at DESC
                 LIMIT :limit OFFSET :offset
             """
             
-            values["limit"] = limit
-            values["offset"] = offset
-            
-            # Ejecutar búsqueda
-            results = await self.db.fetch_all(query=query_sql, values=values)
-            
             # Contar total
             count_sql = f"""
                 SELECT COUNT(*) as total
                 FROM workflow_executions w
                 LEFT JOIN requests r ON w.request_id = r.request_id
-                WHERE {" AND ".join(conditions)}
+                WHERE {where}
             """
-            count_values = {k: v for k, v in values.items() if k not in ['limit', 'offset']}
-            total_result = await self.db.fetch_one(query=count_sql, values=count_values)
+
+            # Scatter-gather: con varios shards cada uno entrega sus primeras
+            # offset + limit filas y la página se corta tras mezclarlas
+            if shards.enabled:
+                page_values = {**values, "limit": limit + offset, "offset": 0}
+            else:
+                page_values = {**values, "limit": limit, "offset": offset}
+
+            async def search_shard(shard):
+                rows = await shard.hot_reader.fetch_all(query=query_sql, values=page_values)
+                total_result = await shard.hot_reader.fetch_one(query=count_sql, values=values)
+                return [dict(row) for row in rows], total_result["total"] if total_result else 0
+
+            pages = await shards.gather(search_shard)
+            results = [row for rows, _ in pages for row in rows]
+            if shards.enabled:
+                results.sort(key=lambda row: row["created_at"], reverse=True)
+                results = results[offset:offset + limit]
             
             return {
                 "count": len(results),
-                "total": total_result["total"] if total_result else 0,
+                "total": sum(total for _, total in pages),
                 "limit": limit,
                 "offset": offset,
-                "results": [dict(row) for row in results]
+                "results": results
             }
         except Exception as e:
             logger.error(f"Error en búsqueda de workflows: {e}")
             raise
 
+    async def search_workflows_json(
+        self,
+        limit: int = 50,
+        offset: int = 0,
+        facets: bool = False,
+        use_counters: bool = True,
+        **filters
+    ) -> Dict:
+        """
+        Misma búsqueda que search_workflows, pero Postgres arma el cuerpo JSON
+        completo (json_agg) en una sola consulta. Devuelve count, total y `body`
+        como texto listo para enviarse sin pasar por Python.
+
+        Con facets=True el cuerpo incluye conteos por estado, nivel de riesgo y
+        banda de monto del conjunto filtrado, calculados con GROUPING SETS en la
+        misma pasada que reemplaza al COUNT(*). Sin filtros, las facetas y el
+        total salen de los contadores mantenidos (search_facet_counts), salvo
+        use_counters=False o si la vista aún no se ha poblado.
+
+        Con varios shards cada uno arma su propio cuerpo (primeras offset + limit
+        filas y sus facetas) y aquí se mezclan: orden por created_at y suma de
+        conteos.
+        """
+        try:
+            counters = None
+            if facets and use_counters and not any(v not in (None, "") for v in filters.values()):
+                counters = await StatsRepository().get_search_facets()
+
+            if not shards.enabled:
+                return await self._search_json(self.hot_reader, limit, offset, facets, counters, filters)
+
+            pages = await shards.gather(lambda shard: self._search_json(
+                shard.hot_reader, limit + offset, 0, facets and counters is None, None, filters
+            ))
+            bodies = [json.loads(page["body"]) for page in pages]
+            # created_at llega como texto ISO de Postgres: el orden lexicográfico es el cronológico
+            results = sorted(
+                (row for body in bodies for row in body["results"]),
+                key=lambda row: row["created_at"], reverse=True
+            )[offset:offset + limit]
+            total = counters["total"] if counters is not None else sum(body["total"] for body in bodies)
+            merged = {"count": len(results), "total": total, "limit": limit, "offset": offset, "results": results}
+            if counters is not None:
+                merged["facets"] = {
+                    **counters["facets"],
+                    "fuente": "contadores",
+                    "actualizado_at": counters["refreshed_at"].isoformat() if counters["refreshed_at"] else None
+                }
+            elif facets:
+                merged["facets"] = {"status": {}, "nivel_riesgo": {}, "monto": {}, "fuente": "consulta"}
+                for body in bodies:
+                    for facet in ("status", "nivel_riesgo", "monto"):
+                        for value, n in body["facets"][facet].items():
+                            merged["facets"][facet][value] = merged["facets"][facet].get(value, 0) + n
+            return {"count": len(results), "total": total, "body": json.dumps(merged, ensure_ascii=False)}
+        except Exception as e:
+            logger.error(f"Error en búsqueda de workflows (JSON): {e}")
+            raise
+
+    async def _search_json(
+        self, reader, limit: int, offset: int, facets: bool, counters: Optional[Dict], filters: Dict
+    ) -> Dict:
+        """Consulta única de search_workflows_json sobre un shard"""
+        try:
+            where, values = self._search_filters(**filters)
+            values = {**values, "limit": limit, "offset": offset}
+
+            if counters is not None:
+                values["total"] = counters["total"]
+                values["facets"] = json.dumps({
+                    **counters["facets"],
+                    "fuente": "contadores",
+                    "actualizado_at": counters["refreshed_at"].isoformat() if counters["refreshed_at"] else None
+                })
+                extra_ctes = ""
+                total_sql = "CAST(:total AS BIGINT)"
+                # Texto -> json en SQL: el codec json del fast path volvería a serializar el str
+                facets_sql = ", 'facets', CAST(CAST(:facets AS TEXT) AS json)"
+            elif facets:
+                extra_ctes = """,
+                facetas AS (
+                    SELECT
+                        GROUPING(status) AS g_status,
+                        GROUPING(nivel_riesgo_facet) AS g_riesgo,
+                        GROUPING(monto_banda) AS g_monto,
+                        COALESCE(status, 'sin_dato') AS status,
+                        COALESCE(nivel_riesgo_facet, 'sin_dato') AS nivel_riesgo,
+                        monto_banda,
+                        COUNT(*) AS n
+                    FROM filtrados
+                    GROUP BY GROUPING SETS ((status), (nivel_riesgo_facet), (monto_banda), ())
+                )"""
+                total_sql = "COALESCE((SELECT n FROM facetas WHERE g_status = 1 AND g_riesgo = 1 AND g_monto = 1), 0)"
+                facets_sql = """, 'facets', json_build_object(
+                            'status', COALESCE(
+                                (SELECT json_object_agg(status, n) FROM facetas WHERE g_status = 0), '{}'::json),
+                            'nivel_riesgo', COALESCE(
+                                (SELECT json_object_agg(nivel_riesgo, n) FROM facetas WHERE g_riesgo = 0), '{}'::json),
+                            'monto', COALESCE(
+                                (SELECT json_object_agg(monto_banda, n) FROM facetas WHERE g_monto = 0), '{}'::json),
+                            'fuente', 'consulta'
+                        )"""
+            else:
+                extra_ctes = ""
+                total_sql = "(SELECT COUNT(*) FROM filtrados)"
+                facets_sql = ""
+
+            # Columnas auxiliares de facetas: solo para agrupar, no salen en los resultados
+            facet_columns = """,
+                        LOWER(w.nivel_riesgo) AS nivel_riesgo_facet,
+                        monto_banda(r.monto_contrato) AS monto_banda""" if facets and counters is None else ""
+            page_columns = """
+                        request_id, proveedor_rut, proveedor_nombre, status, nivel_riesgo,
+                        certificado_emitido, created_at, monto_contrato, objeto_contrato"""
+
+            query_sql = f"""
+                WITH filtrados AS (
+                    SELECT 
+                        w.request_id, w.proveedor_rut, w.proveedor_nombre,
+                        w.status, w.nivel_riesgo, w.certificado_emitido,
+                        w.created_at, r.monto_contrato, r.objeto_contrato{facet_columns}
+                    FROM workflow_executions w
+                    LEFT JOIN requests r ON w.request_id = r.request_id
+                    WHERE {where}
+                ),
+                pagina AS (
+                    SELECT {page_columns}
+                    FROM filtrados
+                    ORDER BY created_at DESC
+                    LIMIT CAST(:limit AS INTEGER) OFFSET CAST(:offset AS INTEGER)
+                ){extra_ctes},
+                conteos AS (
+                    SELECT
+                        (SELECT COUNT(*) FROM pagina) AS count,
+                        {total_sql} AS total
+                )
+                SELECT
+                    conteos.count, conteos.total,
+                    json_build_object(
+                        'count', conteos.count,
+                        'total', conteos.total,
+                        'limit', CAST(:limit AS INTEGER),
+                        'offset', CAST(:offset AS INTEGER),
+                        'results', COALESCE(
+                            (SELECT json_agg(pagina ORDER BY pagina.created_at DESC) FROM pagina),
+                            '[]'::json
+                        ){facets_sql}
+                    )::text AS body
+                FROM conteos
+            """
+            
+            result = await reader.fetch_one(query=query_sql, values=values)
+            return dict(result)
+        except Exception as e:
+            logger.error(f"Error en búsqueda de workflows (JSON): {e}")
+            raise
+
     async def get_statistics_summary(self) -> Dict:
         """Obtiene estadísticas generales del sistema"""
         try:
@@ -144,8 +360,14 @@ class Art17Repository:
                 FROM workflow_executions
                 WHERE proveedor_rut IS NOT NULL
             """
-            result = await self.db.fetch_one(query=query)
-            return dict(result) if result else {}
+            # Cada RUT vive en un solo shard: también los proveedores distintos se suman
+            pages = await change_cache.get_or_load(
+                STATS, ALL, "summary", lambda: shards.gather(lambda shard: shard.reader.fetch_one(query=query))
+            )
+            rows = [row for row in pages if row]
+            if not rows:
+                return {}
+            return {key: sum(row[key] or 0 for row in rows) for key in rows[0].keys()}
         except Exception as e:
             logger.error(f"Error al obtener estadísticas: {e}")
             raise
@@ -155,29 +377,147 @@ class Art17Repository:
         try:
             query = """
                 SELECT 
-                    w.*, r.proveedor_nombre as request_proveedor_nombre,
-                    r.monto_contrato, r.objeto_contrato, r.created_at as request_created_at
+                    w.*, w.id as workflow_execution_id,
+                    r.proveedor_nombre as request_proveedor_nombre,
+                    r.monto_contrato, r.objeto_contrato, r.created_at as request_created_at,
+                    c.certificado_id, c.issued_at as certificado_issued_at
                 FROM workflow_executions w
                 JOIN requests r ON w.request_id = r.request_id
+                LEFT JOIN certificates c ON c.workflow_execution_id = w.id
                 WHERE w.request_id = :request_id
+                  -- Poda de particiones mensuales: la ejecución nunca precede a la solicitud
+                  AND w.created_at >= COALESCE(r.created_at, CAST('-infinity' AS TIMESTAMP))
             """
-            result = await self.db.fetch_one(query=query, values={"request_id": request_id})
+            result = await shards.find(
+                request_id, lambda shard: shard.hot_reader.fetch_one(query=query, values={"request_id": request_id})
+            )
             return dict(result) if result else None
         except Exception as e:
             logger.error(f"Error al obtener workflow {request_id}: {e}")
             raise
 
-    async def get_audit_trail(self, request_id: str) -> List[Dict]:
-        """Obtiene el trail de auditoría de una solicitud"""
+    async def get_certificate_by_id(self, certificado_id: str) -> Optional[Dict]:
+        """Obtiene un certificado con los datos de su solicitud y evaluación"""
+        try:
+            query = """
+                SELECT 
+                    c.certificado_id, c.request_id, c.issued_at, c.hash_final, c.firma_digital,
+                    r.proveedor_rut, r.proveedor_nombre, r.monto_contrato, r.objeto_contrato,
+                    w.riesgo, w.cumplimiento, w.workflow_type
+                FROM certificates c
+                JOIN requests r ON r.request_id = c.request_id
+                LEFT JOIN workflow_executions w
+                    ON w.id = c.workflow_execution_id AND w.created_at >= COALESCE(r.created_at, CAST('-infinity' AS TIMESTAMP))
+                WHERE c.certificado_id = :certificado_id
+            """
+            result = await shards.find(
+                certificado_id,
+                lambda shard: shard.hot_reader.fetch_one(query=query, values={"certificado_id": certificado_id})
+            )
+            return dict(result) if result else None
+        except Exception as e:
+            logger.error(f"Error al obtener certificado {certificado_id}: {e}")
+            raise
+
+    async def get_certificates_issued_between(
+        self, desde: datetime, hasta: datetime, limit: int = 100
+    ) -> List[Dict]:
+        """
+        Certificados emitidos en [desde, hasta). Los IDs ordenables se leen con un
+        range scan sobre el índice único de certificado_id; los IDs antiguos
+        (CERT-<hex>, sin tiempo) se filtran por issued_at.
+        """
         try:
+            lower, upper = certificado_id_bounds(desde, hasta)
             query = """
-                SELECT id, action, user_id, details, timestamp
+                (
+                    SELECT certificado_id, request_id, issued_at, hash_final
+                    FROM certificates
+                    WHERE certificado_id >= :lower AND certificado_id < :upper
+                      AND certificado_id ~ :pattern
+                    ORDER BY certificado_id
+                    LIMIT :limit
+                )
+                UNION ALL
+                (
+                    SELECT certificado_id, request_id, issued_at, hash_final
+                    FROM certificates
+                    WHERE issued_at >= :desde AND issued_at < :hasta
+                      AND certificado_id !~ :pattern
+                    ORDER BY issued_at
+                    LIMIT :limit
+                )
+            """
+            values = {
+                "lower": lower, "upper": upper, "pattern": CERT_ID_SQL_PATTERN,
+                "desde": desde, "hasta": hasta, "limit": limit
+            }
+            pages = await shards.gather(lambda shard: shard.reader.fetch_all(query=query, values=values))
+            rows = sorted((dict(row) for results in pages for row in results), key=lambda row: row["issued_at"])
+            return rows[:limit]
+        except Exception as e:
+            logger.error(f"Error al listar certificados entre {desde} y {hasta}: {e}")
+            raise
+
+    async def get_audit_trail(self, request_id: str, include_proof: bool = False) -> Dict:
+        """
+        Obtiene el trail de auditoría de una solicitud: etapas con hash y eventos.
+        Con include_proof agrega la prueba de la cadena de auditoría y su checkpoint.
+        """
+        try:
+            request_query = """
+                SELECT r.status, r.created_at,
+                    w.hash_ingest, w.hash_riesgo, w.hash_compliance, w.hash_final,
+                    w.timestamp_final, w.created_at as workflow_created_at
+                FROM requests r
+                LEFT JOIN workflow_executions w
+                    ON w.request_id = r.request_id AND w.created_at >= COALESCE(r.created_at, CAST('-infinity' AS TIMESTAMP))
+                WHERE r.request_id = :request_id
+                ORDER BY w.created_at DESC NULLS LAST
+                LIMIT 1
+            """
+            # La solicitud está en el shard de su proveedor; audit_log, en el catálogo
+            request = await shards.find(
+                request_id, lambda shard: shard.reader.fetch_one(query=request_query, values={"request_id": request_id})
+            )
+            if not request:
+                return {"request_id": request_id, "exists": False}
+            
+            # Sin ejecución registrada la solicitud no tiene etapas
+            stages = []
+            if request["hash_ingest"] is not None:
+                stages = [
+                    {"etapa": "ingest", "hash": request["hash_ingest"], "timestamp": request["workflow_created_at"]},
+                    {"etapa": "riesgo", "hash": request["hash_riesgo"], "timestamp": None},
+                    {"etapa": "compliance", "hash": request["hash_compliance"], "timestamp": None},
+                    {"etapa": "final", "hash": request["hash_final"], "timestamp": request["timestamp_final"]},
+                ]
+            
+            query = """
+                SELECT id, action, user_id, details, timestamp, seq, prev_hash, entry_hash
                 FROM audit_log
                 WHERE request_id = :request_id
+                  -- Poda de particiones mensuales en tiempo de ejecución. timestamp lo
+                  -- pone la app (UTC) y created_at la BD: el margen cubre desfase y zona horaria
+                  AND timestamp >= COALESCE(
+                      CAST(:request_created_at AS TIMESTAMP) - INTERVAL '1 day', CAST('-infinity' AS TIMESTAMP)
+                  )
                 ORDER BY timestamp DESC
             """
-            results = await self.db.fetch_all(query=query, values={"request_id": request_id})
-            return [dict(row) for row in results]
+            results = await self.reader.fetch_all(
+                query=query,
+                values={"request_id": request_id, "request_created_at": request["created_at"]}
+            )
+            trail = {
+                "request_id": request_id,
+                "exists": True,
+                "status": request["status"],
+                "workflow_stages": stages,
+                "audit_events": [dict(row) for row in results]
+            }
+            if include_proof:
+                trail["audit_proof"] = await request_proof(request_id)
+            return trail
         except Exception as e:
             logger.error(f"Error al obtener audit trail de {request_id}: {e}")
             raise
@@ -0,0 +1,194 @@
+import logging
+from typing import Dict, List, Optional
+from src.db.database import database, read_database
+from src.db.routing import mark_write
+from src.services.tracing import traced_methods
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_STREAM = "_global"
+
+# Clave del advisory lock de checkpoints: una sola instancia a la vez
+CHECKPOINT_LOCK_KEY = 1741
+
+ENTRY_COLUMNS = """
+    id, request_id, stream, seq, prev_hash, entry_hash,
+    action, user_id, details::text AS details_text, timestamp
+"""
+
+
+@traced_methods
+class AuditChainRepository:
+    def __init__(self, db=None):
+        self.db = db or database
+        self.reader = read_database if db is None else db
+
+    async def get_stream_entries(
+        self, stream: str, after_seq: int = 0, until_seq: Optional[int] = None, reader=None
+    ) -> List[Dict]:
+        """Eventos encadenados de un stream con seq en (after_seq, until_seq], en orden"""
+        try:
+            condition = "request_id IS NULL" if stream == GLOBAL_STREAM else "request_id = :stream"
+            results = await (reader or self.db).fetch_all(
+                query=f"""
+                    SELECT {ENTRY_COLUMNS}
+                    FROM audit_log
+                    WHERE {condition} AND stream = :stream
+                      AND seq > :after_seq
+                      AND (CAST(:until_seq AS BIGINT) IS NULL OR seq <= CAST(:until_seq AS BIGINT))
+                    ORDER BY seq
+                """,
+                values={"stream": stream, "after_seq": after_seq, "until_seq": until_seq}
+            )
+            return [dict(row) for row in results]
+        except Exception as e:
+            logger.error(f"Error leyendo cadena de auditoría {stream}: {e}")
+            raise
+
+    async def get_pending_heads(self, limit: int) -> List[Dict]:
+        """Streams con eventos posteriores a su último checkpoint y la cabeza firmada previa"""
+        try:
+            results = await self.db.fetch_all(
+                query="""
+                    SELECT
+                        h.stream, h.seq, h.entry_hash,
+                        COALESCE(c.seq, 0) AS checkpoint_seq,
+                        COALESCE(c.entry_hash, '') AS checkpoint_hash
+                    FROM audit_chain_heads h
+                    LEFT JOIN LATERAL (
+                        SELECT seq, entry_hash FROM audit_checkpoint_heads
+                        WHERE stream = h.stream
+                        ORDER BY checkpoint_id DESC
+                        LIMIT 1
+                    ) c ON true
+                    WHERE h.seq > h.checkpointed_seq
+                    ORDER BY h.stream
+                    LIMIT :limit
+                """,
+                values={"limit": limit}
+            )
+            return [dict(row) for row in results]
+        except Exception as e:
+            logger.error(f"Error leyendo cabezas pendientes de auditoría: {e}")
+            raise
+
+    async def get_last_checkpoint(self) -> Optional[Dict]:
+        row = await self.db.fetch_one(
+            query="SELECT * FROM audit_checkpoints ORDER BY id DESC LIMIT 1"
+        )
+        return dict(row) if row else None
+
+    async def get_checkpoints_after(self, checkpoint_id: int) -> List[Dict]:
+        results = await self.db.fetch_all(
+            query="SELECT * FROM audit_checkpoints WHERE id > :checkpoint_id ORDER BY id",
+            values={"checkpoint_id": checkpoint_id}
+        )
+        return [dict(row) for row in results]
+
+    async def get_checkpoint_heads(self, checkpoint_id: int, reader=None) -> List[Dict]:
+        results = await (reader or self.db).fetch_all(
+            query="""
+                SELECT stream, seq, entry_hash FROM audit_checkpoint_heads
+                WHERE checkpoint_id = :checkpoint_id
+            """,
+            values={"checkpoint_id": checkpoint_id}
+        )
+        return [dict(row) for row in results]
+
+    async def get_checkpoint_deltas(self, checkpoint_id: int) -> List[Dict]:
+        """
+        Cabezas del checkpoint junto con la cabeza de cada stream en el checkpoint
+        anterior que lo cubría (0 y '' si es su primer checkpoint)
+        """
+        results = await self.db.fetch_all(
+            query="""
+                SELECT
+                    h.stream, h.seq, h.entry_hash,
+                    COALESCE(p.seq, 0) AS checkpoint_seq,
+                    COALESCE(p.entry_hash, '') AS checkpoint_hash
+                FROM audit_checkpoint_heads h
+                LEFT JOIN LATERAL (
+                    SELECT seq, entry_hash FROM audit_checkpoint_heads
+                    WHERE stream = h.stream AND checkpoint_id < h.checkpoint_id
+                    ORDER BY checkpoint_id DESC
+                    LIMIT 1
+                ) p ON true
+                WHERE h.checkpoint_id = :checkpoint_id
+            """,
+            values={"checkpoint_id": checkpoint_id}
+        )
+        return [dict(row) for row in results]
+
+    async def get_stream_checkpoint(self, stream: str, reader=None) -> Optional[Dict]:
+        """Último checkpoint que cubre el stream, con la cabeza registrada en él"""
+        row = await (reader or self.db).fetch_one(
+            query="""
+                SELECT c.*, h.seq AS covered_seq, h.entry_hash AS covered_hash
+                FROM audit_checkpoint_heads h
+                JOIN audit_checkpoints c ON c.id = h.checkpoint_id
+                WHERE h.stream = :stream
+                ORDER BY h.checkpoint_id DESC
+                LIMIT 1
+            """,
+            values={"stream": stream}
+        )
+        return dict(row) if row else None
+
+    async def try_checkpoint_lock(self) -> bool:
+        """Advisory lock de transacción: llamar dentro de la transacción del checkpoint"""
+        return await self.db.fetch_val(
+            query="SELECT pg_try_advisory_xact_lock(:key)", values={"key": CHECKPOINT_LOCK_KEY}
+        )
+
+    async def save_checkpoint(
+        self, prev_hash: str, merkle_root: str, checkpoint_hash: str,
+        heads: List[Dict], entries: int, firma_digital: Optional[str]
+    ) -> int:
+        """Registra el checkpoint y sus cabezas; se llama dentro de una transacción"""
+        try:
+            mark_write()
+            checkpoint_id = await self.db.fetch_val(
+                query="""
+                    INSERT INTO audit_checkpoints
+                        (prev_hash, merkle_root, checkpoint_hash, streams, entries, firma_digital)
+                    VALUES (:prev_hash, :merkle_root, :checkpoint_hash, :streams, :entries, :firma_digital)
+                    RETURNING id
+                """,
+                values={
+                    "prev_hash": prev_hash,
+                    "merkle_root": merkle_root,
+                    "checkpoint_hash": checkpoint_hash,
+                    "streams": len(heads),
+                    "entries": entries,
+                    "firma_digital": firma_digital
+                }
+            )
+            values = {
+                "checkpoint_id": checkpoint_id,
+                "streams": [h["stream"] for h in heads],
+                "seqs": [h["seq"] for h in heads],
+                "hashes": [h["entry_hash"] for h in heads]
+            }
+            await self.db.execute(
+                query="""
+                    INSERT INTO audit_checkpoint_heads (checkpoint_id, stream, seq, entry_hash)
+                    SELECT :checkpoint_id, s.stream, s.seq, s.entry_hash
+                    FROM unnest(
+                        CAST(:streams AS VARCHAR[]), CAST(:seqs AS BIGINT[]), CAST(:hashes AS VARCHAR[])
+                    ) AS s(stream, seq, entry_hash)
+                """,
+                values=values
+            )
+            await self.db.execute(
+                query="""
+                    UPDATE audit_chain_heads h
+                    SET checkpointed_seq = s.seq
+                    FROM unnest(CAST(:streams AS VARCHAR[]), CAST(:seqs AS BIGINT[])) AS s(stream, seq)
+                    WHERE h.stream = s.stream
+                """,
+                values={"streams": values["streams"], "seqs": values["seqs"]}
+            )
+            return checkpoint_id
+        except Exception as e:
+            logger.error(f"Error guardando checkpoint de auditoría: {e}")
+            raise
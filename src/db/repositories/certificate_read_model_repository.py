@@ -0,0 +1,214 @@
+import logging
+from typing import List, Optional
+from src.db.database import database, read_database, shards
+from src.db.fastpath import fastpath
+from src.db.routing import mark_write
+from src.services.change_feed import CERTIFICATE, change_cache
+from src.services.tracing import traced_methods
+
+logger = logging.getLogger(__name__)
+
+# Proyección única desde las tablas fuente: la usan la escritura en línea, la
+# actualización por decisión HITL, el rebuild y la lectura de respaldo.
+PROJECTION_SQL = """
+    SELECT
+        c.certificado_id, c.request_id, c.issued_at,
+        jsonb_build_object(
+            'certificado_id', c.certificado_id,
+            'request_id', c.request_id,
+            'issued_at', c.issued_at::text,
+            'hash_final', c.hash_final,
+            'proveedor', jsonb_build_object(
+                'rut', r.proveedor_rut,
+                'nombre', r.proveedor_nombre
+            ),
+            'contrato', jsonb_build_object(
+                'monto', NULLIF(r.monto_contrato, 0)::float8,
+                'objeto', r.objeto_contrato
+            ),
+            'evaluacion', jsonb_build_object(
+                'nivel_riesgo', w.riesgo,
+                'cumplimiento', COALESCE(w.cumplimiento, false),
+                'workflow_type', w.workflow_type
+            ),
+            'verificacion', jsonb_build_object(
+                'url', '/api/v2/certificates/' || c.certificado_id || '/verify',
+                'metodo', 'GET'
+            )
+        ) AS certificado,
+        jsonb_build_object(
+            'exists', true,
+            'certificado_id', c.certificado_id,
+            'request_id', c.request_id,
+            'issued_at', c.issued_at::text,
+            'hash_certificado', c.hash_final,
+            'hash_workflow', w.hash_final,
+            'firma_digital', c.firma_digital,
+            'hash_match', chequeo.hash_match,
+            'chain_complete', chequeo.chain_complete,
+            'estado', w.status,
+            'hitl_decision', w.hitl_decision,
+            'valid', chequeo.valid,
+            'confianza', CASE WHEN chequeo.valid THEN 'ALTA' ELSE 'BAJA' END,
+            'mensaje', CASE
+                WHEN chequeo.valid THEN '✅ Certificado válido e íntegro'
+                ELSE '⚠️ Certificado con problemas de integridad'
+            END
+        ) || CASE
+            WHEN NOT chequeo.chain_complete
+                THEN jsonb_build_object('advertencia', 'La cadena de hashes está incompleta')
+            WHEN NOT chequeo.hash_match
+                THEN jsonb_build_object('advertencia', 'El hash final no coincide con el recalculado desde la cadena')
+            WHEN chequeo.hash_match IS NULL
+                THEN jsonb_build_object('advertencia', 'Cadena anterior a v2: el hash final no es recalculable')
+            ELSE '{}'::jsonb
+        END AS verificacion
+    FROM certificates c
+    JOIN requests r ON r.request_id = c.request_id
+    LEFT JOIN workflow_executions w
+        ON w.id = c.workflow_execution_id AND w.created_at >= COALESCE(r.created_at, CAST('-infinity' AS TIMESTAMP))
+    LEFT JOIN LATERAL (
+        -- Etapa final de hash_chain.hash_final() recalculada en SQL: sha256 de
+        -- '<hash_compliance>|<JSON canónico>' con timestamp_final en isoformat()
+        SELECT encode(sha256(convert_to(
+            w.hash_compliance || '|{"certificado_id":' || to_json(c.certificado_id)::text
+            || ',"etapa":"final","timestamp_final":"'
+            || to_char(w.timestamp_final, 'YYYY-MM-DD"T"HH24:MI:SS')
+            || CASE WHEN w.timestamp_final = date_trunc('second', w.timestamp_final)
+                    THEN '' ELSE to_char(w.timestamp_final, '.US') END
+            || '"}',
+            'UTF8'
+        )), 'hex') AS hash_final
+        WHERE w.metadata->>'hash_chain' = 'v2'
+    ) recalculado ON true
+    CROSS JOIN LATERAL (
+        SELECT
+            hash_match, chain_complete,
+            -- Sin cadena recalculable queda solo la consistencia certificado/ejecución
+            COALESCE(hash_match, c.hash_final = w.hash_final, false) AND chain_complete
+                AND COALESCE(w.hitl_decision, '') <> 'reject' AS valid
+        FROM (
+            SELECT
+                -- NULL en ejecuciones anteriores a la cadena v2 (no recalculables)
+                CASE WHEN w.metadata->>'hash_chain' = 'v2' THEN
+                    COALESCE(c.hash_final = recalculado.hash_final AND w.hash_final = recalculado.hash_final, false)
+                END AS hash_match,
+                COALESCE(
+                    w.hash_ingest IS NOT NULL AND w.hash_riesgo IS NOT NULL
+                    AND w.hash_compliance IS NOT NULL AND w.hash_final IS NOT NULL,
+                    false
+                ) AS chain_complete
+        ) hashes
+    ) chequeo
+"""
+
+UPSERT_SQL = """
+    INSERT INTO certificate_read_model
+        (certificado_id, request_id, issued_at, certificado, verificacion, updated_at)
+    SELECT certificado_id, request_id, issued_at, certificado, verificacion, NOW()
+    FROM ({projection} WHERE {condition}) proyeccion
+    ON CONFLICT (certificado_id) DO UPDATE
+    SET request_id = EXCLUDED.request_id,
+        issued_at = EXCLUDED.issued_at,
+        certificado = EXCLUDED.certificado,
+        verificacion = EXCLUDED.verificacion,
+        updated_at = NOW()
+"""
+
+DOCUMENTS = ("certificado", "verificacion")
+
+
+@traced_methods
+class CertificateReadModelRepository:
+    def __init__(self, db=None):
+        self.db = db or database
+        self.reader = read_database if db is None else db
+        # Sin BD explícita las lecturas se rutean al shard del certificado
+        self.routed = db is None
+
+    @property
+    def hot_reader(self):
+        """Lecturas públicas por clave primaria: fast path asyncpg si está activo"""
+        return fastpath if fastpath.enabled else self.reader
+
+    async def project_certificate(self, certificado_id: str):
+        """Proyecta un certificado; se llama dentro de la transacción que lo emite"""
+        mark_write()
+        await self.db.execute(
+            query=UPSERT_SQL.format(projection=PROJECTION_SQL, condition="c.certificado_id = :certificado_id"),
+            values={"certificado_id": certificado_id}
+        )
+
+    async def project_request(self, request_id: str) -> List[str]:
+        """
+        Reproyecta los certificados de una solicitud (p. ej. tras una decisión HITL)
+        y devuelve sus certificado_id
+        """
+        mark_write()
+        rows = await self.db.fetch_all(
+            query=UPSERT_SQL.format(projection=PROJECTION_SQL, condition="c.request_id = :request_id")
+            + " RETURNING certificado_id",
+            values={"request_id": request_id}
+        )
+        return [row["certificado_id"] for row in rows]
+
+    async def project_batch(self, last_id: int, batch_size: int) -> Optional[int]:
+        """Reproyecta un lote por id de certificates; devuelve el último id o None al terminar"""
+        last = await self.db.fetch_val(
+            query="""
+                SELECT MAX(id) FROM (
+                    SELECT id FROM certificates WHERE id > :last_id ORDER BY id LIMIT :batch_size
+                ) lote
+            """,
+            values={"last_id": last_id, "batch_size": batch_size}
+        )
+        if last is None:
+            return None
+        await self.db.execute(
+            query=UPSERT_SQL.format(projection=PROJECTION_SQL, condition="c.id > :last_id AND c.id <= :last"),
+            values={"last_id": last_id, "last": last}
+        )
+        return last
+
+    async def get_document(self, certificado_id: str, document: str) -> Optional[str]:
+        """
+        Respuesta pública ya serializada (texto JSON) leída por clave primaria.
+        Si el certificado aún no está proyectado se arma desde las tablas fuente.
+        """
+        if document not in DOCUMENTS:
+            raise ValueError(f"Documento inválido. Debe ser: {list(DOCUMENTS)}")
+        try:
+            if not self.routed:
+                return await self._read_document(self.hot_reader, self.reader, certificado_id, document)
+            # Caché local invalidada por el change feed al emitir o reproyectar
+            return await change_cache.get_or_load(
+                CERTIFICATE, certificado_id, document,
+                lambda: shards.find(
+                    certificado_id,
+                    lambda shard: self._read_document(shard.hot_reader, shard.reader, certificado_id, document)
+                )
+            )
+        except Exception as e:
+            logger.error(f"Error leyendo modelo de lectura de {certificado_id}: {e}")
+            raise
+
+    async def _read_document(self, hot_reader, reader, certificado_id: str, document: str) -> Optional[str]:
+        values = {"certificado_id": certificado_id}
+        body = await hot_reader.fetch_val(
+            query=f"""
+                SELECT {document}::text FROM certificate_read_model
+                WHERE certificado_id = :certificado_id
+            """,
+            values=values
+        )
+        if body is None:
+            body = await reader.fetch_val(
+                query=f"""
+                    SELECT {document}::text FROM ({PROJECTION_SQL}
+                    WHERE c.certificado_id = :certificado_id) proyeccion
+                """,
+                values=values
+            )
+            if body is not None:
+                logger.warning(f"⚠️ Certificado {certificado_id} ausente del modelo de lectura")
+        return body
@@ -1,19 +1,39 @@
 import logging
-import json
 from typing import Dict, List, Optional
 from datetime import datetime
-from src.db.database import database
+from src.db.database import database, read_database, shards
+from src.db.routing import mark_write
+from src.db.repositories.stats_repository import StatsRepository
+from src.db.repositories.certificate_read_model_repository import CertificateReadModelRepository
+from src.services.audit import emit
+from src.services.audit_chain import request_proof
+from src.services.change_feed import ALL, CERTIFICATE, PROVEEDOR, STATS, change_cache, publish
+from src.services.tracing import traced_methods
+from src.utils.rut import normalize_rut
 
 logger = logging.getLogger(__name__)
 
+# Orden de revisión: riesgo alto primero (NULL al final, como en SQL)
+_RISK_ORDER = {"alto": 1, "medio": 2, "bajo": 3}
+
+@traced_methods
 class HITLRepository:
     def __init__(self):
         self.db = database
+        self.reader = read_database
     
-    async def get_pending_hitl_cases(self, limit: int = 50, offset: int = 0) -> Dict:
+    async def get_pending_hitl_cases(
+        self, limit: int = 50, offset: int = 0, proveedor_rut: Optional[str] = None
+    ) -> Dict:
         """Obtiene todos los casos que requieren revisión humana"""
         try:
-            query = """
+            rut_filter = ""
+            values = {}
+            if proveedor_rut:
+                rut_filter = "AND w.proveedor_rut_num = :rut_num"
+                values["rut_num"] = normalize_rut(proveedor_rut)[0]
+            
+            query = f"""
                 SELECT 
                     w.request_id, w.proveedor_rut, w.proveedor_nombre,
                     w.nivel_riesgo, w.riesgo_score, w.hitl_reason,
@@ -24,6 +44,7 @@ class HITLRepository:
                 WHERE w.hitl_required = true 
                   AND w.hitl_decision IS NULL
                   AND w.status = 'hitl_required'
+                  {rut_filter}
                 ORDER BY 
                     CASE w.nivel_riesgo
                         WHEN 'alto' THEN 1
@@ -33,45 +54,83 @@ class HITLRepository:
                     w.created_at ASC
                 LIMIT :limit OFFSET :offset
             """
-            results = await self.db.fetch_all(query=query, values={"limit": limit, "offset": offset})
-            count_query = """
+            count_query = f"""
                 SELECT COUNT(*) as total
-                FROM workflow_executions
+                FROM workflow_executions w
                 WHERE hitl_required = true AND hitl_decision IS NULL AND status = 'hitl_required'
+                  {rut_filter}
             """
-            total_result = await self.db.fetch_one(query=count_query)
+
+            async def pending_in(shard, page_values):
+                # Consulta caliente: fast path asyncpg con sentencias preparadas si está activo
+                results = await shard.hot_reader.fetch_all(query=query, values={**values, **page_values})
+                total_result = await shard.hot_reader.fetch_one(query=count_query, values=values)
+                return [dict(row) for row in results], total_result["total"] if total_result else 0
+
+            if not shards.enabled or proveedor_rut:
+                # Con filtro de RUT basta el shard del proveedor
+                shard = shards.for_rut(values.get("rut_num"))
+                cases, total = await pending_in(shard, {"limit": limit, "offset": offset})
+            else:
+                # Scatter-gather: primeras offset + limit de cada shard, mezcla y corte
+                pages = await shards.gather(lambda shard: pending_in(shard, {"limit": limit + offset, "offset": 0}))
+                cases = sorted(
+                    (case for rows, _ in pages for case in rows),
+                    key=lambda case: (_RISK_ORDER.get(case["nivel_riesgo"], 4), case["created_at"])
+                )[offset:offset + limit]
+                total = sum(total for _, total in pages)
             return {
-                "count": len(results),
-                "total": total_result["total"] if total_result else 0,
-                "pending_cases": [dict(row) for row in results]
+                "count": len(cases),
+                "total": total,
+                "pending_cases": cases
             }
         except Exception as e:
-            logger.error(f"Error obteniendo casos HITL pendientes: {e}")
+            logger.error("Error obteniendo casos HITL pendientes: %s", e)
             raise
     
-    async def get_hitl_case_detail(self, request_id: str) -> Optional[Dict]:
-        """Obtiene detalle completo de un caso HITL"""
+    async def get_hitl_case_detail(self, request_id: str, include_proof: bool = False) -> Optional[Dict]:
+        """Obtiene detalle completo de un caso HITL (opcionalmente con prueba de auditoría)"""
         try:
             query = """
                 SELECT w.*, r.proveedor_nombre as request_proveedor_nombre,
-                    r.monto_contrato, r.objeto_contrato, r.status as request_status
+                    r.monto_contrato, r.objeto_contrato, r.status as request_status,
+                    r.created_at as request_created_at
                 FROM workflow_executions w
                 LEFT JOIN requests r ON w.request_id = r.request_id
                 WHERE w.request_id = :request_id AND w.hitl_required = true
+                  -- Poda de particiones mensuales; sin solicitud (o sin fecha) no acota
+                  AND w.created_at >= COALESCE(
+                      (SELECT created_at FROM requests WHERE request_id = :request_id),
+                      CAST('-infinity' AS TIMESTAMP)
+                  )
             """
-            result = await self.db.fetch_one(query=query, values={"request_id": request_id})
+            # El caso está en el shard del proveedor; audit_log, en el catálogo
+            result = await shards.find(
+                request_id, lambda shard: shard.reader.fetch_one(query=query, values={"request_id": request_id})
+            )
             if not result:
                 return None
             case = dict(result)
             audit_query = """
-                SELECT action, user_id, details, timestamp
-                FROM audit_log WHERE request_id = :request_id ORDER BY timestamp DESC
+                SELECT action, user_id, details, timestamp, seq, entry_hash
+                FROM audit_log
+                WHERE request_id = :request_id
+                  -- Reloj de la app contra reloj de la BD: margen por desfase y zona horaria
+                  AND timestamp >= COALESCE(
+                      CAST(:request_created_at AS TIMESTAMP) - INTERVAL '1 day', CAST('-infinity' AS TIMESTAMP)
+                  )
+                ORDER BY timestamp DESC
             """
-            audit_results = await self.db.fetch_all(query=audit_query, values={"request_id": request_id})
+            audit_results = await self.reader.fetch_all(
+                query=audit_query,
+                values={"request_id": request_id, "request_created_at": case["request_created_at"]}
+            )
             case["audit_trail"] = [dict(row) for row in audit_results]
+            if include_proof:
+                case["audit_proof"] = await request_proof(request_id)
             return case
         except Exception as e:
-            logger.error(f"Error obteniendo detalle de caso HITL {request_id}: {e}")
+            logger.error("Error obteniendo detalle de caso HITL %s: %s", request_id, e)
             raise
     
     async def submit_hitl_decision(
@@ -103,41 +162,67 @@ class HITLRepository:
                 WHERE request_id = CAST(:request_id AS VARCHAR)
                   AND hitl_required = true
                   AND hitl_decision IS NULL
-                RETURNING request_id
+                RETURNING request_id, proveedor_rut_num
             """
             
-            result = await self.db.fetch_one(
-                query=update_query,
-                values={
-                    "request_id": str(request_id),
-                    "decision": str(decision),
-                    "reviewer": str(reviewer),
-                    "notes": str(notes) if notes else None,
-                    "new_status": str(new_status)
-                }
-            )
-            
-            if not result:
+            shard = await shards.locate_request_write(str(request_id))
+            if shard is None:
                 raise ValueError(f"Caso {request_id} no encontrado o ya fue revisado")
+            db = shard.database
+            audit_event = {
+                "request_id": request_id,
+                "user_id": reviewer,
+                "details": {"decision": decision, "notes": notes},
+                "durable": True,
+                "db": self.db
+            }
             
-            # Registrar en audit log con JSON válido
-            audit_details = json.dumps({"decision": decision, "notes": notes})
-            audit_query = """
-                INSERT INTO audit_log (request_id, action, user_id, details, timestamp)
-                VALUES (CAST(:request_id AS VARCHAR), :action, :user_id, CAST(:details AS JSONB), NOW())
-            """
+            # Decisión, auditoría y modelo de lectura en una sola transacción
+            async with db.transaction():
+                mark_write()
+                result = await db.fetch_one(
+                    query=update_query,
+                    values={
+                        "request_id": str(request_id),
+                        "decision": str(decision),
+                        "reviewer": str(reviewer),
+                        "notes": str(notes) if notes else None,
+                        "new_status": str(new_status)
+                    }
+                )
+                
+                if not result:
+                    raise ValueError(f"Caso {request_id} no encontrado o ya fue revisado")
+                
+                # Si el slot empezó a copiarse a otro shard, la decisión se revierte (503)
+                await shards.lock_slot_write(shard, result["proveedor_rut_num"])
+                
+                # Auditoría durable: se confirma o revierte junto con la decisión
+                if shard is shards.catalog:
+                    await emit(f"HITL_DECISION_{decision.upper()}", **audit_event)
+                
+                # La verificación pública refleja la decisión (un rechazo invalida)
+                certificados = await CertificateReadModelRepository(db).project_request(str(request_id))
+                
+                # Las demás instancias invalidan sus cachés al confirmar
+                await publish(
+                    [(CERTIFICATE, certificado_id) for certificado_id in certificados]
+                    + ([(PROVEEDOR, result["proveedor_rut_num"])] if result["proveedor_rut_num"] is not None else []),
+                    db=db
+                )
             
-            await self.db.execute(
-                query=audit_query,
-                values={
-                    "request_id": str(request_id),
-                    "action": f"HITL_DECISION_{decision.upper()}",
-                    "user_id": str(reviewer),
-                    "details": audit_details
-                }
-            )
+            # audit_log vive en el catálogo: en otro shard se escribe tras confirmar
+            if shard is not shards.catalog:
+                await emit(f"HITL_DECISION_{decision.upper()}", **audit_event)
+            
+            if decision in ('approve', 'reject'):
+                try:
+                    await StatsRepository().record_hitl_resolution(at=datetime.utcnow())
+                except Exception as e:
+                    # La corrección periódica de rollups recupera el incremento perdido
+                    logger.warning("Rollup HITL no actualizado para %s: %s", request_id, e)
             
-            logger.info(f"Decisión HITL registrada: {request_id} - {decision} por {reviewer}")
+            logger.info("Decisión HITL registrada: %s - %s por %s", request_id, decision, reviewer)
             
             return {
                 "success": True,
@@ -149,7 +234,7 @@ class HITLRepository:
             }
             
         except Exception as e:
-            logger.error(f"Error registrando decisión HITL para {request_id}: {e}")
+            logger.error("Error registrando decisión HITL para %s: %s", request_id, e)
             raise
     
     async def get_hitl_statistics(self) -> Dict:
@@ -162,13 +247,28 @@ class HITLRepository:
                     COUNT(*) FILTER (WHERE hitl_decision = 'approve') as approved,
                     COUNT(*) FILTER (WHERE hitl_decision = 'reject') as rejected,
                     COUNT(*) FILTER (WHERE hitl_decision = 'escalate') as escalated,
-                    AVG(EXTRACT(EPOCH FROM (hitl_reviewed_at - created_at))/3600) 
-                        FILTER (WHERE hitl_reviewed_at IS NOT NULL) as avg_review_time_hours
+                    SUM(EXTRACT(EPOCH FROM (hitl_reviewed_at - created_at))/3600) 
+                        FILTER (WHERE hitl_reviewed_at IS NOT NULL) as review_hours,
+                    COUNT(*) FILTER (WHERE hitl_reviewed_at IS NOT NULL) as reviewed
                 FROM workflow_executions
                 WHERE created_at > NOW() - INTERVAL '30 days'
             """
-            result = await self.db.fetch_one(query=query)
-            return dict(result) if result else {}
+            # Se suman los shards; el promedio sale de las sumas y conteos
+            pages = await change_cache.get_or_load(
+                STATS, ALL, "hitl", lambda: shards.gather(lambda shard: shard.reader.fetch_one(query=query))
+            )
+            rows = [row for row in pages if row]
+            if not rows:
+                return {}
+            stats = {
+                key: sum(row[key] or 0 for row in rows)
+                for key in ("total_hitl_cases", "pending", "approved", "rejected", "escalated")
+            }
+            reviewed = sum(row["reviewed"] for row in rows)
+            stats["avg_review_time_hours"] = (
+                sum(row["review_hours"] or 0 for row in rows) / reviewed if reviewed else None
+            )
+            return stats
         except Exception as e:
-            logger.error(f"Error obteniendo estadísticas HITL: {e}")
+            logger.error("Error obteniendo estadísticas HITL: %s", e)
             raise
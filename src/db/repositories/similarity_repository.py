@@ -0,0 +1,96 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Sequence, Tuple
+from src.db.database import database
+from src.db.routing import mark_write
+from src.services.tracing import traced_methods
+
+logger = logging.getLogger(__name__)
+
+
+@traced_methods
+class SimilarityRepository:
+    def __init__(self, db=None):
+        self.db = db or database
+
+    async def save_signature(
+        self, request_id: str, rut_num: int, contract_at: datetime,
+        version: int, signature: bytes, buckets: Sequence[Tuple[int, int]]
+    ):
+        """Reemplaza la firma y las bandas LSH de una solicitud"""
+        try:
+            mark_write()
+            async with self.db.transaction():
+                await self.db.execute(
+                    query="""
+                        INSERT INTO contract_signatures
+                            (request_id, proveedor_rut_num, contract_at, version, signature)
+                        VALUES (:request_id, :rut_num, :contract_at, :version, :signature)
+                        ON CONFLICT (request_id) DO UPDATE SET
+                            proveedor_rut_num = EXCLUDED.proveedor_rut_num,
+                            contract_at = EXCLUDED.contract_at,
+                            version = EXCLUDED.version,
+                            signature = EXCLUDED.signature
+                    """,
+                    values={
+                        "request_id": request_id, "rut_num": rut_num, "contract_at": contract_at,
+                        "version": version, "signature": signature
+                    }
+                )
+                await self.db.execute(
+                    query="DELETE FROM contract_lsh_buckets WHERE request_id = :request_id",
+                    values={"request_id": request_id}
+                )
+                await self.db.execute_many(
+                    query="""
+                        INSERT INTO contract_lsh_buckets
+                            (proveedor_rut_num, band, bucket, contract_at, request_id)
+                        VALUES (:rut_num, :band, :bucket, :contract_at, :request_id)
+                    """,
+                    values=[
+                        {
+                            "rut_num": rut_num, "band": band, "bucket": bucket,
+                            "contract_at": contract_at, "request_id": request_id
+                        }
+                        for band, bucket in buckets
+                    ]
+                )
+        except Exception as e:
+            logger.error(f"Error guardando firma de similitud {request_id}: {e}")
+            raise
+
+    async def find_candidates(
+        self, rut_num: int, buckets: Sequence[Tuple[int, int]],
+        desde: datetime, hasta: datetime, exclude_request_id: str, version: int
+    ) -> List[Dict]:
+        """Solicitudes del mismo RUT que comparten al menos un bucket LSH en la ventana"""
+        try:
+            results = await self.db.fetch_all(
+                query="""
+                    SELECT s.request_id, s.contract_at, s.signature
+                    FROM contract_signatures s
+                    WHERE s.request_id IN (
+                        SELECT b.request_id
+                        FROM contract_lsh_buckets b
+                        JOIN unnest(CAST(:bands AS SMALLINT[]), CAST(:buckets AS BIGINT[])) AS q(band, bucket)
+                            ON b.band = q.band AND b.bucket = q.bucket
+                        WHERE b.proveedor_rut_num = :rut_num
+                          AND b.contract_at BETWEEN :desde AND :hasta
+                          AND b.request_id <> :request_id
+                    )
+                    AND s.version = :version
+                """,
+                values={
+                    "rut_num": rut_num,
+                    "bands": [band for band, _ in buckets],
+                    "buckets": [bucket for _, bucket in buckets],
+                    "desde": desde,
+                    "hasta": hasta,
+                    "request_id": exclude_request_id,
+                    "version": version,
+                }
+            )
+            return [dict(row) for row in results]
+        except Exception as e:
+            logger.error(f"Error buscando contratos similares del RUT {rut_num}: {e}")
+            raise
@@ -0,0 +1,320 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from src.db.database import database, read_database, shards
+from src.services.tracing import traced_methods
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_BUCKETS = ("hour", "day")
+
+# Granularidad pedida -> (bucket almacenado del que se lee, truncamiento aplicado)
+TIMESERIES_BUCKETS = {
+    "hour": ("hour", "hour"),
+    "day": ("day", "day"),
+    "week": ("day", "week"),
+    "month": ("day", "month"),
+}
+
+
+
+def bucket_floor(value: datetime, trunc: str) -> datetime:
+    """Inicio del bucket que contiene `value` (mismo criterio que date_trunc)"""
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if trunc == "hour":
+        return value
+    value = value.replace(hour=0)
+    if trunc == "week":
+        return value - timedelta(days=value.weekday())
+    if trunc == "month":
+        return value.replace(day=1)
+    return value
+
+
+def bucket_ceil(value: datetime, trunc: str) -> datetime:
+    """Primer límite de bucket >= `value`"""
+    start = bucket_floor(value, trunc)
+    if start == value:
+        return value
+    if trunc == "hour":
+        return start + timedelta(hours=1)
+    if trunc == "day":
+        return start + timedelta(days=1)
+    if trunc == "week":
+        return start + timedelta(weeks=1)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+ROLLUP_COUNTERS = [
+    "solicitudes", "certificados_emitidos",
+    "riesgo_bajo", "riesgo_medio", "riesgo_alto",
+    "hitl_abiertos", "hitl_resueltos"
+]
+
+# Contadores por bucket del rango [desde, hasta) calculados desde las tablas base
+ROLLUP_AGGREGATE_SQL = """
+    SELECT
+        bucket_start,
+        SUM(solicitudes) AS solicitudes, SUM(certificados_emitidos) AS certificados_emitidos,
+        SUM(riesgo_bajo) AS riesgo_bajo, SUM(riesgo_medio) AS riesgo_medio, SUM(riesgo_alto) AS riesgo_alto,
+        SUM(hitl_abiertos) AS hitl_abiertos, SUM(hitl_resueltos) AS hitl_resueltos
+    FROM (
+        SELECT
+            date_trunc(:bucket, created_at) AS bucket_start,
+            1 AS solicitudes,
+            CASE WHEN certificado_emitido THEN 1 ELSE 0 END AS certificados_emitidos,
+            CASE WHEN LOWER(COALESCE(nivel_riesgo, riesgo)) = 'bajo' THEN 1 ELSE 0 END AS riesgo_bajo,
+            CASE WHEN LOWER(COALESCE(nivel_riesgo, riesgo)) = 'medio' THEN 1 ELSE 0 END AS riesgo_medio,
+            CASE WHEN LOWER(COALESCE(nivel_riesgo, riesgo)) = 'alto' THEN 1 ELSE 0 END AS riesgo_alto,
+            CASE WHEN hitl_required THEN 1 ELSE 0 END AS hitl_abiertos,
+            0 AS hitl_resueltos
+        FROM workflow_executions
+        WHERE created_at >= :desde AND created_at < :hasta
+        UNION ALL
+        SELECT date_trunc(:bucket, hitl_reviewed_at), 0, 0, 0, 0, 0, 0, 1
+        FROM workflow_executions
+        WHERE hitl_reviewed_at >= :desde AND hitl_reviewed_at < :hasta
+          AND hitl_decision IN ('approve', 'reject')
+    ) eventos
+    GROUP BY bucket_start
+"""
+
+@traced_methods
+class StatsRepository:
+    def __init__(self):
+        self.db = database
+        self.reader = read_database
+
+    async def _increment(self, at: datetime, counters: Dict[str, int]):
+        """Suma contadores a los buckets hora y día que contienen `at`"""
+        columns = ", ".join(counters.keys())
+        placeholders = ", ".join(f":{name}" for name in counters.keys())
+        updates = ", ".join(
+            f"{name} = workflow_stats_rollup.{name} + EXCLUDED.{name}" for name in counters.keys()
+        )
+        query = f"""
+            INSERT INTO workflow_stats_rollup (bucket_size, bucket_start, {columns}, updated_at)
+            VALUES
+                ('hour', date_trunc('hour', CAST(:at AS TIMESTAMP)), {placeholders}, NOW()),
+                ('day', date_trunc('day', CAST(:at AS TIMESTAMP)), {placeholders}, NOW())
+            ON CONFLICT (bucket_size, bucket_start) DO UPDATE
+            SET {updates}, updated_at = NOW()
+        """
+        await self.db.execute(query=query, values={"at": at, **counters})
+
+    async def record_workflow(
+        self, at: datetime, riesgo: Optional[str], certificado_emitido: bool, hitl_abierto: bool = False
+    ):
+        """
+        Registra incrementalmente un workflow finalizado. Los flags deben venir de
+        las columnas certificado_emitido y hitl_required de la ejecución guardada,
+        las mismas que cuenta ROLLUP_AGGREGATE_SQL.
+        """
+        try:
+            counters = {
+                "solicitudes": 1,
+                "certificados_emitidos": 1 if certificado_emitido else 0,
+                "hitl_abiertos": 1 if hitl_abierto else 0,
+            }
+            nivel = (riesgo or "").lower()
+            if nivel in ("bajo", "medio", "alto"):
+                counters[f"riesgo_{nivel}"] = 1
+            await self._increment(at, counters)
+        except Exception as e:
+            logger.error(f"Error actualizando rollup de workflow: {e}")
+            raise
+
+    async def record_hitl_resolution(self, at: datetime):
+        """Registra incrementalmente un caso HITL resuelto (aprobado o rechazado)"""
+        try:
+            await self._increment(at, {"hitl_resueltos": 1})
+        except Exception as e:
+            logger.error(f"Error actualizando rollup HITL: {e}")
+            raise
+
+    async def refresh_rollups(self, desde: datetime, hasta: datetime) -> int:
+        """
+        Recalcula desde las tablas base los buckets del rango [desde, hasta).
+        Corrige datos tardíos y cualquier incremento perdido; el rango se alinea a días
+        completos para que los buckets diarios queden consistentes. Con sharding
+        los rollups viven en el catálogo y se agregan desde todos los shards.
+        """
+        try:
+            desde = desde.replace(hour=0, minute=0, second=0, microsecond=0)
+            if hasta.time() != datetime.min.time():
+                hasta = hasta.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+            updates = ", ".join(f"{name} = EXCLUDED.{name}" for name in ROLLUP_COUNTERS)
+            refreshed = 0
+            async with self.db.transaction():
+                for bucket in ROLLUP_BUCKETS:
+                    await self.db.execute(
+                        query="""
+                            DELETE FROM workflow_stats_rollup
+                            WHERE bucket_size = :bucket
+                              AND bucket_start >= :desde AND bucket_start < :hasta
+                        """,
+                        values={"bucket": bucket, "desde": desde, "hasta": hasta}
+                    )
+                    values = {"bucket": bucket, "desde": desde, "hasta": hasta}
+                    if not shards.enabled:
+                        await self.db.execute(
+                            query=f"""
+                                INSERT INTO workflow_stats_rollup
+                                    (bucket_size, bucket_start, {", ".join(ROLLUP_COUNTERS)}, updated_at)
+                                SELECT :bucket, bucket_start, {", ".join(ROLLUP_COUNTERS)}, NOW()
+                                FROM ({ROLLUP_AGGREGATE_SQL}) agregado
+                                ON CONFLICT (bucket_size, bucket_start) DO UPDATE
+                                SET {updates}, updated_at = NOW()
+                            """,
+                            values=values
+                        )
+                    else:
+                        # Cada shard agrega sus workflows; los buckets se suman en el catálogo
+                        merged: Dict[datetime, Dict[str, int]] = {}
+                        for rows in await shards.gather(
+                            lambda shard: shard.database.fetch_all(query=ROLLUP_AGGREGATE_SQL, values=values)
+                        ):
+                            for row in rows:
+                                totals = merged.setdefault(row["bucket_start"], dict.fromkeys(ROLLUP_COUNTERS, 0))
+                                for name in ROLLUP_COUNTERS:
+                                    totals[name] += int(row[name])
+                        if merged:
+                            await self.db.execute_many(
+                                query=f"""
+                                    INSERT INTO workflow_stats_rollup
+                                        (bucket_size, bucket_start, {", ".join(ROLLUP_COUNTERS)}, updated_at)
+                                    VALUES (:bucket, :bucket_start, {", ".join(f":{n}" for n in ROLLUP_COUNTERS)}, NOW())
+                                    ON CONFLICT (bucket_size, bucket_start) DO UPDATE
+                                    SET {updates}, updated_at = NOW()
+                                """,
+                                values=[
+                                    {"bucket": bucket, "bucket_start": bucket_start, **totals}
+                                    for bucket_start, totals in merged.items()
+                                ]
+                            )
+                    refreshed += 1
+
+            logger.info(f"Rollups recalculados entre {desde.isoformat()} y {hasta.isoformat()}")
+            return refreshed
+        except Exception as e:
+            logger.error(f"Error recalculando rollups: {e}")
+            raise
+
+    async def get_timeseries(self, bucket: str, desde: datetime, hasta: datetime) -> Dict:
+        """
+        Serie de tiempo leída solo desde la tabla de rollups. El rango se amplía
+        a límites de bucket: el primer y el último punto son periodos completos.
+        """
+        try:
+            if bucket not in TIMESERIES_BUCKETS:
+                raise ValueError(f"Bucket inválido. Debe ser: {list(TIMESERIES_BUCKETS)}")
+            source, trunc = TIMESERIES_BUCKETS[bucket]
+            requested = (desde, hasta)
+            desde, hasta = bucket_floor(desde, trunc), bucket_ceil(hasta, trunc)
+
+            query = f"""
+                SELECT
+                    date_trunc('{trunc}', bucket_start) AS bucket,
+                    SUM(solicitudes) AS solicitudes,
+                    SUM(certificados_emitidos) AS certificados_emitidos,
+                    SUM(riesgo_bajo) AS riesgo_bajo,
+                    SUM(riesgo_medio) AS riesgo_medio,
+                    SUM(riesgo_alto) AS riesgo_alto,
+                    SUM(hitl_abiertos) AS hitl_abiertos,
+                    SUM(hitl_resueltos) AS hitl_resueltos
+                FROM workflow_stats_rollup
+                WHERE bucket_size = :source
+                  AND bucket_start >= :desde AND bucket_start < :hasta
+                GROUP BY 1
+                ORDER BY 1
+            """
+            values = {"source": source, "desde": desde, "hasta": hasta}
+            rows = await self.reader.fetch_all(query=query, values=values)
+
+            # Backlog HITL acumulado antes del rango pedido
+            base_query = """
+                SELECT COALESCE(SUM(hitl_abiertos - hitl_resueltos), 0) AS backlog
+                FROM workflow_stats_rollup
+                WHERE bucket_size = :source AND bucket_start < :desde
+            """
+            base = await self.reader.fetch_one(
+                query=base_query, values={"source": source, "desde": desde}
+            )
+            backlog = int(base["backlog"]) if base else 0
+
+            points: List[Dict] = []
+            for row in rows:
+                backlog += int(row["hitl_abiertos"]) - int(row["hitl_resueltos"])
+                point = {name: int(row[name]) for name in ROLLUP_COUNTERS}
+                point["bucket"] = row["bucket"].isoformat()
+                point["hitl_backlog"] = backlog
+                points.append(point)
+
+            return {
+                "bucket": bucket,
+                "from": desde.isoformat(),
+                "to": hasta.isoformat(),
+                "requested_from": requested[0].isoformat(),
+                "requested_to": requested[1].isoformat(),
+                "count": len(points),
+                "series": points
+            }
+        except Exception as e:
+            logger.error(f"Error obteniendo serie de tiempo: {e}")
+            raise
+
+    async def refresh_search_facets(self):
+        """Refresca los contadores de facetas sin filtro (search_facet_counts) en cada shard"""
+        try:
+            async def refresh(shard):
+                populated = await shard.database.fetch_val(
+                    query="SELECT relispopulated FROM pg_class WHERE oid = to_regclass('search_facet_counts')"
+                )
+                if populated is None:
+                    return
+                # CONCURRENTLY exige que la vista ya tenga datos
+                concurrently = "CONCURRENTLY " if populated else ""
+                await shard.database.execute(query=f"REFRESH MATERIALIZED VIEW {concurrently}search_facet_counts")
+
+            await shards.gather(refresh)
+            logger.info("Facetas de búsqueda recalculadas")
+        except Exception as e:
+            logger.error(f"Error refrescando facetas de búsqueda: {e}")
+            raise
+
+    async def get_search_facets(self) -> Optional[Dict]:
+        """
+        Facetas y total sin filtros desde la vista materializada, sumados entre
+        shards; None si la vista aún no se puebla en alguno
+        """
+        try:
+            async def read(shard):
+                populated = await shard.reader.fetch_val(
+                    query="SELECT relispopulated FROM pg_class WHERE oid = to_regclass('search_facet_counts')"
+                )
+                if not populated:
+                    return None
+                return await shard.reader.fetch_all(
+                    query="SELECT facet, valor, total, refreshed_at FROM search_facet_counts"
+                )
+
+            pages = await shards.gather(read)
+            if any(rows is None for rows in pages):
+                return None
+            facets: Dict[str, Dict[str, int]] = {"status": {}, "nivel_riesgo": {}, "monto": {}}
+            total, refreshed_at = 0, None
+            for rows in pages:
+                for row in rows:
+                    # El refresco más antiguo acota la frescura del conjunto
+                    if refreshed_at is None or row["refreshed_at"] < refreshed_at:
+                        refreshed_at = row["refreshed_at"]
+                    if row["facet"] == "total":
+                        total += int(row["total"])
+                    else:
+                        counts = facets[row["facet"]]
+                        counts[row["valor"]] = counts.get(row["valor"], 0) + int(row["total"])
+            return {"total": total, "facets": facets, "refreshed_at": refreshed_at}
+        except Exception as e:
+            logger.error(f"Error leyendo facetas de búsqueda: {e}")
+            raise
@@ -2,42 +2,87 @@ from databases import Database
 from datetime import datetime
 import json
 
+from src.db.routing import mark_write
+from src.services.tracing import traced_methods
+
+@traced_methods
 class WorkflowRepository:
     def __init__(self, db: Database):
         self.db = db
     
     async def save_request(self, request_data: dict):
         query = """
-            INSERT INTO requests (request_id, proveedor_rut, proveedor_nombre, 
+            INSERT INTO requests (request_id, proveedor_rut, proveedor_rut_num,
+                                 proveedor_rut_dv, proveedor_nombre, 
                                  monto_contrato, objeto_contrato, status)
-            VALUES (:request_id, :proveedor_rut, :proveedor_nombre, 
+            VALUES (:request_id, :proveedor_rut, :proveedor_rut_num,
+                    :proveedor_rut_dv, :proveedor_nombre, 
                     :monto_contrato, :objeto_contrato, :status)
             ON CONFLICT (request_id) DO UPDATE 
             SET status = :status
             RETURNING id
         """
+        mark_write()
         return await self.db.fetch_one(query, values=request_data)
     
     async def save_workflow_execution(self, workflow_data: dict):
         query = """
             INSERT INTO workflow_executions 
-            (request_id, workflow_type, ingest_timestamp, hash_ingest,
+            (request_id, proveedor_rut, proveedor_rut_num, proveedor_rut_dv,
+             workflow_type, ingest_timestamp, hash_ingest,
              riesgo, hash_riesgo, cumplimiento, hash_compliance, 
              hash_final, timestamp_final, metadata)
-            VALUES (:request_id, :workflow_type, :ingest_timestamp, :hash_ingest,
+            VALUES (:request_id, :proveedor_rut, :proveedor_rut_num, :proveedor_rut_dv,
+                    :workflow_type, :ingest_timestamp, :hash_ingest,
                     :riesgo, :hash_riesgo, :cumplimiento, :hash_compliance,
                     :hash_final, :timestamp_final, :metadata)
             RETURNING id
         """
+        mark_write()
         return await self.db.fetch_one(query, values=workflow_data)
     
     async def save_certificate(self, cert_data: dict):
+        """
+        Inserta el certificado y marca su ejecución como emitida en la misma
+        sentencia. Devuelve además los flags de la ejecución que alimentan los
+        rollups, para que el incremento y el recálculo lean la misma columna.
+        """
         query = """
-            INSERT INTO certificates 
-            (certificado_id, request_id, workflow_execution_id, hash_final, 
-             firma_digital, issued_at)
-            VALUES (:certificado_id, :request_id, :workflow_execution_id, 
-                    :hash_final, :firma_digital, :issued_at)
-            RETURNING id
+            WITH cert AS (
+                INSERT INTO certificates 
+                (certificado_id, request_id, workflow_execution_id, hash_final, 
+                 firma_digital, issued_at)
+                VALUES (:certificado_id, :request_id, :workflow_execution_id, 
+                        :hash_final, :firma_digital, :issued_at)
+                RETURNING id, workflow_execution_id
+            ), ejecucion AS (
+                UPDATE workflow_executions
+                SET certificado_emitido = TRUE
+                WHERE id = (SELECT workflow_execution_id FROM cert)
+                RETURNING certificado_emitido, hitl_required, created_at
+            )
+            SELECT cert.id, ejecucion.certificado_emitido, ejecucion.hitl_required, ejecucion.created_at
+            FROM cert LEFT JOIN ejecucion ON TRUE
         """
+        mark_write()
         return await self.db.fetch_one(query, values=cert_data)
+    
+    async def get_completed_result(self, request_id: str):
+        """Resultado almacenado de un workflow ya completado (None si no existe)"""
+        query = """
+            SELECT result FROM requests
+            WHERE request_id = :request_id AND result IS NOT NULL
+        """
+        result = await self.db.fetch_val(query, values={"request_id": request_id})
+        if result is None:
+            return None
+        return json.loads(result) if isinstance(result, str) else result
+    
+    async def save_result(self, request_id: str, result: dict):
+        query = """
+            UPDATE requests
+            SET result = CAST(:result AS JSONB), completed_at = NOW()
+            WHERE request_id = :request_id
+        """
+        mark_write()
+        await self.db.execute(query, values={"request_id": request_id, "result": json.dumps(result)})
@@ -0,0 +1,243 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+import os
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import databases
+
+from src.db.instrumentation import instrument
+
+logger = logging.getLogger(__name__)
+
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_POLL_SECONDS = float(os.getenv("REPLICA_POLL_SECONDS", "1"))
+
+# Token que el cliente reenvía tras una escritura para leer lo que escribió
+CONSISTENCY_HEADER = "X-Consistency-Token"
+
+
+def parse_lsn(value: Optional[str]) -> Optional[int]:
+    """'16/B374D848' -> entero comparable; None si el valor no es un LSN"""
+    if not value:
+        return None
+    try:
+        high, low = value.strip().split("/")
+        return (int(high, 16) << 32) + int(low, 16)
+    except ValueError:
+        return None
+
+
+class ConsistencyContext:
+    """Estado por request: LSN mínimo exigido a las réplicas y si hubo escrituras"""
+
+    def __init__(self, min_lsn: Optional[int] = None):
+        self.min_lsn = min_lsn
+        self.wrote = False
+
+
+_consistency: contextvars.ContextVar[Optional[ConsistencyContext]] = contextvars.ContextVar(
+    "consistency", default=None
+)
+_force_primary: contextvars.ContextVar[bool] = contextvars.ContextVar("force_primary", default=False)
+
+
+@contextmanager
+def primary_reads():
+    """Las lecturas dentro del bloque (y de las tareas que cree) van al primario"""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def mark_write():
+    """Los métodos de escritura lo llaman: el resto del request lee del primario"""
+    ctx = _consistency.get()
+    if ctx is not None:
+        ctx.wrote = True
+
+
+def requires_primary() -> bool:
+    """True si el request ya escribió o trae un token de consistencia"""
+    ctx = _consistency.get()
+    return ctx is not None and (ctx.wrote or ctx.min_lsn is not None)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.host = urlparse(url).hostname or url
+        self.database = instrument(databases.Database(url))
+        self.replay_lsn: Optional[int] = None
+        self.lag_seconds: Optional[float] = None
+        self.connected = False
+        self.last_error: Optional[str] = None
+
+    @property
+    def healthy(self) -> bool:
+        return (
+            self.connected
+            and self.lag_seconds is not None
+            and self.lag_seconds <= REPLICA_MAX_LAG_SECONDS
+        )
+
+    def status(self) -> Dict:
+        return {
+            "host": self.host,
+            "connected": self.connected,
+            "healthy": self.healthy,
+            "lag_seconds": round(self.lag_seconds, 3) if self.lag_seconds is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class ReplicaRouter:
+    """
+    Punto de acceso de solo lectura para los repositorios: reparte las lecturas
+    entre réplicas sanas y vuelve al primario si no hay ninguna, si el request ya
+    escribió o si ninguna réplica alcanzó el LSN del token de consistencia.
+    Sin réplicas configuradas delega todo en el primario.
+    """
+
+    def __init__(self, primary, replica_urls: List[str]):
+        self.primary = primary
+        self.replicas = [Replica(url) for url in replica_urls]
+        self._cycle = itertools.cycle(self.replicas) if self.replicas else None
+        self._monitor_task: Optional[asyncio.Task] = None
+
+    def __getattr__(self, name: str):
+        return getattr(self.primary, name)
+
+    async def connect(self):
+        for replica in self.replicas:
+            try:
+                await replica.database.connect()
+                replica.connected = True
+                logger.info(f"✅ Réplica conectada: {replica.host}")
+            except Exception as e:
+                replica.last_error = str(e)
+                logger.error(f"❌ Error conectando réplica {replica.host}: {e}")
+        if self.replicas:
+            await self._poll_lag()
+            self._monitor_task = asyncio.create_task(self._monitor_loop())
+
+    async def disconnect(self):
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
+        for replica in self.replicas:
+            if replica.connected:
+                await replica.database.disconnect()
+                replica.connected = False
+
+    async def current_primary_lsn(self) -> Optional[str]:
+        return await self.primary.fetch_val(query="SELECT pg_current_wal_lsn()::text")
+
+    async def _poll_lag(self):
+        try:
+            primary_lsn = parse_lsn(await self.current_primary_lsn())
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo leer el LSN del primario: {e}")
+            primary_lsn = None
+
+        for replica in self.replicas:
+            if not replica.connected:
+                continue
+            try:
+                row = await replica.database.fetch_one(
+                    query="""
+                        SELECT pg_last_wal_replay_lsn()::text AS replay_lsn,
+                               EXTRACT(EPOCH FROM (NOW() - pg_last_xact_replay_timestamp())) AS lag
+                    """
+                )
+                replica.replay_lsn = parse_lsn(row["replay_lsn"])
+                if primary_lsn is not None and replica.replay_lsn is not None and replica.replay_lsn >= primary_lsn:
+                    # Réplica al día: el timestamp de replay solo envejece si el primario está inactivo
+                    replica.lag_seconds = 0.0
+                else:
+                    replica.lag_seconds = float(row["lag"]) if row["lag"] is not None else None
+                replica.last_error = None
+            except Exception as e:
+                replica.lag_seconds = None
+                replica.last_error = str(e)
+                logger.warning(f"⚠️ Réplica {replica.host} no responde: {e}")
+
+    async def _monitor_loop(self):
+        while True:
+            await asyncio.sleep(REPLICA_POLL_SECONDS)
+            try:
+                await self._poll_lag()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Error monitoreando réplicas: {e}")
+
+    def choose_replica(self) -> Optional[Replica]:
+        """Réplica que puede atender la lectura actual; None si debe ir al primario"""
+        if not self.replicas or _force_primary.get():
+            return None
+
+        ctx = _consistency.get()
+        if ctx is not None and ctx.wrote:
+            return None
+        min_lsn = ctx.min_lsn if ctx is not None else None
+
+        for _ in range(len(self.replicas)):
+            replica = next(self._cycle)
+            if not replica.healthy:
+                continue
+            if min_lsn is not None and (replica.replay_lsn is None or replica.replay_lsn < min_lsn):
+                continue
+            return replica
+        return None
+
+    def _choose(self):
+        replica = self.choose_replica()
+        return replica.database if replica is not None else self.primary
+
+    async def fetch_all(self, query, values: Optional[Dict] = None):
+        return await self._choose().fetch_all(query=query, values=values)
+
+    async def fetch_one(self, query, values: Optional[Dict] = None):
+        return await self._choose().fetch_one(query=query, values=values)
+
+    async def fetch_val(self, query, values: Optional[Dict] = None, column=0):
+        return await self._choose().fetch_val(query=query, values=values, column=column)
+
+    def status(self) -> List[Dict]:
+        return [replica.status() for replica in self.replicas]
+
+
+def consistency_middleware(router: ReplicaRouter):
+    """
+    Middleware HTTP de read-your-writes: toma el LSN mínimo del header del cliente
+    y, si el request escribió, responde con el LSN actual del primario.
+    """
+
+    async def middleware(request, call_next):
+        ctx = ConsistencyContext(parse_lsn(request.headers.get(CONSISTENCY_HEADER)))
+        token = _consistency.set(ctx)
+        try:
+            response = await call_next(request)
+        finally:
+            _consistency.reset(token)
+
+        if ctx.wrote and router.replicas:
+            try:
+                lsn = await router.current_primary_lsn()
+                if lsn:
+                    response.headers[CONSISTENCY_HEADER] = lsn
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo emitir token de consistencia: {e}")
+        return response
+
+    return middleware
@@ -1,36 +1,284 @@
+import argparse
 import asyncio
+import hashlib
 import os
-from databases import Database
+import re
+import time
 from pathlib import Path
+from typing import List, Optional
 
-async def run_migrations():
-    database_url = os.getenv("DATABASE_URL")
+import asyncpg
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
+# Clave fija de pg_advisory_lock: serializa migraciones entre instancias de Cloud Run
+MIGRATION_LOCK_KEY = 2159501721
+
+# Directiva de cabecera para migraciones que no pueden ir en transacción
+# (por ejemplo CREATE INDEX CONCURRENTLY); cada sentencia se confirma por separado.
+NO_TRANSACTION_DIRECTIVE = "-- migrate:no-transaction"
+
+_FILENAME_RE = re.compile(r"^(\d+)_([\w\-]+)\.sql$")
+_CONCURRENT_INDEX_RE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE
+)
+
+LEDGER_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        checksum VARCHAR(64) NOT NULL,
+        transactional BOOLEAN NOT NULL,
+        execution_ms INTEGER,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class Migration:
+    def __init__(self, path: Path):
+        match = _FILENAME_RE.match(path.name)
+        if not match:
+            raise ValueError(f"Nombre de migración inválido: {path.name} (esperado NNN_nombre.sql)")
+        self.path = path
+        self.version = int(match.group(1))
+        self.name = match.group(2)
+        self.sql = path.read_text()
+        self.checksum = hashlib.sha256(self.sql.encode()).hexdigest()
+        self.transactional = not any(
+            line.strip().lower() == NO_TRANSACTION_DIRECTIVE for line in self.sql.splitlines()
+        )
+
+    @property
+    def mode(self) -> str:
+        return "tx" if self.transactional else "no-tx"
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = [Migration(p) for p in sorted(directory.glob("*.sql"))]
+    versions = [m.version for m in migrations]
+    duplicated = {v for v in versions if versions.count(v) > 1}
+    if duplicated:
+        raise ValueError(f"Versiones de migración duplicadas: {sorted(duplicated)}")
+    return sorted(migrations, key=lambda m: m.version)
+
+
+def split_statements(sql: str) -> List[str]:
+    """
+    Separa un script en sentencias respetando comillas, identificadores,
+    comentarios y bloques $tag$ ... $tag$ (funciones plpgsql).
+    """
+    statements = []
+    current = []
+    i = 0
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch == "-" and sql.startswith("--", i):
+            end = sql.find("\n", i)
+            end = n if end == -1 else end
+            current.append(sql[i:end])
+            i = end
+        elif ch == "/" and sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+            current.append(sql[i:end])
+            i = end
+        elif ch in ("'", '"'):
+            end = i + 1
+            while end < n:
+                if sql[end] == ch:
+                    if end + 1 < n and sql[end + 1] == ch:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+        elif ch == "$":
+            match = re.match(r"\$[A-Za-z_]*\$", sql[i:])
+            if match:
+                tag = match.group(0)
+                end = sql.find(tag, i + len(tag))
+                end = n if end == -1 else end + len(tag)
+                current.append(sql[i:end])
+                i = end
+            else:
+                current.append(ch)
+                i += 1
+        elif ch == ";":
+            statements.append("".join(current))
+            current = []
+            i += 1
+        else:
+            current.append(ch)
+            i += 1
+    statements.append("".join(current))
+
+    def has_code(statement: str) -> bool:
+        code = re.sub(r"--[^\n]*", "", statement)
+        return bool(code.strip())
+
+    return [s.strip() for s in statements if has_code(s)]
+
+
+async def ensure_ledger(conn: asyncpg.Connection):
+    await conn.execute(LEDGER_DDL)
+
+
+async def applied_migrations(conn: asyncpg.Connection) -> dict:
+    rows = await conn.fetch("SELECT version, name, checksum FROM schema_migrations ORDER BY version")
+    return {row["version"]: row for row in rows}
+
+
+def pending_migrations(migrations: List[Migration], applied: dict) -> List[Migration]:
+    """Migraciones por aplicar; falla si una ya aplicada cambió de contenido"""
+    for migration in migrations:
+        row = applied.get(migration.version)
+        if row and row["checksum"] != migration.checksum:
+            raise RuntimeError(
+                f"Checksum distinto para la migración {migration.version:03d}_{migration.name}: "
+                f"el archivo cambió después de aplicarse"
+            )
+    return [m for m in migrations if m.version not in applied]
+
+
+async def _drop_invalid_index(conn: asyncpg.Connection, statement: str):
+    """Un CREATE INDEX CONCURRENTLY fallido deja un índice INVALID que IF NOT EXISTS omitiría"""
+    match = _CONCURRENT_INDEX_RE.search(statement)
+    if not match:
+        return
+    invalid = await conn.fetchval(
+        """
+        SELECT NOT i.indisvalid
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = $1
+        """,
+        match.group(1),
+    )
+    if invalid:
+        print(f"  ⚠️  Eliminando índice inválido {match.group(1)} de un intento previo")
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+
+
+async def record_migration(conn: asyncpg.Connection, migration: Migration, elapsed_ms: int):
+    await conn.execute(
+        """
+        INSERT INTO schema_migrations (version, name, checksum, transactional, execution_ms)
+        VALUES ($1, $2, $3, $4, $5)
+        """,
+        migration.version, migration.name, migration.checksum, migration.transactional, elapsed_ms,
+    )
+
+
+async def apply_migration(conn: asyncpg.Connection, migration: Migration) -> int:
+    start = time.perf_counter()
+
+    if migration.transactional:
+        # Script completo en una sola transacción (soporta funciones plpgsql);
+        # dentro de un dry-run es un savepoint de la transacción externa
+        async with conn.transaction():
+            await conn.execute(migration.sql)
+            elapsed_ms = int((time.perf_counter() - start) * 1000)
+            await record_migration(conn, migration, elapsed_ms)
+        return elapsed_ms
+
+    statements = split_statements(migration.sql)
+    for i, statement in enumerate(statements, 1):
+        await _drop_invalid_index(conn, statement)
+        await conn.execute(statement)
+        print(f"    ✅ Statement {i}/{len(statements)}")
+    elapsed_ms = int((time.perf_counter() - start) * 1000)
+    await record_migration(conn, migration, elapsed_ms)
+    return elapsed_ms
+
+
+async def _apply_pending(conn: asyncpg.Connection, pending: List[Migration], dry_run: bool):
+    for migration in pending:
+        label = f"{migration.version:03d}_{migration.name}"
+        if dry_run and not migration.transactional:
+            print(f"  ⏭️  {label}: no-tx, se omite en dry-run (las siguientes pueden depender de ella)")
+            continue
+        print(f"📋 {'Validating' if dry_run else 'Running'} migration: {label}")
+        try:
+            elapsed_ms = await apply_migration(conn, migration)
+        except Exception as e:
+            print(f"  ❌ {label}: {e}")
+            raise
+        print(f"  ✅ {label} ({elapsed_ms} ms)")
+
+
+async def run_migrations(
+    database_url: Optional[str] = None,
+    dry_run: bool = False,
+    plan: bool = False,
+    baseline: Optional[int] = None,
+):
+    database_url = database_url or os.getenv("DATABASE_URL")
     if not database_url:
         print("❌ DATABASE_URL not set")
         return
-    
-    db = Database(database_url)
-    await db.connect()
+
+    migrations = load_migrations()
+    conn = await asyncpg.connect(database_url)
     print("✅ Connected to database")
-    
-    migration_file = Path(__file__).parent / "migrations" / "001_initial_schema.sql"
-    
-    print(f"📋 Running migration: {migration_file.name}")
-    
-    with open(migration_file, 'r') as f:
-        sql = f.read()
-    
-    statements = [s.strip() for s in sql.split(';') if s.strip()]
-    
-    for i, statement in enumerate(statements, 1):
+
+    try:
+        await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_KEY)
         try:
-            await db.execute(statement)
-            print(f"  ✅ Statement {i}/{len(statements)}")
-        except Exception as e:
-            print(f"  ⚠️  Statement {i}: {str(e)}")
-    
-    await db.disconnect()
-    print("✅ Migrations completed")
+            await ensure_ledger(conn)
+            pending = pending_migrations(migrations, await applied_migrations(conn))
+
+            if baseline is not None:
+                for migration in [m for m in pending if m.version <= baseline]:
+                    await record_migration(conn, migration, 0)
+                    print(f"  📌 Baseline: {migration.version:03d}_{migration.name} marcada como aplicada")
+                return
+
+            if not pending:
+                print("✅ Schema up to date")
+                return
+
+            print(f"📋 {len(pending)} migraciones pendientes:")
+            for migration in pending:
+                print(f"  - {migration.version:03d}_{migration.name} [{migration.mode}] {migration.checksum[:12]}")
+            if plan:
+                return
+
+            if dry_run:
+                # Todo el dry-run ocurre en una transacción que se revierte al final
+                tx = conn.transaction()
+                await tx.start()
+                try:
+                    await _apply_pending(conn, pending, dry_run=True)
+                finally:
+                    await tx.rollback()
+            else:
+                await _apply_pending(conn, pending, dry_run=False)
+
+            print("✅ Migrations completed" if not dry_run else "✅ Dry-run completed")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_KEY)
+    finally:
+        await conn.close()
+
 
 if __name__ == "__main__":
-    asyncio.run(run_migrations())
+    parser = argparse.ArgumentParser(description="Motor de migraciones versionadas")
+    parser.add_argument("--plan", action="store_true", help="Solo lista las migraciones pendientes")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Ejecuta cada migración transaccional y hace rollback")
+    parser.add_argument("--baseline", type=int, default=None,
+                        help="Marca como aplicadas las migraciones hasta esta versión, sin ejecutarlas")
+    parser.add_argument("--all-shards", action="store_true",
+                        help="Aplica también en cada URL de DATABASE_SHARD_URLS")
+    args = parser.parse_args()
+
+    async def _run_all():
+        from src.db.sharding import SHARD_URLS
+
+        urls = [None] + (SHARD_URLS if args.all_shards else [])
+        for url in urls:
+            await run_migrations(url, dry_run=args.dry_run, plan=args.plan, baseline=args.baseline)
+
+    asyncio.run(_run_all())
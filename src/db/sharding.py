@@ -0,0 +1,320 @@
+"""
+Sharding horizontal de los datos de workflow por RUT de proveedor.
+
+Cada RUT cae en uno de SHARD_SLOTS slots lógicos (hash estable, igual a la
+función SQL shard_slot) y cada slot vive en un shard físico. El shard 0 es el
+catálogo (DATABASE_URL); los demás se configuran en DATABASE_SHARD_URLS. La
+asignación slot -> shard se guarda en shard_slots del catálogo (sin fila:
+slot % N) y se relee periódicamente, así que un rebalanceo no exige reiniciar.
+
+Los request_id y certificado_id generados llevan el slot en sus dos últimos
+caracteres: las lecturas por ID van directo a su shard. Los request_id de
+clientes (o IDs anteriores al sharding) se ubican consultando los shards y
+quedan en caché.
+
+En el shard del proveedor viven requests, workflow_executions, certificates,
+certificate_read_model y las firmas de similitud. audit_log (con su cadena de
+hashes y checkpoints) y los rollups de estadísticas siguen en el catálogo.
+Sin DATABASE_SHARD_URLS hay un único shard, el catálogo, y nada cambia.
+
+    python -m src.db.sharding status
+    python -m src.db.sharding slot 76086428-5
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+from urllib.parse import urlparse
+
+import databases
+
+from src.db.instrumentation import instrument
+from src.utils.ids import SLOT_BITS, id_slot
+
+logger = logging.getLogger(__name__)
+
+SHARD_SLOTS = 1 << SLOT_BITS
+# Shards adicionales al catálogo, separados por coma (el orden fija su índice 1..N)
+SHARD_URLS = [u.strip() for u in os.getenv("DATABASE_SHARD_URLS", "").split(",") if u.strip()]
+SHARD_MAP_REFRESH_SECONDS = float(os.getenv("SHARD_MAP_REFRESH_SECONDS", "30"))
+LOCATE_CACHE_SIZE = int(os.getenv("SHARD_LOCATE_CACHE_SIZE", "100000"))
+# Espacio de advisory locks (dos claves int4) por slot: las escrituras lo toman
+# compartido en su transacción, rebalance_shards exclusivo mientras copia
+SLOT_LOCK_NAMESPACE = 1718
+
+T = TypeVar("T")
+
+
+class ShardSlotMovingError(Exception):
+    """El slot del proveedor se está moviendo de shard: reintentar en unos segundos"""
+
+
+def slot_for_rut(rut_num: int) -> int:
+    """Slot lógico de un RUT (cuerpo entero); idéntico a shard_slot() en SQL"""
+    digest = hashlib.sha256(str(rut_num).encode("ascii")).digest()
+    return int.from_bytes(digest[:4], "big") % SHARD_SLOTS
+
+
+class Shard:
+    def __init__(self, index: int, database, reader=None, url: Optional[str] = None):
+        self.index = index
+        self.database = database
+        # El catálogo lee vía réplicas; los demás shards, de su primario
+        self.reader = reader or database
+        self.host = (urlparse(url).hostname or url) if url else "catalogo"
+        self.url = url
+        self.connected = url is None
+        self.last_error: Optional[str] = None
+
+    @property
+    def hot_reader(self):
+        """Consultas calientes: el fast path asyncpg solo apunta al catálogo"""
+        from src.db.fastpath import fastpath
+
+        return fastpath if self.index == 0 and fastpath.enabled else self.reader
+
+    def status(self) -> Dict:
+        return {"shard": self.index, "host": self.host, "connected": self.connected, "last_error": self.last_error}
+
+
+class ShardRouter:
+    """
+    Punto de acceso a los shards para repositorios y workflow: shard por RUT o
+    por ID, y scatter-gather sobre todos los shards para búsquedas y estadísticas.
+    """
+
+    def __init__(self, catalog, catalog_reader, shard_urls: List[str]):
+        self.shards = [Shard(0, catalog, catalog_reader)] + [
+            Shard(i, instrument(databases.Database(url)), url=url)
+            for i, url in enumerate(shard_urls, start=1)
+        ]
+        self.slot_map = [self.default_shard(slot) for slot in range(SHARD_SLOTS)]
+        self.moving: set = set()
+        self._located: "OrderedDict[str, int]" = OrderedDict()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.shards) > 1
+
+    @property
+    def catalog(self) -> Shard:
+        return self.shards[0]
+
+    def default_shard(self, slot: int) -> int:
+        return slot % len(self.shards)
+
+    async def connect(self):
+        for shard in self.shards[1:]:
+            try:
+                await shard.database.connect()
+                shard.connected = True
+                logger.info(f"✅ Shard {shard.index} conectado: {shard.host}")
+            except Exception as e:
+                shard.last_error = str(e)
+                logger.error(f"❌ Error conectando shard {shard.index} ({shard.host}): {e}")
+        if self.enabled:
+            await self.load_slot_map()
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def disconnect(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        for shard in self.shards[1:]:
+            if shard.connected:
+                await shard.database.disconnect()
+                shard.connected = False
+
+    async def load_slot_map(self):
+        """Relee shard_slots del catálogo (slots sin fila: shard por defecto)"""
+        rows = await self.catalog.database.fetch_all(query="SELECT slot, shard, state FROM shard_slots")
+        slot_map = [self.default_shard(slot) for slot in range(SHARD_SLOTS)]
+        moving = set()
+        for row in rows:
+            if row["shard"] >= len(self.shards):
+                logger.error(f"❌ Slot {row['slot']} asignado al shard {row['shard']}, que no está configurado")
+                continue
+            slot_map[row["slot"]] = row["shard"]
+            if row["state"] == "moving":
+                moving.add(row["slot"])
+        if slot_map != self.slot_map:
+            # Las ubicaciones en caché pueden haber cambiado de shard
+            self._located.clear()
+        self.slot_map, self.moving = slot_map, moving
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(SHARD_MAP_REFRESH_SECONDS)
+            try:
+                await self.load_slot_map()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Error releyendo el mapa de shards: {e}")
+
+    # ==================== RUTEO ====================
+
+    def shard_for_slot(self, slot: int) -> Shard:
+        return self.shards[self.slot_map[slot]]
+
+    def slot_for_rut(self, rut_num: int) -> int:
+        return slot_for_rut(rut_num)
+
+    def for_rut(self, rut_num: Optional[int]) -> Shard:
+        if not self.enabled or rut_num is None:
+            return self.catalog
+        return self.shard_for_slot(slot_for_rut(rut_num))
+
+    def for_rut_write(self, rut_num: Optional[int]) -> Shard:
+        """Shard para escribir datos del proveedor; falla si su slot se está moviendo"""
+        if self.enabled and rut_num is not None and slot_for_rut(rut_num) in self.moving:
+            raise ShardSlotMovingError(f"Datos del proveedor en migración de shard (slot {slot_for_rut(rut_num)})")
+        return self.for_rut(rut_num)
+
+    async def lock_slot_write(self, shard: Shard, rut_num: Optional[int]):
+        """
+        Dentro de la transacción que escribe en `shard`: toma el lock compartido
+        del slot y confirma en shard_slots (no en el mapa en memoria, que puede
+        estar atrasado) que el slot sigue en este shard y no se está moviendo.
+        Así ninguna escritura se cuela en el origen después de que
+        rebalance_shards empezó a copiarlo.
+        """
+        if not self.enabled or rut_num is None:
+            return
+        slot = slot_for_rut(rut_num)
+        locked = await shard.database.fetch_val(
+            query="SELECT pg_try_advisory_xact_lock_shared(:namespace, :slot)",
+            values={"namespace": SLOT_LOCK_NAMESPACE, "slot": slot}
+        )
+        if not locked:
+            raise ShardSlotMovingError(f"Datos del proveedor en migración de shard (slot {slot})")
+        row = await self.catalog.database.fetch_one(
+            query="SELECT shard, state FROM shard_slots WHERE slot = :slot", values={"slot": slot}
+        )
+        assigned = row["shard"] if row is not None else self.default_shard(slot)
+        if assigned != shard.index or (row is not None and row["state"] == "moving"):
+            self.moving.add(slot)
+            raise ShardSlotMovingError(f"Datos del proveedor en migración de shard (slot {slot})")
+
+    def for_id(self, identifier: Optional[str]) -> Optional[Shard]:
+        """Shard indicado por el slot codificado en un ID generado; None si no lo trae"""
+        if not self.enabled:
+            return self.catalog
+        slot = id_slot(identifier)
+        return self.shard_for_slot(slot) if slot is not None else None
+
+    def _candidates(self, identifier: Optional[str]) -> List[Shard]:
+        hinted = self.for_id(identifier)
+        cached = self._located.get(identifier) if identifier else None
+        first = [s for s in (self.shards[cached] if cached is not None else None, hinted) if s is not None]
+        return list(dict.fromkeys(first + self.shards))
+
+    def _remember(self, identifier: str, shard: Shard):
+        self._located[identifier] = shard.index
+        self._located.move_to_end(identifier)
+        while len(self._located) > LOCATE_CACHE_SIZE:
+            self._located.popitem(last=False)
+
+    async def find(self, identifier: str, fn: Callable[[Shard], Awaitable[Optional[T]]]) -> Optional[T]:
+        """
+        Ejecuta fn en el shard indicado por el ID (o el recordado) y, si no
+        encuentra nada, en los demás. Devuelve el primer resultado no vacío.
+        """
+        if not self.enabled:
+            return await fn(self.catalog)
+        for shard in self._candidates(identifier):
+            result = await fn(shard)
+            if result is not None:
+                self._remember(identifier, shard)
+                return result
+        return None
+
+    async def locate_request(self, request_id: str) -> Optional[Shard]:
+        """Shard que contiene la solicitud (None si no existe en ninguno)"""
+        if not self.enabled:
+            return self.catalog
+
+        async def probe(shard: Shard):
+            exists = await shard.reader.fetch_val(
+                query="SELECT 1 FROM requests WHERE request_id = :request_id",
+                values={"request_id": request_id}
+            )
+            return shard if exists else None
+
+        return await self.find(request_id, probe)
+
+    async def locate_request_write(self, request_id: str) -> Optional[Shard]:
+        """Como locate_request, pero falla si el slot del proveedor se está moviendo"""
+        if not self.enabled:
+            return self.catalog
+
+        async def probe(shard: Shard):
+            row = await shard.database.fetch_one(
+                query="SELECT proveedor_rut_num FROM requests WHERE request_id = :request_id",
+                values={"request_id": request_id}
+            )
+            return (shard, row["proveedor_rut_num"]) if row else None
+
+        found = await self.find(request_id, probe)
+        if found is None:
+            return None
+        shard, rut_num = found
+        self.for_rut_write(rut_num)
+        return shard
+
+    async def gather(self, fn: Callable[[Shard], Awaitable[T]]) -> List[T]:
+        """Scatter: fn en todos los shards en paralelo, resultados en orden de shard"""
+        if not self.enabled:
+            return [await fn(self.catalog)]
+        return list(await asyncio.gather(*(fn(shard) for shard in self.shards)))
+
+    def status(self) -> Dict:
+        counts = [0] * len(self.shards)
+        for shard_index in self.slot_map:
+            counts[shard_index] += 1
+        return {
+            "enabled": self.enabled,
+            "slots": SHARD_SLOTS,
+            "shards": [{**shard.status(), "slots": counts[shard.index]} for shard in self.shards],
+            "moving_slots": sorted(self.moving),
+        }
+
+
+# ==================== CLI ====================
+
+async def main(args):
+    from src.utils.rut import normalize_rut
+
+    if args.command == "slot":
+        rut_num, rut_dv = normalize_rut(args.rut)
+        slot = slot_for_rut(rut_num)
+        print(f"RUT {rut_num}-{rut_dv}: slot {slot} (shard por defecto {slot % (len(SHARD_URLS) + 1)})")
+        return
+
+    from src.db.database import connect_db, disconnect_db, shards
+
+    await connect_db()
+    try:
+        status = shards.status()
+        print(f"{'shard':<7}{'host':<30}{'slots':>7}  conectado")
+        for shard in status["shards"]:
+            print(f"{shard['shard']:<7}{shard['host']:<30}{shard['slots']:>7}  {'✅' if shard['connected'] else '❌'}")
+        if status["moving_slots"]:
+            print(f"⏳ Slots en migración: {status['moving_slots']}")
+    finally:
+        await disconnect_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharding por RUT de proveedor")
+    parser.add_argument("command", choices=["status", "slot"])
+    parser.add_argument("rut", nargs="?", help="RUT a ubicar (slot)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,225 @@
+"""
+Eventos de auditoría: un único `emit()` para rutas, repositorios y nodos del grafo.
+
+- durable=True: el INSERT se ejecuta en la conexión del llamador, es decir,
+  dentro de su transacción si la hay (se confirma o revierte junto con ella).
+- durable=False (por defecto): el evento va a un buffer en memoria que se vacía
+  con COPY por tamaño o por tiempo. Si el buffer se llena, emit() espera
+  (backpressure) hasta AUDIT_BACKPRESSURE_SECONDS y luego descarta el evento.
+  El apagado de la API vacía lo pendiente antes de cerrar la BD.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "200")) / 1000
+BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "10000"))
+BACKPRESSURE_SECONDS = float(os.getenv("AUDIT_BACKPRESSURE_SECONDS", "0.5"))
+SHUTDOWN_FLUSH_SECONDS = float(os.getenv("AUDIT_SHUTDOWN_FLUSH_SECONDS", "10"))
+
+COLUMNS = ["request_id", "action", "user_id", "details", "timestamp"]
+
+INSERT_SQL = """
+    INSERT INTO audit_log (request_id, action, user_id, details, timestamp)
+    VALUES (CAST(:request_id AS VARCHAR), :action, :user_id, CAST(:details AS JSONB), :timestamp)
+"""
+
+# (request_id, action, user_id, details JSON, timestamp): el orden de COLUMNS
+AuditRecord = Tuple[Optional[str], str, Optional[str], str, datetime]
+
+
+def _record(action: str, request_id: Optional[str], user_id: Optional[str], details: Optional[Dict]) -> AuditRecord:
+    return (
+        str(request_id) if request_id is not None else None,
+        action,
+        str(user_id) if user_id is not None else None,
+        json.dumps(details or {}, ensure_ascii=False, default=str),
+        # Hora del evento, no la del flush: el orden del trail no depende del buffer
+        datetime.utcnow(),
+    )
+
+
+class AuditWriter:
+    def __init__(
+        self,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        buffer_size: int = BUFFER_SIZE,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batch: List[AuditRecord] = []
+        self._writing = False
+        self._closing = False
+        self._counters = {
+            "emitted": 0, "written": 0, "dropped": 0, "flushes": 0,
+            "flush_errors": 0, "backpressure_waits": 0,
+        }
+        self._last_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def put(self, record: AuditRecord):
+        self._counters["emitted"] += 1
+        try:
+            self._queue.put_nowait(record)
+            return
+        except asyncio.QueueFull:
+            self._counters["backpressure_waits"] += 1
+        try:
+            await asyncio.wait_for(self._queue.put(record), BACKPRESSURE_SECONDS)
+        except asyncio.TimeoutError:
+            self._counters["dropped"] += 1
+            logger.warning(f"⚠️ Buffer de auditoría lleno: evento {record[1]} descartado")
+
+    async def _fill_batch(self):
+        """Espera el primer evento y junta hasta batch_size o hasta flush_interval"""
+        self._batch.append(await self._queue.get())
+        deadline = time.monotonic() + self.flush_interval
+        while len(self._batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                self._batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+    def _drain(self) -> List[AuditRecord]:
+        batch, self._batch = self._batch, []
+        while not self._queue.empty() and len(batch) < self.batch_size:
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _write(self, batch: List[AuditRecord]):
+        from src.db.database import database
+
+        started = time.perf_counter()
+        try:
+            async with database.connection() as connection:
+                await connection.raw_connection.copy_records_to_table(
+                    "audit_log", records=batch, columns=COLUMNS
+                )
+            self._counters["written"] += len(batch)
+            self._counters["flushes"] += 1
+        except Exception as e:
+            # Best-effort: el lote se pierde, pero queda registrado en logs
+            self._counters["flush_errors"] += 1
+            self._counters["dropped"] += len(batch)
+            logger.error(f"❌ Error escribiendo {len(batch)} eventos de auditoría: {e}")
+        finally:
+            self._last_flush_ms = (time.perf_counter() - started) * 1000
+
+    async def _loop(self):
+        while not self._closing:
+            # El lote en construcción vive en self._batch: si se cancela la espera, no se pierde
+            await self._fill_batch()
+            batch, self._batch = self._batch, []
+            self._writing = True
+            try:
+                await self._write(batch)
+            finally:
+                self._writing = False
+
+    def start(self):
+        """Inicia el writer en segundo plano (idempotente)"""
+        if self.running:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.buffer_size)
+        self._closing = False
+        self._task = asyncio.create_task(self._loop())
+        logger.info(
+            f"Auditoría por lotes activa: {self.batch_size} eventos o {self.flush_interval * 1000:.0f}ms"
+        )
+
+    async def stop(self, timeout: float = SHUTDOWN_FLUSH_SECONDS):
+        """Detiene el loop y vacía lo pendiente, con un tope de tiempo"""
+        if self._task is None:
+            return
+        # Un COPY en curso termina; la espera de eventos se interrumpe
+        self._closing = True
+        if not self._writing:
+            self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        deadline = time.monotonic() + timeout
+        while self._batch or not self._queue.empty():
+            if time.monotonic() >= deadline:
+                pending = len(self._batch) + self._queue.qsize()
+                self._counters["dropped"] += pending
+                logger.error(f"❌ Apagado: {pending} eventos de auditoría sin escribir")
+                break
+            await self._write(self._drain())
+        logger.info(f"Auditoría detenida ({self._counters['written']} eventos escritos)")
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "buffered": len(self._batch) + (self._queue.qsize() if self._queue else 0),
+            "buffer_size": self.buffer_size,
+            "batch_size": self.batch_size,
+            "flush_interval_ms": self.flush_interval * 1000,
+            "last_flush_ms": round(self._last_flush_ms, 2),
+            **self._counters,
+        }
+
+
+audit_writer = AuditWriter()
+
+
+async def emit(
+    action: str,
+    request_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    details: Optional[Dict] = None,
+    durable: bool = False,
+    db=None,
+):
+    """
+    Registra un evento de auditoría. Con durable=True escribe en `db` (o en la
+    BD global) dentro de la transacción en curso y propaga los errores.
+    """
+    record = _record(action, request_id, user_id, details)
+
+    if durable:
+        if db is None:
+            from src.db.database import database as db
+        await db.execute(query=INSERT_SQL, values=dict(zip(COLUMNS, record)))
+        return
+
+    if audit_writer.running:
+        await audit_writer.put(record)
+        return
+
+    # Sin writer (scripts, BD no conectada al arranque): escritura directa best-effort
+    try:
+        from src.db.database import database
+        if database and database.is_connected:
+            await database.execute(query=INSERT_SQL, values=dict(zip(COLUMNS, record)))
+    except Exception as e:
+        logger.warning(f"⚠️ Evento de auditoría {action} no registrado: {e}")
+
+
+def start_audit_writer():
+    audit_writer.start()
+
+
+async def stop_audit_writer():
+    await audit_writer.stop()
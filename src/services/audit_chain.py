@@ -0,0 +1,422 @@
+"""
+Cadena de hashes del audit_log y checkpoints firmados.
+
+El trigger `audit_log_chain` (migración 008) encadena cada evento con el anterior
+de su stream. Este módulo:
+
+- recalcula entry_hash con la misma serialización que `audit_entry_hash` en SQL;
+- crea checkpoints periódicos: verifica solo los eventos nuevos de cada stream
+  desde su cabeza del checkpoint anterior, arma una raíz Merkle de las cabezas,
+  la encadena al checkpoint previo y la firma con el P12;
+- verifica la integridad de forma incremental (desde el último checkpoint, o
+  desde uno dado): por cada checkpoint recorre los eventos que selló en cada
+  stream y entrega pruebas por solicitud: cadena del stream + camino Merkle al
+  checkpoint.
+
+    python -m src.services.audit_chain checkpoint
+    python -m src.services.audit_chain verify [--from-checkpoint N]
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from src.db.repositories.audit_chain_repository import AuditChainRepository, GLOBAL_STREAM
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_INTERVAL_SECONDS = int(os.getenv("AUDIT_CHECKPOINT_INTERVAL_SECONDS", "300"))
+CHECKPOINT_MAX_STREAMS = int(os.getenv("AUDIT_CHECKPOINT_MAX_STREAMS", "5000"))
+
+GENESIS = ""
+
+_checkpoint_task: Optional[asyncio.Task] = None
+
+
+# ==================== HASHES ====================
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _timestamp(value) -> str:
+    # to_char(ts, 'YYYY-MM-DD"T"HH24:MI:SS.US') en SQL
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%f") if isinstance(value, datetime) else str(value)
+
+
+def entry_hash(entry: Dict) -> str:
+    return _sha256("|".join([
+        entry["prev_hash"] or "",
+        entry["stream"],
+        str(entry["seq"]),
+        entry["action"] or "",
+        entry["user_id"] or "",
+        entry["details_text"] or "",
+        _timestamp(entry["timestamp"]),
+    ]))
+
+
+def verify_entries(entries: List[Dict], start_seq: int, start_hash: str) -> List[Dict]:
+    """
+    Verifica eventos consecutivos de un stream a partir de una cabeza confiable.
+    Devuelve la lista de problemas (vacía si la cadena está íntegra).
+    """
+    problems = []
+    expected_seq, expected_prev = start_seq + 1, start_hash
+    for entry in entries:
+        stream = entry["request_id"] if entry["request_id"] is not None else GLOBAL_STREAM
+        if entry["seq"] != expected_seq:
+            problems.append({"seq": expected_seq, "problema": "evento_faltante"})
+            expected_seq = entry["seq"]
+        if entry["stream"] != stream:
+            problems.append({"seq": entry["seq"], "problema": "stream_alterado"})
+        if entry["prev_hash"] != expected_prev:
+            problems.append({"seq": entry["seq"], "problema": "enlace_roto"})
+        if entry_hash(entry) != entry["entry_hash"]:
+            problems.append({"seq": entry["seq"], "problema": "evento_alterado"})
+        expected_seq, expected_prev = entry["seq"] + 1, entry["entry_hash"]
+    return problems
+
+
+def _verify_pending(head: Dict, chain: List[Dict]) -> List[Dict]:
+    """Eventos nuevos de un stream contra su cabeza firmada y su cabeza actual"""
+    problems = verify_entries(chain, head["checkpoint_seq"], head["checkpoint_hash"])
+    if not problems and (
+        not chain or chain[-1]["seq"] != head["seq"] or chain[-1]["entry_hash"] != head["entry_hash"]
+    ):
+        # Eventos borrados al final del stream
+        problems.append({"seq": head["seq"], "problema": "cabeza_inconsistente"})
+    return problems
+
+
+# ==================== MERKLE ====================
+
+def merkle_leaf(stream: str, seq: int, head_hash: str) -> str:
+    return _sha256(f"leaf|{stream}|{seq}|{head_hash}")
+
+
+def _sorted_leaves(heads: List[Dict]) -> List[Tuple[str, str]]:
+    # Orden por stream en Python: no depende de la collation de la BD
+    return [
+        (h["stream"], merkle_leaf(h["stream"], h["seq"], h["entry_hash"]))
+        for h in sorted(heads, key=lambda h: h["stream"])
+    ]
+
+
+def _parent(left: str, right: str) -> str:
+    return _sha256(f"node|{left}|{right}")
+
+
+def merkle_root(leaves: List[str]) -> str:
+    level = list(leaves)
+    if not level:
+        return _sha256("empty")
+    while len(level) > 1:
+        # Nodo impar: sube sin duplicarse
+        level = [
+            _parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ]
+    return level[0]
+
+
+def merkle_path(leaves: List[str], index: int) -> List[Dict]:
+    path = []
+    level = list(leaves)
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            path.append({"side": "left" if sibling < index else "right", "hash": level[sibling]})
+        level = [
+            _parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ]
+        index //= 2
+    return path
+
+
+def verify_merkle_path(leaf: str, path: List[Dict], root: str) -> bool:
+    node = leaf
+    for step in path:
+        node = _parent(step["hash"], node) if step["side"] == "left" else _parent(node, step["hash"])
+    return node == root
+
+
+def checkpoint_hash(prev_hash: str, root: str) -> str:
+    return _sha256(f"checkpoint|{prev_hash}|{root}")
+
+
+# ==================== FIRMA ====================
+
+def _sign(hash_hex: str) -> Optional[str]:
+    try:
+        from src.signing.p12_signer import P12HashSigner, DEFAULT_P12_PATH
+        return P12HashSigner(os.getenv("P12_PATH", DEFAULT_P12_PATH)).sign_hash(hash_hex)
+    except Exception as e:
+        logger.warning(f"⚠️ Checkpoint de auditoría sin firma: {e}")
+        return None
+
+
+def _signature_status(hash_hex: str, firma: Optional[str]) -> Optional[bool]:
+    """True/False si se pudo verificar la firma, None si no hay firma o certificado"""
+    if not firma:
+        return None
+    try:
+        from src.signing.p12_signer import load_certificate, load_signing_certificate_der, verify_hash_signature
+        der = load_signing_certificate_der()
+        if der is None:
+            return None
+        return verify_hash_signature(load_certificate(der), hash_hex, firma)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo verificar la firma del checkpoint: {e}")
+        return None
+
+
+def _verify_checkpoint(checkpoint: Dict, heads: List[Dict], prev_hash: Optional[str]) -> Tuple[List[str], Optional[bool]]:
+    """Problemas del checkpoint y estado de su firma (None: no verificable)"""
+    problems = []
+    root = merkle_root([leaf for _, leaf in _sorted_leaves(heads)])
+    if root != checkpoint["merkle_root"]:
+        problems.append("raiz_merkle_alterada")
+    if checkpoint_hash(checkpoint["prev_hash"], checkpoint["merkle_root"]) != checkpoint["checkpoint_hash"]:
+        problems.append("hash_checkpoint_alterado")
+    if prev_hash is not None and checkpoint["prev_hash"] != prev_hash:
+        problems.append("checkpoint_desenlazado")
+    signature = _signature_status(checkpoint["checkpoint_hash"], checkpoint["firma_digital"])
+    if signature is False:
+        problems.append("firma_invalida")
+    return problems, signature
+
+
+# ==================== CHECKPOINTS ====================
+
+async def create_checkpoint(repo: Optional[AuditChainRepository] = None) -> Optional[Dict]:
+    """
+    Verifica los eventos nuevos de cada stream desde su cabeza firmada anterior y
+    registra un checkpoint firmado. Los streams con fallas quedan fuera (y se
+    reportan) para no sellar una cadena alterada.
+    """
+    repo = repo or AuditChainRepository()
+    async with repo.db.transaction():
+        if not await repo.try_checkpoint_lock():
+            logger.info("Checkpoint de auditoría en curso en otra instancia")
+            return None
+
+        pending = await repo.get_pending_heads(CHECKPOINT_MAX_STREAMS)
+        if not pending:
+            return None
+
+        verified, failures, entries = [], [], 0
+        for head in pending:
+            chain = await repo.get_stream_entries(head["stream"], head["checkpoint_seq"], head["seq"])
+            problems = _verify_pending(head, chain)
+            if problems:
+                failures.append({"stream": head["stream"], "problemas": problems})
+                logger.error(f"❌ Cadena de auditoría alterada en {head['stream']}: {problems[:3]}")
+                continue
+            entries += len(chain)
+            verified.append({"stream": head["stream"], "seq": head["seq"], "entry_hash": head["entry_hash"]})
+
+        if not verified:
+            return {"checkpoint_id": None, "failures": failures}
+
+        last = await repo.get_last_checkpoint()
+        prev_hash = last["checkpoint_hash"] if last else GENESIS
+        root = merkle_root([leaf for _, leaf in _sorted_leaves(verified)])
+        digest = checkpoint_hash(prev_hash, root)
+        checkpoint_id = await repo.save_checkpoint(
+            prev_hash, root, digest, verified, entries, _sign(digest)
+        )
+
+    logger.info(
+        f"🔏 Checkpoint de auditoría {checkpoint_id}: {len(verified)} streams, {entries} eventos"
+        + (f", {len(failures)} streams con fallas" if failures else "")
+    )
+    return {
+        "checkpoint_id": checkpoint_id,
+        "checkpoint_hash": digest,
+        "streams": len(verified),
+        "entries": entries,
+        "failures": failures,
+    }
+
+
+async def verify_audit_chain(
+    from_checkpoint: Optional[int] = None, repo: Optional[AuditChainRepository] = None
+) -> Dict:
+    """
+    Verificación incremental: los checkpoints posteriores a `from_checkpoint` (por
+    defecto solo el último) y los eventos aún no cubiertos por ninguno. En cada
+    checkpoint se recalcula, por stream, la cadena desde su cabeza en el
+    checkpoint anterior hasta la sellada. Costo O(eventos desde el checkpoint
+    de partida), no O(tabla).
+
+    Los checkpoints sin firma o sin certificado para verificarla no se dan por
+    buenos en silencio: quedan en `firmas_no_verificadas`.
+    """
+    repo = repo or AuditChainRepository()
+    result = {
+        "ok": True, "checkpoints_verificados": 0, "streams_verificados": 0, "eventos_verificados": 0,
+        "fallas": [], "firmas_no_verificadas": []
+    }
+
+    if from_checkpoint is None:
+        last = await repo.get_last_checkpoint()
+        checkpoints, prev_hash = ([last] if last else []), None
+    else:
+        checkpoints = await repo.get_checkpoints_after(from_checkpoint)
+        trusted = await repo.db.fetch_val(
+            query="SELECT checkpoint_hash FROM audit_checkpoints WHERE id = :id",
+            values={"id": from_checkpoint}
+        )
+        prev_hash = trusted if trusted is not None else GENESIS
+
+    for checkpoint in checkpoints:
+        heads = await repo.get_checkpoint_deltas(checkpoint["id"])
+        problems, signature = _verify_checkpoint(checkpoint, heads, prev_hash)
+        if problems:
+            result["fallas"].append({"checkpoint_id": checkpoint["id"], "problemas": problems})
+        if signature is None:
+            result["firmas_no_verificadas"].append({
+                "checkpoint_id": checkpoint["id"],
+                "motivo": "sin_firma" if not checkpoint["firma_digital"] else "sin_certificado",
+            })
+        # Los eventos sellados: de la cabeza previa de cada stream a la de este checkpoint
+        for head in heads:
+            chain = await repo.get_stream_entries(head["stream"], head["checkpoint_seq"], head["seq"])
+            stream_problems = _verify_pending(head, chain)
+            if stream_problems:
+                result["fallas"].append({
+                    "checkpoint_id": checkpoint["id"], "stream": head["stream"], "problemas": stream_problems
+                })
+            result["streams_verificados"] += 1
+            result["eventos_verificados"] += len(chain)
+        prev_hash = checkpoint["checkpoint_hash"]
+        result["checkpoints_verificados"] += 1
+
+    pending = await repo.get_pending_heads(CHECKPOINT_MAX_STREAMS)
+    for head in pending:
+        chain = await repo.get_stream_entries(head["stream"], head["checkpoint_seq"], head["seq"])
+        problems = _verify_pending(head, chain)
+        if problems:
+            result["fallas"].append({"stream": head["stream"], "problemas": problems})
+        result["streams_verificados"] += 1
+        result["eventos_verificados"] += len(chain)
+
+    result["ok"] = not result["fallas"]
+    return result
+
+
+async def request_proof(request_id: str, repo: Optional[AuditChainRepository] = None) -> Dict:
+    """
+    Prueba de integridad de una solicitud: su cadena completa recalculada y el
+    camino Merkle desde su cabeza hasta el último checkpoint firmado que la cubre.
+    """
+    repo = repo or AuditChainRepository()
+    chain = await repo.get_stream_entries(request_id, reader=repo.reader)
+    problems = verify_entries(chain, 0, GENESIS)
+    proof = {
+        "stream": request_id,
+        "eventos_encadenados": len(chain),
+        "cadena_valida": not problems,
+        "problemas": problems,
+        "cabeza": {"seq": chain[-1]["seq"], "entry_hash": chain[-1]["entry_hash"]} if chain else None,
+        "checkpoint": None,
+        "eventos_sin_checkpoint": len(chain),
+    }
+
+    checkpoint = await repo.get_stream_checkpoint(request_id, reader=repo.reader)
+    if checkpoint is None:
+        return proof
+
+    heads = await repo.get_checkpoint_heads(checkpoint["id"], reader=repo.reader)
+    leaves = _sorted_leaves(heads)
+    index = next(i for i, (stream, _) in enumerate(leaves) if stream == request_id)
+    leaf = leaves[index][1]
+    path = merkle_path([l for _, l in leaves], index)
+    covered = next((e for e in chain if e["seq"] == checkpoint["covered_seq"]), None)
+
+    proof["checkpoint"] = {
+        "id": checkpoint["id"],
+        "created_at": checkpoint["created_at"],
+        "seq_cubierto": checkpoint["covered_seq"],
+        "entry_hash_cubierto": checkpoint["covered_hash"],
+        "hoja": leaf,
+        "camino_merkle": path,
+        "merkle_root": checkpoint["merkle_root"],
+        "prev_hash": checkpoint["prev_hash"],
+        "checkpoint_hash": checkpoint["checkpoint_hash"],
+        "firma_digital": checkpoint["firma_digital"],
+        "cabeza_coincide": covered is not None and covered["entry_hash"] == checkpoint["covered_hash"],
+        "camino_valido": verify_merkle_path(leaf, path, checkpoint["merkle_root"]),
+        "hash_valido": checkpoint_hash(checkpoint["prev_hash"], checkpoint["merkle_root"]) == checkpoint["checkpoint_hash"],
+    }
+    proof["eventos_sin_checkpoint"] = sum(1 for e in chain if e["seq"] > checkpoint["covered_seq"])
+    return proof
+
+
+# ==================== TAREA PERIÓDICA ====================
+
+async def _checkpoint_loop():
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL_SECONDS)
+        try:
+            await create_checkpoint()
+        except Exception as e:
+            logger.error(f"❌ Error creando checkpoint de auditoría: {e}")
+
+
+def start_audit_checkpointer():
+    """Inicia los checkpoints periódicos (idempotente)"""
+    global _checkpoint_task
+    if _checkpoint_task is None or _checkpoint_task.done():
+        _checkpoint_task = asyncio.create_task(_checkpoint_loop())
+        logger.info(f"Checkpoints de auditoría cada {CHECKPOINT_INTERVAL_SECONDS}s")
+
+
+async def stop_audit_checkpointer():
+    global _checkpoint_task
+    if _checkpoint_task is not None:
+        _checkpoint_task.cancel()
+        try:
+            await _checkpoint_task
+        except asyncio.CancelledError:
+            pass
+        _checkpoint_task = None
+
+
+async def main(args):
+    from src.db.database import connect_db, disconnect_db
+
+    await connect_db()
+    try:
+        if args.command == "checkpoint":
+            result = await create_checkpoint()
+            if result is None:
+                print("✅ Sin eventos nuevos")
+            else:
+                print(f"🔏 Checkpoint {result['checkpoint_id']}: {result.get('streams', 0)} streams, {result.get('entries', 0)} eventos")
+                for failure in result["failures"]:
+                    print(f"  ❌ {failure['stream']}: {failure['problemas'][:3]}")
+        else:
+            result = await verify_audit_chain(args.from_checkpoint)
+            print(
+                f"{'✅' if result['ok'] else '❌'} {result['checkpoints_verificados']} checkpoints, "
+                f"{result['streams_verificados']} streams, {result['eventos_verificados']} eventos"
+            )
+            for failure in result["fallas"]:
+                print(f"  ❌ {failure}")
+            for unverified in result["firmas_no_verificadas"]:
+                print(f"  ⚠️ Firma no verificada: {unverified}")
+    finally:
+        await disconnect_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cadena de hashes del audit_log")
+    parser.add_argument("command", choices=["checkpoint", "verify"])
+    parser.add_argument("--from-checkpoint", type=int, help="Último checkpoint confiable (verify)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,432 @@
+"""
+Re-verificación masiva de integridad de certificados emitidos en un período.
+
+    python -m src.services.bulk_verification --from 2024-01-01 --to 2024-07-01
+    python -m src.services.bulk_verification --resume <job_id>
+
+Los certificados se leen por tramos con consultas paginadas por id (keyset, sin
+transacción larga; desde la API, en réplicas) y cada tramo se verifica en un
+pool de procesos (uno por núcleo): hash final contra la ejecución, cadena
+completa, recálculo de la cadena canónica y firma digital con el certificado
+X.509 parseado una sola vez por worker. Tras cada tramo se
+escribe un checkpoint, así que una ejecución interrumpida continúa donde quedó.
+El resultado es un reporte firmado más un archivo JSONL con las fallas.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv("BULK_VERIFY_CHUNK_SIZE", "2000"))
+WORKERS = int(os.getenv("BULK_VERIFY_WORKERS", "0")) or os.cpu_count() or 1
+REPORTS_DIR = Path(os.getenv("VERIFICATION_REPORTS_DIR", "reports"))
+JOB_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+STREAM_QUERY = """
+    SELECT
+        c.id, c.certificado_id, c.request_id, c.issued_at,
+        c.hash_final AS hash_certificado, c.firma_digital,
+        w.id AS workflow_execution_id,
+        w.hash_ingest, w.hash_riesgo, w.hash_compliance, w.hash_final,
+        w.riesgo, w.cumplimiento, w.ingest_timestamp, w.timestamp_final,
+        w.metadata->>'hash_chain' AS hash_chain,
+        r.proveedor_rut, r.proveedor_nombre, r.monto_contrato, r.objeto_contrato
+    FROM certificates c
+    JOIN requests r ON r.request_id = c.request_id
+    LEFT JOIN workflow_executions w
+        ON w.id = c.workflow_execution_id AND w.created_at >= COALESCE(r.created_at, CAST('-infinity' AS TIMESTAMP))
+    WHERE c.id > :after_id AND c.issued_at >= :desde AND c.issued_at < :hasta
+    ORDER BY c.id
+    LIMIT :limit
+"""
+
+# Lector de tramos: (after_id, desde, hasta, limit) -> filas con id > after_id
+PageReader = Callable[[int, datetime, datetime, int], Awaitable[List[Dict]]]
+
+
+def database_page_reader(db) -> PageReader:
+    """Tramos sobre un Database de `databases` o el ReplicaRouter (read_database)"""
+    async def fetch_page(after_id: int, desde: datetime, hasta: datetime, limit: int) -> List[Dict]:
+        rows = await db.fetch_all(
+            query=STREAM_QUERY, values={"after_id": after_id, "desde": desde, "hasta": hasta, "limit": limit}
+        )
+        return [dict(row) for row in rows]
+    return fetch_page
+
+
+def asyncpg_page_reader(conn) -> PageReader:
+    """Tramos sobre una conexión asyncpg (CLI)"""
+    from src.db.fastpath import to_positional
+
+    query, names = to_positional(STREAM_QUERY)
+
+    async def fetch_page(after_id: int, desde: datetime, hasta: datetime, limit: int) -> List[Dict]:
+        values = {"after_id": after_id, "desde": desde, "hasta": hasta, "limit": limit}
+        return [dict(record) for record in await conn.fetch(query, *(values[name] for name in names))]
+    return fetch_page
+
+STAGE_COLUMNS = {
+    "ingest": "hash_ingest",
+    "riesgo": "hash_riesgo",
+    "compliance": "hash_compliance",
+    "final": "hash_final",
+}
+
+
+# ==================== WORKERS (PROCESOS) ====================
+
+_certificate = None
+
+
+def _init_worker(certificate_der: Optional[bytes]):
+    """Parsea el certificado X.509 una sola vez por proceso"""
+    global _certificate
+    if certificate_der:
+        from src.signing.p12_signer import load_certificate
+        _certificate = load_certificate(certificate_der)
+
+
+def _verify_row(row: Dict, counts: Counter) -> List[str]:
+    from src.workflows.art17.hash_chain import HASH_CHAIN_VERSION, recompute_chain
+
+    problems = []
+    if row["workflow_execution_id"] is None:
+        problems.append("sin_ejecucion")
+    else:
+        if row["hash_certificado"] != row["hash_final"]:
+            problems.append("hash_final_no_coincide")
+        if any(row[column] is None for column in STAGE_COLUMNS.values()):
+            problems.append("cadena_incompleta")
+        elif row["hash_chain"] == HASH_CHAIN_VERSION:
+            counts["cadena_recalculada"] += 1
+            recomputed = recompute_chain(row)
+            for etapa, column in STAGE_COLUMNS.items():
+                if recomputed[etapa] != row[column]:
+                    problems.append(f"hash_{etapa}_alterado")
+        else:
+            # Ejecuciones anteriores a la cadena canónica: solo consistencia
+            counts["cadena_legada"] += 1
+
+    if row["firma_digital"]:
+        if _certificate is None:
+            counts["firma_no_verificable"] += 1
+        else:
+            from src.signing.p12_signer import verify_hash_signature
+            if verify_hash_signature(_certificate, row["hash_certificado"], row["firma_digital"]):
+                counts["firma_valida"] += 1
+            else:
+                problems.append("firma_invalida")
+    else:
+        counts["sin_firma"] += 1
+    return problems
+
+
+def verify_chunk(rows: List[Dict]) -> Dict:
+    """Verifica un tramo completo dentro de un worker"""
+    started = time.process_time()
+    counts: Counter = Counter()
+    failures = []
+    for row in rows:
+        problems = _verify_row(row, counts)
+        if problems:
+            counts["con_fallas"] += 1
+            failures.append({
+                "certificado_id": row["certificado_id"],
+                "request_id": row["request_id"],
+                "issued_at": row["issued_at"].isoformat() if row["issued_at"] else None,
+                "problemas": problems,
+            })
+        else:
+            counts["integros"] += 1
+    return {
+        "rows": len(rows),
+        "counts": dict(counts),
+        "failures": failures,
+        "cpu_seconds": time.process_time() - started,
+    }
+
+
+# ==================== ORQUESTACIÓN ====================
+
+def _write_json(path: Path, content: Dict):
+    tmp = path.with_name(f"{path.name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False, indent=2, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _signing_certificate_der() -> Optional[bytes]:
+    try:
+        from src.signing.p12_signer import load_signing_certificate_der
+        return load_signing_certificate_der()
+    except Exception as e:
+        logger.warning(f"⚠️ Sin certificado de firma: las firmas no se verificarán ({e})")
+        return None
+
+
+def _sign_report(report_hash: str) -> Tuple[Optional[str], Optional[str]]:
+    try:
+        import base64
+        from src.signing.p12_signer import P12HashSigner, DEFAULT_P12_PATH
+        signer = P12HashSigner(os.getenv("P12_PATH", DEFAULT_P12_PATH))
+        return signer.sign_hash(report_hash), base64.b64encode(signer.certificate_der()).decode()
+    except Exception as e:
+        logger.warning(f"⚠️ Reporte sin firmar: {e}")
+        return None, None
+
+
+class BulkVerificationJob:
+    def __init__(
+        self,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        job_id: Optional[str] = None,
+        workers: int = WORKERS,
+        chunk_size: int = CHUNK_SIZE,
+        reports_dir: Path = REPORTS_DIR,
+    ):
+        self.job_id = job_id or f"verify-{datetime.utcnow():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.reports_dir = Path(reports_dir)
+        self.checkpoint_path = self.reports_dir / f"{self.job_id}.checkpoint.json"
+        self.failures_path = self.reports_dir / f"{self.job_id}.failures.jsonl"
+        self.report_path = self.reports_dir / f"{self.job_id}.report.json"
+
+        self.desde = desde
+        self.hasta = hasta
+        self.status = "pending"
+        self.last_id = 0
+        self.rows = 0
+        self.counts: Counter = Counter()
+        self.cpu_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.failures_bytes = 0
+        self.error: Optional[str] = None
+
+    @classmethod
+    def resume(cls, job_id: str, reports_dir: Path = REPORTS_DIR, **kwargs) -> "BulkVerificationJob":
+        job = cls(job_id=job_id, reports_dir=reports_dir, **kwargs)
+        if not job.checkpoint_path.exists():
+            raise ValueError(f"No existe checkpoint para {job_id}")
+        with open(job.checkpoint_path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        job.desde = datetime.fromisoformat(checkpoint["desde"])
+        job.hasta = datetime.fromisoformat(checkpoint["hasta"])
+        job.last_id = checkpoint["last_id"]
+        job.rows = checkpoint["rows"]
+        job.counts = Counter(checkpoint["counts"])
+        job.cpu_seconds = checkpoint["cpu_seconds"]
+        job.wall_seconds = checkpoint["wall_seconds"]
+        job.failures_bytes = checkpoint["failures_bytes"]
+        return job
+
+    def progress(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "desde": self.desde.isoformat() if self.desde else None,
+            "hasta": self.hasta.isoformat() if self.hasta else None,
+            "certificados": self.rows,
+            "last_id": self.last_id,
+            "counts": dict(self.counts),
+            "throughput": self._throughput(),
+            "report": str(self.report_path) if self.report_path.exists() else None,
+            "error": self.error,
+        }
+
+    def _throughput(self) -> Dict:
+        return {
+            "certificados_por_segundo": round(self.rows / self.wall_seconds, 1) if self.wall_seconds else 0,
+            # Por núcleo: certificados por segundo de CPU efectivamente usado en los workers
+            "certificados_por_segundo_por_nucleo": round(self.rows / self.cpu_seconds, 1) if self.cpu_seconds else 0,
+            "workers": self.workers,
+        }
+
+    def _checkpoint(self):
+        _write_json(self.checkpoint_path, {
+            "job_id": self.job_id,
+            "desde": self.desde.isoformat(),
+            "hasta": self.hasta.isoformat(),
+            "last_id": self.last_id,
+            "rows": self.rows,
+            "counts": dict(self.counts),
+            "cpu_seconds": self.cpu_seconds,
+            "wall_seconds": self.wall_seconds,
+            "failures_bytes": self.failures_bytes,
+            "updated_at": datetime.utcnow().isoformat(),
+        })
+
+    def _apply(self, result: Dict, last_id: int, failures_file):
+        for failure in result["failures"]:
+            failures_file.write(json.dumps(failure, ensure_ascii=False) + "\n")
+        failures_file.flush()
+        os.fsync(failures_file.fileno())
+        self.failures_bytes = failures_file.tell()
+
+        self.last_id = last_id
+        self.rows += result["rows"]
+        self.counts.update(result["counts"])
+        self.cpu_seconds += result["cpu_seconds"]
+        self._checkpoint()
+
+    async def run(self, fetch_page: PageReader) -> Dict:
+        """Ejecuta (o continúa) el job leyendo los tramos con `fetch_page`"""
+        self.reports_dir.mkdir(parents=True, exist_ok=True)
+        self.status = "running"
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        wall_before = self.wall_seconds
+
+        # Fallas de tramos sin checkpoint (interrupción) se descartan y se recalculan
+        with open(self.failures_path, "a+b"):
+            pass
+        os.truncate(self.failures_path, self.failures_bytes)
+
+        context = multiprocessing.get_context("spawn")
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context,
+            initializer=_init_worker, initargs=(_signing_certificate_der(),)
+        )
+        try:
+            with open(self.failures_path, "a", encoding="utf-8") as failures_file:
+                pending = deque()
+                fetched_id = self.last_id
+                exhausted = False
+                while True:
+                    # Hasta dos tramos por worker en vuelo; se aplican en orden de id
+                    while not exhausted and len(pending) < self.workers * 2:
+                        rows = await fetch_page(fetched_id, self.desde, self.hasta, self.chunk_size)
+                        if rows:
+                            fetched_id = rows[-1]["id"]
+                            pending.append((fetched_id, loop.run_in_executor(pool, verify_chunk, rows)))
+                        if len(rows) < self.chunk_size:
+                            exhausted = True
+                    if not pending:
+                        break
+                    last_id, future = pending.popleft()
+                    self._apply(await future, last_id, failures_file)
+                    self.wall_seconds = wall_before + time.perf_counter() - started
+                    logger.info(
+                        f"🔎 {self.job_id}: {self.rows} certificados, "
+                        f"{self.counts.get('con_fallas', 0)} con fallas (último id {last_id})"
+                    )
+
+            self.wall_seconds = wall_before + time.perf_counter() - started
+            self._checkpoint()
+            report = self._write_report()
+            self.status = "completed"
+            return report
+        except asyncio.CancelledError:
+            self.status = "interrupted"
+            raise
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            logger.error(f"❌ Re-verificación {self.job_id} interrumpida: {e}")
+            raise
+        finally:
+            # Sin esperar a los workers: una cancelación no bloquea el event loop
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _write_report(self) -> Dict:
+        sha256 = hashlib.sha256()
+        with open(self.failures_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(block)
+
+        resumen = {
+            "job_id": self.job_id,
+            "periodo": {"desde": self.desde.isoformat(), "hasta": self.hasta.isoformat()},
+            "generado_at": datetime.utcnow().isoformat(),
+            "certificados": self.rows,
+            "integros": self.counts.get("integros", 0),
+            "con_fallas": self.counts.get("con_fallas", 0),
+            "detalle": dict(self.counts),
+            "wall_seconds": round(self.wall_seconds, 3),
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "throughput": self._throughput(),
+            "fallas": {"archivo": self.failures_path.name, "sha256": sha256.hexdigest()},
+        }
+        report_hash = hashlib.sha256(
+            json.dumps(resumen, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        firma, certificado = _sign_report(report_hash)
+        report = {
+            "resumen": resumen,
+            "sha256": report_hash,
+            "firma_digital": firma,
+            "certificado_firmante": certificado,
+        }
+        _write_json(self.report_path, report)
+        logger.info(
+            f"✅ Re-verificación {self.job_id}: {resumen['certificados']} certificados, "
+            f"{resumen['con_fallas']} con fallas → {self.report_path}"
+        )
+        return report
+
+
+# ==================== CLI ====================
+
+async def main(args):
+    import asyncpg
+
+    database_url = args.database_url or os.getenv("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL not set")
+        return
+
+    options = {"workers": args.workers, "chunk_size": args.chunk_size, "reports_dir": Path(args.reports_dir)}
+    if args.resume:
+        job = BulkVerificationJob.resume(args.resume, **options)
+        print(f"↩️  Continuando {job.job_id} desde id {job.last_id} ({job.rows} ya verificados)")
+    else:
+        if not args.desde or not args.hasta:
+            print("❌ --from y --to son obligatorios (o --resume)")
+            return
+        job = BulkVerificationJob(
+            datetime.fromisoformat(args.desde), datetime.fromisoformat(args.hasta), **options
+        )
+        print(f"🔎 Job {job.job_id}")
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        report = await job.run(asyncpg_page_reader(conn))
+    finally:
+        await conn.close()
+
+    resumen = report["resumen"]
+    print(f"  ✅ {resumen['certificados']} certificados: {resumen['integros']} íntegros, {resumen['con_fallas']} con fallas")
+    print(
+        f"  ⚡ {resumen['throughput']['certificados_por_segundo']}/s total, "
+        f"{resumen['throughput']['certificados_por_segundo_por_nucleo']}/s por núcleo "
+        f"({resumen['throughput']['workers']} workers)"
+    )
+    print(f"  📄 {job.report_path} ({'firmado' if report['firma_digital'] else 'SIN FIRMA'})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-verificación masiva de certificados")
+    parser.add_argument("--from", dest="desde", help="Inicio del período (ISO 8601)")
+    parser.add_argument("--to", dest="hasta", help="Fin exclusivo del período (ISO 8601)")
+    parser.add_argument("--resume", help="job_id a continuar desde su checkpoint")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--reports-dir", default=str(REPORTS_DIR))
+    parser.add_argument("--database-url", help="Por defecto DATABASE_URL (se recomienda una réplica)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,352 @@
+"""
+Change feed entre instancias: invalidación de cachés locales vía LISTEN/NOTIFY.
+
+Las rutas de escritura llaman a publish() dentro de su transacción: cada cambio
+(entidad, clave) se inserta en change_outbox y el trigger emite NOTIFY, que
+Postgres entrega solo si la transacción se confirma. Cada instancia mantiene
+una conexión LISTEN por base (catálogo y shards) y al recibir un evento borra
+las entradas de change_cache con esa entidad y clave. La caché se llena desde
+el primario: una réplica atrasada podría guardar datos anteriores al evento que
+acaba de invalidarlos.
+
+Las estadísticas agregadas no publican eventos (cambiarían con cada
+certificado): sus entradas viven STATS_TTL_SECONDS, así que todas las
+escrituras de esa ventana se absorben en una sola recarga por instancia.
+
+Tras una desconexión la caché se ignora hasta reconectar; al reconectar se
+releen del outbox los eventos posteriores al último visto (versión = id, más un
+margen de tiempo por commits fuera de orden). Si la desconexión pudo superar la
+retención del outbox, se vacía toda la caché.
+
+El retraso de invalidación (del INSERT en el outbox a la invalidación local,
+incluye el desfase de reloj con la BD) se expone en /api/v2/debug/change-feed.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from src.db.routing import primary_reads, requires_primary
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "change_feed"
+# 0 desactiva la caché local (las lecturas van siempre a la BD)
+CACHE_SIZE = int(os.getenv("CHANGE_FEED_CACHE_SIZE", "10000"))
+# Red de seguridad: ninguna entrada vive más que esto aunque se pierda un evento
+CACHE_TTL_SECONDS = float(os.getenv("CHANGE_FEED_CACHE_TTL_SECONDS", "300"))
+# Desactualización máxima de las estadísticas agregadas (no se invalidan por evento)
+STATS_TTL_SECONDS = float(os.getenv("CHANGE_FEED_STATS_TTL_SECONDS", "10"))
+RECONNECT_SECONDS = float(os.getenv("CHANGE_FEED_RECONNECT_SECONDS", "2"))
+HEALTHCHECK_SECONDS = float(os.getenv("CHANGE_FEED_HEALTHCHECK_SECONDS", "10"))
+REPLAY_MARGIN_SECONDS = float(os.getenv("CHANGE_FEED_REPLAY_MARGIN_SECONDS", "60"))
+RETENTION_HOURS = float(os.getenv("CHANGE_FEED_RETENTION_HOURS", "24"))
+PURGE_INTERVAL_SECONDS = float(os.getenv("CHANGE_FEED_PURGE_INTERVAL_SECONDS", "3600"))
+
+# Entidades publicadas; la clave ALL invalida la entidad completa
+CERTIFICATE = "certificate"
+PROVEEDOR = "proveedor"
+STATS = "stats"
+ALL = "*"
+
+Change = Tuple[str, str]
+
+PUBLISH_SQL = """
+    INSERT INTO change_outbox (entity, key)
+    SELECT * FROM unnest(CAST(:entities AS VARCHAR[]), CAST(:keys AS VARCHAR[]))
+"""
+
+
+async def publish(changes: Iterable[Change], db=None):
+    """
+    Registra cambios (entidad, clave) en el outbox usando la conexión del
+    llamador: dentro de su transacción, se confirman o revierten con ella.
+    """
+    changes = list(dict.fromkeys((entity, str(key)) for entity, key in changes))
+    if not changes:
+        return
+    if db is None:
+        from src.db.database import database as db
+    await db.execute(query=PUBLISH_SQL, values={
+        "entities": [entity for entity, _ in changes],
+        "keys": [key for _, key in changes],
+    })
+
+
+class ChangeCache:
+    """
+    Caché LRU local por (entidad, clave, variante). Solo se usa mientras el
+    listener está sano; las lecturas que exigen primario (read-your-writes) la
+    saltan. Los valores se comparten entre llamadores: son de solo lectura.
+    """
+
+    def __init__(
+        self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL_SECONDS, ttls: Optional[Dict[str, float]] = None
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        # TTL por entidad; las demás usan ttl
+        self.ttls = {STATS: STATS_TTL_SECONDS} if ttls is None else ttls
+        self.enabled = False
+        self._entries: "OrderedDict[Tuple[str, str], Dict[Hashable, Tuple[float, Any]]]" = OrderedDict()
+        # Época de la última invalidación por clave y por entidad: una carga que
+        # empezó antes no se guarda (podría traer datos ya invalidados)
+        self._epoch = 0
+        self._floor = 0
+        self._invalidated: Dict[Tuple[str, str], int] = {}
+        self._entity_invalidated: Dict[str, int] = {}
+        self._counters = {"hits": 0, "misses": 0, "bypassed": 0, "stores_skipped": 0, "invalidations": 0}
+
+    async def get_or_load(
+        self, entity: str, key: str, variant: Hashable, loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        if not self.enabled or self.max_size <= 0 or requires_primary():
+            self._counters["bypassed"] += 1
+            return await loader()
+
+        slot = (entity, str(key))
+        entry = self._entries.get(slot, {}).get(variant)
+        if entry is not None and entry[0] > time.monotonic():
+            self._counters["hits"] += 1
+            self._entries.move_to_end(slot)
+            return entry[1]
+
+        self._counters["misses"] += 1
+        started = self._epoch
+        # Del primario: lo que se guarda ya incluye toda escritura confirmada
+        # antes de la última invalidación recibida
+        with primary_reads():
+            value = await loader()
+        if value is None:
+            return value
+        if (
+            not self.enabled or started < self._floor
+            or self._invalidated.get(slot, -1) > started
+            or self._entity_invalidated.get(entity, -1) > started
+        ):
+            self._counters["stores_skipped"] += 1
+            return value
+        self._entries.setdefault(slot, {})[variant] = (time.monotonic() + self.ttls.get(entity, self.ttl), value)
+        self._entries.move_to_end(slot)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, entity: str, key: str):
+        self._epoch += 1
+        self._counters["invalidations"] += 1
+        if key == ALL:
+            self._entity_invalidated[entity] = self._epoch
+            for slot in [slot for slot in self._entries if slot[0] == entity]:
+                del self._entries[slot]
+            return
+        slot = (entity, key)
+        self._entries.pop(slot, None)
+        self._invalidated[slot] = self._epoch
+        if len(self._invalidated) > 2 * max(self.max_size, 1):
+            # Se olvidan las marcas: toda carga en curso queda sin guardar
+            self._invalidated.clear()
+            self._floor = self._epoch
+
+    def clear(self):
+        self._epoch += 1
+        self._floor = self._epoch
+        self._entries.clear()
+        self._invalidated.clear()
+        self._entity_invalidated.clear()
+
+    def stats(self) -> Dict:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "entity_ttl_seconds": self.ttls,
+            "hit_ratio": round(self._counters["hits"] / lookups, 4) if lookups else 0,
+            **self._counters,
+        }
+
+
+class _Source:
+    """Una conexión LISTEN contra una base (catálogo o shard)"""
+
+    def __init__(self, index: int, url: str):
+        self.index = index
+        self.url = url
+        self.conn = None
+        self.connected = False
+        self.last_id: Optional[int] = None
+        # Hora de la BD en el último chequeo exitoso: ventana de relectura
+        self.last_seen_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.last_purge = 0.0
+
+
+class ChangeFeed:
+    def __init__(self, cache: ChangeCache):
+        self.cache = cache
+        self._sources: List[_Source] = []
+        self._tasks: List[asyncio.Task] = []
+        self._lags_ms: deque = deque(maxlen=1000)
+        self._counters = {"events": 0, "replayed": 0, "full_invalidations": 0, "reconnects": 0, "errors": 0}
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    @property
+    def healthy(self) -> bool:
+        return self.running and all(source.connected for source in self._sources)
+
+    def _update_cache_state(self):
+        healthy = self.healthy
+        if self.cache.enabled and not healthy:
+            # Sin listener no llegan invalidaciones: la caché deja de usarse
+            self.cache.enabled = False
+        elif healthy and not self.cache.enabled:
+            self.cache.enabled = True
+
+    def _apply(self, source: _Source, event_id: int, entity: str, key: str):
+        self.cache.invalidate(entity, key)
+        if source.last_id is None or event_id > source.last_id:
+            source.last_id = event_id
+
+    def _on_notify(self, source: _Source):
+        def callback(connection, pid, channel, payload: str):
+            try:
+                event_id, entity, rest = payload.split("|", 2)
+                key, epoch = rest.rsplit("|", 1)
+                self._apply(source, int(event_id), entity, key)
+                self._counters["events"] += 1
+                self._lags_ms.append(max(time.time() - float(epoch), 0.0) * 1000)
+            except Exception as e:
+                self._counters["errors"] += 1
+                logger.error(f"❌ Evento de change feed inválido ({payload!r}): {e}")
+        return callback
+
+    async def _replay(self, source: _Source):
+        """Relee del outbox lo ocurrido mientras la conexión no escuchaba"""
+        conn = source.conn
+        if source.last_id is None:
+            # Primera conexión: la caché de esta base aún está vacía
+            source.last_id = await conn.fetchval("SELECT COALESCE(MAX(id), 0) FROM change_outbox")
+            return
+        now = await conn.fetchval("SELECT clock_timestamp()::timestamp")
+        since = (source.last_seen_at or now) - timedelta(seconds=REPLAY_MARGIN_SECONDS)
+        if source.last_seen_at is None or now - source.last_seen_at > timedelta(hours=RETENTION_HOURS) / 2:
+            self.cache.clear()
+            self._counters["full_invalidations"] += 1
+            source.last_id = await conn.fetchval("SELECT COALESCE(MAX(id), 0) FROM change_outbox")
+            logger.warning(f"⚠️ Change feed (base {source.index}): desconexión larga, caché vaciada")
+            return
+        rows = await conn.fetch(
+            "SELECT id, entity, key FROM change_outbox WHERE id > $1 OR created_at >= $2 ORDER BY id",
+            source.last_id, since
+        )
+        for row in rows:
+            self._apply(source, row["id"], row["entity"], row["key"])
+        self._counters["replayed"] += len(rows)
+        if rows:
+            logger.info(f"🔁 Change feed (base {source.index}): {len(rows)} eventos releídos tras reconectar")
+
+    async def _purge(self, source: _Source):
+        if time.monotonic() - source.last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        source.last_purge = time.monotonic()
+        await source.conn.execute(
+            "DELETE FROM change_outbox WHERE created_at < clock_timestamp() - make_interval(hours => $1)",
+            RETENTION_HOURS
+        )
+
+    async def _run(self, source: _Source):
+        import asyncpg
+
+        while True:
+            try:
+                source.conn = await asyncpg.connect(source.url)
+                # LISTEN antes de releer: un evento puede llegar dos veces, nunca cero
+                await source.conn.add_listener(CHANNEL, self._on_notify(source))
+                await self._replay(source)
+                source.connected, source.last_error = True, None
+                self._update_cache_state()
+                logger.info(f"✅ Change feed escuchando en base {source.index}")
+                while True:
+                    source.last_seen_at = await source.conn.fetchval("SELECT clock_timestamp()::timestamp")
+                    await self._purge(source)
+                    await asyncio.sleep(HEALTHCHECK_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                source.last_error = str(e)
+                self._counters["errors"] += 1
+                logger.error(f"❌ Change feed (base {source.index}) desconectado: {e}")
+            finally:
+                source.connected = False
+                self._update_cache_state()
+                if source.conn is not None and not source.conn.is_closed():
+                    try:
+                        await source.conn.close(timeout=2)
+                    except Exception:
+                        source.conn.terminate()
+                source.conn = None
+            self._counters["reconnects"] += 1
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    def start(self, urls: List[str]):
+        """Una conexión LISTEN por base (idempotente)"""
+        if self.running or self.cache.max_size <= 0:
+            return
+        self._sources = [_Source(index, url) for index, url in enumerate(urls)]
+        self._tasks = [asyncio.create_task(self._run(source)) for source in self._sources]
+        logger.info(f"Change feed activo en {len(urls)} base(s)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self.cache.enabled = False
+        self.cache.clear()
+
+    def stats(self) -> Dict:
+        lags = sorted(self._lags_ms)
+
+        def percentile(p: float) -> Optional[float]:
+            return round(lags[min(int(len(lags) * p), len(lags) - 1)], 2) if lags else None
+
+        return {
+            "running": self.running,
+            "healthy": self.healthy,
+            "sources": [
+                {"base": s.index, "connected": s.connected, "last_id": s.last_id, "last_error": s.last_error}
+                for s in self._sources
+            ],
+            "lag_ms": {"samples": len(lags), "p50": percentile(0.5), "p95": percentile(0.95),
+                       "p99": percentile(0.99), "max": round(lags[-1], 2) if lags else None},
+            **self._counters,
+            "cache": self.cache.stats(),
+        }
+
+
+change_cache = ChangeCache()
+change_feed = ChangeFeed(change_cache)
+
+
+def start_change_feed():
+    from src.db.sharding import SHARD_URLS
+
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        change_feed.start([database_url] + SHARD_URLS)
+
+
+async def stop_change_feed():
+    await change_feed.stop()
@@ -0,0 +1,278 @@
+"""
+Detección de contratos casi idénticos (posible fraccionamiento de compras).
+
+    python -m src.services.contract_similarity build [--batch-size 5000]
+
+objeto_contrato se normaliza (minúsculas, sin tildes ni puntuación) y se
+descompone en shingles de caracteres. Su firma MinHash se calcula con
+one-permutation hashing: cada shingle se hashea una sola vez y cae en una de
+NUM_HASHES particiones, conservando el mínimo por partición; las particiones
+vacías (textos cortos) se rellenan con densificación óptima. La fracción de
+posiciones iguales entre dos firmas estima la similitud de Jaccard.
+
+Las firmas se agrupan en LSH_BANDS bandas de LSH_ROWS filas; dos contratos son
+candidatos si coinciden en al menos una banda, con lo que la búsqueda es un
+lookup indexado por (RUT, banda, bucket) en vez de comparar todo el historial.
+Con 16 x 8 un par es candidato con probabilidad 1 - (1 - J^8)^16: > 0,99 con
+Jaccard 0,9, ~0,95 con 0,8 y ~0,01 con 0,4.
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import struct
+import time
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cambiar cualquiera de estos parámetros exige subir SIGNATURE_VERSION y reconstruir
+SIGNATURE_VERSION = 1
+SHINGLE_SIZE = 5
+NUM_HASHES = 128
+LSH_BANDS = 16
+LSH_ROWS = NUM_HASHES // LSH_BANDS
+
+SIMILARITY_THRESHOLD = float(os.getenv("SPLIT_SIMILARITY_THRESHOLD", "0.8"))
+WINDOW_DAYS = int(os.getenv("SPLIT_WINDOW_DAYS", "90"))
+# Contratos similares del mismo RUT en la ventana para marcar fraccionamiento
+SPLIT_MIN_MATCHES = int(os.getenv("SPLIT_MIN_MATCHES", "2"))
+BUILD_BATCH_SIZE = int(os.getenv("SIMILARITY_BUILD_BATCH_SIZE", "5000"))
+
+_BIN_BITS = (NUM_HASHES - 1).bit_length()
+_VALUE_MASK = 0xFFFFFFFF
+_MASK64 = (1 << 64) - 1
+# Multiply-shift (2-universal) sobre el shingle como entero: tras normalizar es
+# ASCII de SHINGLE_SIZE bytes, y los bits altos del producto son los uniformes
+_MULTIPLIER = 0x9E3779B97F4A7C15
+_OFFSET = 0x632BE59BD9B4E019
+_EMPTY = _VALUE_MASK + 1
+_SIGNATURE_FORMAT = f"<{NUM_HASHES}I"
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+# Secuencia fija de particiones candidatas por partición vacía (densificación)
+_DENSIFY_PROBES = [
+    [
+        int.from_bytes(hashlib.blake2b(f"{index}:{attempt}".encode(), digest_size=8).digest(), "little")
+        & (NUM_HASHES - 1)
+        for attempt in range(1, 4 * NUM_HASHES)
+    ]
+    for index in range(NUM_HASHES)
+]
+
+Signature = Tuple[int, ...]
+
+
+def normalize_text(text: Optional[str]) -> str:
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def shingles(text: Optional[str]) -> set:
+    normalized = normalize_text(text)
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text: Optional[str]) -> Optional[Signature]:
+    """Firma MinHash de objeto_contrato; None si no queda texto tras normalizar"""
+    values = shingles(text)
+    if not values:
+        return None
+
+    bins = [_EMPTY] * NUM_HASHES
+    for shingle in values:
+        h = (int.from_bytes(shingle.encode("ascii"), "little") * _MULTIPLIER + _OFFSET) & _MASK64
+        index = h >> (64 - _BIN_BITS)
+        value = (h >> (32 - _BIN_BITS)) & _VALUE_MASK
+        if value < bins[index]:
+            bins[index] = value
+
+    # Densificación óptima: cada partición vacía copia la de una partición no
+    # vacía elegida por un hash de (partición, intento), igual en todas las firmas
+    filled = list(bins)
+    for index, value in enumerate(bins):
+        if value == _EMPTY:
+            for probe in _DENSIFY_PROBES[index]:
+                value = bins[probe]
+                if value != _EMPTY:
+                    break
+            else:
+                # Prácticamente imposible con al menos una partición llena
+                value = min(bins)
+            filled[index] = value
+    return tuple(filled)
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    """Estimación de Jaccard: fracción de posiciones iguales"""
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+
+def lsh_buckets(signature: Signature) -> List[Tuple[int, int]]:
+    """(banda, bucket) por banda; bucket es un BIGINT con signo"""
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(struct.pack(f"<{LSH_ROWS}I", *rows), digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, "little", signed=True)))
+    return buckets
+
+
+def pack_signature(signature: Signature) -> bytes:
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def unpack_signature(data: bytes) -> Signature:
+    return struct.unpack(_SIGNATURE_FORMAT, bytes(data))
+
+
+# ==================== INDEXACIÓN Y CONSULTA ====================
+
+async def index_contract(
+    request_id: str, rut_num: int, objeto_contrato: Optional[str],
+    contract_at: Optional[datetime] = None, db=None
+) -> Optional[Signature]:
+    """Indexa (o reindexa) una solicitud; llamado desde ingest"""
+    from src.db.repositories.similarity_repository import SimilarityRepository
+
+    signature = minhash(objeto_contrato)
+    if signature is None:
+        return None
+    await SimilarityRepository(db).save_signature(
+        request_id, rut_num, contract_at or datetime.utcnow(), SIGNATURE_VERSION,
+        pack_signature(signature), lsh_buckets(signature)
+    )
+    return signature
+
+
+async def find_near_duplicates(
+    request_id: str, rut_num: int, objeto_contrato: Optional[str],
+    at: Optional[datetime] = None, window_days: int = WINDOW_DAYS,
+    threshold: float = SIMILARITY_THRESHOLD, db=None
+) -> List[Dict]:
+    """Contratos del mismo RUT en ±window_days con similitud estimada >= threshold"""
+    from src.db.repositories.similarity_repository import SimilarityRepository
+
+    signature = minhash(objeto_contrato)
+    if signature is None:
+        return []
+    at = at or datetime.utcnow()
+    window = timedelta(days=window_days)
+    candidates = await SimilarityRepository(db).find_candidates(
+        rut_num, lsh_buckets(signature), at - window, at + window, request_id, SIGNATURE_VERSION
+    )
+
+    matches = []
+    for candidate in candidates:
+        score = similarity(signature, unpack_signature(candidate["signature"]))
+        if score >= threshold:
+            matches.append({
+                "request_id": candidate["request_id"],
+                "similitud": round(score, 3),
+                "contract_at": candidate["contract_at"].isoformat(),
+            })
+    matches.sort(key=lambda m: m["similitud"], reverse=True)
+    return matches
+
+
+# ==================== CONSTRUCCIÓN MASIVA ====================
+
+PENDING_QUERY = """
+    SELECT r.id, r.request_id, r.proveedor_rut_num, r.objeto_contrato, r.created_at
+    FROM requests r
+    LEFT JOIN contract_signatures s ON s.request_id = r.request_id
+    WHERE r.id > $1
+      AND r.proveedor_rut_num IS NOT NULL
+      AND (s.request_id IS NULL OR s.version <> $2)
+    ORDER BY r.id
+    LIMIT $3
+"""
+
+
+async def build_index(conn, batch_size: int = BUILD_BATCH_SIZE) -> Dict:
+    """
+    Indexa las solicitudes sin firma vigente por lotes de id (keyset), con COPY.
+    Reanudable: lo ya indexado con la versión actual se omite.
+    """
+    last_id = 0
+    stats = {"indexadas": 0, "sin_texto": 0}
+    started = time.perf_counter()
+    while True:
+        rows = await conn.fetch(PENDING_QUERY, last_id, SIGNATURE_VERSION, batch_size)
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        signatures, buckets = [], []
+        for row in rows:
+            signature = minhash(row["objeto_contrato"])
+            if signature is None:
+                stats["sin_texto"] += 1
+                continue
+            signatures.append((
+                row["request_id"], row["proveedor_rut_num"], row["created_at"],
+                SIGNATURE_VERSION, pack_signature(signature)
+            ))
+            buckets.extend(
+                (row["proveedor_rut_num"], band, bucket, row["created_at"], row["request_id"])
+                for band, bucket in lsh_buckets(signature)
+            )
+
+        request_ids = [s[0] for s in signatures]
+        async with conn.transaction():
+            # Firmas de versiones anteriores se reemplazan completas
+            await conn.execute("DELETE FROM contract_lsh_buckets WHERE request_id = ANY($1)", request_ids)
+            await conn.execute("DELETE FROM contract_signatures WHERE request_id = ANY($1)", request_ids)
+            await conn.copy_records_to_table(
+                "contract_signatures", records=signatures,
+                columns=["request_id", "proveedor_rut_num", "contract_at", "version", "signature"]
+            )
+            await conn.copy_records_to_table(
+                "contract_lsh_buckets", records=buckets,
+                columns=["proveedor_rut_num", "band", "bucket", "contract_at", "request_id"]
+            )
+
+        stats["indexadas"] += len(signatures)
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"🧬 Similitud: {stats['indexadas']} indexadas "
+            f"({stats['indexadas'] / elapsed:.0f}/s, último id {last_id})"
+        )
+
+    stats["segundos"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+async def main(args):
+    import asyncpg
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL not set")
+        return
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        print(f"🧬 Construyendo índice de similitud (v{SIGNATURE_VERSION}, {LSH_BANDS}x{LSH_ROWS})")
+        stats = await build_index(conn, args.batch_size)
+        print(
+            f"  ✅ {stats['indexadas']} solicitudes indexadas, {stats['sin_texto']} sin objeto_contrato "
+            f"en {stats['segundos']}s"
+        )
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice MinHash/LSH de objeto_contrato")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--batch-size", type=int, default=BUILD_BATCH_SIZE)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,294 @@
+"""
+Diagnóstico de CPU en producción, solo bajo demanda.
+
+- sample_profile(): muestreador estadístico de pilas. Un hilo lee
+  sys._current_frames() de todos los hilos (incluido el del event loop) cada
+  interval_ms durante la ventana pedida y agrega las pilas. Devuelve pilas
+  colapsadas ("hilo;f1;f2 N", el formato de flamegraph.pl y speedscope) y las
+  funciones con más muestras propias e inclusivas. Fuera de la ventana no
+  corre nada.
+- LoopLagMonitor: un latido en el event loop y un hilo vigía. Si el loop no
+  late en LOOP_LAG_THRESHOLD_MS, el vigía captura la pila del hilo del loop
+  (el callback que lo bloquea) y la registra en el log. Apagado por defecto:
+  se activa con LOOP_LAG_MONITOR=true o desde /api/v2/debug/loop-lag.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+
+LOOP_LAG_MONITOR = os.getenv("LOOP_LAG_MONITOR", "false").lower() == "true"
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", "50"))
+LOOP_LAG_EVENTS = int(os.getenv("LOOP_LAG_EVENTS", "100"))
+
+# Hojas donde un hilo espera (IO, locks, colas) en vez de usar CPU
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("socket.py", "accept"),
+}
+
+_labels: Dict[object, str] = {}
+
+
+class ProfileInProgressError(Exception):
+    """Ya hay un perfilado en curso en esta instancia"""
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+
+def _stack(frame) -> Tuple[Tuple[str, ...], bool]:
+    """Pila raíz -> hoja y si la hoja es una espera"""
+    leaf = frame.f_code
+    idle = (os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_LEAVES
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels), idle
+
+
+def _format_stack(frame, limit: int = 12) -> List[str]:
+    stack, _ = _stack(frame)
+    return list(stack[-limit:])
+
+
+# ==================== MUESTREADOR ====================
+
+_profile_lock = threading.Lock()
+
+
+def _sample(
+    seconds: float, interval: float, include_idle: bool, stop: threading.Event
+) -> Tuple[Counter, int, int]:
+    me = threading.get_ident()
+    stacks: Counter = Counter()
+    samples = idle_samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline and not stop.is_set():
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            stack, idle = _stack(frame)
+            samples += 1
+            if idle:
+                idle_samples += 1
+                if not include_idle:
+                    continue
+            stacks[(names.get(thread_id, str(thread_id)),) + stack] += 1
+        stop.wait(interval)
+    return stacks, samples, idle_samples
+
+
+def _sample_and_release(*args) -> Tuple[Counter, int, int]:
+    # El lock se suelta cuando el hilo termina de verdad, no cuando se cancela quien lo espera
+    try:
+        return _sample(*args)
+    finally:
+        _profile_lock.release()
+
+
+def _top_functions(stacks: Counter, top_n: int) -> List[Dict]:
+    own: Counter = Counter()
+    total: Counter = Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        # Inclusivo: una vez por pila aunque la función sea recursiva
+        for function in set(stack[1:]):
+            total[function] += count
+    sampled = sum(stacks.values()) or 1
+    return [
+        {
+            "function": function,
+            "self": own[function],
+            "total": total[function],
+            "self_pct": round(own[function] * 100 / sampled, 2),
+            "total_pct": round(total[function] * 100 / sampled, 2),
+        }
+        for function, _ in own.most_common(top_n)
+    ]
+
+
+async def sample_profile(
+    seconds: float, interval_ms: float = PROFILE_INTERVAL_MS, top_n: int = 30, include_idle: bool = False
+) -> Dict:
+    """Perfila todos los hilos durante `seconds`; uno a la vez por instancia"""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfileInProgressError("Ya hay un perfilado en curso")
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+    stop = threading.Event()
+    start = time.perf_counter()
+    try:
+        # Hilo propio: el muestreo no depende de que el loop esté libre
+        sampling = asyncio.get_running_loop().run_in_executor(
+            None, _sample_and_release, seconds, interval_ms / 1000, include_idle, stop
+        )
+    except BaseException:
+        _profile_lock.release()
+        raise
+    logger.info(f"🔬 Perfilado de {seconds}s iniciado (intervalo {interval_ms}ms)")
+    try:
+        # shield: si se cancela la request, el hilo igual corre (y suelta el lock) pero se detiene
+        stacks, samples, idle_samples = await asyncio.shield(sampling)
+    except asyncio.CancelledError:
+        stop.set()
+        raise
+    elapsed = time.perf_counter() - start
+
+    collapsed = [f"{';'.join(stack)} {count}" for stack, count in stacks.most_common()]
+    return {
+        "seconds": round(elapsed, 3),
+        "interval_ms": interval_ms,
+        "samples": samples,
+        "idle_samples": idle_samples,
+        "include_idle": include_idle,
+        "top": _top_functions(stacks, top_n),
+        "collapsed": collapsed,
+    }
+
+
+# ==================== LAG DEL EVENT LOOP ====================
+
+class LoopLagMonitor:
+    def __init__(self, threshold_ms: float = LOOP_LAG_THRESHOLD_MS, interval_ms: float = LOOP_LAG_INTERVAL_MS):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.events: Deque[Dict] = deque(maxlen=LOOP_LAG_EVENTS)
+        self.lags: Deque[float] = deque(maxlen=1000)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop: Optional[threading.Event] = None
+        self._loop_thread: Optional[int] = None
+        self._last_tick = 0.0
+        self._tick = 0
+        self._reported_tick = -1
+        self._stop_at: Optional[float] = None
+        self._counters = {"ticks": 0, "blocked": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, seconds: Optional[float] = None):
+        """Inicia el monitor (idempotente); con `seconds` se detiene solo al cumplirse"""
+        self._stop_at = time.monotonic() + seconds if seconds else None
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._last_tick = time.monotonic()
+        # Un Event por activación: un vigía anterior que aún no terminó no revive
+        self._stop = threading.Event()
+        self._task = asyncio.create_task(self._heartbeat(self._stop))
+        self._watchdog = threading.Thread(
+            target=self._watch, args=(self._stop,), name="loop-lag-watchdog", daemon=True
+        )
+        self._watchdog.start()
+        logger.info(f"⏱️ Monitor de lag del event loop activo (umbral {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _heartbeat(self, stop: threading.Event):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self.lags.append(lag)
+            self._last_tick = now
+            self._tick += 1
+            self._counters["ticks"] += 1
+            if lag >= self.threshold:
+                event = self.events[-1] if self.events and self.events[-1]["tick"] == self._tick - 1 else None
+                if event is not None:
+                    # El vigía ya registró la pila: se completa con la duración real
+                    event["lag_ms"] = round(lag * 1000, 1)
+                else:
+                    logger.warning(f"🐌 Event loop atrasado {lag * 1000:.0f}ms")
+            if self._stop_at is not None and now >= self._stop_at:
+                stop.set()
+                self._task = None
+                logger.info("⏱️ Monitor de lag del event loop detenido (fin de la ventana)")
+                return
+
+    def _watch(self, stop: threading.Event):
+        while not stop.wait(self.interval / 2):
+            tick = self._tick
+            stalled = time.monotonic() - self._last_tick - self.interval
+            if stalled < self.threshold or tick == self._reported_tick:
+                continue
+            self._reported_tick = tick
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = _format_stack(frame)
+            self._counters["blocked"] += 1
+            self.events.append({
+                "tick": tick,
+                "timestamp": time.time(),
+                "lag_ms": round(stalled * 1000, 1),
+                "stack": stack,
+            })
+            logger.warning(
+                "🐌 Event loop bloqueado más de %.0fms en: %s", stalled * 1000, " <- ".join(reversed(stack[-4:]))
+            )
+
+    def stats(self) -> Dict:
+        lags = sorted(self.lags)
+
+        def pct(p: float) -> Optional[float]:
+            return round(lags[min(int(len(lags) * p), len(lags) - 1)] * 1000, 2) if lags else None
+
+        return {
+            "running": self.running,
+            "threshold_ms": self.threshold * 1000,
+            "interval_ms": self.interval * 1000,
+            "lag_p50_ms": pct(0.5),
+            "lag_p99_ms": pct(0.99),
+            "lag_max_ms": round(lags[-1] * 1000, 2) if lags else None,
+            **self._counters,
+            "events": list(self.events)[::-1],
+        }
+
+
+loop_lag_monitor = LoopLagMonitor()
+
+
+def start_loop_lag_monitor():
+    """Solo con LOOP_LAG_MONITOR=true; si no, se activa bajo demanda"""
+    if LOOP_LAG_MONITOR:
+        loop_lag_monitor.start()
+
+
+async def stop_loop_lag_monitor():
+    await loop_lag_monitor.stop()
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from src.db.routing import requires_primary
+
+logger = logging.getLogger(__name__)
+
+# Ventana stale-while-revalidate: tras completarse una lectura, las siguientes
+# reciben ese resultado de inmediato y disparan una sola recarga en segundo plano.
+# 0 desactiva la ventana (solo se comparten llamadas simultáneas).
+STALE_SECONDS = float(os.getenv("SINGLE_FLIGHT_STALE_SECONDS", "0"))
+# Tope de resultados retenidos para la ventana: las claves incluyen parámetros libres
+RECENT_MAX_KEYS = int(os.getenv("SINGLE_FLIGHT_RECENT_MAX_KEYS", "1024"))
+
+
+def flight_key(route: str, **params) -> Tuple:
+    """Clave normalizada: ruta + parámetros ordenados (los None se ignoran)"""
+    return (route, tuple(sorted((k, v) for k, v in params.items() if v is not None)))
+
+
+class SingleFlight:
+    """
+    Coalescencia de lecturas idénticas: las llamadas concurrentes con la misma
+    clave comparten una sola llamada al repositorio y reciben el mismo resultado,
+    que los llamadores deben tratar como de solo lectura.
+    """
+
+    def __init__(self, stale_seconds: float = STALE_SECONDS, max_recent: int = RECENT_MAX_KEYS):
+        self.stale_seconds = stale_seconds
+        self.max_recent = max_recent
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._recent: Dict[Hashable, Tuple[float, Any]] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, route: str, name: str):
+        counters = self._counters.get(route)
+        if counters is None:
+            counters = self._counters[route] = {
+                "calls": 0, "executed": 0, "coalesced": 0, "stale_hits": 0, "errors": 0
+            }
+        counters[name] += 1
+
+    def _launch(self, key: Tuple, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        route = key[0]
+        self._count(route, "executed")
+        # Tarea propia: si el primer llamador se cancela, el resto igual recibe el resultado
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+
+        def done(t: asyncio.Task):
+            self._inflight.pop(key, None)
+            if t.cancelled():
+                return
+            if t.exception() is not None:
+                self._count(route, "errors")
+            elif self.stale_seconds > 0:
+                self._remember(key, t.result())
+
+        task.add_done_callback(done)
+        return task
+
+    def _remember(self, key: Hashable, result: Any):
+        """Guarda el resultado para la ventana; al pasar el tope purga vencidos y luego los más antiguos"""
+        now = time.monotonic()
+        # Reinsertar al final: el orden del dict es el de la última recarga
+        self._recent.pop(key, None)
+        self._recent[key] = (now + self.stale_seconds, result)
+        if len(self._recent) <= self.max_recent:
+            return
+        for stale_key in [k for k, (expires_at, _) in self._recent.items() if expires_at <= now]:
+            del self._recent[stale_key]
+        while len(self._recent) > self.max_recent:
+            del self._recent[next(iter(self._recent))]
+
+    async def do(self, key: Tuple, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta `fn` o se une a la ejecución en curso con la misma clave"""
+        route = key[0]
+        self._count(route, "calls")
+
+        # Read-your-writes: quien exige un LSN mínimo o ya escribió no comparte resultados
+        if requires_primary():
+            self._count(route, "executed")
+            return await fn()
+
+        recent = self._recent.get(key)
+        if recent is not None:
+            expires_at, result = recent
+            if expires_at > time.monotonic():
+                self._count(route, "stale_hits")
+                if key not in self._inflight:
+                    self._launch(key, fn)
+                return result
+            self._recent.pop(key, None)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self._count(route, "coalesced")
+        else:
+            task = self._launch(key, fn)
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict:
+        routes = {}
+        for route, counters in self._counters.items():
+            avoided = counters["coalesced"] + counters["stale_hits"]
+            routes[route] = {
+                **counters,
+                "db_calls_avoided": avoided,
+                "avoided_ratio": round(avoided / counters["calls"], 4) if counters["calls"] else 0,
+            }
+        return {
+            "stale_seconds": self.stale_seconds,
+            "in_flight": len(self._inflight),
+            "recent": len(self._recent),
+            "db_calls_avoided": sum(r["db_calls_avoided"] for r in routes.values()),
+            "routes": routes,
+        }
+
+    def reset(self):
+        self._counters.clear()
+        self._recent.clear()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from src.db.repositories.stats_repository import StatsRepository
+
+logger = logging.getLogger(__name__)
+
+# Ventana reciente que se recalcula en cada pasada (corrección de datos tardíos)
+CORRECTION_WINDOW_HOURS = int(os.getenv("ROLLUP_CORRECTION_WINDOW_HOURS", "48"))
+REFRESH_INTERVAL_SECONDS = int(os.getenv("ROLLUP_REFRESH_INTERVAL_SECONDS", "900"))
+
+_refresher_task: Optional[asyncio.Task] = None
+
+
+async def refresh_recent_rollups():
+    """Recalcula los buckets de la ventana de corrección y las facetas de búsqueda"""
+    hasta = datetime.utcnow()
+    desde = hasta - timedelta(hours=CORRECTION_WINDOW_HOURS)
+    repo = StatsRepository()
+    await repo.refresh_rollups(desde, hasta)
+    # Contadores de facetas de la búsqueda sin filtros
+    await repo.refresh_search_facets()
+
+
+async def _refresher_loop():
+    while True:
+        try:
+            await refresh_recent_rollups()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error en corrección periódica de rollups: {e}")
+        await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
+
+
+def start_rollup_refresher():
+    """Inicia la tarea periódica de corrección (idempotente)"""
+    global _refresher_task
+    if _refresher_task is None or _refresher_task.done():
+        _refresher_task = asyncio.create_task(_refresher_loop())
+        logger.info(f"Corrección de rollups activa cada {REFRESH_INTERVAL_SECONDS}s")
+
+
+async def stop_rollup_refresher():
+    global _refresher_task
+    if _refresher_task is not None:
+        _refresher_task.cancel()
+        try:
+            await _refresher_task
+        except asyncio.CancelledError:
+            pass
+        _refresher_task = None
+
+
+async def backfill_rollups(desde: datetime, hasta: datetime, chunk_days: int = 7):
+    """Reconstruye el historial por tramos, recorriendo created_at vía el índice BRIN"""
+    from src.db.database import connect_db, disconnect_db
+
+    await connect_db()
+    try:
+        repo = StatsRepository()
+        cursor = desde
+        while cursor < hasta:
+            tramo_fin = min(cursor + timedelta(days=chunk_days), hasta)
+            await repo.refresh_rollups(cursor, tramo_fin)
+            print(f"  ✅ Rollups {cursor.date()} → {tramo_fin.date()}")
+            cursor = tramo_fin
+    finally:
+        await disconnect_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill de rollups de estadísticas")
+    parser.add_argument("--since", required=True, help="Fecha inicial (YYYY-MM-DD)")
+    parser.add_argument("--until", default=None, help="Fecha final (YYYY-MM-DD), por defecto hoy")
+    parser.add_argument("--chunk-days", type=int, default=7)
+    args = parser.parse_args()
+
+    since = datetime.fromisoformat(args.since)
+    until = datetime.fromisoformat(args.until) if args.until else datetime.utcnow()
+    asyncio.run(backfill_rollups(since, until, args.chunk_days))
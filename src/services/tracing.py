@@ -0,0 +1,312 @@
+"""
+Trazas en proceso para requests lentas (sin collector).
+
+Cada request HTTP abre una traza; dentro, span() registra handler, métodos de
+repositorio, adquisición de conexión y sentencias SQL, nodos del grafo y
+operaciones de firma. El span activo viaja en un contextvar, así que las
+tareas creadas dentro (gather de shards, single-flight) cuelgan del span que
+las creó.
+
+Al terminar la request el árbol completo se conserva solo si duró más de
+TRACE_SLOW_MS o cae en la fracción TRACE_SAMPLE_RATE, en un buffer circular
+de TRACE_BUFFER_SIZE trazas. Con TRACE_EXPORT_FILE cada traza conservada se
+agrega además como una línea OTLP/JSON (el formato del file exporter de
+OpenTelemetry).
+
+Fuera de una traza span() cuesta una lectura de contextvar.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "500"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+# Tope de spans por traza: un scatter-gather grande no debe crecer sin límite
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE")
+# Destino de la exportación manual (/api/v2/debug/traces/export) sin TRACE_EXPORT_FILE
+DEFAULT_EXPORT_FILE = "traces.otlp.jsonl"
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "cleantransparency-v2")
+
+# Tipos de span (SpanKind de OTLP entre paréntesis)
+SERVER = "server"          # handler HTTP (2)
+INTERNAL = "internal"      # repositorio, nodo del grafo, firma (1)
+CLIENT = "client"          # adquisición de conexión y sentencia SQL (3)
+_OTLP_KIND = {INTERNAL: 1, SERVER: 2, CLIENT: 3}
+
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "kind", "attributes", "start_ns", "duration_ns", "error")
+
+    def __init__(self, name: str, kind: str, parent_id: Optional[str], attributes: Dict):
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.duration_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ns / 1e6, 3) if self.duration_ns is not None else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "dropped_spans", "sampled")
+
+    def __init__(self, sampled: bool):
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+        self.sampled = sampled
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def summary(self) -> Dict:
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "start_ns": root.start_ns,
+            "duration_ms": round((root.duration_ns or 0) / 1e6, 3),
+            "status_code": root.attributes.get("http.status_code"),
+            "spans": len(self.spans),
+            "dropped_spans": self.dropped_spans,
+            "sampled": self.sampled,
+        }
+
+    def tree(self) -> Dict:
+        """Spans anidados por parent_id, hijos en orden de inicio"""
+        nodes = {s.span_id: {**s.to_dict(), "children": []} for s in self.spans}
+        for s in sorted(self.spans[1:], key=lambda s: s.start_ns):
+            parent = nodes.get(s.parent_id)
+            if parent is not None:
+                parent["children"].append(nodes[s.span_id])
+        return {**self.summary(), "root": nodes[self.root.span_id]}
+
+
+_active: contextvars.ContextVar[Optional[Tuple[Trace, Span]]] = contextvars.ContextVar("trace_span", default=None)
+_traces: Deque[Trace] = deque(maxlen=TRACE_BUFFER_SIZE)
+_export_lock = threading.Lock()
+_counters: Dict[str, int] = {"requests": 0, "kept_slow": 0, "kept_sampled": 0, "exported": 0, "export_errors": 0}
+
+
+@contextmanager
+def span(name: str, kind: str = INTERNAL, **attributes):
+    """Registra un span hijo del activo; sin traza activa no hace nada"""
+    active = _active.get()
+    if active is None:
+        yield None
+        return
+    trace, parent = active
+    if len(trace.spans) >= TRACE_MAX_SPANS:
+        trace.dropped_spans += 1
+        yield None
+        return
+
+    current = Span(name, kind, parent.span_id, attributes)
+    trace.spans.append(current)
+    token = _active.set((trace, current))
+    start = time.perf_counter_ns()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration_ns = time.perf_counter_ns() - start
+        _active.reset(token)
+
+
+def tracing_active() -> bool:
+    return _active.get() is not None
+
+
+def traced(name: str, kind: str = INTERNAL):
+    """Decorador para funciones async o síncronas"""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, kind):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def traced_methods(cls):
+    """Decorador de clase: un span por cada método async público (repositorios)"""
+    for attr, fn in list(vars(cls).items()):
+        if not attr.startswith("_") and inspect.iscoroutinefunction(fn):
+            setattr(cls, attr, traced(f"{cls.__name__}.{attr}")(fn))
+    return cls
+
+
+# ==================== MIDDLEWARE ====================
+
+def _keep(trace: Trace):
+    duration_ms = trace.root.duration_ns / 1e6
+    if duration_ms >= TRACE_SLOW_MS:
+        _counters["kept_slow"] += 1
+    elif trace.sampled:
+        _counters["kept_sampled"] += 1
+    else:
+        return
+    _traces.append(trace)
+    if TRACE_EXPORT_FILE:
+        # Escritura fuera del event loop
+        asyncio.get_running_loop().run_in_executor(None, _append_export, TRACE_EXPORT_FILE, [trace])
+
+
+async def tracing_middleware(request, call_next):
+    if not TRACING_ENABLED:
+        return await call_next(request)
+
+    _counters["requests"] += 1
+    trace = Trace(sampled=random.random() < TRACE_SAMPLE_RATE)
+    root = Span(f"{request.method} {request.url.path}", SERVER, None, {"http.method": request.method})
+    trace.spans.append(root)
+    token = _active.set((trace, root))
+    start = time.perf_counter_ns()
+    try:
+        response = await call_next(request)
+        root.attributes["http.status_code"] = response.status_code
+        return response
+    except BaseException as e:
+        root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        root.duration_ns = time.perf_counter_ns() - start
+        _active.reset(token)
+        # Plantilla de la ruta ('/api/v2/proveedores/{rut}/profile') para agrupar
+        route = request.scope.get("route")
+        if route is not None and getattr(route, "path", None):
+            root.name = f"{request.method} {route.path}"
+            root.attributes["http.route"] = route.path
+        root.attributes["http.target"] = request.url.path
+        _keep(trace)
+
+
+# ==================== CONSULTA Y EXPORTACIÓN ====================
+
+def get_traces(limit: int = 50, min_ms: float = 0) -> List[Dict]:
+    """Resúmenes de las trazas retenidas, más recientes primero"""
+    summaries = [t.summary() for t in reversed(_traces)]
+    return [s for s in summaries if s["duration_ms"] >= min_ms][:limit]
+
+
+def find_trace(trace_id: str) -> Optional[Trace]:
+    for trace in _traces:
+        if trace.trace_id == trace_id:
+            return trace
+    return None
+
+
+def get_trace(trace_id: str) -> Optional[Dict]:
+    trace = find_trace(trace_id)
+    return trace.tree() if trace is not None else None
+
+
+def _otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(traces: List[Trace]) -> Dict:
+    """ExportTraceServiceRequest en JSON (OTLP/HTTP JSON)"""
+    spans = []
+    for trace in traces:
+        for s in trace.spans:
+            otlp_span = {
+                "traceId": trace.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": _OTLP_KIND[s.kind],
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.start_ns + (s.duration_ns or 0)),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            }
+            if s.parent_id:
+                otlp_span["parentSpanId"] = s.parent_id
+            spans.append(otlp_span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+        }]
+    }
+
+
+def _append_export(path: str, traces: List[Trace]):
+    line = json.dumps(to_otlp(traces), default=str) + "\n"
+    try:
+        with _export_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+        _counters["exported"] += len(traces)
+    except OSError as e:
+        _counters["export_errors"] += 1
+        logger.error(f"❌ No se pudo exportar trazas a {path}: {e}")
+
+
+def export_traces(path: str) -> int:
+    """Escribe el buffer completo como una línea OTLP/JSON en `path`"""
+    traces = list(_traces)
+    if traces:
+        _append_export(path, traces)
+    return len(traces)
+
+
+def get_tracing_stats() -> Dict:
+    return {
+        "enabled": TRACING_ENABLED,
+        "slow_ms": TRACE_SLOW_MS,
+        "sample_rate": TRACE_SAMPLE_RATE,
+        "buffered": len(_traces),
+        "buffer_size": TRACE_BUFFER_SIZE,
+        "export_file": TRACE_EXPORT_FILE,
+        **_counters,
+    }
+
+
+def reset_traces():
+    _traces.clear()
@@ -0,0 +1,534 @@
+"""
+Snapshot local para la verificación pública de certificados.
+
+Archivo binario inmutable, leído con mmap:
+
+    cabecera | registros ordenados (certificado_id, hash_final, issued_at, doc) |
+    documentos JSON de /verify (incluyen la firma) | filtro de Bloom
+
+Sobre el archivo se mantiene un delta en memoria con los cambios recientes del
+modelo de lectura (emisiones y decisiones HITL), sondeado de forma incremental;
+al superar un umbral se compacta en un archivo nuevo que reemplaza al anterior.
+
+Los negativos se responden con el filtro de Bloom y la marca de agua: un ID
+cuyo instante de emisión (codificado en el ID) es anterior a la marca de agua y
+que no está en el snapshot no existe. Los positivos salen del delta o del mmap.
+Nada de esto toca Postgres, así que la verificación sigue respondiendo sin BD.
+Con DATABASE_SHARD_URLS el snapshot se arma y se sondea desde todos los shards.
+"""
+import argparse
+import asyncio
+import hashlib
+import heapq
+import logging
+import math
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from src.utils.ids import certificado_id_timestamp, is_valid_certificado_id
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = Path(os.getenv("VERIFICATION_SNAPSHOT_PATH", "snapshots/verification_snapshot.bin"))
+SNAPSHOT_ENABLED = os.getenv("VERIFICATION_SNAPSHOT_ENABLED", "true").lower() == "true"
+REFRESH_SECONDS = float(os.getenv("VERIFICATION_SNAPSHOT_REFRESH_SECONDS", "30"))
+# Entradas del delta en memoria antes de compactar a un archivo nuevo
+COMPACT_THRESHOLD = int(os.getenv("VERIFICATION_SNAPSHOT_COMPACT_THRESHOLD", "10000"))
+# Cubre transacciones en vuelo y desfase de reloj entre la API y Postgres
+MARGIN_SECONDS = float(os.getenv("VERIFICATION_SNAPSHOT_MARGIN_SECONDS", "120"))
+BLOOM_FPR = float(os.getenv("VERIFICATION_SNAPSHOT_BLOOM_FPR", "0.001"))
+POLL_BATCH = 5000
+CURSOR_PREFETCH = 2000
+
+MAGIC = b"CTVS"
+VERSION = 1
+# magic, versión, funciones hash del Bloom, registros, creado (µs), marca de agua (µs),
+# offset registros, offset documentos, offset Bloom, bits del Bloom
+HEADER = struct.Struct("<4sHBxIqqQQQQ")
+# certificado_id, sha256 crudo, issued_at (µs), offset y largo del documento
+RECORD = struct.Struct("<32s32sqQI")
+ID_SIZE = 32
+NO_HASH = bytes(32)
+
+FOUND, ABSENT, UNKNOWN = "found", "absent", "unknown"
+
+# (hash_final, issued_at µs, documento JSON)
+Entry = Tuple[bytes, int, bytes]
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_us(value: datetime) -> int:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_us(value: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def _hash_bytes(value: Optional[str]) -> bytes:
+    try:
+        return bytes.fromhex(value) if value else NO_HASH
+    except ValueError:
+        return NO_HASH
+
+
+# ==================== FILTRO DE BLOOM ====================
+
+class BloomFilter:
+    def __init__(self, bits: int, hashes: int, data: Optional[bytes] = None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, fpr: float = BLOOM_FPR) -> "BloomFilter":
+        capacity = max(capacity, 1024)
+        bits = int(math.ceil(-capacity * math.log(fpr) / (math.log(2) ** 2)))
+        return cls(bits, max(1, round(bits / capacity * math.log(2))))
+
+    def _positions(self, key: bytes) -> Iterator[int]:
+        # Doble hashing sobre un solo digest
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key: bytes):
+        for position in self._positions(key):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.data[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+# ==================== ARCHIVO ====================
+
+class SnapshotWriter:
+    """Escribe un snapshot a partir de entradas ya ordenadas por certificado_id (bytes)"""
+
+    def __init__(self, path: Path, expected: int, watermark_us: int):
+        self.path = path
+        self.watermark_us = watermark_us
+        # Holgura para las entradas que el delta agregue antes de la próxima compactación
+        self.bloom = BloomFilter.for_capacity(int(expected * 1.2) + COMPACT_THRESHOLD)
+        self._records = tempfile.TemporaryFile()
+        self._documents = tempfile.TemporaryFile()
+        self._offset = 0
+        self.last_key = b""
+        self.count = 0
+
+    def add(self, key: bytes, hash_raw: bytes, issued_us: int, document: bytes):
+        if key <= self.last_key:
+            raise ValueError(f"Entradas fuera de orden: {key!r}")
+        self._records.write(RECORD.pack(key, hash_raw, issued_us, self._offset, len(document)))
+        self._documents.write(document)
+        self._offset += len(document)
+        self.last_key = key
+        self.bloom.add(key)
+        self.count += 1
+
+    def finish(self) -> Path:
+        records_off = HEADER.size
+        documents_off = records_off + self.count * RECORD.size
+        bloom_off = documents_off + self._offset
+        created_us = _to_us(datetime.utcnow())
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp, "wb") as out:
+                out.write(HEADER.pack(
+                    MAGIC, VERSION, self.bloom.hashes, self.count, created_us, self.watermark_us,
+                    records_off, documents_off, bloom_off, self.bloom.bits
+                ))
+                for part in (self._records, self._documents):
+                    part.seek(0)
+                    shutil.copyfileobj(part, out)
+                out.write(self.bloom.data)
+                out.flush()
+                os.fsync(out.fileno())
+            # Reemplazo atómico: los lectores con el mmap anterior no se ven afectados
+            os.replace(tmp, self.path)
+        finally:
+            self._records.close()
+            self._documents.close()
+            if tmp.exists():
+                tmp.unlink()
+        return self.path
+
+
+class SnapshotFile:
+    """Vista de solo lectura (mmap) con búsqueda binaria sobre registros de ancho fijo"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        (
+            magic, version, hashes, self.count, self.created_us, self.watermark_us,
+            self._records_off, self._documents_off, bloom_off, bits
+        ) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Snapshot de verificación inválido: {path}")
+        self.bloom = BloomFilter(bits, hashes, self._map[bloom_off:bloom_off + (bits + 7) // 8])
+
+    def _record(self, index: int) -> Tuple[bytes, bytes, int, int, int]:
+        return RECORD.unpack_from(self._map, self._records_off + index * RECORD.size)
+
+    def _document(self, offset: int, length: int) -> bytes:
+        start = self._documents_off + offset
+        return self._map[start:start + length]
+
+    def get(self, key: bytes) -> Optional[Entry]:
+        padded = key.ljust(ID_SIZE, b"\0")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            start = self._records_off + middle * RECORD.size
+            if self._map[start:start + ID_SIZE] < padded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            record_key, hash_raw, issued_us, offset, length = self._record(low)
+            if record_key == padded:
+                return hash_raw, issued_us, self._document(offset, length)
+        return None
+
+    def __iter__(self) -> Iterator[Tuple[bytes, Entry]]:
+        for index in range(self.count):
+            record_key, hash_raw, issued_us, offset, length = self._record(index)
+            yield record_key.rstrip(b"\0"), (hash_raw, issued_us, self._document(offset, length))
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def _merge(file: Optional[SnapshotFile], delta: Dict[bytes, Entry]) -> Iterator[Tuple[bytes, Entry]]:
+    """Entradas del archivo y del delta en orden; el delta prevalece"""
+    pending = sorted(delta.items())
+    i = 0
+    for key, entry in (file if file is not None else ()):
+        while i < len(pending) and pending[i][0] < key:
+            yield pending[i]
+            i += 1
+        if i < len(pending) and pending[i][0] == key:
+            yield pending[i]
+            i += 1
+        else:
+            yield key, entry
+    yield from pending[i:]
+
+
+def _write_merged(path: Path, file: Optional[SnapshotFile], delta: Dict[bytes, Entry], watermark_us: int) -> int:
+    writer = SnapshotWriter(path, (file.count if file else 0) + len(delta), watermark_us)
+    for key, (hash_raw, issued_us, document) in _merge(file, delta):
+        writer.add(key, hash_raw, issued_us, document)
+    writer.finish()
+    return writer.count
+
+
+# ==================== FUENTE: MODELO DE LECTURA ====================
+
+SNAPSHOT_COLUMNS = """
+    certificado_id, issued_at, updated_at,
+    verificacion->>'hash_certificado' AS hash_final,
+    verificacion::text AS verificacion
+"""
+
+
+def _row_entry(row) -> Tuple[bytes, Entry]:
+    return row["certificado_id"].encode(), (
+        _hash_bytes(row["hash_final"]),
+        _to_us(row["issued_at"]),
+        row["verificacion"].encode("utf-8"),
+    )
+
+
+async def _merge_cursors(conns: List) -> AsyncIterator:
+    """Filas de todos los shards en orden de certificado_id (merge de cursores ordenados)"""
+    # COLLATE "C": mismo orden que la comparación de bytes del archivo
+    query = f"SELECT {SNAPSHOT_COLUMNS} FROM certificate_read_model ORDER BY certificado_id COLLATE \"C\""
+    cursors = [conn.cursor(query, prefetch=CURSOR_PREFETCH).__aiter__() for conn in conns]
+    heads = []
+    for index, cursor in enumerate(cursors):
+        row = await anext(cursor, None)
+        if row is not None:
+            heapq.heappush(heads, (row["certificado_id"].encode(), index, row))
+    while heads:
+        _, index, row = heapq.heappop(heads)
+        yield row
+        row = await anext(cursors[index], None)
+        if row is not None:
+            heapq.heappush(heads, (row["certificado_id"].encode(), index, row))
+
+
+async def build_from_database(conns: List, path: Path = SNAPSHOT_PATH) -> int:
+    """
+    Snapshot completo desde certificate_read_model de todos los shards (una
+    conexión por shard, catálogo primero), con un cursor del lado del servidor
+    en cada uno.
+    """
+    watermark_us = _to_us(datetime.utcnow() - timedelta(seconds=MARGIN_SECONDS))
+    expected = sum([await conn.fetchval("SELECT COUNT(*) FROM certificate_read_model") for conn in conns])
+    writer = SnapshotWriter(path, expected, watermark_us)
+    async with AsyncExitStack() as stack:
+        for conn in conns:
+            await stack.enter_async_context(conn.transaction())
+        async for row in _merge_cursors(conns):
+            key, (hash_raw, issued_us, document) = _row_entry(row)
+            if len(key) > ID_SIZE:
+                logger.warning(f"⚠️ certificado_id demasiado largo para el snapshot: {row['certificado_id']}")
+                continue
+            if key == writer.last_key:
+                # Copiado en dos shards durante un rebalanceo: basta una entrada
+                continue
+            writer.add(key, hash_raw, issued_us, document)
+    writer.finish()
+    logger.info(f"📸 Snapshot de verificación generado: {writer.count} certificados de {len(conns)} shards")
+    return writer.count
+
+
+# ==================== SNAPSHOT EN LA API ====================
+
+class VerificationSnapshot:
+    def __init__(self, path: Path = SNAPSHOT_PATH):
+        self.path = path
+        self._file: Optional[SnapshotFile] = None
+        self._delta: Dict[bytes, Entry] = {}
+        self.bloom: Optional[BloomFilter] = None
+        self.watermark_us: Optional[int] = None
+        # Cursor de sondeo sobre (updated_at, certificado_id) del modelo de lectura:
+        # el inicial (marca de agua del archivo) y el avance de cada shard
+        self._cursor: Optional[Tuple[datetime, str]] = None
+        self._shard_cursors: Dict[int, Tuple[datetime, str]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.last_refresh: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.bloom is not None
+
+    def load(self) -> bool:
+        """Abre el archivo del disco (sin BD); False si no existe o es inválido"""
+        if not self.path.exists():
+            return False
+        try:
+            snapshot = SnapshotFile(self.path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.error(f"❌ No se pudo abrir el snapshot de verificación: {e}")
+            return False
+        self._swap(snapshot)
+        # Se vuelve a leer todo lo posterior a la marca de agua del archivo, en cada shard
+        self._cursor = (_from_us(snapshot.watermark_us), "")
+        self._shard_cursors = {}
+        logger.info(f"📸 Snapshot de verificación cargado: {snapshot.count} certificados")
+        return True
+
+    def _swap(self, snapshot: SnapshotFile):
+        bloom = BloomFilter(snapshot.bloom.bits, snapshot.bloom.hashes, snapshot.bloom.data)
+        for key in self._delta:
+            bloom.add(key)
+        previous = self._file
+        self._file, self.bloom = snapshot, bloom
+        self.watermark_us = max(self.watermark_us or 0, snapshot.watermark_us)
+        if previous is not None:
+            previous.close()
+
+    def _covers(self, certificado_id: str) -> bool:
+        """True si el snapshot está completo para el instante codificado en el ID"""
+        issued = certificado_id_timestamp(certificado_id)
+        if issued is None or self.watermark_us is None:
+            # Formato antiguo (sin instante) o sin marca de agua: no se puede negar
+            return False
+        return _to_us(issued) < self.watermark_us
+
+    def lookup(self, certificado_id: str) -> Tuple[str, Optional[bytes]]:
+        """(FOUND, documento /verify) | (ABSENT, None) | (UNKNOWN, None): consultar la BD"""
+        if not self.active or not is_valid_certificado_id(certificado_id):
+            # Solo se niegan IDs con formato que el snapshot puede cubrir; el resto, la BD
+            return UNKNOWN, None
+
+        key = certificado_id.encode()
+        if key in self.bloom:
+            entry = self._delta.get(key)
+            if entry is None and self._file is not None:
+                entry = self._file.get(key)
+            if entry is not None:
+                return FOUND, entry[2]
+        return (ABSENT, None) if self._covers(certificado_id) else (UNKNOWN, None)
+
+    async def _poll_shard(self, shard, horizon: datetime) -> int:
+        since_ts, since_id = self._shard_cursors.get(shard.index, self._cursor)
+        applied = 0
+        while True:
+            rows = await shard.reader.fetch_all(
+                query=f"""
+                    SELECT {SNAPSHOT_COLUMNS}
+                    FROM certificate_read_model
+                    WHERE (updated_at, certificado_id) > (:since_ts, :since_id)
+                    ORDER BY updated_at, certificado_id
+                    LIMIT :limit
+                """,
+                values={"since_ts": since_ts, "since_id": since_id, "limit": POLL_BATCH}
+            )
+            for row in rows:
+                key, entry = _row_entry(row)
+                if len(key) <= ID_SIZE:
+                    self._delta[key] = entry
+                    self.bloom.add(key)
+            applied += len(rows)
+            if rows:
+                since_ts, since_id = rows[-1]["updated_at"], rows[-1]["certificado_id"]
+            if len(rows) < POLL_BATCH:
+                break
+
+        # El cursor nunca pasa del horizonte: lo que confirmen las transacciones
+        # en vuelo con un updated_at anterior se vuelve a leer en la próxima pasada
+        self._shard_cursors[shard.index] = (since_ts, since_id) if since_ts < horizon else (horizon, "")
+        return applied
+
+    async def poll(self) -> int:
+        """
+        Incorpora al delta los cambios del modelo de lectura posteriores al
+        cursor de cada shard. La marca de agua solo avanza si todos los shards
+        respondieron: un certificado de un shard sin sondear no se niega.
+        """
+        from src.db.database import shards
+
+        if not self.active or self._cursor is None:
+            return 0
+        horizon = datetime.utcnow() - timedelta(seconds=MARGIN_SECONDS)
+        applied = await shards.gather(lambda shard: self._poll_shard(shard, horizon))
+        self.watermark_us = max(self.watermark_us or 0, _to_us(horizon))
+        return sum(applied)
+
+    async def compact(self):
+        """Reescribe archivo + delta en un archivo nuevo (en un hilo) y lo reemplaza"""
+        delta = dict(self._delta)
+        count = await asyncio.to_thread(_write_merged, self.path, self._file, delta, self.watermark_us)
+        self._swap(SnapshotFile(self.path))
+        for key, entry in delta.items():
+            if self._delta.get(key) is entry:
+                del self._delta[key]
+        logger.info(f"📸 Snapshot compactado: {count} certificados, {len(self._delta)} en delta")
+
+    async def rebuild(self):
+        """Snapshot completo desde el primario de cada shard"""
+        from src.db.database import shards
+
+        async with AsyncExitStack() as stack:
+            conns = [
+                (await stack.enter_async_context(shard.database.connection())).raw_connection
+                for shard in shards.shards
+            ]
+            await build_from_database(conns, self.path)
+        self._delta.clear()
+        self.watermark_us = None
+        self.load()
+
+    async def refresh(self):
+        if not self.active:
+            await self.rebuild()
+        await self.poll()
+        if len(self._delta) >= COMPACT_THRESHOLD:
+            await self.compact()
+        self.last_refresh = datetime.utcnow()
+        self.last_error = None
+
+    def status(self) -> Dict:
+        return {
+            "active": self.active,
+            "certificates": self._file.count if self._file else 0,
+            "delta": len(self._delta),
+            "watermark": _from_us(self.watermark_us).isoformat() if self.watermark_us else None,
+            "last_refresh": self.last_refresh.isoformat() if self.last_refresh else None,
+            "last_error": self.last_error,
+        }
+
+    async def _refresh_loop(self):
+        from src.db.database import is_connected
+
+        while True:
+            if is_connected():
+                try:
+                    await self.refresh()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Sin BD se sigue respondiendo con el último estado conocido
+                    self.last_error = str(e)
+                    logger.warning(f"⚠️ Snapshot de verificación no actualizado: {e}")
+            await asyncio.sleep(REFRESH_SECONDS)
+
+    def start(self):
+        if not SNAPSHOT_ENABLED:
+            return
+        if not self.active:
+            self.load()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+verification_snapshot = VerificationSnapshot()
+
+
+def start_verification_snapshot():
+    verification_snapshot.start()
+
+
+async def stop_verification_snapshot():
+    await verification_snapshot.stop()
+
+
+# ==================== CLI ====================
+
+async def main(args):
+    import asyncpg
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("❌ DATABASE_URL not set")
+        return
+
+    from src.db.sharding import SHARD_URLS
+
+    conns = [await asyncpg.connect(url) for url in [database_url] + SHARD_URLS]
+    try:
+        count = await build_from_database(conns, Path(args.path))
+        print(f"  ✅ {count} certificados → {args.path}")
+    finally:
+        for conn in conns:
+            await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera el snapshot local de verificación")
+    parser.add_argument("--path", default=str(SNAPSHOT_PATH))
+    asyncio.run(main(parser.parse_args()))
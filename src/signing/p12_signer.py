@@ -1,5 +1,21 @@
+import base64
+import os
+from typing import Optional
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa, utils
+from cryptography.hazmat.primitives.serialization.pkcs12 import load_key_and_certificates
+
+from src.services.tracing import traced
+
+DEFAULT_P12_PATH = "/secrets/p12_certificado_v2"
+
+
 class P12HashSigner:
-    def __init__(self, p12_path: str = "/secrets/p12_certificado_v2", password_env: str = "P12_PASSWORD"):
+    @traced("signing.load_p12")
+    def __init__(self, p12_path: str = DEFAULT_P12_PATH, password_env: str = "P12_PASSWORD"):
         self.p12_path = p12_path
         self.password = os.getenv(password_env, "").encode()
 
@@ -9,7 +25,67 @@ class P12HashSigner:
         with open(p12_path, "rb") as f:
             p12_data = f.read()
 
-        key, cert, _ = load_key_and_certificates(p12_data, self.password)
+        key, cert, _ = load_key_and_certificates(p12_data, self.password or None)
         self.private_key = key
         self.cert = cert
 
+    @traced("signing.sign_hash")
+    def sign_hash(self, hash_hex: str) -> str:
+        """Firma un SHA-256 ya calculado (hex) y devuelve la firma en base64"""
+        digest = bytes.fromhex(hash_hex)
+        algorithm = utils.Prehashed(hashes.SHA256())
+        if isinstance(self.private_key, rsa.RSAPrivateKey):
+            signature = self.private_key.sign(digest, padding.PKCS1v15(), algorithm)
+        elif isinstance(self.private_key, ec.EllipticCurvePrivateKey):
+            signature = self.private_key.sign(digest, ec.ECDSA(algorithm))
+        else:
+            raise ValueError(f"Tipo de llave no soportado: {type(self.private_key).__name__}")
+        return base64.b64encode(signature).decode()
+
+    def certificate_der(self) -> bytes:
+        return self.cert.public_bytes(serialization.Encoding.DER)
+
+
+def load_certificate(data: bytes) -> x509.Certificate:
+    """Certificado X.509 en PEM o DER"""
+    if data.lstrip().startswith(b"-----BEGIN"):
+        return x509.load_pem_x509_certificate(data)
+    return x509.load_der_x509_certificate(data)
+
+
+@traced("signing.verify")
+def verify_hash_signature(cert: x509.Certificate, hash_hex: str, firma_base64: str) -> bool:
+    """Verifica una firma de sign_hash con la llave pública del certificado"""
+    try:
+        digest = bytes.fromhex(hash_hex)
+        signature = base64.b64decode(firma_base64, validate=True)
+    except ValueError:
+        return False
+
+    public_key = cert.public_key()
+    algorithm = utils.Prehashed(hashes.SHA256())
+    try:
+        if isinstance(public_key, rsa.RSAPublicKey):
+            public_key.verify(signature, digest, padding.PKCS1v15(), algorithm)
+        elif isinstance(public_key, ec.EllipticCurvePublicKey):
+            public_key.verify(signature, digest, ec.ECDSA(algorithm))
+        else:
+            return False
+    except InvalidSignature:
+        return False
+    return True
+
+
+def load_signing_certificate_der(cert_path: Optional[str] = None) -> Optional[bytes]:
+    """
+    Certificado público para verificar firmas: SIGNING_CERT_PATH (PEM/DER) o,
+    en su defecto, el del P12 de firma. None si no hay ninguno disponible.
+    """
+    cert_path = cert_path or os.getenv("SIGNING_CERT_PATH")
+    if cert_path:
+        with open(cert_path, "rb") as f:
+            return load_certificate(f.read()).public_bytes(serialization.Encoding.DER)
+    p12_path = os.getenv("P12_PATH", DEFAULT_P12_PATH)
+    if os.path.exists(p12_path):
+        return P12HashSigner(p12_path).certificate_der()
+    return None
@@ -0,0 +1,143 @@
+"""
+Identificadores ordenables por tiempo (estilo ULID) para certificados.
+
+Formato: CERT-<26 caracteres Crockford base32> = 48 bits de milisegundos UTC +
+80 bits aleatorios. Los IDs de un mismo milisegundo son monótonos (el sufijo
+aleatorio se incrementa), así que el orden lexicográfico coincide con el orden
+de emisión y los inserts crecen por el extremo derecho del índice B-tree.
+
+Con sharding, los 10 bits finales (los dos últimos caracteres) llevan el slot
+del proveedor: el incremento monótono avanza de a 2^10 para no tocarlos, así
+que un ID basta para saber en qué shard buscar. Lo mismo vale para los
+request_id generados (REQ-<ULID>).
+
+Los IDs antiguos (CERT-<10 hex>) siguen siendo válidos; no llevan tiempo.
+"""
+import re
+import secrets
+import threading
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+CERT_PREFIX = "CERT-"
+REQUEST_PREFIX = "REQ-"
+CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+TIME_CHARS = 10
+RANDOM_CHARS = 16
+RANDOM_BITS = 80
+ULID_LENGTH = TIME_CHARS + RANDOM_CHARS
+# Bits bajos reservados para el slot de shard (2 caracteres Crockford)
+SLOT_BITS = 10
+SLOT_CHARS = SLOT_BITS // 5
+_RANDOM_STEP = 1 << SLOT_BITS
+
+CERT_ID_RE = re.compile(rf"^{CERT_PREFIX}[{CROCKFORD}]{{{ULID_LENGTH}}}$")
+LEGACY_CERT_ID_RE = re.compile(rf"^{CERT_PREFIX}[0-9a-f]{{10}}$")
+REQUEST_ID_RE = re.compile(rf"^{REQUEST_PREFIX}[{CROCKFORD}]{{{ULID_LENGTH}}}$")
+# Mismo patrón para filtrar en Postgres (los IDs antiguos no son ordenables)
+CERT_ID_SQL_PATTERN = rf"^{CERT_PREFIX}[{CROCKFORD}]{{{ULID_LENGTH}}}$"
+
+_DECODE = {char: index for index, char in enumerate(CROCKFORD)}
+
+
+def _encode(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(CROCKFORD[index])
+    return "".join(reversed(chars))
+
+
+def _to_ms(at: datetime) -> int:
+    # Las columnas TIMESTAMP del esquema guardan UTC sin zona
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return int(at.timestamp() * 1000)
+
+
+class ULIDGenerator:
+    """Generador monótono dentro del proceso (seguro entre hilos)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def new(self, at: Optional[datetime] = None, slot: Optional[int] = None) -> str:
+        if at is not None:
+            # Instante explícito (backfills, pruebas): sin estado monótono
+            ms, random_part = _to_ms(at), secrets.randbits(RANDOM_BITS)
+        else:
+            ms = _to_ms(datetime.now(timezone.utc))
+            with self._lock:
+                if ms <= self._last_ms:
+                    # Mismo milisegundo (o reloj hacia atrás): se incrementa el aleatorio
+                    # por encima de los bits del slot
+                    ms = self._last_ms
+                    random_part = self._last_random + _RANDOM_STEP
+                    if random_part >= 1 << RANDOM_BITS:
+                        ms += 1
+                        random_part = secrets.randbits(RANDOM_BITS)
+                else:
+                    random_part = secrets.randbits(RANDOM_BITS)
+                self._last_ms, self._last_random = ms, random_part
+        if slot is not None:
+            random_part = (random_part & ~(_RANDOM_STEP - 1)) | slot
+        return _encode(ms, TIME_CHARS) + _encode(random_part, RANDOM_CHARS)
+
+
+_generator = ULIDGenerator()
+
+
+def new_ulid(at: Optional[datetime] = None, slot: Optional[int] = None) -> str:
+    return _generator.new(at, slot)
+
+
+def new_certificado_id(at: Optional[datetime] = None, slot: Optional[int] = None) -> str:
+    return f"{CERT_PREFIX}{new_ulid(at, slot)}"
+
+
+def new_request_id(slot: Optional[int] = None) -> str:
+    return f"{REQUEST_PREFIX}{new_ulid(slot=slot)}"
+
+
+def id_slot(identifier: Optional[str]) -> Optional[int]:
+    """
+    Slot codificado en un certificado_id o request_id generado; None si el ID
+    no tiene ese formato (request_id de clientes, certificados antiguos). Los
+    IDs emitidos antes del sharding también decodifican un slot (al azar): el
+    lector debe tolerar que no esté ahí.
+    """
+    if not (is_time_ordered_id(identifier) or REQUEST_ID_RE.match(identifier or "")):
+        return None
+    slot = 0
+    for char in identifier[-SLOT_CHARS:]:
+        slot = slot * 32 + _DECODE[char]
+    return slot
+
+
+def is_time_ordered_id(certificado_id: str) -> bool:
+    return bool(CERT_ID_RE.match(certificado_id or ""))
+
+
+def is_valid_certificado_id(certificado_id: str) -> bool:
+    """Acepta el formato actual y el antiguo CERT-<10 hex>"""
+    return is_time_ordered_id(certificado_id) or bool(LEGACY_CERT_ID_RE.match(certificado_id or ""))
+
+
+def certificado_id_timestamp(certificado_id: str) -> Optional[datetime]:
+    """Instante de emisión (UTC, sin zona) codificado en el ID; None para IDs antiguos"""
+    if not is_time_ordered_id(certificado_id):
+        return None
+    ms = 0
+    for char in certificado_id[len(CERT_PREFIX):len(CERT_PREFIX) + TIME_CHARS]:
+        ms = ms * 32 + _DECODE[char]
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+
+def certificado_id_bounds(desde: datetime, hasta: datetime) -> Tuple[str, str]:
+    """Rango [inferior, superior) de IDs emitidos entre desde y hasta, para un range scan"""
+    lower = CERT_PREFIX + _encode(_to_ms(desde), TIME_CHARS) + "0" * RANDOM_CHARS
+    upper = CERT_PREFIX + _encode(_to_ms(hasta), TIME_CHARS) + "0" * RANDOM_CHARS
+    return lower, upper
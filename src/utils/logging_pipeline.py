@@ -0,0 +1,195 @@
+"""
+Logging sin bloquear el event loop.
+
+El hilo que registra solo filtra y encola el LogRecord; el mensaje se arma
+(%-args), se serializa a JSON y se escribe en un hilo de fondo
+(QueueListener). Para que el formateo sea realmente diferido, las rutas
+calientes usan logger.info("... %s", valor) en vez de f-strings.
+
+- Muestreo y límite por logger para INFO/DEBUG:
+    LOG_SAMPLE_RATES="src.workflows.art17.flow=0.1,src.api.routes=0.5"
+    LOG_RATE_LIMITS="src.db.repositories=50"   (líneas por segundo)
+  Se aplica la regla del prefijo más largo del nombre del logger.
+- WARNING y superiores nunca se muestrean ni se descartan: con la cola llena,
+  el hilo que registra espera.
+- LOG_FORMAT=json (por defecto) o text para el formato anterior.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Atributos propios de LogRecord: el resto viene de extra={...} y va al JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_counters: Dict[str, int] = {"enqueued": 0, "sampled_out": 0, "rate_limited": 0, "queue_full": 0}
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["NonBlockingQueueHandler"] = None
+_output: Optional[logging.Handler] = None
+
+
+def parse_logger_rules(spec: Optional[str]) -> Dict[str, float]:
+    """'a.b=0.1,c=5' -> {'a.b': 0.1, 'c': 5.0}"""
+    rules = {}
+    for item in (spec or "").split(","):
+        name, sep, value = item.strip().partition("=")
+        if sep and name:
+            rules[name.strip()] = float(value)
+    return rules
+
+
+def _match(rules: Dict[str, float], name: str) -> Optional[float]:
+    """Regla del prefijo más largo (por componentes del nombre del logger)"""
+    while name:
+        if name in rules:
+            return rules[name]
+        name = name.rpartition(".")[0]
+    return rules.get("root")
+
+
+class JSONFormatter(logging.Formatter):
+    """Una línea JSON por registro; los campos de extra={...} se incluyen tal cual"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Muestreo y token bucket por logger; solo para niveles bajo WARNING"""
+
+    def __init__(self, sample_rates: Dict[str, float], rate_limits: Dict[str, float]):
+        super().__init__()
+        self.sample_rates = sample_rates
+        self.rate_limits = rate_limits
+        self._rules: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def _rules_for(self, name: str) -> Tuple[Optional[float], Optional[float]]:
+        rules = self._rules.get(name)
+        if rules is None:
+            rules = self._rules[name] = (_match(self.sample_rates, name), _match(self.rate_limits, name))
+        return rules
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        sample_rate, rate_limit = self._rules_for(record.name)
+        if sample_rate is not None and random.random() >= sample_rate:
+            _counters["sampled_out"] += 1
+            return False
+        if rate_limit is not None:
+            now = time.monotonic()
+            with self._lock:
+                bucket = self._buckets.get(record.name)
+                if bucket is None:
+                    bucket = self._buckets[record.name] = [rate_limit, now]
+                # [tokens, última recarga]; capacidad de un segundo de ráfaga
+                bucket[0] = min(rate_limit, bucket[0] + (now - bucket[1]) * rate_limit)
+                bucket[1] = now
+                if bucket[0] < 1:
+                    _counters["rate_limited"] += 1
+                    return False
+                bucket[0] -= 1
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Encola el LogRecord sin formatearlo (el estándar arma el mensaje en el hilo
+    que registra). Con la cola llena descarta INFO/DEBUG y espera con WARNING+.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                _counters["queue_full"] += 1
+                return
+            self.queue.put(record)
+        _counters["enqueued"] += 1
+
+
+def configure_logging(stream=None):
+    """
+    Reemplaza los handlers del logger raíz por el pipeline con cola y arranca
+    el hilo escritor. Idempotente.
+    """
+    global _listener, _handler, _output
+    if _listener is not None:
+        return
+
+    _output = output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    _handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _handler.addFilter(SamplingFilter(
+        parse_logger_rules(os.getenv("LOG_SAMPLE_RATES")),
+        parse_logger_rules(os.getenv("LOG_RATE_LIMITS"))
+    ))
+
+    # Campos que ningún formato usa: evita recorrer la pila y consultar hilo/proceso por registro
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Vacía la cola y detiene el hilo escritor; lo que se registre después se escribe directo"""
+    global _listener
+    if _listener is not None:
+        root = logging.getLogger()
+        root.addHandler(_output)
+        root.removeHandler(_handler)
+        _listener.stop()
+        _listener = None
+
+
+def get_logging_stats() -> Dict:
+    return {
+        "format": LOG_FORMAT,
+        "level": LOG_LEVEL,
+        "running": _listener is not None,
+        "queued": _handler.queue.qsize() if _handler is not None else 0,
+        "queue_size": LOG_QUEUE_SIZE,
+        **_counters,
+    }
@@ -0,0 +1,64 @@
+import re
+from typing import Optional, Tuple
+
+# Formatos aceptados: 12.345.678-9, 12345678-9, 123456789, 12345678-k
+_RUT_PATTERN = re.compile(r"^(\d{1,2}(?:\.?\d{3}){2}|\d{1,8})-?([\dkK])$")
+
+
+def compute_dv(body: int) -> str:
+    """Calcula el dígito verificador (módulo 11) de un cuerpo de RUT"""
+    total = 0
+    factor = 2
+    while body > 0:
+        total += (body % 10) * factor
+        body //= 10
+        factor = 2 if factor == 7 else factor + 1
+    dv = 11 - (total % 11)
+    if dv == 11:
+        return "0"
+    if dv == 10:
+        return "K"
+    return str(dv)
+
+
+def normalize_rut(raw: str) -> Tuple[int, str]:
+    """
+    Normaliza un RUT a (cuerpo entero, DV en mayúscula).
+    Lanza ValueError si el formato o el dígito verificador no son válidos.
+    """
+    if raw is None:
+        raise ValueError("RUT vacío")
+
+    match = _RUT_PATTERN.match(str(raw).strip())
+    if not match:
+        raise ValueError(f"RUT con formato inválido: '{raw}'")
+
+    body = int(match.group(1).replace(".", ""))
+    dv = match.group(2).upper()
+
+    if body <= 0:
+        raise ValueError(f"RUT con formato inválido: '{raw}'")
+
+    expected = compute_dv(body)
+    if dv != expected:
+        raise ValueError(f"RUT '{raw}' con dígito verificador inválido (esperado {expected})")
+
+    return body, dv
+
+
+def try_normalize_rut(raw: Optional[str]) -> Optional[Tuple[int, str]]:
+    """Como normalize_rut, pero retorna None en vez de lanzar ValueError"""
+    try:
+        return normalize_rut(raw)
+    except ValueError:
+        return None
+
+
+def format_rut(body: int, dv: str) -> str:
+    """Formato canónico almacenado: cuerpo sin puntos, guion y DV en mayúscula"""
+    return f"{body}-{dv.upper()}"
+
+
+def canonical_rut(raw: str) -> str:
+    """Normaliza y valida un RUT, retornando su forma canónica"""
+    return format_rut(*normalize_rut(raw))
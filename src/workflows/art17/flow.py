@@ -1,15 +1,28 @@
 from langgraph.graph import StateGraph, END
 from datetime import datetime
-import uuid
-import hashlib
-from typing import TypedDict, Optional
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, TypedDict, Optional
 import logging
 
+from src.db.sharding import ShardSlotMovingError
+from src.services.audit import emit
+from src.services.change_feed import CERTIFICATE, PROVEEDOR, publish
+from src.services.tracing import traced
+from src.services import contract_similarity
+from src.utils.ids import new_certificado_id, new_request_id
+from src.workflows.art17 import hash_chain
+from src.utils.rut import normalize_rut, format_rut, try_normalize_rut
+
 logger = logging.getLogger(__name__)
 
 class Art17State(TypedDict, total=False):
     request_id: Optional[str]
     proveedor_rut: Optional[str]
+    proveedor_rut_num: Optional[int]
+    proveedor_rut_dv: Optional[str]
     proveedor_nombre: Optional[str]
     monto_contrato: Optional[float]
     objeto_contrato: Optional[str]
@@ -18,114 +31,236 @@ class Art17State(TypedDict, total=False):
     riesgo: Optional[str]
     hash_riesgo: Optional[str]
     cumplimiento: Optional[bool]
+    contratos_similares: Optional[List[Dict]]
     hash_compliance: Optional[str]
     certificado_id: Optional[str]
     timestamp_final: Optional[str]
     hash_final: Optional[str]
     workflow_id: Optional[str]
 
-def compute_hash(state: Art17State):
-    serialized = str(state).encode()
-    return hashlib.sha256(serialized).hexdigest()
 
 async def ingest(state: Art17State):
-    from src.db.database import database
-    from src.db.repositories.art17_repository import Art17Repository
+    from src.db.database import database, shards
+    from src.db.repositories.workflow_repository import WorkflowRepository
+
+    # Normaliza el RUT antes de persistir: ValueError si el DV no es válido
+    rut_num, rut_dv = normalize_rut(state.get("proveedor_rut"))
+    state["proveedor_rut"] = format_rut(rut_num, rut_dv)
+    state["proveedor_rut_num"] = rut_num
+    state["proveedor_rut_dv"] = rut_dv
 
     state["ingest_timestamp"] = datetime.utcnow().isoformat()
-    state["hash_ingest"] = compute_hash(state)
+    state["hash_ingest"] = hash_chain.hash_ingest(
+        state["request_id"], state["proveedor_rut"], state.get("proveedor_nombre"),
+        state.get("monto_contrato"), state.get("objeto_contrato"), state["ingest_timestamp"]
+    )
 
     try:
         if database and database.is_connected:
-            repo = Art17Repository(database)
+            # Todo lo de la solicitud vive en el shard de su proveedor
+            shard = shards.for_rut_write(rut_num)
+            shard_db = shard.database
+            repo = WorkflowRepository(shard_db)
 
-            await repo.save_request({
-                "request_id": state["request_id"],
-                "proveedor_rut": state["proveedor_rut"],
-                "proveedor_nombre": state.get("proveedor_nombre"),
-                "monto_contrato": state.get("monto_contrato"),
-                "objeto_contrato": state.get("objeto_contrato"),
-                "status": "processing"
-            })
-            logger.info(f"✅ Request {state['request_id']} guardado")
+            async with shard_db.transaction():
+                # Ninguna escritura en un slot que rebalance_shards está copiando
+                await shards.lock_slot_write(shard, rut_num)
+                await repo.save_request({
+                    "request_id": state["request_id"],
+                    "proveedor_rut": state["proveedor_rut"],
+                    "proveedor_rut_num": state["proveedor_rut_num"],
+                    "proveedor_rut_dv": state["proveedor_rut_dv"],
+                    "proveedor_nombre": state.get("proveedor_nombre"),
+                    "monto_contrato": state.get("monto_contrato"),
+                    "objeto_contrato": state.get("objeto_contrato"),
+                    "status": "processing"
+                })
+            logger.info("✅ Request %s guardado", state['request_id'])
+            try:
+                async with shard_db.transaction():
+                    await shards.lock_slot_write(shard, rut_num)
+                    await contract_similarity.index_contract(
+                        state["request_id"], rut_num, state.get("objeto_contrato"), db=shard_db
+                    )
+            except Exception as e:
+                # build reindexa lo que falte; no bloquea la certificación
+                logger.warning("⚠️ Firma de similitud no guardada para %s: %s", state['request_id'], e)
         else:
             logger.warning("⚠️ BD no disponible")
+    except ShardSlotMovingError:
+        # Se reintenta (cola) o se responde 503 cuando termine el rebalanceo
+        raise
     except Exception as e:
-        logger.error(f"❌ Error guardando en BD: {e}")
+        logger.error("❌ Error guardando en BD: %s", e)
 
+    await emit("WORKFLOW_INGEST", request_id=state["request_id"], details={
+        "proveedor_rut": state["proveedor_rut"], "hash": state["hash_ingest"]
+    })
     return state
 
 async def risk_check(state: Art17State):
     rut = state.get("proveedor_rut", "")
     state["riesgo"] = "BAJO" if rut.endswith("0") else "MEDIO"
-    state["hash_riesgo"] = compute_hash(state)
-    logger.info(f"✅ Risk check: {state['riesgo']}")
+    state["hash_riesgo"] = hash_chain.hash_riesgo(state["hash_ingest"], state["riesgo"])
+    logger.info("✅ Risk check: %s", state['riesgo'])
+    await emit("WORKFLOW_RISK_CHECK", request_id=state["request_id"], details={
+        "riesgo": state["riesgo"], "hash": state["hash_riesgo"]
+    })
     return state
 
 async def compliance_check(state: Art17State):
-    state["cumplimiento"] = True
-    state["hash_compliance"] = compute_hash(state)
-    logger.info(f"✅ Compliance: {state['cumplimiento']}")
+    from src.db.database import database, shards
+
+    # Fraccionamiento: contratos casi idénticos del mismo RUT en la ventana (LSH)
+    state["contratos_similares"] = []
+    if database and database.is_connected:
+        try:
+            state["contratos_similares"] = await contract_similarity.find_near_duplicates(
+                state["request_id"], state["proveedor_rut_num"], state.get("objeto_contrato"),
+                db=shards.for_rut(state["proveedor_rut_num"]).database
+            )
+        except Exception as e:
+            logger.warning("⚠️ Búsqueda de contratos similares falló para %s: %s", state['request_id'], e)
+    state["cumplimiento"] = len(state["contratos_similares"]) < contract_similarity.SPLIT_MIN_MATCHES
+    if not state["cumplimiento"]:
+        logger.warning(
+            "🚩 Posible fraccionamiento en %s: %s contratos similares del mismo proveedor",
+            state['request_id'], len(state['contratos_similares'])
+        )
+    state["hash_compliance"] = hash_chain.hash_compliance(state["hash_riesgo"], state["cumplimiento"])
+    logger.info("✅ Compliance: %s", state['cumplimiento'])
+    await emit("WORKFLOW_COMPLIANCE", request_id=state["request_id"], details={
+        "cumplimiento": state["cumplimiento"], "hash": state["hash_compliance"],
+        "contratos_similares": [c["request_id"] for c in state["contratos_similares"]]
+    })
     return state
 
 async def final_report(state: Art17State):
-    from src.db.database import database
-    from src.db.repositories.art17_repository import Art17Repository
+    from src.db.database import database, shards
+    from src.db.repositories.workflow_repository import WorkflowRepository
+    from src.db.repositories.stats_repository import StatsRepository
+    from src.db.repositories.certificate_read_model_repository import CertificateReadModelRepository
 
-    state["certificado_id"] = f"CERT-{uuid.uuid4().hex[:10]}"
+    # ID ordenable por tiempo: inserts al final del índice y range scans por fecha;
+    # lleva el slot del proveedor para que la verificación vaya directo a su shard
+    state["certificado_id"] = new_certificado_id(slot=shards.slot_for_rut(state["proveedor_rut_num"]))
     state["timestamp_final"] = datetime.utcnow().isoformat()
-    state["hash_final"] = compute_hash(state)
+    state["hash_final"] = hash_chain.hash_final(
+        state["hash_compliance"], state["certificado_id"], state["timestamp_final"]
+    )
 
     try:
         if database and database.is_connected:
-            repo = Art17Repository(database)
-
-            workflow_id = await repo.save_workflow_execution({
-                "request_id": state["request_id"],
-                "workflow_type": "art17",
-                "ingest_timestamp": state["ingest_timestamp"],
-                "hash_ingest": state["hash_ingest"],
-                "riesgo": state["riesgo"],
-                "hash_riesgo": state["hash_riesgo"],
-                "cumplimiento": state["cumplimiento"],
-                "hash_compliance": state["hash_compliance"],
-                "hash_final": state["hash_final"],
-                "timestamp_final": state["timestamp_final"],
-                "metadata": "{}"
-            })
-
-            state["workflow_id"] = workflow_id
-
-            await repo.save_certificate({
-                "certificado_id": state["certificado_id"],
+            shard = shards.for_rut_write(state["proveedor_rut_num"])
+            repo = WorkflowRepository(shard.database)
+            audit_event = {
                 "request_id": state["request_id"],
-                "hash_final": state["hash_final"],
-                "issued_at": state["timestamp_final"]
-            })
+                "details": {"certificado_id": state["certificado_id"], "hash": state["hash_final"]},
+                "durable": True,
+            }
 
-            await repo.save_request({
-                "request_id": state["request_id"],
-                "proveedor_rut": state["proveedor_rut"],
-                "proveedor_nombre": state.get("proveedor_nombre"),
-                "monto_contrato": state.get("monto_contrato"),
-                "objeto_contrato": state.get("objeto_contrato"),
-                "status": "completed"
-            })
-
-            logger.info(f"✅ Certificado emitido: {state['certificado_id']}")
+            # Ejecución, certificado, estado, resultado y modelo de lectura: todo o nada
+            async with shard.database.transaction():
+                # Sección crítica: un duplicado de otra instancia espera aquí y, si
+                # esta ya emitió, adopta el resultado almacenado en vez de emitir otro
+                await _acquire_request_xact_lock(shard.database, state["request_id"])
+                # El mapa en memoria puede estar atrasado: se confirma contra shard_slots
+                # con el lock del slot tomado, que rebalance_shards retiene mientras copia
+                await shards.lock_slot_write(shard, state["proveedor_rut_num"])
+                stored = await repo.get_completed_result(state["request_id"])
+                if stored is not None:
+                    logger.info("♻️ Request %s completado por otra ejecución: se adopta su resultado", state['request_id'])
+                    state.update(stored)
+                    return state
+
+                workflow_row = await repo.save_workflow_execution({
+                    "request_id": state["request_id"],
+                    "proveedor_rut": state["proveedor_rut"],
+                    "proveedor_rut_num": state["proveedor_rut_num"],
+                    "proveedor_rut_dv": state["proveedor_rut_dv"],
+                    "workflow_type": "art17",
+                    "ingest_timestamp": state["ingest_timestamp"],
+                    "hash_ingest": state["hash_ingest"],
+                    "riesgo": state["riesgo"],
+                    "hash_riesgo": state["hash_riesgo"],
+                    "cumplimiento": state["cumplimiento"],
+                    "hash_compliance": state["hash_compliance"],
+                    "hash_final": state["hash_final"],
+                    "timestamp_final": state["timestamp_final"],
+                    # Versión de la cadena: permite recalcularla en la re-verificación masiva
+                    "metadata": json.dumps({
+                        "hash_chain": hash_chain.HASH_CHAIN_VERSION,
+                        "contratos_similares": state.get("contratos_similares") or []
+                    })
+                })
+
+                state["workflow_id"] = str(workflow_row["id"]) if workflow_row else None
+
+                cert_row = await repo.save_certificate({
+                    "certificado_id": state["certificado_id"],
+                    "request_id": state["request_id"],
+                    "workflow_execution_id": workflow_row["id"] if workflow_row else None,
+                    "hash_final": state["hash_final"],
+                    "firma_digital": None,
+                    "issued_at": state["timestamp_final"]
+                })
+
+                await repo.save_request({
+                    "request_id": state["request_id"],
+                    "proveedor_rut": state["proveedor_rut"],
+                    "proveedor_rut_num": state["proveedor_rut_num"],
+                    "proveedor_rut_dv": state["proveedor_rut_dv"],
+                    "proveedor_nombre": state.get("proveedor_nombre"),
+                    "monto_contrato": state.get("monto_contrato"),
+                    "objeto_contrato": state.get("objeto_contrato"),
+                    "status": "completed"
+                })
+                await CertificateReadModelRepository(shard.database).project_certificate(state["certificado_id"])
+                # Invalidación de cachés en todas las instancias, solo si esto se confirma
+                # (las estadísticas expiran solas: ver STATS_TTL_SECONDS)
+                changes = [(CERTIFICATE, state["certificado_id"])]
+                if state.get("proveedor_rut_num") is not None:
+                    changes.append((PROVEEDOR, state["proveedor_rut_num"]))
+                await publish(changes, db=shard.database)
+                if shard is shards.catalog:
+                    await emit("CERTIFICADO_EMITIDO", db=database, **audit_event)
+                # Resultado de la ejecución: los reintentos lo reciben sin re-ejecutar
+                await repo.save_result(state["request_id"], dict(state))
+
+            # audit_log vive en el catálogo: en otro shard se escribe tras confirmar
+            if shard is not shards.catalog:
+                await emit("CERTIFICADO_EMITIDO", db=database, **audit_event)
+
+            try:
+                # Mismas columnas y mismo created_at que cuenta el recálculo periódico
+                await StatsRepository().record_workflow(
+                    at=(cert_row["created_at"] if cert_row else None) or datetime.utcnow(),
+                    riesgo=state.get("riesgo"),
+                    certificado_emitido=bool(cert_row and cert_row["certificado_emitido"]),
+                    hitl_abierto=bool(cert_row and cert_row["hitl_required"])
+                )
+            except Exception as e:
+                # La corrección periódica de rollups recupera el incremento perdido
+                logger.warning("⚠️ Rollup no actualizado para %s: %s", state['request_id'], e)
+
+            logger.info("✅ Certificado emitido: %s", state['certificado_id'])
         else:
             logger.warning("⚠️ BD no disponible en final_report")
+    except (WorkflowInProgressError, ShardSlotMovingError):
+        raise
     except Exception as e:
-        logger.error(f"❌ Error finalizando workflow: {e}")
+        # La transacción se revirtió: nada quedó persistido
+        state["workflow_id"] = None
+        logger.error("❌ Error finalizando workflow: %s", e)
 
     return state
 
 def build():
     g = StateGraph(Art17State)
-    g.add_node("ingest", ingest)
-    g.add_node("risk", risk_check)
-    g.add_node("compliance", compliance_check)
-    g.add_node("final", final_report)
+    g.add_node("ingest", traced("graph.ingest")(ingest))
+    g.add_node("risk", traced("graph.risk")(risk_check))
+    g.add_node("compliance", traced("graph.compliance")(compliance_check))
+    g.add_node("final", traced("graph.final")(final_report))
     g.set_entry_point("ingest")
     g.add_edge("ingest", "risk")
     g.add_edge("risk", "compliance")
@@ -135,7 +270,81 @@ def build():
 
 workflow = build()
 
+# ==================== EJECUCIÓN IDEMPOTENTE ====================
+
+# Espacio de advisory locks (dos claves int4) para las ejecuciones por request_id
+WORKFLOW_LOCK_NAMESPACE = 1717
+# Espera máxima de un duplicado mientras otra instancia ejecuta el mismo request_id
+LOCK_WAIT_SECONDS = float(os.getenv("WORKFLOW_LOCK_WAIT_SECONDS", "30"))
+LOCK_POLL_SECONDS = 0.1
+
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+class WorkflowInProgressError(Exception):
+    """Otra instancia sigue ejecutando el mismo request_id tras la espera máxima"""
+
+
+async def _acquire_request_xact_lock(db, request_id: str):
+    """
+    Advisory lock de transacción sobre la conexión que escribe el certificado:
+    se libera solo con el commit o el rollback, sin ocupar una conexión del
+    pool durante el resto del grafo.
+    """
+    deadline = time.monotonic() + LOCK_WAIT_SECONDS
+    while True:
+        acquired = await db.fetch_val(
+            query="SELECT pg_try_advisory_xact_lock(:namespace, hashtext(:request_id))",
+            values={"namespace": WORKFLOW_LOCK_NAMESPACE, "request_id": request_id}
+        )
+        if acquired:
+            return
+        if time.monotonic() >= deadline:
+            raise WorkflowInProgressError(f"Request {request_id} en ejecución en otra instancia")
+        await asyncio.sleep(LOCK_POLL_SECONDS)
+
+
+async def _run_once(input_data: dict):
+    from src.db.database import database, shards
+    from src.db.repositories.workflow_repository import WorkflowRepository
+
+    request_id = input_data["request_id"]
+    if database and database.is_connected:
+        # Resultado almacenado en el shard del proveedor (RUT inválido: el
+        # catálogo, ingest lo rechaza igual)
+        rut_key = try_normalize_rut(input_data.get("proveedor_rut"))
+        shard_db = shards.for_rut_write(rut_key[0] if rut_key else None).database
+        stored = await WorkflowRepository(shard_db).get_completed_result(request_id)
+        if stored is not None:
+            logger.info("♻️ Request %s ya completado: se devuelve el resultado almacenado", request_id)
+            return stored
+
+    # final_report serializa la emisión con un lock de transacción y guarda el
+    # resultado en la misma transacción que el certificado
+    return await workflow.ainvoke(Art17State(**input_data))
+
+
 async def run_art17_workflow(input_data: dict):
-    initial = Art17State(**input_data)
-    result = await workflow.ainvoke(initial)
-    return result
+    """
+    Ejecuta el workflow una sola vez por request_id: los duplicados concurrentes
+    de esta instancia esperan la misma ejecución, los de otras instancias se
+    serializan en la transacción de final_report (el segundo adopta el
+    certificado del primero), y los reintentos posteriores reciben el resultado
+    almacenado.
+    Sin request_id se genera uno con el slot de shard del proveedor.
+    """
+    from src.db.database import shards
+
+    if not input_data.get("request_id"):
+        rut_num, _ = normalize_rut(input_data.get("proveedor_rut"))
+        input_data = {**input_data, "request_id": new_request_id(slot=shards.slot_for_rut(rut_num))}
+    request_id = input_data.get("request_id")
+    task = _inflight.get(request_id)
+    if task is None:
+        task = asyncio.ensure_future(_run_once(input_data))
+        _inflight[request_id] = task
+        task.add_done_callback(lambda _: _inflight.pop(request_id, None))
+    else:
+        logger.info("⏳ Request %s duplicado en curso: esperando la ejecución original", request_id)
+    # shield: si un cliente se desconecta, la ejecución compartida continúa
+    return await asyncio.shield(task)
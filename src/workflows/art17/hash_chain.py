@@ -0,0 +1,79 @@
+"""
+Cadena de hashes canónica del workflow Art. 17.
+
+Cada etapa encadena el hash anterior con los campos que agrega, serializados
+como JSON canónico, de modo que toda la cadena puede recalcularse después
+únicamente con lo que queda persistido en requests, workflow_executions y
+certificates. Sin dependencias: la usan el grafo y los workers de verificación.
+
+Las ejecuciones anteriores (sin `hash_chain` en metadata) hasheaban el estado
+completo con str() y no son recalculables; solo admiten chequeos de consistencia.
+"""
+import hashlib
+import json
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Optional, Union
+
+HASH_CHAIN_VERSION = "v2"
+
+
+def _monto(value: Optional[Union[float, Decimal, str]]) -> Optional[str]:
+    # DECIMAL(15, 2) en la BD: el hash usa la misma representación
+    if value is None:
+        return None
+    return str(Decimal(str(value)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+
+
+def _timestamp(value: Optional[Union[datetime, str]]) -> Optional[str]:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _digest(previous: Optional[str], fields: Dict) -> str:
+    payload = json.dumps(fields, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(f"{previous or ''}|{payload}".encode("utf-8")).hexdigest()
+
+
+def hash_ingest(
+    request_id: str, proveedor_rut: str, proveedor_nombre: Optional[str],
+    monto_contrato, objeto_contrato: Optional[str], ingest_timestamp
+) -> str:
+    return _digest(None, {
+        "etapa": "ingest",
+        "request_id": request_id,
+        "proveedor_rut": proveedor_rut,
+        "proveedor_nombre": proveedor_nombre,
+        "monto_contrato": _monto(monto_contrato),
+        "objeto_contrato": objeto_contrato,
+        "ingest_timestamp": _timestamp(ingest_timestamp),
+    })
+
+
+def hash_riesgo(previous: str, riesgo: Optional[str]) -> str:
+    return _digest(previous, {"etapa": "riesgo", "riesgo": riesgo})
+
+
+def hash_compliance(previous: str, cumplimiento: Optional[bool]) -> str:
+    return _digest(previous, {"etapa": "compliance", "cumplimiento": cumplimiento})
+
+
+def hash_final(previous: str, certificado_id: str, timestamp_final) -> str:
+    return _digest(previous, {
+        "etapa": "final",
+        "certificado_id": certificado_id,
+        "timestamp_final": _timestamp(timestamp_final),
+    })
+
+
+def recompute_chain(row: Dict) -> Dict[str, str]:
+    """Recalcula las cuatro etapas desde una fila persistida"""
+    ingest = hash_ingest(
+        row["request_id"], row["proveedor_rut"], row["proveedor_nombre"],
+        row["monto_contrato"], row["objeto_contrato"], row["ingest_timestamp"]
+    )
+    riesgo = hash_riesgo(ingest, row["riesgo"])
+    compliance = hash_compliance(riesgo, row["cumplimiento"])
+    final = hash_final(compliance, row["certificado_id"], row["timestamp_final"])
+    return {"ingest": ingest, "riesgo": riesgo, "compliance": compliance, "final": final}
@@ -0,0 +1,202 @@
+"""
+Cola de procesamiento Art. 17 respaldada en la tabla requests.
+
+Las filas importadas con --enqueue quedan en status 'queued'. El worker las
+reclama por lotes con FOR UPDATE SKIP LOCKED (varias instancias no se pisan),
+las marca 'processing' y ejecuta run_art17_workflow con concurrencia acotada.
+Con sharding se reclama en cada shard, solo las filas de los slots que tiene
+asignados.
+
+Cada reclamo sella claimed_at: una fila 'processing' con el lease vencido
+(ART17_QUEUE_LEASE_SECONDS; la instancia murió a mitad del workflow) se vuelve
+a reclamar. Al detenerse, el worker devuelve a 'queued' las filas que tenía en
+curso. Un reintento tras un lease vencido no duplica el certificado: el
+resultado de la solicitud es idempotente.
+
+    python -m src.workflows.art17.queue [--once]
+"""
+import argparse
+import asyncio
+import logging
+import os
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# 0 desactiva el worker dentro de la API (p. ej. si corre como proceso aparte)
+QUEUE_CONCURRENCY = int(os.getenv("ART17_QUEUE_CONCURRENCY", "4"))
+QUEUE_POLL_SECONDS = float(os.getenv("ART17_QUEUE_POLL_SECONDS", "5"))
+# Más que la duración normal de un workflow: vencido, otra instancia lo retoma
+QUEUE_LEASE_SECONDS = float(os.getenv("ART17_QUEUE_LEASE_SECONDS", "600"))
+
+CLAIM_SQL = """
+    UPDATE requests SET status = 'processing', claimed_at = CURRENT_TIMESTAMP
+    WHERE id IN (
+        SELECT id FROM requests
+        WHERE (status = 'queued'
+               OR (status = 'processing' AND claimed_at IS NOT NULL
+                   AND claimed_at < CURRENT_TIMESTAMP - CAST(:lease AS DOUBLE PRECISION) * INTERVAL '1 second'))
+          -- Solo slots asignados a este shard: una fila en otro shard no se
+          -- completaría aquí (el workflow escribe en el shard del proveedor)
+          AND shard_slot(proveedor_rut_num) = ANY(CAST(:slots AS INTEGER[]))
+          -- Proveedores cuyo slot se está moviendo de shard esperan en la cola
+          AND NOT (shard_slot(proveedor_rut_num) = ANY(CAST(:moving AS INTEGER[])))
+        ORDER BY id
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING request_id, proveedor_rut, proveedor_nombre, monto_contrato, objeto_contrato
+"""
+
+RELEASE_SQL = """
+    UPDATE requests SET status = 'queued', claimed_at = NULL
+    WHERE request_id = ANY(CAST(:request_ids AS VARCHAR[])) AND status = 'processing'
+"""
+
+_worker_task: Optional[asyncio.Task] = None
+# request_id en curso por shard: se devuelven a la cola al detener el worker
+_in_flight: Dict[int, Set[str]] = {}
+
+
+async def claim_requests(db, limit: int, slots, moving=()):
+    return await db.fetch_all(
+        CLAIM_SQL,
+        values={"limit": limit, "slots": list(slots), "moving": list(moving), "lease": QUEUE_LEASE_SECONDS}
+    )
+
+
+async def release_in_flight() -> int:
+    """Devuelve a 'queued' las solicitudes que este proceso dejó a medias"""
+    from src.db.database import shards
+
+    released = 0
+    for shard in shards.shards:
+        request_ids = _in_flight.pop(shard.index, set())
+        if not request_ids:
+            continue
+        try:
+            await shard.database.execute(RELEASE_SQL, values={"request_ids": sorted(request_ids)})
+            released += len(request_ids)
+        except Exception as e:
+            # El lease vencido las devuelve igual a la cola
+            logger.error(f"❌ No se pudieron devolver a la cola {len(request_ids)} solicitudes (shard {shard.index}): {e}")
+    if released:
+        logger.info(f"📬 {released} solicitudes en curso devueltas a la cola Art. 17")
+    return released
+
+
+async def _process(db, row, semaphore: asyncio.Semaphore) -> bool:
+    from src.db.sharding import ShardSlotMovingError
+    from src.workflows.art17.flow import run_art17_workflow
+
+    async with semaphore:
+        request_id = row["request_id"]
+        try:
+            result = await run_art17_workflow({
+                "request_id": request_id,
+                "proveedor_rut": row["proveedor_rut"],
+                "proveedor_nombre": row["proveedor_nombre"],
+                "monto_contrato": float(row["monto_contrato"]) if row["monto_contrato"] is not None else None,
+                "objeto_contrato": row["objeto_contrato"],
+            })
+            if result.get("workflow_id"):
+                return True
+            error, status = "sin certificado persistido", "failed"
+        except ShardSlotMovingError as e:
+            # Vuelve a la cola: se reintenta cuando termine el rebalanceo
+            error, status = str(e), "queued"
+        except Exception as e:
+            error, status = str(e), "failed"
+
+        logger.error(f"❌ Request en cola {request_id} falló: {error}")
+        try:
+            await db.execute(
+                "UPDATE requests SET status = :status WHERE request_id = :request_id AND status = 'processing'",
+                values={"request_id": request_id, "status": status}
+            )
+        except Exception as e:
+            logger.error(f"❌ No se pudo marcar {request_id} como {status}: {e}")
+        return False
+
+
+async def process_queue_batch(concurrency: int = QUEUE_CONCURRENCY) -> int:
+    """Reclama y procesa un lote por shard; retorna cuántas solicitudes se tomaron"""
+    from src.db.database import shards
+
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    claimed = 0
+    for shard in shards.shards:
+        slots = [slot for slot, index in enumerate(shards.slot_map) if index == shard.index]
+        if not slots:
+            continue
+        rows = await claim_requests(shard.database, max(concurrency, 1) * 4, slots, shards.moving)
+        if not rows:
+            continue
+        in_flight = _in_flight.setdefault(shard.index, set())
+        request_ids = [row["request_id"] for row in rows]
+        in_flight.update(request_ids)
+        results = await asyncio.gather(*(_process(shard.database, row, semaphore) for row in rows))
+        in_flight.difference_update(request_ids)
+        logger.info(f"📬 Cola Art. 17 (shard {shard.index}): {sum(results)}/{len(rows)} solicitudes certificadas")
+        claimed += len(rows)
+    return claimed
+
+
+async def _worker_loop():
+    while True:
+        try:
+            if await process_queue_batch():
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error en la cola Art. 17: {e}")
+        await asyncio.sleep(QUEUE_POLL_SECONDS)
+
+
+def start_art17_queue_worker():
+    """Inicia el worker de la cola (idempotente; no hace nada si la concurrencia es 0)"""
+    global _worker_task
+    if QUEUE_CONCURRENCY <= 0:
+        return
+    if _worker_task is None or _worker_task.done():
+        _worker_task = asyncio.create_task(_worker_loop())
+        logger.info(f"Cola Art. 17 activa (concurrencia {QUEUE_CONCURRENCY})")
+
+
+async def stop_art17_queue_worker():
+    global _worker_task
+    if _worker_task is not None:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
+        await release_in_flight()
+
+
+async def main(args):
+    from src.db.database import connect_db, disconnect_db
+
+    await connect_db()
+    try:
+        total = 0
+        while True:
+            claimed = await process_queue_batch(args.concurrency)
+            total += claimed
+            if not claimed:
+                if args.once:
+                    break
+                await asyncio.sleep(QUEUE_POLL_SECONDS)
+        print(f"✅ {total} solicitudes procesadas desde la cola")
+    finally:
+        await release_in_flight()
+        await disconnect_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker de la cola Art. 17")
+    parser.add_argument("--concurrency", type=int, default=max(QUEUE_CONCURRENCY, 1))
+    parser.add_argument("--once", action="store_true", help="Terminar cuando la cola quede vacía")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+"""
+Invalidación de cachés entre instancias vía outbox + LISTEN/NOTIFY (src/services/change_feed.py).
+
+Necesita Postgres: se omite sin DATABASE_URL. Cada "instancia" es un ChangeFeed
+con su propia caché y su propia conexión LISTEN.
+
+    DATABASE_URL=... pytest tests/test_change_feed.py
+"""
+import asyncio
+import itertools
+import os
+import time
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL no definida", allow_module_level=True)
+
+import asyncpg
+import databases
+import pytest_asyncio
+
+from src.db.run_migrations import run_migrations
+from src.services import change_feed
+from src.services.change_feed import CHANNEL, ChangeCache, ChangeFeed, publish
+
+ENTITY = "test_change_feed"
+
+
+async def wait_for(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timeout esperando el change feed"
+        await asyncio.sleep(0.02)
+
+
+class VersionedLoader:
+    """Lectura simulada: devuelve una versión nueva cada vez que llega a la BD"""
+
+    def __init__(self):
+        self.versions = itertools.count(1)
+        self.loads = 0
+
+    async def __call__(self):
+        self.loads += 1
+        return next(self.versions)
+
+
+@pytest_asyncio.fixture
+async def writer():
+    await run_migrations(os.environ["DATABASE_URL"])
+    db = databases.Database(os.environ["DATABASE_URL"])
+    await db.connect()
+    try:
+        yield db
+    finally:
+        await db.execute(query="DELETE FROM change_outbox WHERE entity = :entity", values={"entity": ENTITY})
+        await db.disconnect()
+
+
+@pytest_asyncio.fixture
+async def instance(monkeypatch):
+    # Caída detectada y reconexión en décimas de segundo
+    monkeypatch.setattr(change_feed, "HEALTHCHECK_SECONDS", 0.1)
+    monkeypatch.setattr(change_feed, "RECONNECT_SECONDS", 0.5)
+    feed = ChangeFeed(ChangeCache(max_size=100))
+    feed.start([os.environ["DATABASE_URL"]])
+    try:
+        await wait_for(lambda: feed.healthy)
+        yield feed
+    finally:
+        await feed.stop()
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_publish_does_not_notify(writer):
+    listener = await asyncpg.connect(os.environ["DATABASE_URL"])
+    received = []
+    try:
+        await listener.add_listener(CHANNEL, lambda conn, pid, channel, payload: received.append(payload))
+
+        async with writer.transaction(force_rollback=True):
+            await publish([(ENTITY, "revertido")], db=writer)
+        async with writer.transaction():
+            await publish([(ENTITY, "confirmado")], db=writer)
+
+        await wait_for(lambda: any(f"|{ENTITY}|confirmado|" in p for p in received))
+        assert not any(f"|{ENTITY}|revertido|" in p for p in received)
+    finally:
+        await listener.close()
+
+
+@pytest.mark.asyncio
+async def test_publish_from_another_instance_invalidates_local_cache(writer, instance):
+    cache = instance.cache
+    loader = VersionedLoader()
+    assert await cache.get_or_load(ENTITY, "k", "v", loader) == 1
+    assert await cache.get_or_load(ENTITY, "k", "v", loader) == 1
+    assert loader.loads == 1
+
+    # Otra instancia escribe: publica en el outbox dentro de su transacción
+    async with writer.transaction():
+        await publish([(ENTITY, "k")], db=writer)
+    await wait_for(lambda: (ENTITY, "k") not in cache._entries)
+
+    assert await cache.get_or_load(ENTITY, "k", "v", loader) == 2
+    assert instance.stats()["lag_ms"]["samples"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_events_missed_while_disconnected_are_replayed(writer, instance):
+    cache = instance.cache
+    loader = VersionedLoader()
+    assert await cache.get_or_load(ENTITY, "k", "v", loader) == 1
+
+    # Se corta la conexión LISTEN y el evento se publica antes de que reconecte
+    source = instance._sources[0]
+    await writer.execute(query="SELECT pg_terminate_backend(:pid)", values={"pid": source.conn.get_server_pid()})
+    await publish([(ENTITY, "k")], db=writer)
+
+    await wait_for(lambda: instance.stats()["reconnects"] >= 1 and instance.healthy)
+
+    assert instance.stats()["replayed"] >= 1
+    assert await cache.get_or_load(ENTITY, "k", "v", loader) == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_is_bypassed_while_listener_is_down(writer, instance):
+    cache = instance.cache
+    loader = VersionedLoader()
+    await cache.get_or_load(ENTITY, "k", "v", loader)
+
+    await instance.stop()
+
+    # Sin listener no llegan invalidaciones: cada lectura va a la BD
+    assert not cache.enabled
+    assert await cache.get_or_load(ENTITY, "k", "v", loader) == 2
+    assert await cache.get_or_load(ENTITY, "k", "v", loader) == 3
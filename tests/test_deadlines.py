@@ -0,0 +1,125 @@
+"""
+Plazos por request y recuperación de conexiones (src/db/deadlines.py, src/api/deadlines.py).
+
+Necesita Postgres: se omite sin DATABASE_URL.
+
+    DATABASE_URL=... pytest tests/test_deadlines.py
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL no definida", allow_module_level=True)
+
+import asyncpg
+import databases
+import pytest_asyncio
+from fastapi import HTTPException
+
+from src.api.deadlines import run_with_deadline
+from src.db.deadlines import DeadlineExceeded, deadline_scope
+from src.db.instrumentation import instrument
+
+POOL_SIZE = 2
+BUDGET = 0.5
+SLEEP = 10
+MARKER = "test_deadlines"
+SLOW_SQL = f"SELECT pg_sleep(:seconds) /* {MARKER} */"
+
+
+class DisconnectingRequest:
+    """Imita el Request de Starlette: se desconecta a los `after` segundos"""
+
+    def __init__(self, after: float):
+        self.disconnect_at = time.monotonic() + after
+
+    async def is_disconnected(self) -> bool:
+        return time.monotonic() >= self.disconnect_at
+
+
+@pytest_asyncio.fixture
+async def db():
+    database = instrument(databases.Database(os.environ["DATABASE_URL"], min_size=POOL_SIZE, max_size=POOL_SIZE))
+    await database.connect()
+    try:
+        yield database
+    finally:
+        await database.disconnect()
+
+
+@pytest_asyncio.fixture
+async def monitor():
+    conn = await asyncpg.connect(os.environ["DATABASE_URL"])
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+async def active_slow_queries(monitor) -> int:
+    # La cancelación llega al servidor un instante después de liberar la conexión
+    await asyncio.sleep(0.2)
+    return await monitor.fetchval(
+        """
+        SELECT COUNT(*) FROM pg_stat_activity
+        WHERE state = 'active' AND pid <> pg_backend_pid() AND query LIKE $1
+        """,
+        f"%{MARKER}%"
+    )
+
+
+async def bounded_slow_query(db):
+    with deadline_scope(BUDGET):
+        return await db.fetch_val(query=SLOW_SQL, values={"seconds": SLEEP})
+
+
+@pytest.mark.asyncio
+async def test_deadline_cuts_queries_that_saturate_the_pool(db, monitor):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(bounded_slow_query(db) for _ in range(POOL_SIZE)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    assert all(isinstance(r, DeadlineExceeded) for r in results)
+    # Cortadas cerca del plazo, no al terminar pg_sleep
+    assert elapsed < BUDGET + 1
+    assert await active_slow_queries(monitor) == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_serves_immediately_after_deadlines(db):
+    await asyncio.gather(*(bounded_slow_query(db) for _ in range(POOL_SIZE)), return_exceptions=True)
+
+    start = time.perf_counter()
+    with deadline_scope(BUDGET):
+        value = await db.fetch_val(query="SELECT 1")
+
+    assert value == 1
+    assert time.perf_counter() - start < BUDGET
+
+
+@pytest.mark.asyncio
+async def test_disconnected_client_gets_499_and_query_is_cancelled(db, monitor):
+    start = time.perf_counter()
+    with pytest.raises(HTTPException) as excinfo:
+        await run_with_deadline(
+            MARKER, SLEEP * 2, DisconnectingRequest(BUDGET),
+            lambda: db.fetch_val(query=SLOW_SQL, values={"seconds": SLEEP})
+        )
+
+    assert excinfo.value.status_code == 499
+    assert time.perf_counter() - start < BUDGET + 1
+    assert await active_slow_queries(monitor) == 0
+    with deadline_scope(BUDGET):
+        assert await db.fetch_val(query="SELECT 1") == 1
+
+
+@pytest.mark.asyncio
+async def test_statement_timeout_does_not_outlive_the_deadline(db, monitor):
+    await asyncio.gather(*(bounded_slow_query(db) for _ in range(POOL_SIZE)), return_exceptions=True)
+
+    # El SET de statement_timeout no sobrevive a la devolución de la conexión
+    for _ in range(POOL_SIZE):
+        assert await db.fetch_val(query="SHOW statement_timeout") == await monitor.fetchval("SHOW statement_timeout")
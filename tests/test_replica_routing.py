@@ -0,0 +1,143 @@
+"""
+Ruteo de lecturas a réplicas y read-your-writes (src/db/routing.py).
+
+Necesita un primario y al menos una réplica en streaming: se omite sin
+DATABASE_URL y DATABASE_REPLICA_URLS.
+
+    DATABASE_URL=... DATABASE_REPLICA_URLS=... pytest tests/test_replica_routing.py
+
+Los requests HTTP pasan por consistency_middleware con objetos mínimos en vez
+de Starlette: el middleware solo usa los headers.
+"""
+import os
+import uuid
+
+import pytest
+
+if not os.getenv("DATABASE_URL") or not os.getenv("DATABASE_REPLICA_URLS"):
+    pytest.skip("DATABASE_URL o DATABASE_REPLICA_URLS no definidas", allow_module_level=True)
+
+import databases
+import pytest_asyncio
+
+from src.db.instrumentation import instrument
+from src.db.routing import (
+    CONSISTENCY_HEADER, ReplicaRouter, consistency_middleware, mark_write, parse_lsn, primary_reads
+)
+
+TABLE = "test_replica_routing"
+IN_RECOVERY = "SELECT pg_is_in_recovery()"
+
+
+class FakeRequest:
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+
+
+class FakeResponse:
+    def __init__(self, body=None):
+        self.body = body
+        self.headers = {}
+
+
+@pytest_asyncio.fixture
+async def router():
+    primary = instrument(databases.Database(os.environ["DATABASE_URL"]))
+    await primary.connect()
+    replica_urls = [u.strip() for u in os.environ["DATABASE_REPLICA_URLS"].split(",") if u.strip()]
+    router = ReplicaRouter(primary, replica_urls)
+    await router.connect()
+    await primary.execute(query=f"CREATE TABLE IF NOT EXISTS {TABLE} (marker TEXT PRIMARY KEY)")
+    try:
+        yield router
+    finally:
+        await primary.execute(query=f"DROP TABLE IF EXISTS {TABLE}")
+        await router.disconnect()
+        await primary.disconnect()
+
+
+async def handle(router, request, call_next):
+    return await consistency_middleware(router)(request, call_next)
+
+
+async def count_marker(db, marker: str) -> int:
+    return await db.fetch_val(query=f"SELECT COUNT(*) FROM {TABLE} WHERE marker = :marker", values={"marker": marker})
+
+
+@pytest.mark.asyncio
+async def test_replica_lag_is_reported(router):
+    status = router.status()
+
+    assert status and all(replica["connected"] for replica in status)
+    assert any(replica["healthy"] and replica["lag_seconds"] is not None for replica in status)
+
+
+@pytest.mark.asyncio
+async def test_plain_reads_go_to_a_replica(router):
+    async def call_next(request):
+        return FakeResponse(await router.fetch_val(query=IN_RECOVERY))
+
+    response = await handle(router, FakeRequest(), call_next)
+
+    assert response.body is True
+    assert CONSISTENCY_HEADER not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_reads_after_mark_write_see_the_write(router):
+    marker = uuid.uuid4().hex
+
+    async def call_next(request):
+        mark_write()
+        await router.primary.execute(query=f"INSERT INTO {TABLE} (marker) VALUES (:marker)", values={"marker": marker})
+        # Mismo request: la lectura va al primario aunque las réplicas no hayan aplicado el INSERT
+        return FakeResponse((await router.fetch_val(query=IN_RECOVERY), await count_marker(router, marker)))
+
+    response = await handle(router, FakeRequest(), call_next)
+
+    assert response.body == (False, 1)
+    assert parse_lsn(response.headers[CONSISTENCY_HEADER]) is not None
+
+
+@pytest.mark.asyncio
+async def test_consistency_token_reads_your_writes_in_the_next_request(router):
+    marker = uuid.uuid4().hex
+
+    async def write(request):
+        mark_write()
+        await router.primary.execute(query=f"INSERT INTO {TABLE} (marker) VALUES (:marker)", values={"marker": marker})
+        return FakeResponse()
+
+    async def read(request):
+        return FakeResponse(await count_marker(router, marker))
+
+    token = (await handle(router, FakeRequest(), write)).headers[CONSISTENCY_HEADER]
+
+    # Con el token solo atiende una réplica que ya aplicó ese LSN (o el primario)
+    response = await handle(router, FakeRequest({CONSISTENCY_HEADER: token}), read)
+    assert response.body == 1
+
+
+@pytest.mark.asyncio
+async def test_token_ahead_of_every_replica_falls_back_to_primary(router):
+    lsn = parse_lsn(await router.current_primary_lsn())
+    future = lsn + (1 << 40)
+    token = f"{future >> 32:X}/{future & 0xFFFFFFFF:X}"
+
+    async def call_next(request):
+        return FakeResponse(await router.fetch_val(query=IN_RECOVERY))
+
+    response = await handle(router, FakeRequest({CONSISTENCY_HEADER: token}), call_next)
+
+    assert response.body is False
+
+
+@pytest.mark.asyncio
+async def test_primary_reads_scope_skips_replicas(router):
+    assert router.choose_replica() is not None
+
+    with primary_reads():
+        assert router.choose_replica() is None
+        assert await router.fetch_val(query=IN_RECOVERY) is False
+
+    assert await router.fetch_val(query=IN_RECOVERY) is True
@@ -0,0 +1,107 @@
+"""Coalescencia de lecturas idénticas (src/services/single_flight.py)"""
+import asyncio
+
+import pytest
+
+from src.services.single_flight import SingleFlight, flight_key
+
+
+class CountingQuery:
+    """Consulta simulada que cuenta cuántas veces se ejecutó"""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.issued = 0
+
+    async def __call__(self):
+        self.issued += 1
+        await asyncio.sleep(self.delay)
+        return {"total_solicitudes": 42, "consulta": self.issued}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_reads_issue_one_query():
+    flight = SingleFlight(stale_seconds=0)
+    query = CountingQuery()
+    key = flight_key("stats_summary")
+
+    results = await asyncio.gather(*(flight.do(key, query) for _ in range(50)))
+
+    assert query.issued == 1
+    assert all(r is results[0] for r in results)
+    counters = flight.stats()["routes"]["stats_summary"]
+    assert counters["calls"] == 50
+    assert counters["db_calls_avoided"] == 49
+
+
+@pytest.mark.asyncio
+async def test_different_params_are_not_coalesced():
+    flight = SingleFlight(stale_seconds=0)
+    query = CountingQuery()
+
+    await asyncio.gather(
+        flight.do(flight_key("profile", rut="11111111-1"), query),
+        flight.do(flight_key("profile", rut="22222222-2"), query),
+    )
+
+    assert query.issued == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_shared_query():
+    flight = SingleFlight(stale_seconds=0)
+    query = CountingQuery(delay=0.1)
+    key = flight_key("stats_summary")
+
+    first = asyncio.ensure_future(flight.do(key, query))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(flight.do(key, query))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert (await second)["total_solicitudes"] == 42
+    assert query.issued == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_window_serves_previous_result_and_revalidates_once():
+    flight = SingleFlight(stale_seconds=60)
+    query = CountingQuery(delay=0.01)
+    key = flight_key("stats_summary")
+
+    fresh = await flight.do(key, query)
+    stale = await asyncio.gather(*(flight.do(key, query) for _ in range(10)))
+    await asyncio.sleep(0.05)
+
+    assert all(r is fresh for r in stale)
+    # Una recarga en segundo plano para las 10 lecturas servidas desde la ventana
+    assert query.issued == 2
+
+
+@pytest.mark.asyncio
+async def test_stale_window_is_bounded():
+    flight = SingleFlight(stale_seconds=60, max_recent=8)
+    query = CountingQuery(delay=0)
+
+    for i in range(100):
+        await flight.do(flight_key("search", query=f"texto-{i}"), query)
+
+    assert flight.stats()["recent"] == 8
+    # Se conservan las claves más recientes
+    await flight.do(flight_key("search", query="texto-99"), query)
+    assert flight.stats()["routes"]["search"]["stale_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_evicted_before_recent_ones():
+    flight = SingleFlight(stale_seconds=0.01, max_recent=4)
+    query = CountingQuery(delay=0)
+
+    for i in range(4):
+        await flight.do(flight_key("search", query=f"viejo-{i}"), query)
+    await asyncio.sleep(0.02)
+    flight.stale_seconds = 60
+    for i in range(2):
+        await flight.do(flight_key("search", query=f"nuevo-{i}"), query)
+
+    assert flight.stats()["recent"] == 2